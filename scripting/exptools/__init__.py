@@ -0,0 +1,7 @@
+"""
+Shared helpers for the scripted and Builder experiments in this folder.
+
+The experiment scripts add the `scripting` folder to `sys.path` and import
+the modules they need, e.g. `from exptools.preload import ImagePreloader`.
+See README.md in this folder for an overview of every module.
+"""
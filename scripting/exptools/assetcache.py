@@ -0,0 +1,157 @@
+"""
+Images pre-scaled to the exact pixel size they are drawn at.
+
+The experiments load full-resolution PNGs and let the GPU scale them down on
+every trial. `ScaledImageCache` instead makes a copy of every image at the
+size (in screen pixels) it will be drawn at, once, and keeps the copies in an
+on-disk cache keyed by a hash of the source image, the target size and the
+resampling filter. The
+next session on the same screen finds them already there. The experiment
+then loads the small copy, which is quicker to decode and upload, and is drawn
+pixel for pixel.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from exptools.preload import decodeImage
+
+
+def _filterName(resample):
+    # e.g. 'lanczos', for the names of the cached copies
+    try:
+        return Image.Resampling(resample).name.lower()
+    except (AttributeError, ValueError):
+        return f'filter{int(resample)}'
+
+
+def pixelSize(win, size, units=None):
+    """
+    Work out the size in screen pixels of a stimulus.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window the stimulus is drawn in (its size is in pixels).
+    size : tuple of float
+        `(width, height)` of the stimulus in `units`.
+    units : str or None
+        `'pix'`, `'height'` or `'norm'`, leave as None for the window's units.
+
+    Returns
+    ==========
+    tuple of int
+        `(width, height)` in pixels.
+    """
+    units = units or win.units
+    winWidth, winHeight = win.size
+    if units == 'pix':
+        scale = (1, 1)
+    elif units == 'height':
+        scale = (winHeight, winHeight)
+    elif units == 'norm':
+        scale = (winWidth / 2, winHeight / 2)
+    else:
+        raise ValueError(f'pixelSize does not support {units!r} units')
+    return (int(round(size[0] * scale[0])), int(round(size[1] * scale[1])))
+
+
+class ScaledImageCache:
+    """
+    An on-disk cache of images scaled to one pixel size.
+
+    Parameters
+    ==========
+    size : tuple of int
+        `(width, height)` in pixels to scale the images to, e.g. from
+        `pixelSize`.
+    cacheDir : str or pathlib.Path
+        Folder to keep the scaled copies in, created if needed.
+    resample : int
+        PIL resampling filter used to scale.
+    """
+
+    def __init__(self, size, cacheDir='cache', resample=Image.LANCZOS):
+        self.size = tuple(int(n) for n in size)
+        self.cacheDir = Path(cacheDir)
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        self.resample = resample
+        self.created = 0  # copies made
+        self.found = 0  # copies already in the cache
+        self._hashes = {}  # (path, size, mtime) -> content hash
+        self._lock = threading.Lock()
+
+    def _sourceHash(self, path, blockSize=2 ** 20):
+        # called from the prepare() workers, so the dict is only touched under the lock
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        with self._lock:
+            if key in self._hashes:
+                return self._hashes[key]
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(blockSize), b''):
+                sha.update(block)
+        with self._lock:
+            return self._hashes.setdefault(key, sha.hexdigest())
+
+    def path(self, source):
+        """
+        Get the path of the scaled copy of an image, making it if needed.
+
+        Parameters
+        ==========
+        source : str or pathlib.Path
+            Full-size image.
+
+        Returns
+        ==========
+        str
+            Path of the scaled copy.
+        """
+        width, height = self.size
+        cached = self.cacheDir / f'{self._sourceHash(source)}_{width}x{height}_{_filterName(self.resample)}.png'
+        if cached.exists():
+            with self._lock:
+                self.found += 1
+            return str(cached)
+        with Image.open(source) as im:
+            scaled = im.convert('RGBA').resize(self.size, self.resample)
+        # write to a temporary name first, so a half-written copy is never used
+        tmp = cached.with_name(f'{cached.stem}.{threading.get_ident()}.tmp.png')
+        scaled.save(tmp)
+        os.replace(tmp, cached)
+        with self._lock:
+            self.created += 1
+        return str(cached)
+
+    def prepare(self, sources, workers=4):
+        """
+        Make sure scaled copies of all `sources` are in the cache, e.g. before
+        the first trial.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.path, list(dict.fromkeys(sources))))
+
+    @property
+    def params(self):
+        """
+        The size and filter of the copies, e.g. for `imagepack.openPack`.
+        """
+        return {'size': list(self.size), 'resample': _filterName(self.resample)}
+
+    def loader(self, path, mode='RGBA'):
+        """
+        Decode the scaled copy of an image, for `ImagePreloader(loader=...)`.
+        """
+        return decodeImage(self.path(path), mode)
+
+    def stats(self):
+        """
+        Get the target size and the number of copies made and found.
+        """
+        return {'size': self.size, 'created': self.created, 'found': self.found}
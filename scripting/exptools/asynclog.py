@@ -0,0 +1,304 @@
+"""
+Logging without disk I/O in the timed parts of an experiment.
+
+A log call normally formats the message and writes it to the file (or the
+console) there and then, which can block on the disk in the middle of a
+trial. Here log calls only put the record, already timestamped, on a bounded
+in-memory queue. A background thread takes the records off the queue, formats
+them and writes them out. If the queue is full (the disk can't keep up), new
+records are dropped and counted rather than blocking the experiment.
+
+- `AsyncFileHandler` is a handler for Python's `logging` (e.g. `image_stim.py`);
+- `asyncLogFile` is a drop-in for PsychoPy's `logging.LogFile` (Builder scripts);
+- `asyncPrint` is a drop-in for `print` in code components.
+"""
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+
+
+class AsyncLogWriter:
+    """
+    Write records to a stream from a bounded queue, on a background thread.
+
+    Parameters
+    ==========
+    stream : file-like
+        Where the formatted records are written.
+    maxsize : int
+        Number of records the queue can hold before new ones are dropped.
+    closeStream : bool
+        Close `stream` when the writer is closed.
+    closeAtExit : bool
+        Close the writer when Python exits. Off for writers that something
+        else closes at exit, such as PsychoPy log files.
+    """
+
+    def __init__(self, stream, maxsize=10000, closeStream=False, closeAtExit=True):
+        self.stream = stream
+        self.closeStream = closeStream
+        self.written = 0
+        self.dropped = 0
+        self.maxDepth = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._drain, name='AsyncLogWriter', daemon=True)
+        self._thread.start()
+        if closeAtExit:
+            # write out whatever is still queued when Python exits (e.g. core.quit)
+            atexit.register(self.close)
+
+    @property
+    def depth(self):
+        """
+        Number of records waiting to be written.
+        """
+        return self._queue.qsize()
+
+    def put(self, format, *args):
+        """
+        Queue a record, to be written as `format(*args)` on the background thread.
+
+        Once the writer is closed, records are written there and then.
+
+        Returns
+        ==========
+        bool
+            False if the queue was full and the record was dropped.
+        """
+        if not self._thread.is_alive():
+            self._write(format(*args), 1)
+            return True
+        try:
+            self._queue.put_nowait((format, args))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.maxDepth = max(self.maxDepth, self._queue.qsize())
+        return True
+
+    def stats(self):
+        """
+        Get the current queue depth, the largest depth so far and the number of
+        records written and dropped.
+        """
+        return {'depth': self.depth, 'maxDepth': self.maxDepth,
+                'written': self.written, 'dropped': self.dropped}
+
+    def close(self):
+        """
+        Write out the queued records and stop the background thread.
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put((None, ()))  # blocks if full, so nothing more is dropped
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _drain(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            # take everything else that is already waiting and write it in one go
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for format, args in batch:
+                if format is None:
+                    done = True
+                    break
+                lines.append(format(*args))
+            self._write(''.join(lines), len(lines))
+        self._finish()
+
+    def _write(self, text, nRecords):
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+            self.written += nRecords
+        except Exception:
+            self.dropped += nRecords
+
+    def _finish(self):
+        try:
+            if self.dropped:
+                self.stream.write(f'{self.dropped} log records were dropped (the log queue was full)\n')
+            self.stream.flush()
+            if self.closeStream:
+                self.stream.close()
+        except (OSError, ValueError):
+            pass  # the stream was already closed, e.g. sys.stdout at exit
+
+
+class AsyncFileHandler(logging.Handler):
+    """
+    A `logging` handler that writes to a file on a background thread.
+
+    Records are formatted when they are written, so pass values as arguments
+    (`logging.info('Displaying image: %s', path)`) rather than formatting the
+    message yourself, and the formatting is off the experiment's thread too.
+
+    Parameters
+    ==========
+    filename : str or pathlib.Path
+        Log file, appended to.
+    maxsize : int
+        Number of records that can wait to be written before new ones are
+        dropped.
+    """
+
+    def __init__(self, filename, maxsize=10000, encoding='utf-8'):
+        super().__init__()
+        self.writer = AsyncLogWriter(open(filename, 'a', encoding=encoding), maxsize, closeStream=True)
+
+    def emit(self, record):
+        # the record already holds its creation time
+        self.writer.put(self._formatLine, record)
+
+    def _formatLine(self, record):
+        try:
+            return self.format(record) + '\n'
+        except Exception:
+            self.handleError(record)
+            return ''
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+class _QueuedStream:
+    # file-like object handing what is written to it to an AsyncLogWriter
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        self.writer.put(str, text)
+
+    def flush(self):
+        pass
+
+
+def asyncLogFile(f, level=None, filemode='a', encoding='utf8', maxsize=10000):
+    """
+    Make a PsychoPy `logging.LogFile` that writes on a background thread.
+
+    PsychoPy keeps log entries in memory (with their time) until
+    `logging.flush()`, which formats them and hands the text to the log
+    file. With this log file, that text is only queued and the disk write
+    happens on the background thread. PsychoPy flushes its log once more at
+    exit, after the exit handlers registered later (such as the
+    `ExperimentHandler`'s), so the writer is closed right after that last
+    flush rather than by an exit handler of its own.
+
+    Parameters
+    ==========
+    f : str
+        Log file name.
+    level : int or None
+        Lowest level to log, as for `logging.LogFile`.
+    filemode, encoding
+        As for `logging.LogFile`.
+    maxsize : int
+        Number of writes that can wait before new ones are dropped.
+
+    Returns
+    ==========
+    psychopy.logging.LogFile
+        The log file, with its `writer` (an `AsyncLogWriter`) attached.
+    """
+    from psychopy import logging as pplogging
+    if level is None:
+        level = pplogging.INFO
+    logFile = pplogging.LogFile(f, level=level, filemode=filemode, encoding=encoding)
+    logFile.writer = AsyncLogWriter(logFile.stream, maxsize, closeAtExit=False)
+    logFile.stream = _QueuedStream(logFile.writer)
+    if not _logFiles:
+        _closeAfterLastFlush(pplogging.root)
+    _logFiles.append(logFile)
+    return logFile
+
+
+def closeLogFile(logFile):
+    """
+    Stop logging to a log file from `asyncLogFile` and write out what is
+    queued for it, e.g. before the next experiment of a battery sets up its
+    own log file.
+    """
+    from psychopy import logging as pplogging
+    pplogging.flush()
+    pplogging.root.removeTarget(logFile)
+    logFile.writer.close()
+    if logFile in _logFiles:
+        _logFiles.remove(logFile)
+
+
+# the open log files from asyncLogFile, closed after PsychoPy's last flush
+_logFiles = []
+_exiting = False
+
+
+def _markExit():
+    global _exiting
+    _exiting = True
+
+
+def _closeAfterLastFlush(logger):
+    # registered after PsychoPy's own exit flush, so it runs before it and only
+    # marks the exit; that last flush then closes the writers once it is done
+    flush = logger.flush
+
+    def flushAndClose():
+        flush()
+        if _exiting:
+            for logFile in list(_logFiles):
+                logFile.writer.close()
+    logger.flush = flushAndClose
+    atexit.register(_markExit)
+
+
+_printer = None
+
+
+def _printLine(args, sep, end):
+    return sep.join(str(arg) for arg in args) + end
+
+
+def asyncPrint(*args, sep=' ', end='\n'):
+    """
+    Like `print`, but the text is formatted and written to stdout on a
+    background thread. Arguments are converted to text when they are written,
+    so pass values that won't change afterwards.
+    """
+    global _printer
+    if _printer is None:
+        _printer = AsyncLogWriter(sys.stdout)
+    _printer.put(_printLine, args, sep, end)
+
+
+if __name__ == '__main__':
+    # quick comparison of the time spent in the log calls
+    import tempfile
+    for name in ('sync', 'async'):
+        with tempfile.TemporaryDirectory() as tmp:
+            logger = logging.getLogger(name)
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = (logging.FileHandler if name == 'sync' else AsyncFileHandler)(f'{tmp}/test.log')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logger.addHandler(handler)
+            times = []
+            for i in range(2000):
+                t0 = time.perf_counter()
+                logger.info('Displaying image: %s', f'imgs/img{i % 10}.png')
+                times.append(time.perf_counter() - t0)
+                time.sleep(0.001)  # the rest of the frame
+            handler.close()
+            stats = f', {handler.writer.stats()}' if name == 'async' else ''
+            print(f'{name}: mean log call {sum(times) / len(times) * 1e6:.0f} us, '
+                  f'slowest {max(times) * 1e6:.0f} us{stats}')
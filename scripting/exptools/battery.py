@@ -0,0 +1,215 @@
+"""
+Running several Builder experiments in one window.
+
+Every Builder script opens its own fullscreen window, measures the frame rate,
+launches its devices and quits, so a test battery reopens all of that for
+every experiment. `runBattery` opens the window and devices once (with the
+first experiment's `setupWindow` and `setupDevices`) and then calls each
+experiment's `run(expInfo, thisExp, win)` in turn, with a fresh
+`ExperimentHandler` from its own `setupData`::
+
+    python -m exptools.battery stroop/builder_exp/stroop_lastrun.py image_stim/builder_exp/image_stim.py --participant 001
+
+While an experiment runs, the next one is imported on a worker thread, its
+image packs are opened or built (its `setupResources`) and its conditions files
+are loaded and kept for its `run`, all from its own folder but without
+changing the working directory. Once the running experiment has saved its
+data, the worker is joined and the next experiment starts, and the previous
+experiment's log file is closed before the next one sets up its own. The
+transition latency between experiments (from the end of one `run` to the
+start of the next) is logged and printed at the end.
+
+Only Builder scripts (with a `run` function) can be part of a battery, the
+hand-written scripts run from top to bottom when imported.
+"""
+import argparse
+import ast
+import importlib.util
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from psychopy import logging
+
+from exptools.asynclog import closeLogFile
+
+# exptools functions whose files can be loaded before the experiment runs (image packs
+# are opened by the script's setupResources)
+_RESOURCE_LOADERS = ('loadConditions',)
+
+
+def resourceCalls(path):
+    """
+    Find the conditions files a Builder script loads.
+
+    Returns
+    ==========
+    list of tuple
+        `(function name, args, kwargs)` of every `loadConditions` call with
+        constant arguments.
+    """
+    tree = ast.parse(Path(path).read_text(encoding='utf-8-sig'))
+    calls = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id in _RESOURCE_LOADERS):
+            try:
+                args = [ast.literal_eval(arg) for arg in node.args]
+                kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in node.keywords}
+            except ValueError:
+                continue  # not a constant, only known when the experiment runs
+            calls.append((node.func.id, args, kwargs))
+    return calls
+
+
+def importExperiment(path, index=0):
+    """
+    Import a Builder script as a module, without running its experiment.
+    """
+    path = Path(path).resolve()
+    spec = importlib.util.spec_from_file_location(f'_battery{index}_{path.stem}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not hasattr(module, 'run'):
+        raise ValueError(f'{path.name} is not a Builder script (it has no run function)')
+    return module
+
+
+class _Preloaded:
+    # the script's loadConditions, handing out what was loaded before the experiment started
+    def __init__(self, loadConditions, folder):
+        self.loadConditions = loadConditions
+        self.folder = folder
+        self.trialLists = {}
+
+    @staticmethod
+    def _key(fileName, selection):
+        return os.path.abspath(fileName), repr(selection)
+
+    def load(self, fileName, selection=''):
+        # loaded from the experiment's folder, where its run will ask for it
+        fileName = os.path.join(self.folder, fileName)
+        self.trialLists[self._key(fileName, selection)] = self.loadConditions(fileName, selection)
+
+    def __call__(self, fileName, selection='', parse=None):
+        trialList = self.trialLists.pop(self._key(fileName, selection), None)
+        if trialList is None or parse is not None:
+            return self.loadConditions(fileName, selection, parse=parse)
+        return trialList
+
+
+def preloadExperiment(path, index=0):
+    """
+    Import a Builder script and load its resources, from its own folder,
+    before its experiment runs.
+
+    The script's `setupResources` opens (or builds) its image packs, which
+    the module keeps. The trial lists of its constant `loadConditions` calls
+    are kept too, and given to those calls when `run` makes them. Relative
+    paths are read from the script's folder and the working directory is not
+    changed, so this can run on a worker thread while another experiment runs.
+    """
+    path = Path(path).resolve()
+    module = importExperiment(path, index)
+    if hasattr(module, 'setupResources'):
+        module.setupResources()
+    calls = resourceCalls(path)
+    if calls:
+        preloaded = _Preloaded(module.loadConditions, str(path.parent))
+        for name, args, kwargs in calls:
+            preloaded.load(*args, **kwargs)
+        module.loadConditions = preloaded
+    return module
+
+
+def runBattery(paths, info=None):
+    """
+    Run Builder experiments one after another in one window.
+
+    Parameters
+    ==========
+    paths : list of str or pathlib.Path
+        Builder scripts, in the order to run them.
+    info : dict or None
+        Values shared by every experiment's `expInfo` (e.g. `participant`,
+        `session`), leave as None to ask for them with the first experiment's
+        dialog.
+
+    Returns
+    ==========
+    list of dict
+        Per experiment: `name`, the wall time of its `run` and the transition
+        latency (s) before it started (None for the first).
+    """
+    paths = [Path(p).resolve() for p in paths]
+    module = preloadExperiment(paths[0], 0)
+    win = deviceManager = logFile = None
+    report = []
+    runEnd = None
+    worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='battery')
+    for index, path in enumerate(paths):
+        # relative paths in the experiment start from its own folder
+        os.chdir(path.parent)
+        expInfo = dict(module.expInfo)
+        if info is None:
+            info = {key.split('|')[0]: value
+                    for key, value in module.showExpInfoDlg(expInfo=dict(expInfo)).items()
+                    if not key.endswith('|hid')}
+        expInfo.update({key: value for key, value in info.items() if key in expInfo})
+        thisExp = module.setupData(expInfo=expInfo)
+        if logFile is not None:
+            # or the next experiment's entries would also go into this one's log
+            closeLogFile(logFile)
+        logFile = module.setupLogging(filename=thisExp.dataFileName)
+        win = module.setupWindow(expInfo=expInfo, win=win)
+        if deviceManager is None:
+            deviceManager = module.deviceManager
+        # every experiment registers its devices with the same manager
+        module.deviceManager = deviceManager
+        module.setupDevices(expInfo=expInfo, thisExp=thisExp, win=win)
+        # the next experiment is imported and its resources loaded during this one
+        nextModule = None
+        if index + 1 < len(paths):
+            nextModule = worker.submit(preloadExperiment, paths[index + 1], index + 1)
+        runStart = time.perf_counter()
+        transition = None if runEnd is None else runStart - runEnd
+        if transition is not None:
+            logging.info(f'{module.expName}: started {transition:.3f} s after the previous experiment')
+        module.run(expInfo=expInfo, thisExp=thisExp, win=win, globalClock='float')
+        runEnd = time.perf_counter()
+        report.append({'name': module.expName, 'run': runEnd - runStart, 'transition': transition})
+        # saved from the experiment's own folder, before moving on to the next one
+        module.saveData(thisExp=thisExp)
+        if nextModule is not None:
+            thisExp.abort()  # or data files will save again on exit
+            module = nextModule.result()
+        else:
+            worker.shutdown()
+            printReport(report)
+            module.quit(thisExp=thisExp, win=win)
+    return report
+
+
+def printReport(report):
+    """
+    Print the run time and transition latency of every experiment.
+    """
+    print(f"{'experiment':<20}{'run s':>10}{'transition s':>14}")
+    for row in report:
+        transition = '' if row['transition'] is None else f"{row['transition']:.3f}"
+        print(f"{row['name']:<20}{row['run']:>10.1f}{transition:>14}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run Builder experiments one after another in one window.')
+    parser.add_argument('scripts', nargs='+')
+    parser.add_argument('--participant', default=None)
+    parser.add_argument('--session', default=None)
+    args, _ = parser.parse_known_args()
+    info = None
+    if args.participant is not None:
+        info = {'participant': args.participant}
+        if args.session is not None:
+            info['session'] = args.session
+    runBattery(args.scripts, info=info)
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the exptools helpers, run them from the `scripting` folder,
+e.g. `python -m exptools.benchmarks.bench_keywait`.
+"""
@@ -0,0 +1,163 @@
+"""
+Compare busy-polling for a key with waiting on the keyboard's event queue.
+
+This is a simulation, no real keyboard backend is used: a background thread
+"presses" a key at a known time after each "stimulus onset" and puts it in a
+simulated queue, stamped with the time of the press. The polling loop stamps
+the key when it sees it (like the original `event.getKeys()` loop in
+stroop.py), while `waitForKeyPress` waits with `waitKeys` (which, like
+`keyboard.Keyboard.waitKeys`, sleeps between looks at the queue) and uses the
+timestamp stored with the key event. For each mode we report the CPU use
+during the wait and the error of the measured RT against the true press time.
+
+The RT error of the waiting mode is zero by construction here, because the
+simulated queue stamps presses exactly, as the psychtoolbox backend aims to.
+What the benchmark does show is the CPU cost of each loop and how the error of
+the polling loop grows with the cost of a poll. How close a real backend's
+timestamps are to the physical key press has to be measured with hardware
+(e.g. a button box or a photodiode and a key switch).
+
+Usage::
+
+    python -m exptools.benchmarks.bench_keywait --trials 50 --poll-cost 0.0002
+
+`--poll-cost` adds a busy delay to every poll, to mimic the window event
+dispatching that `event.getKeys()` does on each call.
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from exptools.responses import waitForKeyPress
+
+
+class _Clock:
+    def __init__(self):
+        self._t0 = time.perf_counter()
+
+    def reset(self):
+        self._t0 = time.perf_counter()
+
+    def getTime(self):
+        return time.perf_counter() - self._t0
+
+
+class _KeyPress:
+    def __init__(self, name, rt):
+        self.name = name
+        self.rt = rt
+
+
+class SimulatedKeyboard:
+    """
+    Keyboard whose key presses come from a background "participant" thread.
+    """
+
+    def __init__(self, pollCost=0.0):
+        self.clock = _Clock()
+        self.pollCost = pollCost
+        self._presses = []
+        self._lock = threading.Lock()
+        self.lastPressTime = None
+
+    def pressAfter(self, delay, name='left'):
+        # press `name` `delay` seconds from now, stamping it with the true time
+        def press():
+            time.sleep(delay)
+            with self._lock:
+                self.lastPressTime = time.perf_counter()
+                self._presses.append((name, self.lastPressTime))
+        threading.Thread(target=press, daemon=True).start()
+
+    def _spend(self):
+        end = time.perf_counter() + self.pollCost
+        while time.perf_counter() < end:
+            pass
+
+    def getKeyNames(self, keyList=None):
+        # like event.getKeys(): names only, no timestamp
+        self._spend()
+        with self._lock:
+            presses, self._presses = self._presses, []
+        return [name for name, t in presses if keyList is None or name in keyList]
+
+    def getKeys(self, keyList=None, waitRelease=False, clear=True):
+        # like keyboard.Keyboard.getKeys(): rt from the event's own timestamp
+        self._spend()
+        with self._lock:
+            presses, self._presses = self._presses, []
+        t0 = time.perf_counter() - self.clock.getTime()
+        return [_KeyPress(name, t - t0) for name, t in presses
+                if keyList is None or name in keyList]
+
+    def waitKeys(self, maxWait=float('inf'), keyList=None, waitRelease=True, clear=True):
+        # the loop of keyboard.Keyboard.waitKeys(), minus the window events
+        start = time.perf_counter()
+        while time.perf_counter() - start < maxWait:
+            keys = self.getKeys(keyList=keyList, waitRelease=waitRelease, clear=clear)
+            if keys:
+                return keys
+            time.sleep(0.00001)
+        return None
+
+
+def pollForKey(kb, keyList):
+    # the original stroop.py loop, with its clock started at stimulus onset
+    respClock = kb.clock
+    keys = []
+    while len(keys) == 0:
+        theseKeys = kb.getKeyNames(keyList=keyList)
+        if len(theseKeys) > 0:
+            keys = theseKeys[0]
+            rt = respClock.getTime()
+    return rt
+
+
+def waitForKey(kb, keyList):
+    return waitForKeyPress(kb, keyList=keyList).rt
+
+
+def runMode(collect, nTrials, pollCost, seed):
+    rng = random.Random(seed)
+    kb = SimulatedKeyboard(pollCost=pollCost)
+    errors = []
+    cpu = wall = 0.0
+    for trial in range(nTrials):
+        # "stimulus onset"
+        kb.clock.reset()
+        onset = time.perf_counter() - kb.clock.getTime()
+        kb.pressAfter(rng.uniform(0.3, 0.8))
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        rt = collect(kb, ['left', 'right'])
+        cpu += time.process_time() - cpu0
+        wall += time.perf_counter() - wall0
+        # compare with when the key was actually pressed
+        trueRt = kb.lastPressTime - onset
+        errors.append((rt - trueRt) * 1000)
+    return {
+        'cpu': 100 * cpu / wall,
+        'meanErr': statistics.mean(errors),
+        'sdErr': statistics.stdev(errors),
+        'maxErr': max(errors, key=abs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--trials', type=int, default=30)
+    parser.add_argument('--poll-cost', type=float, default=0.0,
+                        help='busy seconds added to every poll')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'CPU %':>8}{'mean err ms':>13}{'SD err ms':>11}{'max err ms':>12}")
+    for name, collect in (('poll', pollForKey), ('wait', waitForKey)):
+        result = runMode(collect, args.trials, args.poll_cost, args.seed)
+        print(f"{name:<10}{result['cpu']:>8.1f}{result['meanErr']:>13.3f}"
+              f"{result['sdErr']:>11.3f}{result['maxErr']:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
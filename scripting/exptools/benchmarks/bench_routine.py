@@ -0,0 +1,216 @@
+"""
+Per-frame overhead of a Routine as its number of components grows.
+
+Runs the same Routine (components with staggered onsets and durations, or
+with `--onsets together` all shown for the whole Routine like the fixation
+cross, in a fixed-length non-slip Routine) once with the frame loop the Builder
+generates, where every component is tested on every frame, and once with
+`RoutineEngine`. The window, stimuli and data handler are stand-ins whose
+calls cost next to nothing and whose flips only move a virtual clock on by a
+frame, so what is measured is the bookkeeping of the frame loop itself: the
+time from the start of a frame to the flip, per frame.
+
+Usage::
+
+    python -m exptools.benchmarks.bench_routine --components 1 4 16 64 256
+    python -m exptools.benchmarks.bench_routine --onsets together
+"""
+import argparse
+import statistics
+import time
+
+from psychopy.constants import NOT_STARTED, STARTED, FINISHED
+
+from exptools.routine import Routine, RoutineEngine, StimComponent
+
+
+class _VirtualTime:
+    def __init__(self, frameDur):
+        self.now = 0.0
+        self.frameDur = frameDur
+
+
+class _Clock:
+    def __init__(self, vt):
+        self._vt = vt
+        self._t0 = vt.now
+
+    def getTime(self, format=None):
+        return self._vt.now - self._t0
+
+    def reset(self):
+        self._t0 = self._vt.now
+
+    def addTime(self, t):
+        self._t0 -= t
+
+
+class _Window:
+    def __init__(self, vt):
+        self._vt = vt
+        self._toCall = []
+
+    def _nextFlip(self):
+        return (round(self._vt.now / self._vt.frameDur) + 1) * self._vt.frameDur
+
+    def getFutureFlipTime(self, clock=None):
+        if clock is None:
+            return self._nextFlip()
+        return clock.getTime() + self._nextFlip() - self._vt.now
+
+    def timeOnFlip(self, obj, attrib):
+        self._toCall.append((setattr, (obj, attrib, None)))
+
+    def callOnFlip(self, function, *args):
+        self._toCall.append((function, args))
+
+    def flip(self):
+        self._vt.now = self._nextFlip()
+        toCall, self._toCall = self._toCall, []
+        for function, args in toCall:
+            if function is setattr:
+                args = args[:2] + (self._vt.now,)
+            function(*args)
+
+
+class _Stim:
+    def __init__(self, name):
+        self.name = name
+        self.status = NOT_STARTED
+        self.autoDraw = False
+
+    def setAutoDraw(self, value):
+        self.autoDraw = value
+
+
+class _Handler:
+    status = STARTED
+
+    def addData(self, name, value):
+        pass
+
+    def timestampOnFlip(self, win, name):
+        pass
+
+
+class _Recorder:
+    # keeps the time from the start of each frame to its flip
+    def __init__(self):
+        self.updates = []
+        self._start = None
+
+    def startRoutine(self, name):
+        pass
+
+    def startFrame(self):
+        self._start = time.perf_counter()
+
+    def endUpdates(self):
+        self.updates.append(time.perf_counter() - self._start)
+
+    def flipped(self):
+        pass
+
+
+def _timing(nComponents, duration, onsets='staggered'):
+    if onsets == 'together':
+        return [0.0] * nComponents, [duration] * nComponents
+    # onsets spread over the first half of the Routine, each lasting a quarter
+    starts = [0.5 * duration * i / nComponents for i in range(nComponents)]
+    return starts, [0.25 * duration] * nComponents
+
+
+def runGenerated(win, thisExp, routineTimer, components, starts, durations, duration, recorder,
+                 frameTolerance=0.001):
+    """
+    The Builder's frame loop, with the per-component code it writes out.
+    """
+    for thisComponent in components:
+        thisComponent.tStart = None
+        thisComponent.tStop = None
+        thisComponent.tStartRefresh = None
+        thisComponent.tStopRefresh = None
+        if hasattr(thisComponent, 'status'):
+            thisComponent.status = NOT_STARTED
+    frameN = -1
+    continueRoutine = True
+    while continueRoutine and routineTimer.getTime() < duration:
+        recorder.startFrame()
+        t = routineTimer.getTime()
+        tThisFlip = win.getFutureFlipTime(clock=routineTimer)
+        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
+        frameN = frameN + 1
+        for comp, start, dur in zip(components, starts, durations):
+            if comp.status == NOT_STARTED and tThisFlip >= start - frameTolerance:
+                comp.frameNStart = frameN
+                comp.tStart = t
+                comp.tStartRefresh = tThisFlipGlobal
+                win.timeOnFlip(comp, 'tStartRefresh')
+                thisExp.timestampOnFlip(win, comp.name + '.started')
+                comp.status = STARTED
+                comp.setAutoDraw(True)
+            if comp.status == STARTED:
+                pass
+            if comp.status == STARTED:
+                if tThisFlipGlobal > comp.tStartRefresh + dur - frameTolerance:
+                    comp.tStop = t
+                    comp.tStopRefresh = tThisFlipGlobal
+                    comp.frameNStop = frameN
+                    thisExp.timestampOnFlip(win, comp.name + '.stopped')
+                    comp.status = FINISHED
+                    comp.setAutoDraw(False)
+        if thisExp.status == FINISHED:
+            return
+        continueRoutine = False
+        for thisComponent in components:
+            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
+                continueRoutine = True
+                break
+        if continueRoutine:
+            recorder.endUpdates()
+            win.flip()
+            recorder.flipped()
+    routineTimer.addTime(-duration)
+
+
+def measure(nComponents, nRoutines, duration, frameDur, onsets='staggered'):
+    """
+    Get the median per-frame overhead (s) of the generated loop and the engine.
+    """
+    starts, durations = _timing(nComponents, duration, onsets)
+    results = []
+    for mode in ('generated', 'engine'):
+        vt = _VirtualTime(frameDur)
+        win, thisExp, routineTimer = _Window(vt), _Handler(), _Clock(vt)
+        recorder = _Recorder()
+        components = [_Stim(f'stim{i}') for i in range(nComponents)]
+        routine = Routine('bench', [StimComponent(comp, start=start, duration=dur)
+                                    for comp, start, dur in zip(components, starts, durations)],
+                          duration=duration)
+        engine = RoutineEngine(win, thisExp, routineTimer, _Clock(vt), frameRecorder=recorder)
+        for _ in range(nRoutines):
+            if mode == 'generated':
+                runGenerated(win, thisExp, routineTimer, components, starts, durations, duration, recorder)
+            else:
+                engine.run(routine)
+        results.append(statistics.median(recorder.updates))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--components', type=int, nargs='+', default=[1, 4, 16, 64, 256])
+    parser.add_argument('--routines', type=int, default=20, help='Routines run per mode')
+    parser.add_argument('--duration', type=float, default=2.0, help='Routine duration (s)')
+    parser.add_argument('--frame-rate', type=float, default=60.0)
+    parser.add_argument('--onsets', choices=['staggered', 'together'], default='staggered')
+    args = parser.parse_args()
+
+    print(f"{'components':>10}{'generated us/frame':>20}{'engine us/frame':>17}{'speed-up':>10}")
+    for n in args.components:
+        generated, engine = measure(n, args.routines, args.duration, 1.0 / args.frame_rate, args.onsets)
+        print(f'{n:>10}{generated * 1e6:>20.1f}{engine * 1e6:>17.1f}{generated / engine:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Time the import phase of every experiment's startup, lazy and eager.
+
+For each entry point the import block is run in a fresh Python several times,
+with `lazyImport` deferring its modules and with everything imported up front,
+and the median wall time is reported. With `--limit`, exits with an error if
+any lazy startup takes longer, so it can guard against slow imports creeping
+back in.
+
+Usage::
+
+    python -m exptools.benchmarks.bench_startup --repeats 5 --limit 3.0
+"""
+import argparse
+import statistics
+import sys
+from pathlib import Path
+
+from exptools.startup import runImports
+
+SCRIPTING = Path(__file__).resolve().parents[2]
+ENTRY_POINTS = [
+    'stroop/scripting/stroop.py',
+    'stroop/builder_exp/stroop_lastrun.py',
+    'image_stim/scripting/image_stim.py',
+    'image_stim/builder_exp/image_stim.py',
+    'fmri/scripting/image_fmri.py',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('scripts', nargs='*', default=ENTRY_POINTS,
+                        help='entry points, relative to the scripting folder')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--limit', type=float, default=None,
+                        help='fail if a lazy startup takes longer than this (s)')
+    args = parser.parse_args()
+
+    print(f"{'entry point':<40}{'lazy s':>8}{'eager s':>9}{'saved s':>9}")
+    tooSlow = []
+    for script in args.scripts:
+        path = SCRIPTING / script
+        # the first run warms the disk cache, like any launch after the first
+        runImports(path)
+        lazy = statistics.median(runImports(path, lazy=True)[0] for _ in range(args.repeats))
+        eager = statistics.median(runImports(path, lazy=False)[0] for _ in range(args.repeats))
+        print(f'{script:<40}{lazy:>8.2f}{eager:>9.2f}{eager - lazy:>9.2f}')
+        if args.limit is not None and lazy > args.limit:
+            tooSlow.append(script)
+    if tooSlow:
+        sys.exit(f'startup over {args.limit} s: ' + ', '.join(tooSlow))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare creating a stimulus in every trial with taking it from a StimulusPool.
+
+Runs the feedback part of stroop.py (a "correct"/"wrong" TextStim) and the
+image part of image_stim.py (a 400x400 ImageStim of a decoded image) for many
+trials, once creating a new stimulus per trial as the scripts used to, and once
+with a `StimulusPool`. For each we report the time per trial to get the
+stimulus and draw it, the Python memory allocated during the run (peak, from
+`tracemalloc`) and the growth of the process' resident memory.
+
+Usage::
+
+    python -m exptools.benchmarks.bench_stimpool --trials 1000
+
+A small PsychoPy window is opened to draw into.
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+from psychopy import visual
+
+from exptools.stimpool import StimulusPool
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _rss():
+    return psutil.Process().memory_info().rss if psutil is not None else float('nan')
+
+
+def runMode(win, getStim, values, nTrials, seed):
+    rng = random.Random(seed)
+    times = []
+    rss0 = _rss()
+    tracemalloc.start()
+    for trial in range(nTrials):
+        value = rng.choice(values)
+        t0 = time.perf_counter()
+        stim = getStim(value)
+        stim.draw()
+        times.append((time.perf_counter() - t0) * 1000)
+        win.flip()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'mean': statistics.mean(times),
+        'p99': sorted(times)[int(0.99 * (len(times) - 1))],
+        'peak': peak / 2 ** 20,
+        'rss': (_rss() - rss0) / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--trials', type=int, default=1000)
+    parser.add_argument('--images', type=int, default=8, help='number of distinct images')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    win = visual.Window(size=(600, 600), units='pix', color='gray')
+    rng = np.random.default_rng(args.seed)
+    # decoded images, as the ImagePreloader hands them out
+    images = {f'image{i}.png': rng.uniform(-1, 1, (512, 512, 3)).astype(np.float32)
+              for i in range(args.images)}
+
+    def makeText(text):
+        return visual.TextStim(win=win, text=text, color='black', height=20)
+
+    def makeImage(image):
+        return visual.ImageStim(win, image=image, size=(400, 400))
+
+    textPool = StimulusPool(makeText).prebuild(['correct', 'wrong'])
+    imagePool = StimulusPool(makeImage, update=lambda stim, image: stim.setImage(image), capacity=1)
+    imagePool.prebuild([None])
+    cases = [
+        ('text new', makeText, ['correct', 'wrong']),
+        ('text pool', textPool.get, ['correct', 'wrong']),
+        ('image new', lambda path: makeImage(images[path]), list(images)),
+        ('image pool', lambda path: imagePool.get(path, images[path]), list(images)),
+    ]
+    print(f"{'mode':<12}{'mean ms':>9}{'p99 ms':>9}{'py peak MiB':>13}{'RSS +MiB':>10}")
+    for name, getStim, values in cases:
+        result = runMode(win, getStim, values, args.trials, args.seed)
+        print(f"{name:<12}{result['mean']:>9.3f}{result['p99']:>9.3f}"
+              f"{result['peak']:>13.2f}{result['rss']:>10.1f}")
+    print(f'text pool: {textPool.stats()}')
+    print(f'image pool: {imagePool.stats()}')
+    win.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Remembering each monitor's measured frame rate.
+
+`win.getActualFrameRate()` makes the participant sit through a measurement
+pause on every launch. `calibratedFrameRate` measures the refresh rate and
+frame-interval jitter once per monitor (identified by its `screeninfo` name,
+position and resolution, and the window size) and stores them in a small JSON
+file in the user's home folder. Later launches reuse the stored values at
+once. The first frames the experiment itself flips are recorded, and
+`checkFrameRate(win)`, called between Routines, compares them with the stored
+rate once there are enough. If they show the monitor's rate has changed (e.g.
+it was switched to another refresh rate) the rate is measured again there, and
+the new values are stored and set on the window, with a warning in the log.
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from pathlib import Path
+
+from psychopy import core, logging
+
+# where the calibrations of all monitors of this computer are kept
+CALIBRATION_FILE = Path.home() / '.exptools' / 'framerate.json'
+
+
+def monitorKey(win, screen=0):
+    """
+    Get the key a monitor's calibration is stored under.
+
+    Combines what `screeninfo` knows about the monitor (name, position, size
+    in pixels and mm) with the window size and whether it is fullscreen.
+    """
+    parts = []
+    try:
+        from screeninfo import get_monitors
+        monitors = get_monitors()
+        if screen < len(monitors):
+            m = monitors[screen]
+            parts.append(f'{m.name}@{m.x},{m.y}:{m.width}x{m.height}'
+                         f':{getattr(m, "width_mm", "")}x{getattr(m, "height_mm", "")}mm')
+    except Exception:
+        parts.append(f'screen{screen}')  # no screeninfo (or no display info)
+    parts.append('window:%dx%d%s' % (win.size[0], win.size[1], ':fullscr' if getattr(win, '_isFullScr', False) else ''))
+    return '|'.join(parts)
+
+
+class CalibrationStore:
+    """
+    Frame-rate calibrations by monitor, in a JSON file.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        JSON file, created when the first calibration is stored.
+    """
+
+    def __init__(self, path=CALIBRATION_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """
+        Get the stored calibration of a monitor, or None.
+        """
+        return self._read().get(key)
+
+    def put(self, key, frameRate, jitter):
+        """
+        Store a monitor's refresh rate (Hz) and frame-interval jitter (SD, s).
+        """
+        with self._lock:
+            calibrations = self._read()
+            calibrations[key] = {'frameRate': frameRate, 'jitter': jitter, 'measured': time.time()}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+            tmp.write_text(json.dumps(calibrations, indent=1))
+            os.replace(tmp, self.path)
+
+
+def intervalStats(intervals):
+    """
+    Get the refresh rate and jitter from frame intervals (s).
+
+    Intervals over 1.5 times the median are dropped frames (or pauses between
+    flips) and are left out of the jitter.
+
+    Returns
+    ==========
+    tuple
+        Refresh rate (Hz) and the SD (s) of the frame intervals.
+    """
+    median = statistics.median(intervals)
+    regular = [dt for dt in intervals if dt < 1.5 * median]
+    jitter = statistics.pstdev(regular) if len(regular) > 1 else 0.0
+    return 1.0 / median, jitter
+
+
+def measureFrames(win, nFrames=60, infoMsg=None):
+    """
+    Flip `nFrames` blank frames and measure their refresh rate and jitter.
+    """
+    if infoMsg:
+        win.showMessage(infoMsg)
+    win.flip()
+    times = []
+    for frame in range(nFrames + 1):
+        win.flip()
+        times.append(core.getTime())
+    if infoMsg:
+        win.hideMessage()
+    return intervalStats([b - a for a, b in zip(times, times[1:])])
+
+
+def calibratedFrameRate(win, screen=None, store=None, infoMsg=None, validateFrames=120, tolerance=0.02):
+    """
+    Get the refresh rate of the window's monitor, measuring it only the first
+    time on this monitor, and set it on the window (as `getActualFrameRate`
+    does).
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window on the monitor.
+    screen : int or None
+        Index of the monitor, as for `visual.Window(screen=...)`, None for
+        the screen the window is on.
+    store : CalibrationStore or None
+        Where calibrations are kept, None for the default file.
+    infoMsg : str or None
+        Message shown while measuring.
+    validateFrames : int
+        Number of the experiment's first frames to check a stored rate
+        against, with `checkFrameRate`. 0 to not check.
+    tolerance : float
+        Relative difference from the stored rate that counts as a change.
+
+    Returns
+    ==========
+    float
+        Refresh rate in Hz.
+    """
+    store = store or CalibrationStore()
+    if screen is None:
+        screen = getattr(win, 'screen', 0)
+    key = monitorKey(win, screen)
+    calibration = store.get(key)
+    if calibration is None:
+        frameRate, jitter = measureFrames(win, infoMsg=infoMsg)
+        store.put(key, frameRate, jitter)
+        logging.info(f'Measured frame rate {frameRate:.2f} Hz (jitter {jitter * 1000:.2f} ms) for {key}')
+    else:
+        frameRate = calibration['frameRate']
+        logging.info(f'Using stored frame rate {frameRate:.2f} Hz for {key}')
+        if validateFrames:
+            win._frameRateCheck = _FrameRateCheck(win, store, key, frameRate, validateFrames, tolerance, infoMsg)
+    _setFrameRate(win, frameRate)
+    return frameRate
+
+
+def checkFrameRate(win, frameRecorder=None):
+    """
+    Check the stored frame rate of the window's monitor against the frames
+    flipped since `calibratedFrameRate`, once there are enough of them.
+
+    Call it between Routines: if the rate has changed, it is measured again
+    (a short pause with a blank screen) and the new rate is stored and set on
+    the window. Does nothing if there is no check to do.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window `calibratedFrameRate` was called for.
+    frameRecorder : exptools.frametiming.FrameRecorder or None
+        Recorder to give the new frame duration, if the rate changed.
+
+    Returns
+    ==========
+    float or None
+        The new refresh rate (Hz) if it was measured again, otherwise None.
+    """
+    check = getattr(win, '_frameRateCheck', None)
+    if check is None or not check.ready():
+        return None
+    win._frameRateCheck = None
+    frameRate = check.run()
+    if frameRate is not None and frameRecorder is not None:
+        frameRecorder.frameDur = 1.0 / round(frameRate)
+    return frameRate
+
+
+def _setFrameRate(win, frameRate):
+    # as getActualFrameRate() leaves the window
+    win._monitorFrameRate = frameRate
+    win.monitorFramePeriod = 1.0 / frameRate
+
+
+class _FrameRateCheck:
+    # records the experiment's first frames, to compare with a stored rate
+
+    def __init__(self, win, store, key, frameRate, nFrames, tolerance, infoMsg):
+        self.win = win
+        self.store = store
+        self.key = key
+        self.frameRate = frameRate
+        self.nFrames = nFrames
+        self.tolerance = tolerance
+        self.infoMsg = infoMsg
+        self.wasRecording = win.recordFrameIntervals
+        self.start = len(win.frameIntervals)
+        win.recordFrameIntervals = True
+
+    def ready(self):
+        return len(self.win.frameIntervals) - self.start >= self.nFrames
+
+    def run(self):
+        win, frameRate = self.win, self.frameRate
+        intervals = list(win.frameIntervals[self.start:self.start + self.nFrames])
+        if not self.wasRecording:
+            win.recordFrameIntervals = False
+        if abs(win.monitorFramePeriod - 1.0 / frameRate) > 1e-9:
+            # the window's timing was changed since (e.g. fast-forwarding), its frames say
+            # nothing about the monitor
+            return None
+        measured, jitter = intervalStats(intervals)
+        if abs(measured - frameRate) <= self.tolerance * frameRate:
+            return None
+        # the experiment's frames can be slow for other reasons, so measure blank frames
+        measured, jitter = measureFrames(win, infoMsg=self.infoMsg)
+        if abs(measured - frameRate) <= self.tolerance * frameRate:
+            return None
+        self.store.put(self.key, measured, jitter)
+        _setFrameRate(win, measured)
+        logging.warning(
+            f'Frame rate of {self.key} has changed from {frameRate:.2f} to {measured:.2f} Hz, '
+            f'measured again and stored (frames before this used {frameRate:.2f} Hz)'
+        )
+        return measured
@@ -0,0 +1,324 @@
+"""
+Optimising pass over Builder's `.psyexp` -> Python export.
+
+The exported scripts do work on every frame that has no effect. For example,
+every visual component gets an `if comp.status == STARTED: pass` branch
+("update params" with nothing to update), and every Routine start computes a
+`_timeToFirstFrame` that is never read. `optimiseScript` rewrites an exported
+script without that work:
+
+- dead per-frame branches (`if <comp>.status == STARTED:` with only `pass`)
+  are removed;
+- parameters set to a constant on every repeat or frame (`<comp>.setX(<constant>)`
+  inside the trial or frame loop) are set once, right after the component
+  is created, unless other code in the loop assigns to the component or its
+  attributes or passes it to a call;
+- unused timing bookkeeping is dropped: the `_timeToFirstFrame` dead stores,
+  and the `<comp>.started`/`.stopped` timestamps of components whose start
+  and stop times aren't saved (`saveStartStop` off in the `.psyexp`, or
+  listed in `dropTimestamps`).
+
+Comments and everything else in the script are kept as they are. A report of
+what was removed, per Routine, tells how much per-frame work was saved::
+
+    python -m exptools.codegen stroop/builder_exp/stroop.psyexp
+    python -m exptools.codegen image_stim/builder_exp/image_stim.psyexp --drop-timestamps polygon_2
+    python -m exptools.codegen --script image_stim_psychopy.py --report-only
+
+The first two compile the experiment with PsychoPy and write the optimised
+result to `<name>_optimised.py`, the last one only reports on an existing
+export. The `_lastrun.py` scripts next to the experiments are written by
+`exporter.py` and are left alone.
+"""
+import argparse
+import ast
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+_ROUTINE_MARKER = re.compile(r'# --- (?:Prepare to start|Run|Ending) Routine "(.+)" ---')
+
+
+def noTimestampComponents(psyexpPath):
+    """
+    Get the components of an experiment whose start and stop times aren't
+    saved (`saveStartStop` off).
+    """
+    names = set()
+    for routine in ET.parse(str(psyexpPath)).getroot().iter('Routine'):
+        for component in routine:
+            for param in component.iter('Param'):
+                if param.get('name') == 'saveStartStop' and param.get('val') == 'False':
+                    names.add(component.get('name'))
+    return names
+
+
+def _isConstant(node):
+    if isinstance(node, ast.Constant):
+        return True
+    if isinstance(node, ast.UnaryOp):
+        return _isConstant(node.operand)
+    if isinstance(node, (ast.Tuple, ast.List)):
+        return all(_isConstant(elt) for elt in node.elts)
+    return False
+
+
+def _isStatusStarted(test):
+    # `<name>.status == STARTED`
+    return (isinstance(test, ast.Compare) and isinstance(test.left, ast.Attribute)
+            and test.left.attr == 'status' and isinstance(test.left.value, ast.Name)
+            and len(test.ops) == 1 and isinstance(test.ops[0], ast.Eq)
+            and isinstance(test.comparators[0], ast.Name) and test.comparators[0].id == 'STARTED')
+
+
+def _changedIn(loop, name):
+    # whether code in the loop rebinds `name`, stores to its attributes or items,
+    # or passes it to a call, any of which may undo a hoisted setter
+    for node in ast.walk(loop):
+        if isinstance(node, ast.Call):
+            args = [arg.value if isinstance(arg, ast.Starred) else arg for arg in node.args]
+            args += [kw.value for kw in node.keywords]
+            if any(isinstance(arg, ast.Name) and arg.id == name for arg in args):
+                return True
+        elif isinstance(getattr(node, 'ctx', None), (ast.Store, ast.Del)):
+            root = node
+            while isinstance(root, (ast.Attribute, ast.Subscript)):
+                root = root.value
+            if isinstance(root, ast.Name) and root.id == name:
+                return True
+    return False
+
+
+class _Finder(ast.NodeVisitor):
+    # collects the statements to remove or move, knowing which loops they are in
+    def __init__(self, dropTimestamps, readNames):
+        self.dropTimestamps = dropTimestamps
+        self.readNames = readNames
+        self.loops = []
+        self.created = {}  # component name -> (first, last) line of its creation
+        self.setters = {}  # (component, method) -> number of calls
+        self.hoistLoops = {}  # setter to hoist -> the outermost loop it is in
+        self.found = []  # (kind, node, perFrame, component)
+
+    def _inLoop(self, node):
+        self.loops.append(node)
+        self.generic_visit(node)
+        self.loops.pop()
+
+    def visit_While(self, node):
+        self._inLoop(node)
+
+    def visit_For(self, node):
+        self._inLoop(node)
+
+    def _perFrame(self):
+        return any(isinstance(loop, ast.While) for loop in self.loops)
+
+    def visit_Assign(self, node):
+        target = node.targets[0] if len(node.targets) == 1 else None
+        if isinstance(target, ast.Name):
+            value = node.value
+            if (not self.loops and isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute)
+                    and isinstance(value.func.value, ast.Name) and value.func.value.id in ('visual', 'sound', 'keyboard')):
+                self.created[target.id] = (node.lineno, node.end_lineno)
+            if (target.id not in self.readNames and target.id.startswith('_')
+                    and isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute)
+                    and value.func.attr == 'getFutureFlipTime'):
+                self.found.append(('deadStore', node, self._perFrame(), target.id))
+        self.generic_visit(node)
+
+    def visit_If(self, node):
+        if (_isStatusStarted(node.test) and not node.orelse
+                and all(isinstance(stmt, ast.Pass) for stmt in node.body)):
+            self.found.append(('deadBranch', node, self._perFrame(), node.test.left.value.id))
+            return
+        self.generic_visit(node)
+
+    def visit_Expr(self, node):
+        call = node.value
+        if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute):
+            owner, method = call.func.value, call.func.attr
+            if isinstance(owner, ast.Name):
+                key = (owner.id, method)
+                self.setters[key] = self.setters.get(key, 0) + 1
+            if (method == 'timestampOnFlip' and len(call.args) == 2
+                    and isinstance(call.args[1], ast.Constant) and isinstance(call.args[1].value, str)):
+                component, _, event = call.args[1].value.rpartition('.')
+                if component in self.dropTimestamps and event in ('started', 'stopped'):
+                    self.found.append(('timestamp', node, self._perFrame(), component))
+            elif (self.loops and isinstance(owner, ast.Name) and method.startswith('set')
+                    and method != 'setAutoDraw' and call.args
+                    and all(_isConstant(arg) for arg in call.args)
+                    and all(_isConstant(kw.value) for kw in call.keywords)):
+                self.found.append(('hoist', node, self._perFrame(), owner.id))
+                self.hoistLoops[node] = self.loops[0]
+        self.generic_visit(node)
+
+
+def _routineOfLines(lines):
+    # the Routine each line belongs to, from the Builder's section comments
+    routines, current = [], ''
+    for line in lines:
+        match = _ROUTINE_MARKER.search(line)
+        if match:
+            current = match.group(1)
+        routines.append(current)
+    return routines
+
+
+def _leadingComments(lines, lineno):
+    # the comment lines right above a statement (1-based lineno), which go with it
+    start = lineno
+    while start > 1 and lines[start - 2].strip().startswith('#') and not _ROUTINE_MARKER.search(lines[start - 2]):
+        start -= 1
+    return start
+
+
+def _remove(lines, remove, first, last):
+    # mark lines first..last (1-based) for removal
+    if (first > 1 and last < len(lines) and not lines[last].strip()
+            and (not lines[first - 2].strip() or lines[first - 2].rstrip().endswith(':'))):
+        last += 1  # don't leave two blank lines, or one opening a block, behind
+    remove.update(range(first, last + 1))
+
+
+def optimiseScript(source, dropTimestamps=()):
+    """
+    Remove per-frame work with no effect from an exported Builder script.
+
+    Parameters
+    ==========
+    source : str
+        Source of the exported script.
+    dropTimestamps : collection of str
+        Components whose `.started`/`.stopped` timestamps to drop.
+
+    Returns
+    ==========
+    tuple
+        The optimised source and a list of `(routine, kind, component,
+        perFrame)` for every change made, where kind is `'deadBranch'`,
+        `'hoist'`, `'timestamp'` or `'deadStore'`.
+    """
+    tree = ast.parse(source)
+    readNames = {node.id for node in ast.walk(tree)
+                 if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    finder = _Finder(set(dropTimestamps), readNames)
+    finder.visit(tree)
+    lines = source.splitlines(keepends=True)
+    routines = _routineOfLines(lines)
+    remove = set()
+    insert = {}  # after line -> lines to insert
+    report = []
+    for kind, node, perFrame, component in finder.found:
+        if kind == 'hoist':
+            method = node.value.func.attr
+            if (component not in finder.created or finder.setters[(component, method)] > 1
+                    or _changedIn(finder.hoistLoops[node], component)):
+                continue  # created elsewhere, set to other values too, or changed by other code
+            statement = ''.join(lines[node.lineno - 1:node.end_lineno])
+            createdFirst, createdLast = finder.created[component]
+            indent = re.match(r'\s*', lines[createdFirst - 1]).group(0)
+            insert.setdefault(createdLast, []).append(indent + statement.lstrip())
+            first = node.lineno
+        else:
+            first = _leadingComments(lines, node.lineno)
+        _remove(lines, remove, first, node.end_lineno)
+        report.append((routines[node.lineno - 1], kind, component, perFrame))
+    # a branch whose setters were all hoisted is left with nothing to do
+    frameLoops = [(node.lineno, node.end_lineno) for node in ast.walk(tree) if isinstance(node, ast.While)]
+    for node in sorted(ast.walk(tree), key=lambda node: -getattr(node, 'lineno', 0)):
+        if (isinstance(node, ast.If) and _isStatusStarted(node.test) and not node.orelse
+                and node.lineno not in remove
+                and any(stmt.lineno in remove for stmt in node.body)
+                and all(isinstance(stmt, ast.Pass) or stmt.lineno in remove for stmt in node.body)):
+            _remove(lines, remove, _leadingComments(lines, node.lineno), node.end_lineno)
+            perFrame = any(start < node.lineno <= end for start, end in frameLoops)
+            report.append((routines[node.lineno - 1], 'deadBranch', node.test.left.value.id, perFrame))
+    out = []
+    for lineno, line in enumerate(lines, start=1):
+        if lineno not in remove:
+            out.append(line)
+        for hoisted in insert.get(lineno, []):
+            out.append(hoisted)
+    optimised = ''.join(out)
+    ast.parse(optimised)  # raises if a block was left empty
+    return optimised, report
+
+
+def formatReport(name, report):
+    """
+    Summarise the changes `optimiseScript` made, per Routine.
+    """
+    labels = {
+        'deadBranch': 'dead branches', 'hoist': 'hoisted setters',
+        'timestamp': 'timestamps', 'deadStore': 'dead stores',
+    }
+    rows = {}
+    for routine, kind, component, perFrame in report:
+        row = rows.setdefault(routine or '(none)', dict.fromkeys(labels, 0))
+        row[kind] += 1
+        row.setdefault('perFrame', 0)
+        row['perFrame'] += perFrame
+    text = [f'{name}: removed {len(report)} statements, '
+            f'{sum(perFrame for *_, perFrame in report)} of them from frame loops',
+            f"{'routine':<16}" + ''.join(f'{label:>17}' for label in labels.values()) + f"{'in frame loop':>15}"]
+    for routine, row in rows.items():
+        text.append(f'{routine:<16}' + ''.join(f'{row[kind]:>17}' for kind in labels) + f"{row['perFrame']:>15}")
+    return '\n'.join(text)
+
+
+def compileExperiment(psyexpPath, outPath=None, optimise=True, dropTimestamps=()):
+    """
+    Export a `.psyexp` file to Python with PsychoPy, then optimise it.
+
+    Parameters
+    ==========
+    psyexpPath : str or pathlib.Path
+        The experiment.
+    outPath : str or pathlib.Path or None
+        Script to write, None for `<name>_optimised.py` next to the
+        experiment (so the `_lastrun.py` script isn't overwritten).
+    optimise : bool
+        Whether to run `optimiseScript` over the export.
+    dropTimestamps : collection of str
+        Components whose timestamps to drop, on top of those with
+        `saveStartStop` off.
+
+    Returns
+    ==========
+    list
+        The changes made, as returned by `optimiseScript`.
+    """
+    from psychopy.scripts import psyexpCompile
+    psyexpPath = Path(psyexpPath)
+    if outPath is None:
+        outPath = psyexpPath.with_name(psyexpPath.stem + '_optimised.py')
+    psyexpCompile.compileScript(infile=str(psyexpPath), outfile=str(outPath))
+    if not optimise:
+        return []
+    source = Path(outPath).read_text(encoding='utf-8-sig')
+    drop = noTimestampComponents(psyexpPath) | set(dropTimestamps)
+    source, report = optimiseScript(source, dropTimestamps=drop)
+    Path(outPath).write_text(source, encoding='utf-8-sig')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export and optimise Builder experiments.')
+    parser.add_argument('experiments', nargs='*', help='.psyexp files')
+    parser.add_argument('--script', nargs='*', default=[], help='already exported scripts to optimise')
+    parser.add_argument('--drop-timestamps', nargs='*', default=[],
+                        help='components whose start/stop timestamps to drop')
+    parser.add_argument('--no-optimise', action='store_true', help='export only')
+    parser.add_argument('--report-only', action='store_true', help="report, but don't rewrite --script files")
+    args = parser.parse_args()
+    for experiment in args.experiments:
+        report = compileExperiment(experiment, optimise=not args.no_optimise, dropTimestamps=args.drop_timestamps)
+        print(formatReport(Path(experiment).name, report))
+    for script in args.script:
+        path = Path(script)
+        source, report = optimiseScript(path.read_text(encoding='utf-8-sig'), dropTimestamps=args.drop_timestamps)
+        if not args.report_only:
+            path.write_text(source, encoding='utf-8-sig')
+        print(formatReport(path.name, report))
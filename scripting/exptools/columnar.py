@@ -0,0 +1,263 @@
+"""
+Typed, columnar (Parquet) output of the trial data.
+
+Reading thousands of sessions back from CSV means parsing every value as text,
+and unpickling `.psydat` files means loading whole ExperimentHandlers. Parquet
+files store each column with a type (`rt` as float64, `key_resp_2.keys` as a
+string, ...) and can be read column by column, so an analysis that only needs
+`rt` and `rating` reads only those two columns.
+
+The schema is derived from the data added with `addData`: a column is a bool,
+int64 or float64 column if all its values are, a list column if all its values
+are lists of one type, and a string column otherwise. Empty cells are nulls.
+The columns that identify a session (`TEXT_COLUMNS`) are always strings, so a
+participant '007' stays '007'. Values read back from a CSV file are typed per
+column too: a column is only numeric if every value in it is written as a
+number, without leading zeros.
+
+Needs `pyarrow`. Without it, writing is skipped with a warning in the log, so
+the CSV files are always there to fall back on. Convert existing files with::
+
+    python -m exptools.columnar data/<participant>_experiment_stream.jsonl
+    python -m exptools.columnar data/<participant>_ratings.csv
+"""
+import csv
+import os
+import re
+import sys
+import warnings
+
+from exptools.lazyimport import lazyImport
+
+# only loaded when a file is written or read
+pa = lazyImport('pyarrow')
+
+# columns identifying the session, stored as strings whatever they look like
+TEXT_COLUMNS = ('participant', 'session', 'date')
+
+# how str() writes numbers, so e.g. '007' or '1_000' are not taken for one
+_INT = re.compile(r'-?(0|[1-9][0-9]*)')
+_FLOAT = re.compile(r'-?(0|[1-9][0-9]*)(\.[0-9]+)?(e[-+][0-9]+)?|-?inf|nan')
+
+
+def _isMissing(value):
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+
+def _scalarType(values):
+    # narrowest arrow type holding all (non-missing) values
+    if all(isinstance(v, bool) for v in values):
+        return pa.bool_()
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return pa.int64()
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return pa.float64()
+    return pa.string()
+
+
+def _columnType(values):
+    values = [v.tolist() if hasattr(v, 'tolist') else v for v in values if not _isMissing(v)]
+    if not values:
+        return pa.string()
+    if all(isinstance(v, (list, tuple)) for v in values):
+        items = [item for v in values for item in v if not _isMissing(item)]
+        return pa.list_(_scalarType(items) if items else pa.string())
+    if any(isinstance(v, (list, tuple, dict)) for v in values):
+        return pa.string()
+    return _scalarType(values)
+
+
+def _cell(value, type):
+    # convert one value to what the column type expects
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if _isMissing(value):
+        return None
+    if pa.types.is_list(type):
+        return [_cell(item, type.value_type) for item in value]
+    if pa.types.is_string(type):
+        return value if isinstance(value, str) else str(value)
+    if pa.types.is_float64(type):
+        return float(value)
+    return value
+
+
+def inferSchema(rows, names=None):
+    """
+    Derive a typed schema from the rows of a session.
+
+    Parameters
+    ==========
+    rows : list of dict
+        One dict per trial, e.g. from `ExperimentHandler.getAllEntries()`.
+    names : list of str or None
+        Column order, leave as None for the order the columns first appear in.
+
+    Returns
+    ==========
+    pyarrow.Schema
+        One field per column.
+    """
+    if names is None:
+        names = list(dict.fromkeys(key for row in rows for key in row))
+    return pa.schema([
+        (name, pa.string() if name in TEXT_COLUMNS else _columnType([row.get(name) for row in rows]))
+        for name in names
+    ])
+
+
+def writeColumnar(rows, path, names=None):
+    """
+    Write the rows of a session to a Parquet file.
+
+    Parameters
+    ==========
+    rows : list of dict
+        One dict per trial.
+    path : str or pathlib.Path
+        Parquet file to write.
+    names : list of str or None
+        Column order, leave as None for the order the columns first appear in.
+
+    Returns
+    ==========
+    str or None
+        Path of the file written, None if pyarrow is not installed.
+    """
+    if pa is None:
+        _warn(f'pyarrow is not installed, not writing {path}')
+        return None
+    import pyarrow.parquet as pq
+    schema = inferSchema(rows, names)
+    columns = [
+        pa.array([_cell(row.get(field.name), field.type) for row in rows], type=field.type)
+        for field in schema
+    ]
+    pq.write_table(pa.Table.from_arrays(columns, schema=schema), str(path))
+    return str(path)
+
+
+def saveAsColumnar(thisExp, path=None):
+    """
+    Write all entries of an ExperimentHandler to a Parquet file.
+
+    Parameters
+    ==========
+    thisExp : psychopy.data.ExperimentHandler
+        Experiment to save.
+    path : str or None
+        Parquet file to write, leave as None for `thisExp.dataFileName` plus
+        `.parquet`.
+    """
+    if path is None:
+        path = thisExp.dataFileName + '.parquet'
+    return writeColumnar(thisExp.getAllEntries(), path)
+
+
+def _warn(message):
+    # in the experiment's log file when running in PsychoPy
+    try:
+        from psychopy import logging
+    except ImportError:
+        warnings.warn(message)
+    else:
+        logging.warning(message)
+
+
+def _textColumn(texts):
+    # values of one column read back from CSV, typed if all of them are numbers (or bools)
+    values = [None if text in ('', 'None') else text for text in texts]
+    present = [text for text in values if text is not None]
+    if not present:
+        return values
+    if all(text in ('True', 'False') for text in present):
+        return [None if text is None else text == 'True' for text in values]
+    if all(_INT.fullmatch(text) for text in present):
+        return [None if text is None else int(text) for text in values]
+    if all(_FLOAT.fullmatch(text) for text in present):
+        return [None if text is None else float(text) for text in values]
+    return values
+
+
+def readWideText(path):
+    """
+    Read a wide CSV file (as written by `saveAsWideText` or `rebuildWideText`)
+    back into typed rows, typing each column as a whole.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        CSV file.
+
+    Returns
+    ==========
+    list of dict
+        One dict per row, without the empty cells.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if header and header[-1] == '':
+            header = header[:-1]  # every line ends with the delimiter
+        lines = list(reader)
+    columns = {
+        name: _textColumn([line[i] if i < len(line) else '' for line in lines])
+        for i, name in enumerate(header)
+    }
+    return [
+        {name: values[n] for name, values in columns.items() if values[n] is not None}
+        for n in range(len(lines))
+    ]
+
+
+def convertToColumnar(path, outPath=None):
+    """
+    Convert a stream file or a wide CSV file to a Parquet file.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        `_stream.jsonl` file written by `StreamingWriter`, or a CSV file.
+    outPath : str or None
+        Parquet file to write, leave as None for `path` with its `_stream.jsonl`
+        or `.csv` ending replaced by `.parquet`.
+    """
+    path = str(path)
+    if path.endswith('_stream.jsonl'):
+        from exptools.streaming import readStream
+        rows = readStream(path)
+        stem = path[:-len('_stream.jsonl')]
+    else:
+        rows = readWideText(path)
+        stem = os.path.splitext(path)[0]
+    return writeColumnar(rows, outPath or stem + '.parquet')
+
+
+def readColumns(path, columns=None):
+    """
+    Read some (or all) columns of a Parquet file, without reading the others.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Parquet file written by this module.
+    columns : list of str or None
+        Columns to read, leave as None for all of them.
+
+    Returns
+    ==========
+    dict
+        Column name to NumPy array (nulls are NaN or None).
+    """
+    import pyarrow.parquet as pq
+    table = pq.read_table(str(path), columns=columns)
+    return {
+        name: table.column(name).to_numpy(zero_copy_only=False)
+        for name in table.column_names
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit('usage: python -m exptools.columnar STREAM.jsonl|DATA.csv [OUT.parquet]')
+    print(convertToColumnar(*sys.argv[1:]))
@@ -0,0 +1,184 @@
+"""
+Compile cache for Builder experiments.
+
+Running a `.psyexp` from the Runner parses the whole XML and generates the
+Python script again on every launch, even when nothing changed. `launch`
+exports the experiment with `exporter.py`, so the script has the exptools
+hooks, and keeps it, and its compiled bytecode, in a `cache` folder next to
+the experiment, under a key made of the SHA-1 of the `.psyexp`, of the local
+modules its Code components import, of the exporter, and the PsychoPy
+version. An unchanged experiment runs straight from the cached bytecode,
+without parsing the XML or compiling Python::
+
+    python -m exptools.compilecache stroop/builder_exp/stroop.psyexp --pilot
+    python -m exptools.compilecache image_stim/builder_exp/image_stim.psyexp --compile-only
+
+The script runs as if it were `<name>_lastrun.py` next to the experiment
+(for its data folder and relative paths), but the `_lastrun.py` file itself is
+left alone. Arguments after the experiment are passed on to the script.
+"""
+import argparse
+import hashlib
+import importlib.util
+import marshal
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from exptools import exporter
+
+# Code component parameters that hold Python code
+_CODE_PARAMS = ('Before Experiment', 'Begin Experiment', 'Begin Routine',
+                'Each Frame', 'End Routine', 'End Experiment')
+_IMPORT = re.compile(r'^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))', re.MULTILINE)
+
+
+def referencedModules(psyexpPath):
+    """
+    Get the local module files the Code components of an experiment import.
+
+    Only modules found next to the experiment are returned, installed
+    packages are covered by the PsychoPy version in the cache key.
+    """
+    psyexpPath = Path(psyexpPath)
+    folder = psyexpPath.parent
+    modules = set()
+    for component in ET.parse(str(psyexpPath)).getroot().iter('CodeComponent'):
+        for param in component.iter('Param'):
+            if param.get('name') not in _CODE_PARAMS or not param.get('val'):
+                continue
+            code = param.get('val').replace('&#10;', '\n')
+            for match in _IMPORT.finditer(code):
+                name = (match.group(1) or match.group(2)).split('.')[0]
+                for candidate in (folder / f'{name}.py', folder / name / '__init__.py'):
+                    if candidate.exists():
+                        modules.add(candidate)
+    return sorted(modules)
+
+
+def cacheKey(psyexpPath, version=None):
+    """
+    Get the cache key of an experiment: a hash of the `.psyexp`, the local
+    modules its Code components import, the exporter and the PsychoPy
+    version (None for the installed one).
+    """
+    if version is None:
+        from psychopy import __version__ as version
+    sha = hashlib.sha1()
+    sha.update(Path(psyexpPath).read_bytes())
+    for module in referencedModules(psyexpPath):
+        sha.update(module.name.encode())
+        sha.update(module.read_bytes())
+    sha.update(Path(exporter.__file__).read_bytes())
+    sha.update(f'psychopy={version}'.encode())
+    return sha.hexdigest()
+
+
+def cachePaths(psyexpPath, key):
+    """
+    Get the cached script and bytecode paths of an experiment for a key.
+    """
+    psyexpPath = Path(psyexpPath)
+    stem = psyexpPath.parent / 'cache' / f'{psyexpPath.stem}_{key[:16]}'
+    return stem.with_suffix('.py'), stem.with_suffix('.bytecode')
+
+
+def scriptPath(psyexpPath):
+    """
+    Get the path the compiled script runs as (`<name>_lastrun.py`).
+    """
+    psyexpPath = Path(psyexpPath).resolve()
+    return psyexpPath.with_name(psyexpPath.stem + '_lastrun.py')
+
+
+def _loadBytecode(path):
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    # bytecode only fits the Python version that wrote it
+    magic = importlib.util.MAGIC_NUMBER
+    if data[:len(magic)] != magic:
+        return None
+    try:
+        return marshal.loads(data[len(magic):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def compileCached(psyexpPath, version=None):
+    """
+    Get the compiled script of an experiment, from the cache if it is
+    unchanged.
+
+    Parameters
+    ==========
+    psyexpPath : str or pathlib.Path
+        The experiment.
+    version : str or None
+        PsychoPy version in the cache key, None for the installed one.
+
+    Returns
+    ==========
+    tuple
+        The code object and whether it came from the cache.
+    """
+    psyexpPath = Path(psyexpPath).resolve()
+    key = cacheKey(psyexpPath, version=version)
+    sourcePath, bytecodePath = cachePaths(psyexpPath, key)
+    code = _loadBytecode(bytecodePath)
+    if code is not None:
+        return code, True
+    if not sourcePath.exists():
+        sourcePath.parent.mkdir(parents=True, exist_ok=True)
+        # drop the scripts of earlier versions of this experiment
+        for old in sourcePath.parent.glob(f'{psyexpPath.stem}_*.*'):
+            if (old.suffix in ('.py', '.bytecode')
+                    and re.fullmatch(re.escape(psyexpPath.stem) + r'_[0-9a-f]{16}', old.stem)):
+                old.unlink()
+        tmp = sourcePath.with_name(f'{sourcePath.stem}.{os.getpid()}.tmp.py')
+        exporter.exportExperiment(psyexpPath, outPath=tmp, originPath=str(scriptPath(psyexpPath)))
+        os.replace(tmp, sourcePath)
+    code = compile(sourcePath.read_text(encoding='utf-8-sig'), str(scriptPath(psyexpPath)), 'exec')
+    tmp = bytecodePath.with_name(f'{bytecodePath.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+    os.replace(tmp, bytecodePath)
+    return code, False
+
+
+def launch(psyexpPath, argv=()):
+    """
+    Run an experiment from its cached compiled script.
+
+    Parameters
+    ==========
+    psyexpPath : str or pathlib.Path
+        The experiment.
+    argv : list of str
+        Arguments for the script (e.g. `['--pilot']`).
+    """
+    t0 = time.perf_counter()
+    code, hit = compileCached(psyexpPath)
+    path = scriptPath(psyexpPath)
+    print(f'{Path(psyexpPath).name}: {"cached" if hit else "compiled"} script ready in '
+          f'{(time.perf_counter() - t0) * 1000:.0f} ms')
+    sys.argv = [str(path)] + list(argv)
+    os.chdir(path.parent)
+    exec(code, {'__name__': '__main__', '__file__': str(path), '__builtins__': __builtins__})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a Builder experiment from its compile cache.')
+    parser.add_argument('experiment', help='.psyexp file')
+    parser.add_argument('--compile-only', action='store_true', help='fill the cache without running')
+    args, scriptArgs = parser.parse_known_args()
+    if args.compile_only:
+        t0 = time.perf_counter()
+        _, hit = compileCached(args.experiment)
+        print(f'{Path(args.experiment).name}: {"already cached" if hit else "compiled"} '
+              f'in {(time.perf_counter() - t0) * 1000:.0f} ms')
+    else:
+        launch(args.experiment, scriptArgs)
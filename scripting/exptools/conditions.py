@@ -0,0 +1,97 @@
+"""
+Cached loading of conditions files.
+
+`data.importConditions` (and `pd.read_csv`) parse the conditions file again on
+every launch, which for long stimulus lists takes a noticeable part of the
+startup time. `loadConditions` keeps the parsed trial list in a small binary
+(pickle) file in a `cache` folder next to the conditions file. The cache is
+used as long as the file's size and modification time are unchanged, or, if
+they changed, its content hash still matches; otherwise the file is parsed
+again with `data.importConditions`. The result is exactly what
+`importConditions` returns: a list of dicts, one per row, for
+`data.TrialHandler(trialList=...)`.
+"""
+import hashlib
+import os
+import pickle
+
+
+def _contentHash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def cachePath(fileName):
+    """
+    Get the path the parsed trial list of a conditions file is cached at.
+    """
+    folder, name = os.path.split(os.path.abspath(fileName))
+    return os.path.join(folder, 'cache', name + '.conditions.pickle')
+
+
+def loadConditions(fileName, selection='', parse=None):
+    """
+    Load a conditions file, from the cache if it is unchanged.
+
+    Parameters
+    ==========
+    fileName : str or pathlib.Path
+        Conditions file (`.csv`, `.xlsx`, ...), as for `data.importConditions`.
+    selection : str or list
+        Rows to select, as for `data.importConditions`.
+    parse : callable or None
+        Function taking `(fileName, selection)` used when the file has to be
+        parsed, leave as None for `data.importConditions`.
+
+    Returns
+    ==========
+    list of dict
+        One dict per row, as returned by `data.importConditions`.
+    """
+    fileName = str(fileName)
+    stat = os.stat(fileName)
+    path = cachePath(fileName)
+    key = {'selection': selection, 'version': _parserVersion(parse)}
+    cached = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception:
+            cached = None  # unreadable cache, parse again
+    if cached is not None and cached['key'] == key:
+        if (cached['size'], cached['mtime']) == (stat.st_size, stat.st_mtime):
+            return cached['trialList']
+        # touched, but maybe not changed
+        sha = _contentHash(fileName)
+        if sha == cached['hash']:
+            _save(path, dict(cached, size=stat.st_size, mtime=stat.st_mtime))
+            return cached['trialList']
+    else:
+        sha = _contentHash(fileName)
+    if parse is None:
+        from psychopy import data
+        trialList = data.importConditions(fileName, selection=selection)
+    else:
+        trialList = parse(fileName, selection)
+    _save(path, {
+        'key': key, 'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': sha,
+        'trialList': trialList,
+    })
+    return trialList
+
+
+def _parserVersion(parse):
+    # a different PsychoPy might parse the same file differently
+    if parse is not None:
+        return getattr(parse, '__qualname__', repr(parse))
+    from psychopy import __version__
+    return __version__
+
+
+def _save(path, entry):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
@@ -0,0 +1,1292 @@
+"""
+Exporting Builder experiments with the exptools hooks.
+
+PsychoPy exports a `.psyexp` to a plain Builder script (from the Builder, the
+Runner, or `psyexpCompile`). `exportExperiment` writes the script from the
+`.psyexp` itself instead, laid out as PsychoPy's export, with the helpers of
+this package built in:
+
+- its Routines run as `routine.Routine` tables on one `RoutineEngine`, which
+  also pauses within a Routine and checks the frame rate between Routines;
+- sound, ioHub and the eyetracker controls are imported lazily;
+- the data rows are streamed to disk (`streaming.py`), converted to Parquet
+  (`columnar.py`) and logged on a background thread (`asynclog.py`), and
+  `print` in code components goes through `asyncPrint`;
+- `--record-frames` records the frame timing, `--pilot --fast-forward` runs the
+  clocks fast;
+- the frame rate is measured once per monitor (`calibration.py`), and one ioHub
+  server is shared by the experiments of a session (`hubpool.py`);
+- conditions files are cached (`conditions.py`), and images named in a
+  conditions column are taken from an image pack (`imagepack.py`), opened by
+  `setupResources()` before the window opens;
+- finished rows are written before Routines that only show shapes.
+
+The `_lastrun.py` scripts in `stroop/builder_exp` and `image_stim/builder_exp`
+are written this way, so they can be written again after the experiment is
+changed in the Builder::
+
+    python -m exptools.exporter stroop/builder_exp/stroop.psyexp
+    python -m exptools.exporter image_stim/builder_exp/image_stim.psyexp
+
+Only the components, loops and settings the experiments use are supported
+(text, polygons, images, keyboards, sliders and code, `TrialHandler` loops, an
+ioHub keyboard and no eyetracker). Anything else raises `ValueError`.
+"""
+import argparse
+import ast
+import datetime
+import re
+import string
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+# visual components and the PsychoPy class each is created as
+_STIMULI = {'TextComponent': 'TextStim', 'PolygonComponent': 'ShapeStim', 'ImageComponent': 'ImageStim'}
+_SUPPORTED = set(_STIMULI) | {'KeyboardComponent', 'SliderComponent', 'CodeComponent', 'RoutineSettingsComponent'}
+# polygon shapes and their `vertices`
+_SHAPES = {'triangle': 'triangle', 'rectangle': 'rectangle', 'circle': 'circle', 'cross': 'cross', 'star': 'star7'}
+# parameters set for each repeat, and their setter
+_SETTERS = {
+    'text': 'setText', 'image': 'setImage', 'pos': 'setPos', 'size': 'setSize', 'ori': 'setOri',
+    'opacity': 'setOpacity', 'letterHeight': 'setHeight', 'color': 'setColor',
+    'fillColor': 'setFillColor', 'lineColor': 'setLineColor',
+}
+_COLORS = ('color', 'fillColor', 'lineColor')
+
+_HEADER = '''\
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+This experiment was created using PsychoPy3 Experiment Builder (v${version}),
+    on ${date}
+and exported with the exptools hooks by `python -m exptools.exporter`.
+If you publish work using this script the most relevant publication is:
+
+    Peirce J, Gray JR, Simpson S, MacAskill M, H\u00f6chenberger R, Sogo H, Kastman E, Lindel\u00f8v JK. (2019)
+        PsychoPy2: Experiments in behavior made easy Behav Res 51: 195.
+        https://doi.org/10.3758/s13428-018-01193-y
+
+"""
+
+# --- Import packages ---
+from psychopy import locale_setup
+from psychopy import prefs
+from psychopy import plugins
+plugins.activatePlugins()
+prefs.hardware['audioLib'] = ${audioLib}
+prefs.hardware['audioLatencyMode'] = ${audioLatency}
+import os  # handy system and path functions
+import sys  # to get file system encoding
+
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from exptools.lazyimport import lazyImport
+# sound, ioHub and the eyetracker controls are only imported when first used
+# (EXPTOOLS_LAZY_IMPORTS=0 imports them here); psychopy.hardware imports the eyetracker
+# controls, and with them the alerts system, so they are deferred before it is imported
+sound = lazyImport('psychopy.sound')
+io = lazyImport('psychopy.iohub')
+lazyImport('psychopy.hardware.eyetracker')
+from psychopy import gui, visual, core, data, event, logging, clock, colors, layout, hardware
+from psychopy.tools import environmenttools
+from psychopy.constants import (NOT_STARTED, STARTED, PLAYING, PAUSED,
+                                STOPPED, FINISHED, PRESSED, RELEASED, FOREVER, priority)
+
+import numpy as np  # whole numpy lib is available, prepend 'np.'
+from numpy import (sin, cos, tan, log, log10, pi, average,
+                   sqrt, std, deg2rad, rad2deg, linspace, asarray)
+from numpy.random import random, randint, normal, shuffle, choice as randchoice
+
+from psychopy.hardware import keyboard
+
+from exptools.frametiming import FrameRecorder, NullFrameRecorder
+from exptools.streaming import StreamingWriter, rebuildWideText
+from exptools.fastforward import fastForwardFromArgs
+from exptools.columnar import convertToColumnar, saveAsColumnar
+from exptools.asynclog import asyncLogFile, asyncPrint
+${packImport}from exptools.conditions import loadConditions
+from exptools.calibration import calibratedFrameRate
+from exptools.hubpool import hubPool
+from exptools.routine import ${routineImports}
+
+${beforeExperiment}# --- Setup global variables (available in all functions) ---
+# create a device manager to handle hardware (keyboards, mice, mirophones, speakers, etc.)
+deviceManager = hardware.DeviceManager()
+# per-frame timing recorder, replaced by a real one in run() when recording frames
+frameRecorder = NullFrameRecorder()
+# crash-safe stream of the data rows, created in setupData()
+streamWriter = None
+${packGlobals}# ensure that relative paths start from the same directory as this script
+_thisDir = os.path.dirname(os.path.abspath(__file__))
+# store info about the experiment session
+psychopyVersion = '${version}'
+expName = '${expName}'  # from the Builder filename that created this script
+# information about this experiment
+expInfo = {
+${expInfo}    'date|hid': data.getDateStr(),
+    'expName|hid': expName,
+    'psychopyVersion|hid': psychopyVersion,
+}
+
+# --- Define some variables which will change depending on pilot mode ---
+\'\'\'
+To run in pilot mode, either use the run/pilot toggle in Builder, Coder and Runner,
+or run the experiment with `--pilot` as an argument. To change what pilot
+#mode does, check out the 'Pilot mode' tab in preferences.
+\'\'\'
+# work out from system args whether we are running in pilot mode
+PILOTING = core.setPilotModeFromArgs()
+# record per-frame timing to a `_frames.npz` sidecar if run with `--record-frames`
+_recordFrames = '--record-frames' in sys.argv
+# in pilot mode, run the clocks faster than real time if run with `--fast-forward[=factor]`
+_fastForward = fastForwardFromArgs() if PILOTING else None
+if _fastForward is not None:
+    expInfo['fastForward|hid'] = _fastForward.factor
+# start off with values from experiment settings
+_fullScr = ${fullScr}
+_winSize = ${winSize}
+_loggingLevel = logging.getLevel('${loggingLevel}')
+# if in pilot mode, apply overrides according to preferences
+if PILOTING:
+    # force windowed mode
+    if prefs.piloting['forceWindowed']:
+        _fullScr = False
+        # set window size
+        _winSize = prefs.piloting['forcedWindowSize']
+    # override logging level
+    _loggingLevel = logging.getLevel(
+        prefs.piloting['pilotLoggingLevel']
+    )
+
+def showExpInfoDlg(expInfo):
+    """
+    Show participant info dialog.
+    Parameters
+    ==========
+    expInfo : dict
+        Information about this experiment.
+
+    Returns
+    ==========
+    dict
+        Information about this experiment.
+    """
+    # show participant info dialog
+    dlg = gui.DlgFromDict(
+        dictionary=expInfo, sortKeys=False, title=expName, alwaysOnTop=True
+    )
+    if dlg.OK == False:
+        core.quit()  # user pressed cancel
+    # return expInfo
+    return expInfo
+
+
+${setupResources}def setupData(expInfo, dataDir=None):
+    """
+    Make an ExperimentHandler to handle trials and saving.
+
+    Parameters
+    ==========
+    expInfo : dict
+        Information about this experiment, created by the `setupExpInfo` function.
+    dataDir : Path, str or None
+        Folder to save the data to, leave as None to create a folder in the current directory.
+    Returns
+    ==========
+    psychopy.data.ExperimentHandler
+        Handler object for this experiment, contains the data to save and information about
+        where to save it to.
+    """
+${setupResourcesCall}    # remove dialog-specific syntax from expInfo
+    for key, val in expInfo.copy().items():
+        newKey, _ = data.utils.parsePipeSyntax(key)
+        expInfo[newKey] = expInfo.pop(key)
+
+    # data file name stem = absolute path + name; later add .psyexp, .csv, .log, etc
+    if dataDir is None:
+        dataDir = _thisDir
+    filename = ${dataFilename}
+    # make sure filename is relative to dataDir
+    if os.path.isabs(filename):
+        dataDir = os.path.commonprefix([dataDir, filename])
+        filename = os.path.relpath(filename, dataDir)
+
+    # an ExperimentHandler isn't essential but helps with data saving
+    thisExp = data.ExperimentHandler(
+        name=expName, version='',
+        extraInfo=expInfo, runtimeInfo=None,
+        originPath=${originPath},
+        savePickle=${savePickle}, saveWideText=${saveWideText},
+        dataFileName=dataDir + os.sep + filename, sortColumns=${sortColumns}
+    )
+${priorities}    # stream every finished row to disk, so a crash doesn't lose the session
+    global streamWriter
+    streamWriter = StreamingWriter(thisExp.dataFileName + '_stream.jsonl').attach(thisExp)
+    # return experiment handler
+    return thisExp
+
+
+def setupLogging(filename):
+    """
+    Setup a log file and tell it what level to log at.
+
+    Parameters
+    ==========
+    filename : str or pathlib.Path
+        Filename to save log file and data files as, doesn't need an extension.
+
+    Returns
+    ==========
+    psychopy.logging.LogFile
+        Text stream to receive inputs from the logging system.
+    """
+    # this outputs to the screen, not a file
+    logging.console.setLevel(_loggingLevel)
+    # save a log file for detail verbose info, written to disk on a background thread
+    logFile = asyncLogFile(filename+'.log', level=_loggingLevel)
+
+    return logFile
+
+
+def setupWindow(expInfo=None, win=None):
+    """
+    Setup the Window
+
+    Parameters
+    ==========
+    expInfo : dict
+        Information about this experiment, created by the `setupExpInfo` function.
+    win : psychopy.visual.Window
+        Window to setup - leave as None to create a new window.
+
+    Returns
+    ==========
+    psychopy.visual.Window
+        Window in which to run this experiment.
+    """
+    if PILOTING:
+        logging.debug('Fullscreen settings ignored as running in pilot mode.')
+
+    if win is None:
+        # if not given a window to setup, make one
+        win = visual.Window(
+            size=_winSize, fullscr=_fullScr, screen=${screen},
+            winType=${winType}, allowStencil=False,
+            monitor=${monitor}, color=${color}, colorSpace=${colorSpace},
+            backgroundImage=${backgroundImage}, backgroundFit=${backgroundFit},
+            blendMode=${blendMode}, useFBO=True,
+            units=${units},
+            checkTiming=False  # we're going to do this ourselves in a moment
+        )
+    else:
+        # if we have a window, just set the attributes which are safe to set
+        win.color = ${color}
+        win.colorSpace = ${colorSpace}
+        win.backgroundImage = ${backgroundImage}
+        win.backgroundFit = ${backgroundFit}
+        win.units = ${units}
+    if expInfo is not None:
+        # get/measure frame rate if not already in expInfo
+        # (measured once per monitor, then reused and checked between Routines)
+        if win._monitorFrameRate is None:
+            calibratedFrameRate(win, infoMsg=${frameRateMsg})
+        expInfo['frameRate'] = win._monitorFrameRate
+    win.mouseVisible = ${mouseVisible}
+    win.hideMessage()
+    # show a visual indicator if we're in piloting mode
+    if PILOTING and prefs.piloting['showPilotingIndicator']:
+        win.showPilotingIndicator()
+
+    return win
+
+
+def setupDevices(expInfo, thisExp, win):
+    """
+    Setup whatever devices are available (mouse, keyboard, speaker, eyetracker, etc.) and add them to
+    the device manager (deviceManager)
+
+    Parameters
+    ==========
+    expInfo : dict
+        Information about this experiment, created by the `setupExpInfo` function.
+    thisExp : psychopy.data.ExperimentHandler
+        Handler object for this experiment, contains the data to save and information about
+        where to save it to.
+    win : psychopy.visual.Window
+        Window in which to run this experiment.
+    Returns
+    ==========
+    bool
+        True if completed successfully.
+    """
+    # --- Setup input devices ---
+    ioConfig = {}
+
+    # Setup iohub keyboard
+    ioConfig['Keyboard'] = dict(use_keymap='psychopy')
+
+    ioSession = '1'
+    if 'session' in expInfo:
+        ioSession = str(expInfo['session'])
+    # reuse the ioHub server of an earlier experiment in this Session, if it is still running
+    ioServer = hubPool.launch(io, window=win, **ioConfig)
+    # store ioServer object in the device manager
+    deviceManager.ioServer = ioServer
+
+    # create a default keyboard (e.g. to check for escape)
+    if deviceManager.getDevice('defaultKeyboard') is None:
+        deviceManager.addDevice(
+            deviceClass='keyboard', deviceName='defaultKeyboard', backend='iohub'
+        )
+${keyboardDevices}    # return True if completed successfully
+    return True
+
+def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
+    """
+    Pause this experiment, preventing the flow from advancing to the next routine until resumed.
+
+    Parameters
+    ==========
+    thisExp : psychopy.data.ExperimentHandler
+        Handler object for this experiment, contains the data to save and information about
+        where to save it to.
+    win : psychopy.visual.Window
+        Window for this experiment.
+    timers : list, tuple
+        List of timers to reset once pausing is finished.
+    playbackComponents : list, tuple
+        List of any components with a `pause` method which need to be paused.
+    """
+    # if we are not paused, do nothing
+    if thisExp.status != PAUSED:
+        return
+
+    # pause any playback components
+    for comp in playbackComponents:
+        comp.pause()
+    # prevent components from auto-drawing
+    win.stashAutoDraw()
+    # make sure we have a keyboard
+    defaultKeyboard = deviceManager.getDevice('defaultKeyboard')
+    if defaultKeyboard is None:
+        defaultKeyboard = deviceManager.addKeyboard(
+            deviceClass='keyboard',
+            deviceName='defaultKeyboard',
+            backend='ioHub',
+        )
+    # run a while loop while we wait to unpause
+    while thisExp.status == PAUSED:
+        # check for quit (typically the Esc key)
+        if defaultKeyboard.getKeys(keyList=['escape']):
+            endExperiment(thisExp, win=win)
+        # flip the screen
+        win.flip()
+    # if stop was requested while paused, quit
+    if thisExp.status == FINISHED:
+        endExperiment(thisExp, win=win)
+    # resume any playback components
+    for comp in playbackComponents:
+        comp.play()
+    # restore auto-drawn components
+    win.retrieveAutoDraw()
+    # reset any timers
+    for timer in timers:
+        timer.reset()
+
+
+def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
+    """
+    Run the experiment flow.
+
+    Parameters
+    ==========
+    expInfo : dict
+        Information about this experiment, created by the `setupExpInfo` function.
+    thisExp : psychopy.data.ExperimentHandler
+        Handler object for this experiment, contains the data to save and information about
+        where to save it to.
+    psychopy.visual.Window
+        Window in which to run this experiment.
+    globalClock : psychopy.core.clock.Clock or None
+        Clock to get global time from - supply None to make a new one.
+    thisSession : psychopy.session.Session or None
+        Handle of the Session object this experiment is being run from, if any.
+    """
+    # mark experiment as started
+    thisExp.status = STARTED
+    # make sure variables created by exec are available globally
+    exec = environmenttools.setExecEnvironment(globals())
+    # get device handles from dict of input devices
+    ioServer = deviceManager.ioServer
+    # get/create a default keyboard (e.g. to check for escape)
+    defaultKeyboard = deviceManager.getDevice('defaultKeyboard')
+    if defaultKeyboard is None:
+        deviceManager.addDevice(
+            deviceClass='keyboard', deviceName='defaultKeyboard', backend='ioHub'
+        )
+    eyetracker = deviceManager.getDevice('eyetracker')
+    # make sure we're running in the directory for this experiment
+    os.chdir(_thisDir)
+    # get filename from ExperimentHandler for convenience
+    filename = thisExp.dataFileName
+    frameTolerance = 0.001  # how close to onset before 'same' frame
+    endExpNow = False  # flag for 'escape' or other condition => quit the exp
+    # get frame duration from frame rate in expInfo
+    if 'frameRate' in expInfo and expInfo['frameRate'] is not None:
+        frameDur = 1.0 / round(expInfo['frameRate'])
+    else:
+        frameDur = 1.0 / 60.0  # could not measure, so guess
+    # start recording frame timing if requested
+    global frameRecorder
+    if _recordFrames:
+        frameRecorder = FrameRecorder(frameDur=frameDur)
+    # from here on the clocks run fast, if piloting with `--fast-forward`
+    if _fastForward is not None:
+        _fastForward.install(win)
+
+    # Start Code - component code to be run after the window creation
+
+${components}    # create some handy timers
+
+    # global clock to track the time since experiment started
+    if globalClock is None:
+        # create a clock if not given one
+        globalClock = core.Clock()
+    if isinstance(globalClock, str):
+        # if given a string, make a clock accoridng to it
+        if globalClock == 'float':
+            # get timestamps as a simple value
+            globalClock = core.Clock(format='float')
+        elif globalClock == 'iso':
+            # get timestamps in ISO format
+            globalClock = core.Clock(format='%Y-%m-%d_%H:%M:%S.%f%z')
+        else:
+            # get timestamps in a custom format
+            globalClock = core.Clock(format=globalClock)
+    if ioServer is not None:
+        ioServer.syncClock(globalClock)
+    logging.setDefaultClock(globalClock)
+    # routine timer to track time remaining of each (possibly non-slip) routine
+    routineTimer = core.Clock()
+    win.flip()  # flip window to reset last flip timer
+    # store the exact time the global clock started
+    expInfo['expStart'] = data.getDateStr(
+        format='%Y-%m-%d %Hh%M.%S.%f %z', fractionalSecondDigits=6
+    )
+
+    # --- Routines: what each one shows and listens for, and when ---
+${routines}    # one frame loop runs them all
+    routines = RoutineEngine(
+        win, thisExp, routineTimer, globalClock, defaultKeyboard,
+        frameRecorder=frameRecorder, frameTolerance=frameTolerance,
+        pauseExperiment=pauseExperiment
+    )
+
+${flow}${endExperimentCode}    # mark experiment as finished
+    endExperiment(thisExp, win=win)
+
+
+def saveData(thisExp):
+    """
+    Save data from this experiment
+
+    Parameters
+    ==========
+    thisExp : psychopy.data.ExperimentHandler
+        Handler object for this experiment, contains the data to save and information about
+        where to save it to.
+    """
+    filename = thisExp.dataFileName
+    # finish the crash-safe stream and rebuild the csv (and a typed parquet file) from it
+    if streamWriter is not None:
+        streamWriter.close()
+        rebuildWideText(streamWriter.path, delim=',')
+        convertToColumnar(streamWriter.path)
+    else:
+        thisExp.saveAsWideText(filename + '.csv', delim=${delim})
+        saveAsColumnar(thisExp)
+    # these shouldn't be strictly necessary (should auto-save)
+    thisExp.saveAsPickle(filename)
+
+
+def endExperiment(thisExp, win=None):
+    """
+    End this experiment, performing final shut down operations.
+
+    This function does NOT close the window or end the Python process - use `quit` for this.
+
+    Parameters
+    ==========
+    thisExp : psychopy.data.ExperimentHandler
+        Handler object for this experiment, contains the data to save and information about
+        where to save it to.
+    win : psychopy.visual.Window
+        Window for this experiment.
+    """
+    if win is not None:
+        # remove autodraw from all current components
+        win.clearAutoDraw()
+        # Flip one final time so any remaining win.callOnFlip()
+        # and win.timeOnFlip() tasks get executed
+        win.flip()
+    # mark experiment handler as finished
+    thisExp.status = FINISHED
+    # write the frame timing sidecar (does nothing unless recording frames)
+    frameRecorder.save(thisExp.dataFileName)
+    # put the real clocks back (does nothing unless fast-forwarding)
+    if _fastForward is not None:
+        _fastForward.uninstall()
+    # shut down eyetracker, if there is one
+    if deviceManager.getDevice('eyetracker') is not None:
+        deviceManager.removeDevice('eyetracker')
+    logging.flush()
+
+
+def quit(thisExp, win=None, thisSession=None):
+    """
+    Fully quit, closing the window and ending the Python process.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window to close.
+    thisSession : psychopy.session.Session or None
+        Handle of the Session object this experiment is being run from, if any.
+    """
+    thisExp.abort()  # or data files will save again on exit
+    # make sure everything is closed down
+    if win is not None:
+        # Flip one final time so any remaining win.callOnFlip()
+        # and win.timeOnFlip() tasks get executed before quitting
+        win.flip()
+        win.close()
+    # shut down eyetracker, if there is one
+    if deviceManager.getDevice('eyetracker') is not None:
+        deviceManager.removeDevice('eyetracker')
+    logging.flush()
+    if thisSession is not None:
+        thisSession.stop()
+    # terminate Python process
+    core.quit()
+
+
+# if running this experiment as a script...
+if __name__ == '__main__':
+    # call all functions in order
+    expInfo = showExpInfoDlg(expInfo=expInfo)
+    thisExp = setupData(expInfo=expInfo)
+    logFile = setupLogging(filename=thisExp.dataFileName)
+    win = setupWindow(expInfo=expInfo)
+    setupDevices(expInfo=expInfo, thisExp=thisExp, win=win)
+    run(
+        expInfo=expInfo,
+        thisExp=thisExp,
+        win=win,
+        globalClock=${clockFormat}
+    )
+    saveData(thisExp=thisExp)
+    quit(thisExp=thisExp, win=win)
+'''
+
+
+class _Component:
+    # a component of a Routine, with its parameters as (value, updates)
+    def __init__(self, element):
+        self.type = element.tag
+        self.name = element.get('name')
+        self.params = {}
+        for param in element.iter('Param'):
+            self.params[param.get('name')] = (param.get('val', '').replace('&#10;', '\n'), param.get('updates'))
+
+    def val(self, name, default=''):
+        return self.params.get(name, (default, None))[0]
+
+    def updates(self, name):
+        return self.params.get(name, ('', None))[1]
+
+    def code(self, name):
+        # Python code of a code component, printing on the logging thread
+        return re.sub(r'\bprint\(', 'asyncPrint(', self.val(name)).strip('\n')
+
+
+class _Experiment:
+    # the parts of a `.psyexp` an export needs
+    def __init__(self, psyexpPath):
+        self.path = Path(psyexpPath)
+        root = ET.parse(str(self.path)).getroot()
+        self.version = root.get('version')
+        self.settings = {param.get('name'): param.get('val', '') for param in root.find('Settings').iter('Param')}
+        self.routines = {}
+        for routine in root.find('Routines'):
+            components = [_Component(element) for element in routine]
+            for component in components:
+                if component.type not in _SUPPORTED:
+                    raise ValueError(f"{component.type} {component.name} in Routine {routine.get('name')} "
+                                     "can't be exported with the exptools hooks")
+            self.routines[routine.get('name')] = [
+                component for component in components
+                if component.type != 'RoutineSettingsComponent' and component.val('disabled') != 'True']
+        self.flow = self._flow(iter(root.find('Flow')))
+
+    def _flow(self, elements, loopName=None):
+        # the flow as routine names and (loop, nested flow) pairs
+        items = []
+        for element in elements:
+            if element.tag == 'Routine':
+                items.append(element.get('name'))
+            elif element.tag == 'LoopInitiator':
+                if element.get('loopType') != 'TrialHandler':
+                    raise ValueError(f"{element.get('loopType')} {element.get('name')} can't be exported")
+                loop = {param.get('name'): param.get('val', '') for param in element.iter('Param')}
+                items.append((loop, self._flow(elements, element.get('name'))))
+            elif element.tag == 'LoopTerminator':
+                if element.get('name') == loopName:
+                    return items
+        return items
+
+    def routineOrder(self):
+        # Routines in the order they first appear in the flow
+        order = []
+
+        def walk(items):
+            for item in items:
+                if isinstance(item, str):
+                    if item not in order:
+                        order.append(item)
+                else:
+                    walk(item[1])
+        walk(self.flow)
+        return order
+
+
+def _num(val):
+    # a number parameter as Builder writes it, None if empty
+    if val.startswith('$'):
+        return val[1:]
+    if not val.strip():
+        return 'None'
+    try:
+        return repr(float(val))
+    except ValueError:
+        return val
+
+
+def _str(val):
+    return val[1:] if val.startswith('$') else repr(val)
+
+
+def _color(val):
+    if val.startswith('$'):
+        return val[1:]
+    if ',' in val:
+        return f'[{val}]'
+    return repr(val)
+
+
+def _initial(component, name, default):
+    # a parameter's value at creation, a default if it is set for each repeat
+    if component.updates(name) not in (None, 'constant', 'None'):
+        return default
+    return component.val(name)
+
+
+def _duration(val):
+    # a duration as the Routine table takes it
+    val = val.strip()
+    if not val:
+        return None
+    if val.startswith('$'):
+        return f'lambda: {val[1:]}'
+    return val
+
+
+def _timing(component):
+    # the start and duration of a component, as Routine table arguments
+    if component.val('startType', 'time (s)') != 'time (s)':
+        raise ValueError(f"{component.name} starts on {component.val('startType')!r}, only 'time (s)' is supported")
+    start = component.val('startVal', '0').strip() or '0'
+    stopType = component.val('stopType', 'duration (s)')
+    stop = component.val('stopVal').strip()
+    if not stop and stopType in ('condition', 'duration (s)', 'time (s)'):
+        duration = None
+    elif stopType == 'duration (s)':
+        duration = _duration(stop)
+    elif stopType == 'time (s)' and not (start + stop).count('$'):
+        duration = repr(float(stop) - float(start))
+    else:
+        raise ValueError(f"{component.name} stops on {stopType!r} {stop!r}, which can't be exported")
+    args = []
+    if start.startswith('$') or float(start) != 0:
+        args.append(f'start={_duration(start)}')
+    if duration is not None:
+        args.append(f'duration={duration}')
+    return args, start, duration
+
+
+def _routineDuration(components):
+    # the fixed duration of a Routine for non-slip timing, None if it can end at any time
+    ends = []
+    for component in components:
+        if component.type == 'CodeComponent':
+            continue
+        if component.type in ('KeyboardComponent', 'SliderComponent') and component.val('forceEndRoutine') == 'True':
+            return None
+        args, start, duration = _timing(component)
+        if duration is None or duration.startswith('lambda') or start.startswith('$'):
+            return None
+        ends.append(float(start) + float(duration))
+    return max(ends) if ends else None
+
+
+def _keyList(val):
+    val = val.strip()
+    if not val:
+        return None
+    if val.startswith('$'):
+        return val[1:]
+    return f'[{val}]'
+
+
+def _conditionColumns(loop):
+    # the columns of a loop's conditions, from the rows stored in the `.psyexp`
+    columns = set()
+    try:
+        tree = ast.parse(loop.get('conditions', ''), mode='eval')
+    except SyntaxError:
+        return columns
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Tuple) and node.elts and isinstance(node.elts[0], ast.Constant):
+            columns.add(node.elts[0].value)
+    return columns
+
+
+def _thisName(loopName):
+    # Builder's name for the current entry of a loop (trials -> thisTrial)
+    name = loopName[:-1] if loopName.endswith('s') else loopName
+    return 'this' + name[0].upper() + name[1:]
+
+
+def _storedNames(code):
+    # names a piece of code assigns to
+    names = set()
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+    return names
+
+
+def _indent(code, prefix):
+    return ''.join(prefix + line + '\n' for line in code.split('\n'))
+
+
+class _Exporter:
+    # writes the script of an experiment, section by section
+    def __init__(self, experiment):
+        self.exp = experiment
+        self.routineOrder = experiment.routineOrder()
+        self.packs = {}  # (conditions file, column) -> name of its image pack
+        self.packed = {}  # image component name -> (pack name, column)
+        self._findPacks(experiment.flow)
+        self.runNames = set()  # names assigned in run(), by Begin/End Routine code
+        for name in self.routineOrder:
+            for component in experiment.routines[name]:
+                if component.type == 'CodeComponent':
+                    for param in ('Begin Experiment', 'Begin Routine', 'End Routine', 'End Experiment'):
+                        if component.code(param).strip():
+                            self.runNames |= _storedNames(component.code(param))
+
+    def _findPacks(self, items, columns=frozenset(), conditionsFile=None):
+        for item in items:
+            if isinstance(item, tuple):
+                loop, nested = item
+                self._findPacks(nested, frozenset(_conditionColumns(loop)), loop.get('conditionsFile'))
+                continue
+            for component in self.exp.routines[item]:
+                image = component.val('image')
+                if (component.type == 'ImageComponent' and component.updates('image') == 'set every repeat'
+                        and image.startswith('$') and image[1:] in columns and conditionsFile):
+                    key = (conditionsFile, image[1:])
+                    pack = self.packs.setdefault(key, f'{image[1:]}Pack')
+                    self.packed[component.name] = (pack, image[1:])
+
+    # --- module level ---
+
+    def beforeExperiment(self):
+        text = ''
+        for name in self.routineOrder:
+            for component in self.exp.routines[name]:
+                if component.type == 'CodeComponent' and component.code('Before Experiment').strip():
+                    text += f"# Run 'Before Experiment' code from {component.name}\n"
+                    text += component.code('Before Experiment') + '\n'
+        return text + '\n' if text else ''
+
+    def packGlobals(self):
+        if not self.packs:
+            return ''
+        images = ', '.join(sorted(self.packed))
+        text = (f'# memory-mapped packs of the images of {images} in the conditions files,\n'
+                '# opened in setupResources()\n')
+        return text + ''.join(f'{pack} = None\n' for pack in self.packs.values())
+
+    def setupResources(self):
+        if not self.packs:
+            return ''
+        names = ', '.join(self.packs.values())
+        text = (
+            'def setupResources():\n'
+            '    """\n'
+            '    Open the memory-mapped packs of the images in the conditions files, building\n'
+            '    them on the first run (or when an image changed), before the window opens.\n'
+            '    Called by `setupData`, or beforehand from any folder or thread (e.g. by a\n'
+            '    battery while the previous experiment runs).\n'
+            '    """\n'
+            f'    global {names}\n'
+        )
+        for (conditionsFile, column), pack in self.packs.items():
+            text += (f'    if {pack} is None:\n'
+                     '        # the image paths start from the experiment\'s folder\n'
+                     f'        {pack} = packConditions(os.path.join(_thisDir, {conditionsFile!r}), '
+                     f'column={column!r}, root=_thisDir)\n')
+        return text + '\n\n'
+
+    def setupResourcesCall(self):
+        if not self.packs:
+            return ''
+        return ('    # open the image packs (unless already open) before the window opens\n'
+                '    setupResources()\n')
+
+    def routineImports(self):
+        names = ['Routine', 'RoutineEngine', 'StimComponent', 'KeyboardComponent', 'SliderComponent']
+        types = {component.type for name in self.routineOrder for component in self.exp.routines[name]}
+        if 'KeyboardComponent' not in types:
+            names.remove('KeyboardComponent')
+        if 'SliderComponent' not in types:
+            names.remove('SliderComponent')
+        return ', '.join(names)
+
+    def expInfo(self):
+        info = ast.literal_eval(self.exp.settings['Experiment info'])
+        text = ''
+        for key, val in info.items():
+            if isinstance(val, str) and re.match(r'''^f(['"]).*\1$''', val):
+                text += f'    {key!r}: {val},\n'  # an f-string, evaluated when the script starts
+            else:
+                text += f'    {key!r}: {val!r},\n'
+        return text
+
+    def priorities(self):
+        priorities = ast.literal_eval(self.exp.settings.get('colPriority') or '{}')
+        return ''.join(f'    thisExp.setPriority({column!r}, {value})\n' for column, value in priorities.items())
+
+    def keyboardDevices(self):
+        text = ''
+        for name in self.routineOrder:
+            for component in self.exp.routines[name]:
+                if component.type == 'KeyboardComponent':
+                    text += (f"    if deviceManager.getDevice({component.name!r}) is None:\n"
+                             f"        # initialise {component.name}\n"
+                             f"        {component.name} = deviceManager.addDevice(\n"
+                             f"            deviceClass='keyboard',\n"
+                             f"            deviceName={component.name!r},\n"
+                             f"        )\n")
+        return text
+
+    # --- run(): creating the components ---
+
+    def components(self):
+        text = ''
+        for name in self.routineOrder:
+            text += f'    # --- Initialize components for Routine "{name}" ---\n'
+            for depth, component in enumerate(self.exp.routines[name]):
+                text += self._create(component, float(-depth))
+            text += '    \n'
+        return text
+
+    def _create(self, c, depth):
+        units = c.val('units', 'from exp settings')
+        unitsArg = '' if units == 'from exp settings' else f'units={units!r}, '
+        if c.type == 'TextComponent':
+            return (f"    {c.name} = visual.TextStim(win=win, name={c.name!r},\n"
+                    f"        text={_str(_initial(c, 'text', ''))},\n"
+                    f"        font={_str(c.val('font'))},\n"
+                    f"        {unitsArg}pos={c.val('pos')}, height={_num(c.val('letterHeight'))}, "
+                    f"wrapWidth={_num(c.val('wrapWidth'))}, ori={_num(c.val('ori'))}, \n"
+                    f"        color={_color(_initial(c, 'color', 'white'))}, colorSpace={c.val('colorSpace')!r}, "
+                    f"opacity={_num(c.val('opacity'))}, \n"
+                    f"        languageStyle={c.val('languageStyle')!r},\n"
+                    f"        depth={depth});\n")
+        if c.type == 'PolygonComponent':
+            shape = c.val('shape')
+            if shape == 'regular polygon...':
+                vertices = c.val('nVertices')
+            elif shape in _SHAPES:
+                vertices = repr(_SHAPES[shape])
+            else:
+                raise ValueError(f'{c.name} is a {shape!r}, which can\'t be exported')
+            return (f"    {c.name} = visual.ShapeStim(\n"
+                    f"        win=win, name={c.name!r},\n"
+                    f"        {unitsArg}size={c.val('size')}, vertices={vertices},\n"
+                    f"        ori={_num(c.val('ori'))}, pos={c.val('pos')}, anchor={c.val('anchor')!r},\n"
+                    f"        lineWidth={_num(c.val('lineWidth'))},     colorSpace={c.val('colorSpace')!r},  "
+                    f"lineColor={_color(_initial(c, 'lineColor', 'white'))}, "
+                    f"fillColor={_color(_initial(c, 'fillColor', 'white'))},\n"
+                    f"        opacity={_num(c.val('opacity'))}, depth={depth}, "
+                    f"interpolate={c.val('interpolate') == 'linear'})\n")
+        if c.type == 'ImageComponent':
+            image = _initial(c, 'image', 'default.png')
+            mask = c.val('mask')
+            return (f"    {c.name} = visual.ImageStim(\n"
+                    f"        win=win,\n"
+                    f"        name={c.name!r}, {unitsArg}\n"
+                    f"        image={_str(image)}, mask={_str(mask) if mask else None}, anchor={c.val('anchor')!r},\n"
+                    f"        ori={_num(c.val('ori'))}, pos={c.val('pos')}, size={c.val('size')},\n"
+                    f"        color={_color(c.val('color'))}, colorSpace={c.val('colorSpace')!r}, "
+                    f"opacity={_num(c.val('opacity'))},\n"
+                    f"        flipHoriz={c.val('flipHoriz')}, flipVert={c.val('flipVert')},\n"
+                    f"        texRes={_num(c.val('texture resolution'))}, "
+                    f"interpolate={c.val('interpolate') == 'linear'}, depth={depth})\n")
+        if c.type == 'SliderComponent':
+            if c.val('storeHistory') == 'True':
+                raise ValueError(f"{c.name} stores its history, which can't be exported")
+            units = None if units == 'from exp settings' else units
+            return (f"    {c.name} = visual.Slider(win=win, name={c.name!r},\n"
+                    f"        startValue={c.val('initVal') or None}, size={c.val('size') or None}, "
+                    f"pos={c.val('pos')}, units={units!r},\n"
+                    f"        labels={c.val('labels') or None}, ticks={c.val('ticks') or None}, "
+                    f"granularity={_num(c.val('granularity'))},\n"
+                    f"        style={c.val('styles')!r}, styleTweaks={c.val('styleTweaks') or ()}, "
+                    f"opacity={_num(c.val('opacity'))},\n"
+                    f"        labelColor={_color(c.val('color'))}, markerColor={_color(c.val('fillColor'))}, "
+                    f"lineColor={_color(c.val('borderColor'))}, colorSpace={c.val('colorSpace')!r},\n"
+                    f"        font={_str(c.val('font'))}, labelHeight={_num(c.val('letterHeight'))},\n"
+                    f"        flip={c.val('flip')}, ori={_num(c.val('ori'))}, depth={int(depth)}, "
+                    f"readOnly={c.val('readOnly')})\n")
+        if c.type == 'KeyboardComponent':
+            if c.val('registerOn', 'press') != 'press':
+                raise ValueError(f"{c.name} registers key releases, which can't be exported")
+            return f"    {c.name} = keyboard.Keyboard(deviceName={c.name!r})\n"
+        if c.type == 'CodeComponent' and c.code('Begin Experiment').strip():
+            return (f"    # Run 'Begin Experiment' code from {c.name}\n"
+                    + _indent(c.code('Begin Experiment'), '    '))
+        return ''
+
+    # --- run(): the Routine tables ---
+
+    def routines(self):
+        text = ''
+        for name in self.routineOrder:
+            components = self.exp.routines[name]
+            specs = []
+            eachFrame = [c for c in components if c.type == 'CodeComponent' and c.code('Each Frame').strip()]
+            if eachFrame:
+                text += self._eachFrame(name, eachFrame)
+            for c in components:
+                if c.type == 'CodeComponent':
+                    continue
+                args, start, duration = _timing(c)
+                if c.type in _STIMULI:
+                    specs.append(f"StimComponent({', '.join([c.name] + args)})")
+                elif c.type == 'KeyboardComponent':
+                    args = [c.name, repr(c.name), f"keyList={_keyList(c.val('allowedKeys'))}"] + args
+                    if c.val('forceEndRoutine') != 'True':
+                        args.append('forceEndRoutine=False')
+                    if c.val('store') != 'last key':
+                        args.append(f"store={c.val('store')!r}")
+                    specs.append(f"KeyboardComponent({', '.join(args)})")
+                else:
+                    args = [c.name] + args
+                    if c.val('forceEndRoutine') != 'True':
+                        args.append('forceEndRoutine=False')
+                    if c.val('storeRating') != 'True':
+                        args.append('storeRating=False')
+                    if c.val('storeRatingTime') != 'True':
+                        args.append('storeRatingTime=False')
+                    specs.append(f"SliderComponent({', '.join(args)})")
+            text += f'    {name} = Routine({name!r}, [\n'
+            text += ''.join(f'        {spec},\n' for spec in specs)
+            options = ''
+            duration = _routineDuration(components)
+            if duration is not None:
+                options += f', duration={duration!r}'
+            if eachFrame:
+                options += f', eachFrame={name}EachFrame'
+            text += f'    ]{options})\n'
+        return text
+
+    def _eachFrame(self, name, components):
+        # the Each Frame code as a function of run(), returning True to end the Routine
+        code = '\n'.join(c.code('Each Frame') for c in components)
+        shared = sorted((_storedNames(code) & self.runNames) - {'continueRoutine'})
+        text = f"    # Run 'Each Frame' code from {', '.join(c.name for c in components)}\n"
+        text += f'    def {name}EachFrame():\n'
+        if shared:
+            text += f"        nonlocal {', '.join(shared)}\n"
+        text += '        continueRoutine = True\n'
+        text += _indent(code, '        ')
+        text += '        return not continueRoutine\n'
+        return text
+
+    # --- run(): the flow ---
+
+    def flow(self):
+        return self._flow(self.exp.flow, '    ', None)
+
+    def _flow(self, items, prefix, loopName):
+        text = ''
+        for item in items:
+            if isinstance(item, str):
+                text += self._runRoutine(item, prefix, loopName)
+            else:
+                text += self._loop(item[0], item[1], prefix)
+        return text
+
+    def _runRoutine(self, name, prefix, loopName):
+        components = self.exp.routines[name]
+        text = f'{prefix}# --- Run Routine "{name}" ---\n'
+        visual = [c for c in components if c.type != 'CodeComponent']
+        if visual and all(c.type == 'PolygonComponent' for c in visual):
+            text += (f'{prefix}# write finished rows in the background while nothing is changing on screen\n'
+                     f'{prefix}if streamWriter is not None:\n'
+                     f'{prefix}    streamWriter.flush()\n')
+        for c in components:
+            if c.type == 'SliderComponent':
+                text += f'{prefix}{c.name}.reset()\n'
+            elif c.type == 'CodeComponent':
+                if c.code('Begin Routine').strip():
+                    text += f"{prefix}# Run 'Begin Routine' code from {c.name}\n"
+                    text += _indent(c.code('Begin Routine'), prefix)
+            else:
+                text += self._setters(c, prefix)
+        handler = f', handler={loopName}' if loopName else ''
+        text += (f'{prefix}if not routines.run({name}{handler}):\n'
+                 f'{prefix}    endExperiment(thisExp, win=win)\n'
+                 f'{prefix}    return\n')
+        for c in components:
+            if c.type == 'CodeComponent' and c.code('End Routine').strip():
+                text += f"{prefix}# Run 'End Routine' code from {c.name}\n"
+                text += _indent(c.code('End Routine'), prefix)
+        if loopName is None:
+            text += f'{prefix}thisExp.nextEntry()\n'
+        return text + f'{prefix}\n'
+
+    def _setters(self, c, prefix):
+        text = ''
+        for param, (val, updates) in c.params.items():
+            if updates in (None, 'None', 'constant', ''):
+                continue
+            if updates != 'set every repeat':
+                raise ValueError(f"{c.name}'s {param} is updated {updates!r}, only 'set every repeat' is supported")
+            method = _SETTERS.get(param)
+            if method is None:
+                raise ValueError(f"{c.name}'s {param} can't be set for each repeat")
+            if c.name in self.packed and param == 'image':
+                pack, column = self.packed[c.name]
+                text += f'{prefix}{c.name}.setImage({pack}.getImage({column}))\n'
+            elif param in _COLORS:
+                text += f"{prefix}{c.name}.{method}({_color(val)}, colorSpace={c.val('colorSpace')!r})\n"
+            elif param == 'text':
+                text += f'{prefix}{c.name}.{method}({_str(val)})\n'
+            else:
+                text += f'{prefix}{c.name}.{method}({val[1:] if val.startswith("$") else val})\n'
+        return text
+
+    def _loop(self, loop, items, prefix):
+        name = loop['name']
+        thisName = _thisName(name)
+        conditionsFile = loop.get('conditionsFile', '')
+        if conditionsFile:
+            selection = loop.get('Selected rows', '')
+            selectionArg = f', selection={selection!r}' if selection else ''
+            trialList = f'loadConditions({conditionsFile!r}{selectionArg})'
+        else:
+            trialList = '[None]'
+        seed = loop.get('random seed', '') or 'None'
+        inner = prefix + '    '
+        text = (f'{prefix}# set up handler to look after randomisation of conditions etc\n'
+                f"{prefix}{name} = data.TrialHandler(nReps={float(loop.get('nReps', '1'))}, "
+                f"method={loop.get('loopType', 'random')!r}, \n"
+                f'{prefix}    extraInfo=expInfo, originPath=-1,\n'
+                f'{prefix}    trialList={trialList},\n'
+                f'{prefix}    seed={seed}, name={name!r})\n'
+                f'{prefix}thisExp.addLoop({name})  # add the loop to the experiment\n'
+                f'{prefix}{thisName} = {name}.trialList[0]  # so we can initialise stimuli with some values\n'
+                f'{prefix}# abbreviate parameter names if possible (e.g. rgb = {thisName}.rgb)\n'
+                f'{prefix}if {thisName} != None:\n'
+                f'{prefix}    for paramName in {thisName}:\n'
+                f'{prefix}        globals()[paramName] = {thisName}[paramName]\n'
+                f'{prefix}\n'
+                f'{prefix}for {thisName} in {name}:\n'
+                f'{inner}currentLoop = {name}\n'
+                f"{inner}thisExp.timestampOnFlip(win, 'thisRow.t', format=globalClock.format)\n"
+                f'{inner}# pause experiment here if requested\n'
+                f'{inner}if thisExp.status == PAUSED:\n'
+                f'{inner}    pauseExperiment(\n'
+                f'{inner}        thisExp=thisExp, \n'
+                f'{inner}        win=win, \n'
+                f'{inner}        timers=[routineTimer], \n'
+                f'{inner}        playbackComponents=[]\n'
+                f'{inner})\n'
+                f'{inner}# abbreviate parameter names if possible (e.g. rgb = {thisName}.rgb)\n'
+                f'{inner}if {thisName} != None:\n'
+                f'{inner}    for paramName in {thisName}:\n'
+                f'{inner}        globals()[paramName] = {thisName}[paramName]\n'
+                f'{inner}\n')
+        text += self._flow(items, inner, name)
+        if loop.get('isTrials', 'True') == 'True':
+            text = text[:-len(f'{inner}\n')] + f'{inner}thisExp.nextEntry()\n{inner}\n'
+        text += (f'{inner}if thisSession is not None:\n'
+                 f'{inner}    # if running in a Session with a Liaison client, send data up to now\n'
+                 f'{inner}    thisSession.sendExperimentData()\n'
+                 f"{prefix}# completed {float(loop.get('nReps', '1'))} repeats of {name!r}\n"
+                 f'{prefix}\n'
+                 f'{prefix}\n')
+        return text
+
+    def endExperimentCode(self):
+        text = ''
+        for name in self.routineOrder:
+            for component in self.exp.routines[name]:
+                if component.type == 'CodeComponent' and component.code('End Experiment').strip():
+                    text += f"    # Run 'End Experiment' code from {component.name}\n"
+                    text += _indent(component.code('End Experiment'), '    ')
+        return text
+
+
+def _checkSettings(settings):
+    # the settings the exported script supports
+    if settings.get('keyboardBackend', 'ioHub') != 'ioHub':
+        raise ValueError(f"the {settings['keyboardBackend']} keyboard backend can't be exported, only ioHub")
+    if settings.get('eyetracker', 'None') != 'None':
+        raise ValueError(f"the {settings['eyetracker']} eyetracker can't be exported")
+    if settings.get('measureFrameRate', 'True') != 'True':
+        raise ValueError("a fixed frame rate can't be exported, the frame rate is always measured")
+
+
+def renderScript(psyexpPath, date=None, originPath=None):
+    """
+    Get the script of a Builder experiment, with the exptools hooks.
+
+    Parameters
+    ==========
+    psyexpPath : str or pathlib.Path
+        The experiment.
+    date : datetime.datetime or None
+        Date of the export in the script's header, None for now.
+    originPath : str or None
+        The `originPath` saved with the data, None for `<name>_lastrun.py`
+        next to the experiment.
+
+    Returns
+    ==========
+    str
+        Source of the script.
+    """
+    experiment = _Experiment(psyexpPath)
+    settings = experiment.settings
+    _checkSettings(settings)
+    exporter = _Exporter(experiment)
+    if date is None:
+        date = datetime.datetime.now()
+    if originPath is None:
+        path = experiment.path.resolve()
+        originPath = str(path.with_name(path.stem + '_lastrun.py'))
+    values = {
+        'version': experiment.version,
+        'date': date.strftime('%B %d, %Y, at %H:%M'),
+        'audioLib': repr(settings.get('Audio lib', 'ptb')),
+        'audioLatency': repr(settings.get('Audio latency priority', '3')),
+        'packImport': 'from exptools.imagepack import packConditions\n' if exporter.packs else '',
+        'routineImports': exporter.routineImports(),
+        'beforeExperiment': exporter.beforeExperiment(),
+        'packGlobals': exporter.packGlobals(),
+        'setupResources': exporter.setupResources(),
+        'setupResourcesCall': exporter.setupResourcesCall(),
+        'expName': settings['expName'],
+        'expInfo': exporter.expInfo(),
+        'fullScr': settings.get('Full-screen window', 'True'),
+        'winSize': settings['Window size (pixels)'],
+        'loggingLevel': settings.get('logging level', 'warning'),
+        'dataFilename': settings['Data filename'],
+        'originPath': repr(originPath),
+        'savePickle': settings.get('Save psydat file', 'True'),
+        'saveWideText': settings.get('Save wide csv file', 'True'),
+        'sortColumns': repr(settings.get('sortColumns', 'time')),
+        'priorities': exporter.priorities(),
+        'screen': int(settings.get('Screen', '1')) - 1,
+        'winType': repr(settings.get('winBackend', 'pyglet')),
+        'monitor': repr(settings.get('Monitor', 'testMonitor')),
+        'color': _color(settings.get('color', '$[0,0,0]')),
+        'colorSpace': repr(settings.get('colorSpace', 'rgb')),
+        'backgroundImage': repr(settings.get('backgroundImg', '')),
+        'backgroundFit': repr(settings.get('backgroundFit', 'none')),
+        'blendMode': repr(settings.get('blendMode', 'avg')),
+        'units': repr(settings.get('Units', 'height')),
+        'frameRateMsg': repr(settings.get('frameRateMsg', '')),
+        'mouseVisible': settings.get('Show mouse', 'False'),
+        'keyboardDevices': exporter.keyboardDevices(),
+        'components': exporter.components(),
+        'routines': exporter.routines(),
+        'flow': exporter.flow(),
+        'endExperimentCode': exporter.endExperimentCode(),
+        'delim': repr(settings.get('Data file delimiter', 'auto')),
+        'clockFormat': repr(settings.get('clockFormat', 'float')),
+    }
+    # without the trailing whitespace of Builder's templates
+    source = re.sub(r'[ \t]+\n', '\n', string.Template(_HEADER).substitute(values))
+    compile(source, str(originPath), 'exec')  # raises if the code components don't fit
+    return source
+
+
+def exportExperiment(psyexpPath, outPath=None, date=None, originPath=None):
+    """
+    Export a Builder experiment to a script with the exptools hooks.
+
+    Parameters
+    ==========
+    psyexpPath : str or pathlib.Path
+        The experiment.
+    outPath : str or pathlib.Path or None
+        Script to write, None for `<name>_lastrun.py` next to the experiment.
+    date, originPath
+        As for `renderScript`, `originPath` defaults to `outPath`.
+
+    Returns
+    ==========
+    pathlib.Path
+        The script written.
+    """
+    psyexpPath = Path(psyexpPath)
+    if outPath is None:
+        outPath = psyexpPath.with_name(psyexpPath.stem + '_lastrun.py')
+    outPath = Path(outPath)
+    if originPath is None:
+        originPath = str(outPath.resolve())
+    source = renderScript(psyexpPath, date=date, originPath=originPath)
+    with open(outPath, 'w', encoding='utf-8-sig', newline='\n') as f:
+        f.write(source)
+    return outPath
+
+
+def readHeader(scriptPath):
+    """
+    Get the export date and `originPath` of an exported script, to export it
+    again as it was.
+    """
+    source = Path(scriptPath).read_text(encoding='utf-8-sig')
+    date = re.search(r'^    on (.+, at \d\d:\d\d)$', source, re.MULTILINE).group(1)
+    originPath = re.search(r'^        originPath=(.+),$', source, re.MULTILINE).group(1)
+    return datetime.datetime.strptime(date, '%B %d, %Y, at %H:%M'), ast.literal_eval(originPath)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export Builder experiments with the exptools hooks.')
+    parser.add_argument('experiment', help='.psyexp file')
+    parser.add_argument('--out', help='script to write (default: <name>_lastrun.py next to the experiment)')
+    parser.add_argument('--keep-header', action='store_true',
+                        help="keep the export date and originPath of the script it replaces")
+    args = parser.parse_args()
+    date = originPath = None
+    out = Path(args.out) if args.out else Path(args.experiment).with_name(Path(args.experiment).stem + '_lastrun.py')
+    if args.keep_header and out.exists():
+        date, originPath = readHeader(out)
+    print(f'wrote {exportExperiment(args.experiment, out, date=date, originPath=originPath)}')
@@ -0,0 +1,132 @@
+"""
+Fast-forward pilot mode.
+
+Piloting a Builder experiment normally means sitting through every fixation,
+ISI and timed routine in real time. In fast-forward mode the experiment's
+clocks run `factor` times faster than real time and `core.wait` returns at
+once, having moved the clocks on by the time it was asked to wait. All the
+clocks (`globalClock`, `routineTimer`, flip times, key times) stay on the same
+virtual timebase, so the timing columns in the data still add up, only
+compressed.
+
+Run a Builder script in pilot mode with `--fast-forward` (60x, so a
+40-minute protocol takes 40 s) or e.g. `--fast-forward=10`. The window still
+flips at its real rate, so at 60x each frame covers a whole second of
+experiment time: stimuli shorter than that are shown for one frame. Use a
+lower factor to see them.
+"""
+import copy
+import sys
+
+
+class FastForward:
+    """
+    Run the PsychoPy clocks faster than real time.
+
+    Parameters
+    ==========
+    factor : float
+        How many seconds of experiment time pass per real second.
+    """
+
+    def __init__(self, factor=60.0):
+        self.factor = float(factor)
+        self.skipped = 0.0  # total time skipped by core.wait
+        self._patched = []
+        self._realTime = None
+
+    def getTime(self):
+        """
+        Get the current (virtual) time, replaces `core.getTime`.
+        """
+        real = self._realTime()
+        return self._virtual0 + (real - self._real0) * self.factor + self.skipped
+
+    def wait(self, secs, hogCPUperiod=0.2):
+        """
+        Skip `secs` seconds of experiment time at once, replaces `core.wait`.
+        """
+        if secs > 0:
+            self.skipped += secs
+
+    def toVirtual(self, realTime):
+        """
+        Convert a recent real timestamp (e.g. of a key event) to virtual time.
+        """
+        return self.getTime() - (self._realTime() - realTime) * self.factor
+
+    def install(self, win=None):
+        """
+        Start running the clocks fast, from the current time on. Does nothing
+        if they already are.
+
+        Parameters
+        ==========
+        win : psychopy.visual.Window or None
+            Window to scale the frame period of, so that `getFutureFlipTime`
+            still predicts the next flip. Its frame rate should already be
+            measured, as measuring it now would give the virtual rate.
+        """
+        if self._patched:
+            return self
+        from psychopy import clock, core
+        from psychopy.hardware import keyboard
+        self._realTime = clock.getTime
+        self._real0 = self._virtual0 = self._realTime()
+        for module in (clock, core):
+            self._patch(module, 'getTime', self.getTime)
+            self._patch(module, 'wait', self.wait)
+        # key events are timestamped by the backend in real time
+        getKeys = keyboard.Keyboard.getKeys
+        fastForward = self
+
+        def getVirtualKeys(kb, *args, **kwargs):
+            # the keyboard can hand out the same KeyPress again (e.g. to add its
+            # duration), so convert copies and leave its own in real time
+            keys = [copy.copy(key) for key in getKeys(kb, *args, **kwargs)]
+            toClock = kb.clock.getTime() - fastForward.getTime()
+            for key in keys:
+                key.tDown = fastForward.toVirtual(key.tDown)
+                key.rt = key.tDown + toClock
+            return keys
+        self._patch(keyboard.Keyboard, 'getKeys', getVirtualKeys)
+        if win is not None:
+            self._patch(win, 'monitorFramePeriod', win.monitorFramePeriod * self.factor)
+        return self
+
+    def uninstall(self):
+        """
+        Put the real clocks (and the window's frame period) back. Does nothing
+        if they aren't running fast.
+        """
+        for target, name, original in reversed(self._patched):
+            setattr(target, name, original)
+        self._patched = []
+
+    def _patch(self, target, name, value):
+        self._patched.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+
+def fastForwardFromArgs(argv=None, default=60.0):
+    """
+    Get a `FastForward` if the script was run with `--fast-forward[=factor]`.
+
+    Parameters
+    ==========
+    argv : list of str or None
+        Arguments to look in, `sys.argv` if None.
+    default : float
+        Factor to use if none is given.
+
+    Returns
+    ==========
+    FastForward or None
+        Not installed yet, call `install` once the window is set up.
+    """
+    for arg in (sys.argv if argv is None else argv):
+        if arg == '--fast-forward':
+            return FastForward(default)
+        if arg.startswith('--fast-forward='):
+            return FastForward(float(arg.split('=', 1)[1]))
+    return None
@@ -0,0 +1,223 @@
+"""
+Opt-in per-frame timing recorder for the Builder routine loops.
+
+Every frame stores the flip-to-flip interval, the time spent updating
+components before the flip and the routine it belongs to, in preallocated
+NumPy ring buffers. At the end of the experiment the buffers are written to a
+`<dataFileName>_frames.npz` sidecar, which can be summarised with::
+
+    python -m exptools.frametiming data/<participant>_stroop_<date>_frames.npz
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+
+
+class FrameRecorder:
+    """
+    Record frame intervals and component update times per routine.
+
+    Call `startRoutine` when a routine is prepared, `startFrame` at the top of
+    each frame, `endUpdates` right before `win.flip()` and `flipped` right
+    after it.
+
+    Parameters
+    ==========
+    frameDur : float
+        Expected duration of one frame in seconds.
+    capacity : int
+        Number of frames kept in the ring buffers; once full, the oldest frames
+        are overwritten (per-routine counts are kept for all frames).
+    dropTolerance : float
+        A flip interval longer than `dropTolerance * frameDur` counts as
+        dropped frames.
+    """
+
+    def __init__(self, frameDur=1 / 60.0, capacity=2 ** 18, dropTolerance=1.5):
+        self.frameDur = frameDur
+        self.capacity = capacity
+        self.dropTolerance = dropTolerance
+        self.nFrames = 0
+        self.routineNames = []
+        # preallocate everything the frame loop writes to
+        self._interval = np.full(capacity, np.nan, dtype=np.float32)
+        self._update = np.zeros(capacity, dtype=np.float32)
+        self._routine = np.zeros(capacity, dtype=np.uint16)
+        self._routineIds = {}
+        self._routineFrames = []
+        self._routineDropped = []
+        self._routineId = self._addRoutine('')  # frames before the first routine
+        self._frameStart = None
+        self._updateDur = 0.0
+        self._lastFlip = None
+
+    def _addRoutine(self, name):
+        self._routineIds[name] = len(self.routineNames)
+        self.routineNames.append(name)
+        self._routineFrames.append(0)
+        self._routineDropped.append(0)
+        return self._routineIds[name]
+
+    def startRoutine(self, name):
+        """
+        Attribute the following frames to the routine called `name`.
+        """
+        routineId = self._routineIds.get(name)
+        if routineId is None:
+            routineId = self._addRoutine(name)
+        self._routineId = routineId
+        # nothing flips between routines (saving, loading the next trial), so
+        # that gap is not a frame interval and must not count as dropped frames
+        self._lastFlip = None
+
+    def startFrame(self):
+        """
+        Mark the start of this frame's component updates.
+        """
+        self._frameStart = perf_counter()
+
+    def endUpdates(self):
+        """
+        Mark the end of this frame's component updates (just before flipping).
+        """
+        if self._frameStart is not None:
+            self._updateDur = perf_counter() - self._frameStart
+
+    def flipped(self):
+        """
+        Record the frame which was just flipped.
+        """
+        now = perf_counter()
+        i = self.nFrames % self.capacity
+        routineId = self._routineId
+        if self._lastFlip is not None:
+            interval = now - self._lastFlip
+            self._interval[i] = interval
+            if interval > self.dropTolerance * self.frameDur:
+                self._routineDropped[routineId] += int(round(interval / self.frameDur)) - 1
+        else:
+            self._interval[i] = np.nan
+        self._update[i] = self._updateDur
+        self._routine[i] = routineId
+        self._routineFrames[routineId] += 1
+        self.nFrames += 1
+        self._lastFlip = now
+
+    def frames(self):
+        """
+        Get the recorded frames in the order they were flipped.
+
+        Returns
+        ==========
+        dict
+            Arrays of `interval`, `update` and `routine` (index into
+            `routineNames`) for each frame still held in the ring buffers.
+        """
+        n = min(self.nFrames, self.capacity)
+        order = np.arange(self.nFrames - n, self.nFrames) % self.capacity
+        return {
+            'interval': self._interval[order],
+            'update': self._update[order],
+            'routine': self._routine[order],
+        }
+
+    def save(self, filename):
+        """
+        Write the recorded frames to a binary sidecar file.
+
+        Parameters
+        ==========
+        filename : str
+            Data file name stem (e.g. `thisExp.dataFileName`), `_frames.npz`
+            is appended to it.
+
+        Returns
+        ==========
+        str
+            Path of the file written.
+        """
+        path = filename + '_frames.npz'
+        np.savez(
+            path,
+            routineNames=np.array(self.routineNames),
+            routineFrames=np.array(self._routineFrames, dtype=np.int64),
+            routineDropped=np.array(self._routineDropped, dtype=np.int64),
+            frameDur=np.float64(self.frameDur),
+            overwritten=np.int64(max(0, self.nFrames - self.capacity)),
+            **self.frames()
+        )
+        return path
+
+
+class NullFrameRecorder:
+    """
+    Stand-in for `FrameRecorder` when frame timing is not being recorded.
+    """
+
+    def startRoutine(self, name):
+        pass
+
+    def startFrame(self):
+        pass
+
+    def endUpdates(self):
+        pass
+
+    def flipped(self):
+        pass
+
+    def save(self, filename):
+        return None
+
+
+def summarise(path):
+    """
+    Summarise a `_frames.npz` sidecar per routine.
+
+    Parameters
+    ==========
+    path : str
+        Sidecar file written by `FrameRecorder.save`.
+
+    Returns
+    ==========
+    list of dict
+        One entry per routine with frame and dropped-frame counts, and the
+        mean and maximum update time and flip interval (in ms).
+    """
+    with np.load(path) as sidecar:
+        names = sidecar['routineNames']
+        frameCounts = sidecar['routineFrames']
+        dropped = sidecar['routineDropped']
+        interval = sidecar['interval']
+        update = sidecar['update']
+        routine = sidecar['routine']
+    rows = []
+    for routineId, name in enumerate(names):
+        if not frameCounts[routineId]:
+            continue
+        these = routine == routineId
+        intervals = interval[these]
+        intervals = intervals[~np.isnan(intervals)]
+        rows.append({
+            'routine': str(name) or '(none)',
+            'frames': int(frameCounts[routineId]),
+            'dropped': int(dropped[routineId]),
+            'meanUpdateMs': float(update[these].mean() * 1000) if these.any() else np.nan,
+            'maxUpdateMs': float(update[these].max() * 1000) if these.any() else np.nan,
+            'meanIntervalMs': float(intervals.mean() * 1000) if intervals.size else np.nan,
+            'maxIntervalMs': float(intervals.max() * 1000) if intervals.size else np.nan,
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    for sidecarPath in sys.argv[1:]:
+        print(sidecarPath)
+        print(f"{'routine':<16}{'frames':>8}{'dropped':>9}{'upd ms':>9}{'max upd':>9}"
+              f"{'ifi ms':>9}{'max ifi':>9}")
+        for row in summarise(sidecarPath):
+            print(f"{row['routine']:<16}{row['frames']:>8}{row['dropped']:>9}"
+                  f"{row['meanUpdateMs']:>9.3f}{row['maxUpdateMs']:>9.3f}"
+                  f"{row['meanIntervalMs']:>9.3f}{row['maxIntervalMs']:>9.3f}")
@@ -0,0 +1,736 @@
+"""
+Headless runs with simulated participants.
+
+Runs any experiment in this folder without a display, a GPU or a person at
+the keyboard. While a `HeadlessSession` is installed:
+
+- time is virtual: `core.getTime`, every `core.Clock` and `core.wait` use a
+  `VirtualClock`, which only moves forward on `win.flip()`, `core.wait()`,
+  key polls and key waits, so a whole session runs in milliseconds;
+- windows and stimuli are stand-ins that accept every call and draw nothing,
+  and no ioHub server is started;
+- a `SimulatedParticipant` answers `event.getKeys`/`waitKeys`,
+  `keyboard.Keyboard`, `RatingScale`, `Slider` and the dialogs, with scripted
+  or randomly drawn keys, ratings and response times. A key press arrives an
+  RT after the experiment first asks for one, whether it polls or waits.
+
+Run a script or a Builder experiment from the command line::
+
+    python -m exptools.headless stroop/scripting/stroop.py --sessions 20
+    python -m exptools.headless stroop/builder_exp/stroop_lastrun.py
+
+The data files are written to the experiment's `data` folder as usual, so they
+can be checked in regression tests.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import runpy
+import sys
+import time
+from pathlib import Path
+
+_MISSING = object()
+_session = None  # the installed HeadlessSession
+
+
+class VirtualClock:
+    """
+    A time source that only moves forward when told to.
+
+    Parameters
+    ==========
+    start : float
+        Initial time in seconds. Starting from the real time keeps clocks
+        created before the session was installed consistent.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def getTime(self):
+        return self.now
+
+    def advance(self, secs):
+        if secs > 0:
+            self.now += secs
+
+    def advanceTo(self, t):
+        if t > self.now:
+            self.now = t
+
+    def wait(self, secs, hogCPUperiod=0.2):
+        # signature of core.wait
+        self.advance(secs)
+
+
+class SimulatedParticipant:
+    """
+    Decides which keys a simulated participant presses, and when.
+
+    Parameters
+    ==========
+    info : dict
+        Values to fill into dialogs, e.g. `{'participant': 'sim01'}`.
+    keys : list of str or None
+        Keys to press in order, each response takes the next one that is
+        allowed. Once used up (or if None) keys are drawn at random from the
+        allowed keys.
+    ratings : list or None
+        Ratings to give in order, random within the scale once used up.
+    rtMean, rtSD, rtMin : float
+        Response times (s) are drawn from a normal distribution clipped at
+        `rtMin`.
+    anyKeys : list of str
+        Keys to choose from when any key is accepted.
+    seed : int or None
+        Seed for the random choices.
+    """
+
+    def __init__(self, info=None, keys=None, ratings=None, rtMean=0.6, rtSD=0.15,
+                 rtMin=0.15, anyKeys=('space',), seed=None):
+        self.info = dict(info or {})
+        self.keys = list(keys or [])
+        self.ratings = list(ratings or [])
+        self.rtMean = rtMean
+        self.rtSD = rtSD
+        self.rtMin = rtMin
+        self.anyKeys = list(anyKeys)
+        self.rng = random.Random(seed)
+        self.nResponses = 0
+
+    def drawRT(self):
+        return max(self.rtMin, self.rng.gauss(self.rtMean, self.rtSD))
+
+    def chooseKey(self, keyList=None):
+        """
+        Pick the key to press, or None if only 'escape' would be allowed.
+        """
+        allowed = [key for key in (keyList or self.anyKeys) if key != 'escape']
+        if not allowed:
+            return None
+        for i, key in enumerate(self.keys):
+            if key in allowed:
+                return self.keys.pop(i)
+        return self.rng.choice(allowed)
+
+    def chooseRating(self, low, high):
+        self.nResponses += 1
+        if self.ratings:
+            return self.ratings.pop(0)
+        return self.rng.randint(low, high)
+
+
+def _asKeyList(keyList):
+    if keyList is not None and not isinstance(keyList, (list, tuple)):
+        return [keyList]
+    return keyList
+
+
+class _KeyQueue:
+    """
+    Key presses of one keyboard. The first time a key is asked for, the
+    participant decides which key they will press and when (after an RT from
+    then). The press only arrives once virtual time reaches it: every poll takes
+    `HeadlessSession.pollCost` seconds, and a blocking wait moves time on to the
+    press, or by `maxWait` if the press would come later.
+    """
+
+    def __init__(self):
+        self.pending = []  # (time, key) of presses the participant has planned
+
+    def clear(self):
+        # presses that have happened are dropped, planned ones are still to come
+        self.pending = [(t, key) for t, key in self.pending if t > _session.clock.now]
+
+    def _plan(self, keyList):
+        # make sure the participant will press one of `keyList`
+        if any(keyList is None or key in keyList for t, key in self.pending):
+            return
+        key = _session.participant.chooseKey(keyList)
+        if key is not None:
+            self.pending.append((_session.clock.now + _session.participant.drawRT(), key))
+            self.pending.sort()
+
+    def _takeDue(self, keyList):
+        due = [(t, key) for t, key in self.pending
+               if t <= _session.clock.now and (keyList is None or key in keyList)]
+        self.pending = [press for press in self.pending if press not in due]
+        _session.participant.nResponses += len(due)
+        return due
+
+    def poll(self, keyList):
+        """
+        Get the (time, key) presses allowed by `keyList` that have happened by
+        now, as `getKeys` would.
+        """
+        keyList = _asKeyList(keyList)
+        self._plan(keyList)
+        _session.clock.advance(_session.pollCost)
+        return self._takeDue(keyList)
+
+    def wait(self, keyList, maxWait=float('inf')):
+        """
+        Wait for a press allowed by `keyList`, for at most `maxWait` seconds, as
+        `waitKeys` would.
+        """
+        keyList = _asKeyList(keyList)
+        self._plan(keyList)
+        deadline = _session.clock.now + maxWait
+        allowed = [t for t, key in self.pending if keyList is None or key in keyList]
+        if allowed and allowed[0] <= deadline:
+            _session.clock.advanceTo(allowed[0])
+        elif deadline < float('inf'):
+            _session.clock.advanceTo(deadline)
+        return self._takeDue(keyList)
+
+
+class HeadlessKeyPress:
+    """
+    Stand-in for `keyboard.KeyPress`.
+    """
+
+    def __init__(self, name, tDown, rt):
+        self.name = self.value = name
+        self.tDown = tDown
+        self.rt = rt
+        self.duration = None
+
+
+class HeadlessKeyboard:
+    """
+    Stand-in for `keyboard.Keyboard`, answered by the simulated participant.
+    """
+
+    def __init__(self, *args, **kwargs):
+        from psychopy import core
+        self.name = kwargs.get('deviceName', '')
+        self.clock = core.Clock()
+        self.status = None
+        self._queue = _KeyQueue()
+
+    def _keyPresses(self, presses):
+        toClock = self.clock.getTime() - _session.clock.now
+        return [HeadlessKeyPress(key, t, t + toClock) for t, key in presses]
+
+    def getKeys(self, keyList=None, ignoreKeys=None, waitRelease=True, clear=True):
+        return self._keyPresses(self._queue.poll(keyList))
+
+    def waitKeys(self, maxWait=float('inf'), keyList=None, waitRelease=True, clear=True):
+        if clear:
+            self._queue.clear()
+        return self._keyPresses(self._queue.wait(keyList, maxWait)) or None
+
+    def clearEvents(self, eventType=None):
+        self._queue.clear()
+
+
+class HeadlessDeviceManager:
+    """
+    Stand-in for `hardware.DeviceManager`, every device is a `HeadlessKeyboard`.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.ioServer = None
+
+    def getDevice(self, deviceName):
+        return self.devices.get(deviceName)
+
+    def addDevice(self, deviceClass=None, deviceName='', **kwargs):
+        self.devices[deviceName] = HeadlessKeyboard(deviceName=deviceName)
+        return self.devices[deviceName]
+
+    addKeyboard = addDevice
+
+    def removeDevice(self, deviceName):
+        self.devices.pop(deviceName, None)
+
+
+class HeadlessIoServer:
+    """
+    Stand-in for the ioHub server connection that `io.launchHubServer` (and
+    `hubPool.launch`) would start in a separate process.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.devices = {}
+
+    def getTime(self):
+        return _session.clock.now
+
+    def getDevice(self, name):
+        return self.devices.get(name)
+
+    def syncClock(self, clock):
+        pass
+
+    def clearEvents(self, device_label='all'):
+        pass
+
+    def quit(self):
+        pass
+
+
+class _AtExit:
+    # stand-in for the `atexit` module, keeping the calls for the end of the script
+    def __init__(self):
+        self.calls = []
+
+    def register(self, function, *args, **kwargs):
+        self.calls.append((function, args, kwargs))
+        return function
+
+    def unregister(self, function):
+        self.calls = [call for call in self.calls if call[0] != function]
+
+    def run(self):
+        calls, self.calls = self.calls, []
+        for function, args, kwargs in reversed(calls):
+            function(*args, **kwargs)
+
+
+class HeadlessStim:
+    """
+    Stand-in for any visual stimulus: it keeps the attributes it is given and
+    every `set...`/`draw` call does nothing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        from psychopy.constants import NOT_STARTED
+        self.__dict__.update(kwargs)
+        self.autoDraw = False
+        self.status = NOT_STARTED  # as PsychoPy's stimuli start out
+
+    def draw(self, win=None):
+        pass
+
+    def setAutoDraw(self, value, log=None):
+        self.autoDraw = value
+
+    def __getattr__(self, name):
+        if name.startswith(('set', 'update', 'reset')):
+            return lambda *args, **kwargs: None
+        raise AttributeError(name)
+
+
+class HeadlessRatingScale(HeadlessStim):
+    """
+    Stand-in for `visual.RatingScale`, the participant answers after an RT
+    drawn on the first `draw()` after `reset()`.
+    """
+
+    def __init__(self, win=None, low=1, high=7, maxTime=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.low, self.high, self.maxTime = low, high, maxTime
+        self.reset()
+
+    def reset(self):
+        self.noResponse = True
+        self._due = None
+        self._rating = self._rt = None
+
+    def draw(self, win=None):
+        now = _session.clock.now
+        if self._due is None:
+            self._onset = now
+            rt = _session.participant.drawRT()
+            if self.maxTime and rt > self.maxTime:
+                rt, self._rating = self.maxTime, None  # timed out
+            else:
+                self._rating = _session.participant.chooseRating(self.low, self.high)
+            self._due, self._rt = now + rt, rt
+        if self.noResponse and now >= self._due:
+            self.noResponse = False
+
+    def getRating(self):
+        return self._rating
+
+    def getRT(self):
+        return self._rt
+
+
+class HeadlessSlider(HeadlessStim):
+    """
+    Stand-in for `visual.Slider`, whose marker is moved by the experiment's
+    own key handling.
+    """
+
+    def __init__(self, win=None, ticks=(1, 2, 3, 4, 5), startValue=None, **kwargs):
+        super().__init__(**kwargs)
+        self.ticks = ticks
+        self.startValue = startValue
+        self.reset()
+
+    def reset(self):
+        self.markerPos = self.startValue
+        self.rating = None
+
+    def getRating(self):
+        return self.markerPos
+
+    def getRT(self):
+        return None
+
+
+class HeadlessWindow:
+    """
+    Stand-in for `visual.Window`: flipping moves the virtual clock on to the
+    next frame and runs the `callOnFlip`/`timeOnFlip` tasks.
+
+    Parameters
+    ==========
+    frameRate : float
+        Simulated refresh rate (Hz).
+    """
+
+    def __init__(self, size=(800, 600), *args, frameRate=60.0, **kwargs):
+        self.size = list(size)
+        self.units = kwargs.get('units', 'norm')
+        self.color = kwargs.get('color', (0, 0, 0))
+        self.colorSpace = 'rgb'
+        self.backgroundImage = self.backgroundFit = None
+        self.mouseVisible = True
+        self.recordFrameIntervals = False
+        self.frameIntervals = []
+        self._monitorFrameRate = frameRate
+        self.monitorFramePeriod = 1.0 / frameRate
+        self.nFlips = 0
+        self.lastFrameT = _session.clock.now
+        self._toCall = []
+        self._autoDraw = []
+
+    def _nextFlip(self):
+        period = self.monitorFramePeriod
+        return (int(_session.clock.now / period) + 1) * period
+
+    def flip(self, clearBuffer=True):
+        _session.clock.advanceTo(self._nextFlip())
+        now = _session.clock.now
+        if self.recordFrameIntervals:
+            self.frameIntervals.append(now - self.lastFrameT)
+        self.lastFrameT = now
+        self.nFlips += 1
+        toCall, self._toCall = self._toCall, []
+        for function, args, kwargs in toCall:
+            function(*args, **kwargs)
+        return now
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self._toCall.append((function, args, kwargs))
+
+    def timeOnFlip(self, obj, attrib, format=float):
+        self.callOnFlip(self._assignFlipTime, obj, attrib)
+
+    def _assignFlipTime(self, obj, attrib):
+        # an attribute of obj, or a key of a dict (e.g. a component's timestamps)
+        if isinstance(obj, dict) and not hasattr(obj, attrib):
+            obj[attrib] = _session.clock.now
+        else:
+            setattr(obj, attrib, _session.clock.now)
+
+    def getFutureFlipTime(self, targetTime=0, clock=None, format=None):
+        nextFlip = self._nextFlip() + targetTime
+        if clock == 'now':
+            return nextFlip - _session.clock.now
+        if clock is None:
+            return nextFlip
+        return clock.getTime() + nextFlip - _session.clock.now
+
+    def getActualFrameRate(self, *args, **kwargs):
+        return self._monitorFrameRate
+
+    def stashAutoDraw(self):
+        pass
+
+    def retrieveAutoDraw(self):
+        pass
+
+    def clearAutoDraw(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith(('show', 'hide', 'set', 'dispatch')):
+            return lambda *args, **kwargs: None
+        raise AttributeError(name)
+
+
+class HeadlessDlg:
+    """
+    Stand-in for `gui.Dlg`: every field gets the participant's value, or its
+    first choice / initial value.
+    """
+
+    def __init__(self, title='', *args, **kwargs):
+        self.data = {}
+        self.OK = True
+
+    def addField(self, key, initial='', choices=None, **kwargs):
+        value = choices[0] if choices else initial
+        self.data[key] = _session.participant.info.get(key.rstrip(':'), value)
+
+    def addText(self, *args, **kwargs):
+        pass
+
+    def show(self):
+        return self.data
+
+
+class HeadlessDlgFromDict:
+    """
+    Stand-in for `gui.DlgFromDict`, filling the dict from the participant's info.
+    """
+
+    def __init__(self, dictionary, *args, **kwargs):
+        for key in dictionary:
+            if key in _session.participant.info:
+                dictionary[key] = _session.participant.info[key]
+        self.dictionary = dictionary
+        self.data = list(dictionary.values())
+        self.OK = True
+
+
+class _HeadlessMonitor:
+    # what screeninfo.get_monitors() returns
+    def __init__(self, width, height):
+        self.name, self.x, self.y = 'headless', 0, 0
+        self.width, self.height = width, height
+
+
+def _importVisual():
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        # no window is ever opened, but pyglet needs a display to import
+        os.environ.setdefault('PYGLET_HEADLESS', 'true')
+    from psychopy import visual
+    return visual
+
+
+class HeadlessSession:
+    """
+    Replace the display, input and timing parts of PsychoPy with headless
+    stand-ins until `uninstall()` (or the end of a `with` block).
+
+    Parameters
+    ==========
+    participant : SimulatedParticipant
+        Who answers the dialogs, keyboards and rating scales.
+    frameRate : float
+        Simulated refresh rate (Hz) of every window.
+    pollCost : float
+        Virtual time (s) each `getKeys` call takes, so a loop polling for a
+        key moves time on until the participant's press arrives.
+    """
+
+    def __init__(self, participant, frameRate=60.0, pollCost=0.001):
+        self.participant = participant
+        self.frameRate = frameRate
+        self.pollCost = pollCost
+        self.clock = None
+        self.atExit = _AtExit()
+        self._patched = []
+
+    def _patch(self, module, name, value):
+        # read __dict__ directly so lazily-imported attributes are not loaded
+        self._patched.append((module, name, module.__dict__.get(name, _MISSING)))
+        setattr(module, name, value)
+
+    def install(self):
+        global _session
+        visual = _importVisual()
+        from psychopy import clock as ppclock, core, event, gui
+        from psychopy.data import experiment
+        from psychopy.hardware import keyboard
+        from exptools.hubpool import hubPool
+        _session = self
+        self.clock = VirtualClock(start=ppclock.getTime())
+        session = self
+
+        def quit():
+            raise SystemExit(0)
+
+        def stamped(presses, timeStamped):
+            if timeStamped:
+                t0 = timeStamped.getTime() - session.clock.now if hasattr(timeStamped, 'getTime') else 0.0
+                return [[key, t + t0] for t, key in presses]
+            return [key for t, key in presses]
+
+        def getKeys(keyList=None, modifiers=False, timeStamped=False):
+            return stamped(_eventQueue.poll(keyList), timeStamped)
+
+        def waitKeys(maxWait=float('inf'), keyList=None, modifiers=False, timeStamped=False, clearEvents=True):
+            if clearEvents:
+                _eventQueue.clear()
+            return stamped(_eventQueue.wait(keyList, maxWait), timeStamped) or None
+
+        def clearEvents(eventType=None):
+            _eventQueue.clear()
+
+        def Window(*args, **kwargs):
+            kwargs.setdefault('frameRate', session.frameRate)
+            return HeadlessWindow(*args, **kwargs)
+
+        def launchHubServer(*args, **kwargs):
+            return HeadlessIoServer()
+
+        def launchScan(win, settings, globalClock=None, *args, **kwargs):
+            # the trigger arrives at once
+            if globalClock is not None:
+                globalClock.reset()
+
+        _eventQueue = _KeyQueue()
+        for module in (ppclock, core):
+            self._patch(module, 'getTime', self.clock.getTime)
+            self._patch(module, 'wait', self.clock.wait)
+        self._patch(core, 'quit', quit)
+        self._patch(event, 'getKeys', getKeys)
+        self._patch(event, 'waitKeys', waitKeys)
+        self._patch(event, 'clearEvents', clearEvents)
+        self._patch(event, 'Mouse', HeadlessStim)
+        self._patch(gui, 'Dlg', HeadlessDlg)
+        self._patch(gui, 'DlgFromDict', HeadlessDlgFromDict)
+        self._patch(keyboard, 'Keyboard', HeadlessKeyboard)
+        self._patch(visual, 'Window', Window)
+        self._patch(visual, 'RatingScale', HeadlessRatingScale)
+        self._patch(visual, 'Slider', HeadlessSlider)
+        # handlers save their data files at exit, run that at the end of the script instead
+        self._patch(experiment, 'atexit', self.atExit)
+        # the pool's own launch, so no server process is started
+        self._patch(hubPool, 'launch', lambda io, window=None, **ioConfig: launchHubServer())
+        for name in ('TextStim', 'TextBox2', 'ImageStim', 'ShapeStim', 'Rect',
+                     'Circle', 'Line', 'Polygon', 'GratingStim'):
+            self._patch(visual, name, HeadlessStim)
+        try:
+            from psychopy import iohub
+            self._patch(iohub, 'launchHubServer', launchHubServer)
+        except ImportError:
+            pass
+        try:
+            from psychopy.hardware import emulator
+            self._patch(emulator, 'launchScan', launchScan)
+        except ImportError:
+            pass
+        try:
+            import screeninfo
+            self._patch(screeninfo, 'get_monitors', lambda: [_HeadlessMonitor(1920, 1080)])
+        except ImportError:
+            pass
+        return self
+
+    def uninstall(self):
+        global _session
+        for module, name, original in reversed(self._patched):
+            if original is _MISSING:
+                delattr(module, name)
+            else:
+                setattr(module, name, original)
+        self._patched = []
+        _session = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+
+def _isBuilderScript(path):
+    source = Path(path).read_text(encoding='utf-8-sig')
+    return 'def setupData(' in source and 'def run(' in source
+
+
+def runScript(path, participant, frameRate=60.0):
+    """
+    Run an experiment script headless, from start to `core.quit()`.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Experiment script. Builder scripts are run through their `setupData`,
+        `setupWindow`, `setupDevices`, `run` and `saveData` functions, other
+        scripts are run top to bottom.
+    participant : SimulatedParticipant
+        Who does the experiment.
+    frameRate : float
+        Simulated refresh rate (Hz).
+
+    Data files that `ExperimentHandler`s save at exit are saved when the
+    script ends, in the script's folder.
+
+    Returns
+    ==========
+    dict
+        Wall time taken, virtual (experiment) time taken and number of
+        responses given.
+    """
+    path = Path(path).resolve()
+    cwd, argv = os.getcwd(), sys.argv
+    os.chdir(path.parent)
+    sys.argv = [str(path)]
+    wall0 = time.perf_counter()
+    try:
+        with HeadlessSession(participant, frameRate=frameRate) as session:
+            t0 = session.clock.now
+            try:
+                if _isBuilderScript(path):
+                    _runBuilder(path, participant)
+                else:
+                    runpy.run_path(str(path), run_name='__main__')
+            except SystemExit:
+                pass
+            session.atExit.run()
+            virtual = session.clock.now - t0
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+    return {
+        'wallTime': time.perf_counter() - wall0,
+        'virtualTime': virtual,
+        'responses': participant.nResponses,
+    }
+
+
+def _runBuilder(path, participant):
+    spec = importlib.util.spec_from_file_location(f'_headless_{path.stem}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.deviceManager = HeadlessDeviceManager()
+    expInfo = dict(module.expInfo)
+    for key in list(expInfo):
+        # dialog keys can carry a '|hid' style suffix
+        if key.split('|')[0] in participant.info:
+            expInfo[key] = participant.info[key.split('|')[0]]
+    thisExp = module.setupData(expInfo=expInfo)
+    module.setupLogging(filename=thisExp.dataFileName)
+    win = module.setupWindow(expInfo=expInfo)
+    module.setupDevices(expInfo=expInfo, thisExp=thisExp, win=win)
+    module.run(expInfo=expInfo, thisExp=thisExp, win=win, globalClock='float')
+    module.saveData(thisExp=thisExp)
+    thisExp.abort()  # or data files will save again on exit
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run an experiment headless with simulated participants.')
+    parser.add_argument('script')
+    parser.add_argument('--sessions', type=int, default=1, help='number of simulated participants')
+    parser.add_argument('--participant', default='sim', help='participant ID prefix')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--frame-rate', type=float, default=60.0)
+    parser.add_argument('--keys', nargs='*', default=None, help='keys to press, in order')
+    args = parser.parse_args()
+
+    seeds = random.Random(args.seed)
+    totalWall = 0.0
+    for n in range(args.sessions):
+        participant = SimulatedParticipant(
+            info={'participant': f'{args.participant}{n + 1:03d}'}, keys=args.keys,
+            seed=seeds.randrange(2 ** 32),
+        )
+        result = runScript(args.script, participant, frameRate=args.frame_rate)
+        totalWall += result['wallTime']
+        print(f"{participant.info['participant']}: {result['virtualTime']:.1f} s of experiment "
+              f"in {result['wallTime'] * 1000:.0f} ms, {result['responses']} responses")
+    print(f'{args.sessions} session(s) in {totalWall:.2f} s')
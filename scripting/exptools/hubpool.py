@@ -0,0 +1,122 @@
+"""
+Keeping one ioHub server running for several experiments.
+
+`io.launchHubServer()` starts a separate process and takes seconds before the
+first routine can start. When a PsychoPy `Session` runs experiments one after
+another in the same Python process (e.g. the stroop and the image experiment
+for the same participant), each experiment's `setupDevices` would launch its
+own server. `hubPool.launch(io, window=win, **ioConfig)` launches the server
+the first time and hands the same running server to every later experiment
+with the same device configuration and window, after clearing its events.
+The experiments' devices are registered with the device manager as usual, on
+the running server. The time each reuse saved (the measured launch time of the
+server) is logged, and totalled by `hubPool.stats()`.
+"""
+import atexit
+import json
+import time
+
+from psychopy import logging
+
+
+class HubServerPool:
+    """
+    One warm ioHub server, reused while its configuration doesn't change.
+
+    Parameters
+    ==========
+    keepAlive : bool
+        Whether to keep the server running for the next experiment. If False,
+        every `launch` starts a new server, as `io.launchHubServer` does.
+    """
+
+    def __init__(self, keepAlive=True):
+        self.keepAlive = keepAlive
+        self.server = None
+        self._key = None
+        self.launchTime = 0.0
+        self.launches = 0
+        self.reuses = 0
+        self.saved = 0.0
+        self._registered = False
+
+    @staticmethod
+    def _configKey(window, ioConfig):
+        # a server is launched for a window's size and units, and a device set
+        win = None
+        if window is not None:
+            win = [list(window.size), window.units, getattr(window, 'screen', 0)]
+        return json.dumps([win, ioConfig], sort_keys=True, default=str)
+
+    def isRunning(self):
+        """
+        Whether the pooled server is still the active ioHub connection.
+        """
+        if self.server is None:
+            return False
+        # `ioHubConnection.quit()` (e.g. from `core.quit()`) clears the active connection
+        return getattr(type(self.server), 'ACTIVE_CONNECTION', self.server) is self.server
+
+    def launch(self, io, window=None, **ioConfig):
+        """
+        Get a running ioHub server, launching one only if there is none for
+        this window and configuration.
+
+        Parameters
+        ==========
+        io : module
+            `psychopy.iohub`.
+        window : psychopy.visual.Window or None
+            Window the server is launched for.
+        **ioConfig
+            Device configuration, as for `io.launchHubServer`.
+
+        Returns
+        ==========
+        psychopy.iohub.client.ioHubConnection
+            The server connection.
+        """
+        key = self._configKey(window, ioConfig)
+        if self.keepAlive and key == self._key and self.isRunning():
+            self.server.clearEvents('all')
+            self.reuses += 1
+            self.saved += self.launchTime
+            logging.info(
+                f'Reused the running ioHub server, saved {self.launchTime:.2f} s '
+                f'({self.saved:.2f} s over {self.reuses} reuses)'
+            )
+            return self.server
+        self.shutdown()
+        t0 = time.perf_counter()
+        self.server = io.launchHubServer(window=window, **ioConfig)
+        self.launchTime = time.perf_counter() - t0
+        self.launches += 1
+        self._key = key
+        logging.info(f'Launched the ioHub server in {self.launchTime:.2f} s')
+        if not self._registered:
+            atexit.register(self.shutdown)
+            self._registered = True
+        return self.server
+
+    def shutdown(self):
+        """
+        Quit the pooled server, if it is running.
+        """
+        if self.isRunning():
+            self.server.quit()
+        self.server = None
+        self._key = None
+
+    def stats(self):
+        """
+        Get the number of launches and reuses, and the launch time (s) the
+        reuses saved.
+        """
+        return {
+            'launches': self.launches, 'reuses': self.reuses,
+            'launchTime': self.launchTime, 'saved': self.saved,
+        }
+
+
+# the pool shared by every experiment run in this process
+hubPool = HubServerPool()
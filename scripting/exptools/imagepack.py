@@ -0,0 +1,217 @@
+"""
+Memory-mapped packs of decoded images.
+
+Showing an image normally means opening its file and decoding the PNG, on
+every trial. An image pack holds all the images of an experiment already
+decoded to raw RGBA pixels, one after the other in a single file, with an
+index of where each one starts. The pack is memory-mapped, so getting an image
+is a NumPy view of the right bytes (no file to open, nothing to decode or
+copy) and the operating system only keeps the pages in use in memory.
+
+The pack also records how the images were decoded (the pixel mode and e.g.
+the size and filter of `ScaledImageCache` copies), and is built again when
+that changes.
+
+Build a pack of every image in a conditions file with::
+
+    python -m exptools.imagepack images.csv --column image
+
+or let `packConditions`/`openPack` build it on the first run.
+"""
+import argparse
+import csv
+import json
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from exptools.preload import decodeImage
+
+_MAGIC = b'IMGPACK1'
+_DATA_START = 64  # image data starts here, the index is at the end of the file
+
+
+def _sourceStat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _resolve(source, root):
+    # relative sources are read from `root`, but keep their names as keys
+    return os.path.join(root, source) if root is not None else source
+
+
+def _packParams(params):
+    # what the pixels in a pack were decoded with
+    return dict({'mode': 'RGBA'}, **(params or {}))
+
+
+def buildPack(sources, packPath, decode=None, params=None, root=None):
+    """
+    Decode images into a new pack file.
+
+    Parameters
+    ==========
+    sources : list of str
+        Image files, also the keys the images are looked up by.
+    packPath : str or pathlib.Path
+        Pack file to write.
+    decode : callable or None
+        Function taking `(path, mode)` and returning a PIL image, e.g.
+        `ScaledImageCache.loader` to pack scaled copies. None to decode the
+        files as they are.
+    params : dict or None
+        What `decode` does to the images, e.g. `ScaledImageCache.params`. It
+        is stored in the pack, and a pack built with other parameters is not
+        current.
+    root : str or None
+        Folder relative `sources` are read from, None for the working
+        directory. The keys are the sources as given.
+
+    Returns
+    ==========
+    ImagePack
+        The new pack, opened.
+    """
+    decode = decode or decodeImage
+    packPath = Path(packPath)
+    packPath.parent.mkdir(parents=True, exist_ok=True)
+    index = {'params': _packParams(params), 'images': {}, 'sources': {}}
+    tmp = packPath.with_name(packPath.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(b'\0' * _DATA_START)
+        for source in dict.fromkeys(sources):
+            pixels = np.asarray(decode(_resolve(source, root), 'RGBA'), dtype=np.uint8)
+            index['images'][source] = [f.tell(), pixels.shape[0], pixels.shape[1]]
+            index['sources'][source] = _sourceStat(_resolve(source, root))
+            f.write(pixels.tobytes())
+        indexOffset = f.tell()
+        f.write(json.dumps(index).encode('utf-8'))
+        f.seek(0)
+        f.write(_MAGIC + struct.pack('<Q', indexOffset))
+    os.replace(tmp, packPath)
+    return ImagePack(packPath)
+
+
+class ImagePack:
+    """
+    A memory-mapped pack of decoded images.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Pack file written by `buildPack`.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._data = np.memmap(self.path, dtype=np.uint8, mode='r')
+        if bytes(self._data[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError(f'{self.path} is not an image pack')
+        indexOffset, = struct.unpack('<Q', bytes(self._data[len(_MAGIC):len(_MAGIC) + 8]))
+        index = json.loads(bytes(self._data[indexOffset:]).decode('utf-8'))
+        self.images = index['images']
+        self.sources = index['sources']
+        self.params = index.get('params', {})
+
+    def __len__(self):
+        return len(self.images)
+
+    def __contains__(self, key):
+        return key in self.images
+
+    def isCurrent(self, sources, params=None, root=None):
+        """
+        Check the pack holds exactly `sources`, unchanged since it was built,
+        decoded with `params` (`params` and `root` as for `buildPack`).
+        """
+        sources = list(dict.fromkeys(sources))
+        if self.params != _packParams(params) or set(sources) != set(self.images):
+            return False
+        return all(self.sources[s] == _sourceStat(_resolve(s, root)) for s in sources)
+
+    def getArray(self, key):
+        """
+        Get an image as a read-only (height, width, 4) uint8 view of the pack.
+        """
+        offset, height, width = self.images[key]
+        return self._data[offset:offset + height * width * 4].reshape(height, width, 4)
+
+    def getImage(self, key, mode='RGBA'):
+        """
+        Get an image as a PIL image sharing its pixels with the pack, which
+        can be passed to `ImageStim.setImage`. Images not in the pack are
+        returned as `key`, so `setImage` loads them from disk as before.
+        """
+        if key not in self.images:
+            return key
+        pixels = self.getArray(key)
+        image = Image.frombuffer('RGBA', (pixels.shape[1], pixels.shape[0]), pixels, 'raw', 'RGBA', 0, 1)
+        return image if mode == 'RGBA' else image.convert(mode)
+
+    def loader(self, path, mode='RGBA'):
+        """
+        Get an image for `ImagePreloader(loader=...)`, from the pack if it is
+        in it, otherwise decoded from disk.
+        """
+        if path in self.images:
+            return self.getImage(path, mode)
+        return decodeImage(path, mode)
+
+
+def openPack(sources, packPath, decode=None, params=None, root=None):
+    """
+    Open a pack of `sources`, building it first if it doesn't exist or is out
+    of date (images added, removed or changed, or other decode parameters).
+
+    Parameters are as for `buildPack`.
+    """
+    if os.path.exists(packPath):
+        pack = ImagePack(packPath)
+        if pack.isCurrent(sources, params, root):
+            return pack
+        del pack
+    return buildPack(sources, packPath, decode=decode, params=params, root=root)
+
+
+def conditionsImages(conditionsFile, column='image'):
+    """
+    Get the image files listed in a column of a conditions CSV file.
+    """
+    with open(conditionsFile, newline='', encoding='utf-8-sig') as f:
+        return [row[column] for row in csv.DictReader(f) if row.get(column)]
+
+
+def packConditions(conditionsFile, column='image', packPath=None, decode=None, params=None, root=None):
+    """
+    Open (building if needed) a pack of every image in a conditions file.
+
+    Parameters
+    ==========
+    conditionsFile : str or pathlib.Path
+        Conditions CSV file, e.g. `images.csv`.
+    column : str
+        Column holding the image files.
+    packPath : str or None
+        Pack file, leave as None for the conditions file with an `.imgpack`
+        extension.
+    decode, params, root
+        As for `buildPack`, e.g. `root` for the experiment's folder when the
+        pack is opened from elsewhere.
+    """
+    if packPath is None:
+        packPath = os.path.splitext(str(conditionsFile))[0] + '.imgpack'
+    return openPack(conditionsImages(conditionsFile, column), packPath, decode=decode, params=params, root=root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the images of a conditions file into one memory-mapped file.')
+    parser.add_argument('conditionsFile')
+    parser.add_argument('--column', default='image')
+    parser.add_argument('--out', default=None, help='pack file (default: conditions file with .imgpack)')
+    args = parser.parse_args()
+    pack = packConditions(args.conditionsFile, args.column, args.out)
+    print(f'{pack.path}: {len(pack)} images, {os.path.getsize(pack.path) / 2 ** 20:.1f} MiB')
@@ -0,0 +1,88 @@
+"""
+Deferred imports of heavy subsystems.
+
+`lazyImport('psychopy.sound')` returns the module straight away, but only
+runs its code (and that of everything it imports) the first time one of its
+attributes is used. An experiment that never plays a sound never pays for
+importing the sound backend. A submodule can be deferred before its package is
+imported, so the package's own import of it gets the deferred module too (e.g.
+`psychopy.hardware` imports `psychopy.hardware.eyetracker`, and with it the
+alerts system, whether or not there is an eyetracker). Set the environment variable
+`EXPTOOLS_LAZY_IMPORTS=0` to import everything up front instead, e.g. to
+compare startup times.
+"""
+import functools
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import types
+
+LAZY_IMPORTS = os.environ.get('EXPTOOLS_LAZY_IMPORTS', '1') != '0'
+
+
+def _findSpec(name):
+    # find a module without running the __init__ of packages it is in that aren't imported yet
+    parent = name.rpartition('.')[0]
+    if not parent or parent in sys.modules:
+        return importlib.util.find_spec(name)
+    parentSpec = _findSpec(parent)
+    if parentSpec is None or parentSpec.submodule_search_locations is None:
+        return None
+    return importlib.machinery.PathFinder.find_spec(name, parentSpec.submodule_search_locations)
+
+
+# what the import system reads from a module already in sys.modules, e.g. when the
+# package imports it, which mustn't load it
+_IMPORT_ATTRS = frozenset(('__spec__', '__name__'))
+
+
+@functools.lru_cache(maxsize=None)
+def _deferredClass(lazyClass):
+    # the class LazyLoader gives its modules, but loading on use rather than on import
+    class DeferredModule(lazyClass):
+        def __getattribute__(self, attr):
+            if attr in _IMPORT_ATTRS:
+                return types.ModuleType.__getattribute__(self, attr)
+            return super().__getattribute__(attr)
+
+    return DeferredModule
+
+
+def lazyImport(name):
+    """
+    Import a module when it is first used.
+
+    Parameters
+    ==========
+    name : str
+        Full module name, e.g. `'psychopy.iohub'`. Its parent package is
+        not imported if it isn't already.
+
+    Returns
+    ==========
+    module or None
+        The (not yet loaded) module, or None if it is not installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if not LAZY_IMPORTS:
+        if importlib.util.find_spec(name) is None:
+            return None
+        return importlib.import_module(name)
+    spec = _findSpec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    module.__class__ = _deferredClass(type(module))
+    # set it on its parent package, as a normal import would (a package imported
+    # later finds it in sys.modules when it imports it)
+    parent, _, child = name.rpartition('.')
+    if parent in sys.modules:
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -0,0 +1,260 @@
+"""
+Fast parsing and time-range lookup of PsychoPy `.log` files.
+
+PsychoPy log files (from `logging.LogFile`) have one entry per line::
+
+    12.3456 \tEXP \timage: autoDraw = True
+
+On a long scan they grow to millions of lines. `parseLog` reads a log file
+once, in binary, into NumPy arrays of time, level, message type and the byte
+offset of every entry, sorted by time. The index is saved next to the log
+(`<name>.log` -> `<name>_logindex.npz`) and reused as long as the log is
+unchanged, so "everything between t0 and t1" is two binary searches, and only
+the messages in that range are read from the log.
+
+From the command line, index a whole study's logs in parallel and/or print the
+entries in a time range::
+
+    python -m exptools.logindex fmri/scripting/data
+    python -m exptools.logindex data/sub01_experiment.log --between 120 124 --type autoDraw
+"""
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# PsychoPy's logging levels, by the name written in the log
+LEVELS = {
+    'CRITICAL': 50, 'ERROR': 40, 'WARNING': 30, 'DATA': 25,
+    'EXP': 22, 'INFO': 20, 'DEBUG': 10, 'NOTSET': 0,
+}
+# message types, in the order they are checked
+TYPES = ['other', 'trial', 'keypress', 'autoDraw', 'set', 'created', 'sound']
+_SET = re.compile(rb'^\S+: \w+ = ')
+
+
+def messageType(message):
+    """
+    Classify a log message (bytes), returning an index into `TYPES`.
+    """
+    if message.startswith(b'New trial'):
+        return 1
+    if message.startswith(b'Keypress:'):
+        return 2
+    if b': autoDraw = ' in message:
+        return 3
+    if _SET.match(message):
+        return 4
+    if message.startswith(b'Created '):
+        return 5
+    if message.startswith(b'Sound '):
+        return 6
+    return 0
+
+
+def indexPath(logPath):
+    """
+    Get the path the index of a log file is saved at.
+    """
+    logPath = str(logPath)
+    return os.path.splitext(logPath)[0] + '_logindex.npz'
+
+
+class LogIndex:
+    """
+    Entries of one log file, sorted by time.
+
+    Parameters
+    ==========
+    logPath : str
+        Log file the index is of.
+    times, levels, types, offsets, lengths : numpy.ndarray
+        Time (s), level number, message type (index into `TYPES`), byte offset
+        of the message and its length in bytes, one per entry, sorted by time.
+    """
+
+    def __init__(self, logPath, times, levels, types, offsets, lengths):
+        self.logPath = str(logPath)
+        self.times = times
+        self.levels = levels
+        self.types = types
+        self.offsets = offsets
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.times)
+
+    def save(self, path=None):
+        """
+        Save the index next to the log (or to `path`), with the log's size and
+        modification time so it can be checked for being up to date.
+        """
+        stat = os.stat(self.logPath)
+        np.savez(
+            path or indexPath(self.logPath), times=self.times, levels=self.levels,
+            types=self.types, offsets=self.offsets, lengths=self.lengths,
+            logStat=np.array([stat.st_size, stat.st_mtime]),
+        )
+
+    def rows(self, t0, t1):
+        """
+        Get the range of entries with `t0 <= time < t1`, by binary search.
+        """
+        return slice(
+            int(np.searchsorted(self.times, t0, side='left')),
+            int(np.searchsorted(self.times, t1, side='left')),
+        )
+
+    def between(self, t0, t1, minLevel=0, types=None):
+        """
+        Get the entries logged between two times.
+
+        Parameters
+        ==========
+        t0, t1 : float
+            Time range (s), including `t0` and excluding `t1`.
+        minLevel : int or str
+            Lowest level to include, e.g. `'EXP'` or 22.
+        types : list of str or None
+            Message types to include (see `TYPES`), None for all.
+
+        Returns
+        ==========
+        list of tuple
+            `(time, level name, type, message)` for every entry, in time order.
+        """
+        if isinstance(minLevel, str):
+            minLevel = LEVELS[minLevel]
+        rows = np.arange(len(self))[self.rows(t0, t1)]
+        keep = self.levels[rows] >= minLevel
+        if types is not None:
+            keep &= np.isin(self.types[rows], [TYPES.index(name) for name in types])
+        rows = rows[keep]
+        names = {number: name for name, number in LEVELS.items()}
+        entries = []
+        with open(self.logPath, 'rb') as f:
+            for row in rows:
+                f.seek(self.offsets[row])
+                message = f.read(self.lengths[row]).decode('utf-8', 'replace')
+                entries.append((
+                    float(self.times[row]), names.get(int(self.levels[row]), str(self.levels[row])),
+                    TYPES[self.types[row]], message,
+                ))
+        return entries
+
+
+def parseLog(logPath):
+    """
+    Parse a PsychoPy log file into a `LogIndex`.
+
+    Lines that don't start with a time and a level (e.g. the continuation
+    lines of a multi-line message) are taken as part of the entry before.
+
+    Parameters
+    ==========
+    logPath : str or pathlib.Path
+        PsychoPy `.log` file.
+
+    Returns
+    ==========
+    LogIndex
+        Its entries, sorted by time.
+    """
+    times, levels, types, offsets, lengths = [], [], [], [], []
+    offset = 0
+    with open(logPath, 'rb') as f:
+        for line in f:
+            parts = line.split(b'\t', 2)
+            level = LEVELS.get(parts[1].strip().decode('ascii', 'replace')) if len(parts) == 3 else None
+            if level is not None:
+                try:
+                    t = float(parts[0])
+                except ValueError:
+                    level = None
+            if level is None:
+                if lengths:
+                    # continuation of the entry before, which now ends with this line
+                    lengths[-1] = offset + len(line.rstrip(b'\r\n')) - offsets[-1]
+            else:
+                message = parts[2].rstrip(b'\r\n')
+                times.append(t)
+                levels.append(level)
+                types.append(messageType(message))
+                offsets.append(offset + len(parts[0]) + len(parts[1]) + 2)
+                lengths.append(len(message))
+            offset += len(line)
+    times = np.array(times, dtype=np.float64)
+    # entries are almost always in order already, a stable sort keeps ties in file order
+    order = np.argsort(times, kind='stable')
+    return LogIndex(
+        logPath, times[order],
+        np.array(levels, dtype=np.int16)[order],
+        np.array(types, dtype=np.int8)[order],
+        np.array(offsets, dtype=np.int64)[order],
+        np.array(lengths, dtype=np.int64)[order],
+    )
+
+
+def loadIndex(logPath):
+    """
+    Get the index of a log file, from its saved index if that is up to date,
+    otherwise by parsing the log (and saving the new index).
+    """
+    path = indexPath(logPath)
+    stat = os.stat(logPath)
+    if os.path.exists(path):
+        with np.load(path) as saved:
+            if tuple(saved['logStat']) == (stat.st_size, stat.st_mtime):
+                return LogIndex(logPath, saved['times'], saved['levels'], saved['types'],
+                                saved['offsets'], saved['lengths'])
+    index = parseLog(logPath)
+    index.save()
+    return index
+
+
+def _indexOne(logPath):
+    return logPath, len(loadIndex(logPath))
+
+
+def indexLogs(paths, workers=None):
+    """
+    Make sure every log file (or every `.log` in the given folders) has an up
+    to date index, parsing them in parallel.
+
+    Returns
+    ==========
+    dict
+        Log path to number of entries.
+    """
+    logPaths = []
+    for path in paths:
+        path = Path(path)
+        logPaths += sorted(str(p) for p in path.rglob('*.log')) if path.is_dir() else [str(path)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_indexOne, logPaths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index PsychoPy log files and look up time ranges.')
+    parser.add_argument('paths', nargs='+', help='log files or folders of log files')
+    parser.add_argument('--between', nargs=2, type=float, metavar=('T0', 'T1'),
+                        help='print the entries logged between T0 and T1')
+    parser.add_argument('--level', default='NOTSET', help='lowest level to print')
+    parser.add_argument('--type', action='append', choices=TYPES, help='message types to print')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    counts = indexLogs(args.paths, workers=args.workers)
+    for logPath, n in counts.items():
+        if args.between is None:
+            print(f'{logPath}: {n} entries')
+            continue
+        for t, level, kind, message in loadIndex(logPath).between(*args.between, args.level, args.type):
+            print(f'{logPath}\t{t:.4f}\t{level}\t{kind}\t{message}')
+
+
+if __name__ == '__main__':
+    main()
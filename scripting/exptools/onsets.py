@@ -0,0 +1,141 @@
+"""
+Frame-locked presentation at absolute onsets.
+
+Chaining `win.flip()` and `core.wait()` lets small delays (flip latency,
+response-terminated ratings) add up, so stimuli slowly drift off the scanner's
+TR grid. `FrameScheduler` instead takes every onset as an absolute time on a
+clock that was reset at the first scanner trigger (as `launchScan` does with
+`globalClock`), works out which frame that onset falls on, and flips the new
+screen on exactly that frame. Flip times are the ones `win.flip()` returns
+(taken when the flip completed), and the drift of every event from its
+nominal onset is logged, so it can be checked that it stays within one frame
+for the whole run.
+"""
+import csv
+
+from psychopy import logging
+
+
+class FrameScheduler:
+    """
+    Flip screens on the frames closest to their scheduled onsets.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window to flip.
+    clock : psychopy.core.Clock
+        Clock the onsets refer to, reset at the first scanner trigger.
+    frameDur : float
+        Duration of one frame in seconds.
+    resync : callable or None
+        Returns the current offset (s) of the scanner from the nominal TR grid,
+        e.g. `TriggerListener.offset`, which is added to every onset.
+    onFrame : callable or None
+        Called after every flip, e.g. `TriggerListener.update` to read the
+        scanner pulses on the main thread.
+    """
+
+    def __init__(self, win, clock, frameDur, resync=None, onFrame=None):
+        self.win = win
+        self.clock = clock
+        self.frameDur = frameDur
+        self.resync = resync
+        self.onFrame = onFrame
+        self.log = []  # one dict per scheduled event
+        self._draw = None  # draws what is currently on the screen
+        self._lastFlip = None
+
+    def targetFrame(self, onset):
+        """
+        Get the number of the frame (counted from the trigger) an onset falls on.
+        """
+        return int(round(onset / self.frameDur))
+
+    def flip(self):
+        """
+        Redraw the current screen and flip it, returning the flip time.
+        """
+        if self._draw is not None:
+            self._draw()
+        flipTime = self.win.flip()
+        # both clocks read back to back, to move the flip time onto `clock`
+        now, logNow = self.clock.getTime(), logging.defaultClock.getTime()
+        if flipTime is None:
+            # no flip time without waitBlanking, now is as close as it gets
+            self._lastFlip = now
+        else:
+            # win.flip() returns the flip time on logging.defaultClock
+            self._lastFlip = flipTime + now - logNow
+        if self.onFrame is not None:
+            self.onFrame()
+        return self._lastFlip
+
+    def hold(self, draw):
+        """
+        Change what is redrawn on the following frames, without flipping now.
+        """
+        self._draw = draw
+
+    def show(self, onset, draw, label=''):
+        """
+        Keep the current screen up until the frame of `onset`, then flip `draw`.
+
+        Parameters
+        ==========
+        onset : float
+            Nominal onset in seconds on `clock`.
+        draw : callable
+            Draws the new screen, e.g. `image.draw`. It is redrawn on every
+            following frame until the next call to `show` or `hold`.
+        label : str
+            Name of the event, for the drift log.
+
+        Returns
+        ==========
+        float
+            Time of the flip that showed the new screen.
+        """
+        if self._lastFlip is None:
+            # nothing flipped on this clock yet, count from the current frame
+            self._lastFlip = self.clock.getTime() - self.frameDur
+        # line the onset up with where the scanner actually is
+        correction = self.resync() if self.resync is not None else 0.0
+        target = onset + correction
+        # flip the old screen until the next flip is the one closest to the target
+        while target - self._lastFlip > 1.5 * self.frameDur:
+            self.flip()
+        self._draw = draw
+        flipTime = self.flip()
+        # drift from the nominal onset, so the correction shows up in it too
+        drift = flipTime - onset
+        self.log.append({
+            'event': label, 'onset': onset, 'correction': correction,
+            'targetFrame': self.targetFrame(target),
+            'frame': self.targetFrame(flipTime),
+            'flipTime': flipTime, 'drift': drift,
+        })
+        if abs(flipTime - target) > self.frameDur:
+            # missed the frame it was scheduled for
+            logging.warning(
+                f'{label} shown {(flipTime - target) * 1000:.1f} ms off its onset at {target:.3f} s'
+            )
+        return flipTime
+
+    def maxDrift(self):
+        """
+        Get the largest absolute drift (in seconds) of all events so far.
+        """
+        return max((abs(row['drift']) for row in self.log), default=0.0)
+
+    def saveLog(self, path):
+        """
+        Write the per-event drift log to a CSV file.
+        """
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(
+                f, fieldnames=['event', 'onset', 'correction', 'targetFrame', 'frame', 'flipTime', 'drift']
+            )
+            writer.writeheader()
+            writer.writerows(self.log)
+        return path
@@ -0,0 +1,182 @@
+"""
+Background image preloading with a bounded LRU cache.
+
+Images are decoded on a worker thread into fully loaded PIL images, which
+`visual.ImageStim` accepts directly, so the disk read and PNG decode no longer
+happen right before the flip that marks image onset.
+"""
+import threading
+from collections import OrderedDict, deque
+
+from PIL import Image
+
+
+def decodeImage(path, mode='RGBA'):
+    """
+    Read an image from disk and decode it fully into memory.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Image file to decode.
+    mode : str
+        PIL mode to convert the pixels to.
+
+    Returns
+    ==========
+    PIL.Image.Image
+        Decoded image, with its pixel buffer already loaded.
+    """
+    with Image.open(path) as im:
+        # convert() always returns a new, fully loaded image
+        return im.convert(mode)
+
+
+class ImagePreloader:
+    """
+    Decode upcoming images on a worker thread and keep them in an LRU cache.
+
+    Call `prefetch` with the images of the next trial(s) before a non-critical
+    period (e.g. the fixation cross), then `getImage` when the stimulus is set.
+    A path that is already decoded is a hit, anything else is decoded on the
+    spot and counted as a miss.
+
+    Parameters
+    ==========
+    capacity : int
+        Maximum number of decoded images to keep in memory.
+    mode : str
+        PIL mode the images are converted to.
+    loader : callable or None
+        Function taking `(path, mode)` and returning a decoded image, leave as
+        None to decode from disk with `decodeImage`.
+    """
+
+    def __init__(self, capacity=8, mode='RGBA', loader=None):
+        if capacity < 1:
+            raise ValueError('ImagePreloader capacity must be at least 1')
+        self.capacity = capacity
+        self.mode = mode
+        self.loader = loader or decodeImage
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0  # requested while the worker was still decoding it
+        self._cache = OrderedDict()
+        self._queue = deque()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._work, name='ImagePreloader', daemon=True
+        )
+        self._thread.start()
+
+    def prefetch(self, paths):
+        """
+        Queue images to be decoded in the background.
+
+        Parameters
+        ==========
+        paths : iterable of str
+            Images needed soon, in the order they will be shown.
+        """
+        with self._lock:
+            for path in paths:
+                if path in self._cache:
+                    # keep it from being evicted before it is used
+                    self._cache.move_to_end(path)
+                elif path not in self._inflight and path not in self._queue:
+                    self._queue.append(path)
+            self._wake.notify()
+
+    def getImage(self, path):
+        """
+        Get a decoded image, decoding it now if it has not been preloaded.
+
+        Parameters
+        ==========
+        path : str
+            Image to get.
+
+        Returns
+        ==========
+        PIL.Image.Image
+            Decoded image, ready to pass to `ImageStim.setImage`.
+        """
+        with self._lock:
+            if path in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(path)
+                return self._cache[path]
+            done = self._inflight.get(path)
+            if done is None:
+                self.misses += 1
+                if path in self._queue:
+                    self._queue.remove(path)
+        if done is not None:
+            # the worker is decoding it right now, waiting is cheaper than redoing it
+            done.wait()
+            with self._lock:
+                self.waits += 1
+                if path in self._cache:
+                    self._cache.move_to_end(path)
+                    return self._cache[path]
+                self.misses += 1
+        img = self.loader(path, self.mode)
+        with self._lock:
+            self._store(path, img)
+        return img
+
+    def stats(self):
+        """
+        Summarise how well preloading kept up.
+
+        Returns
+        ==========
+        dict
+            Counts of hits, misses, waits and currently cached images.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'waits': self.waits,
+                'cached': len(self._cache), 'queued': len(self._queue),
+            }
+
+    def close(self):
+        """
+        Stop the worker thread and drop all cached images.
+        """
+        with self._lock:
+            self._closed = True
+            self._queue.clear()
+            self._wake.notify()
+        self._thread.join()
+        self._cache.clear()
+
+    def _store(self, path, img):
+        # caller holds the lock
+        self._cache[path] = img
+        self._cache.move_to_end(path)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                path = self._queue.popleft()
+                done = self._inflight[path] = threading.Event()
+            try:
+                img = self.loader(path, self.mode)
+            except Exception:
+                # leave it to getImage to decode again and raise in the main thread
+                img = None
+            with self._lock:
+                if img is not None:
+                    self._store(path, img)
+                del self._inflight[path]
+            done.set()
@@ -0,0 +1,42 @@
+"""
+Response collection that waits on the keyboard's event queue.
+
+PsychoPy's `keyboard.Keyboard` (with the default psychtoolbox backend) records
+key presses in its own queue, with a timestamp taken when the key event
+arrives, not when Python asks for it. So instead of spinning on
+`event.getKeys()`, which makes the RT depend on how fast the loop runs, we
+can wait with `Keyboard.waitKeys` and still get the exact press time from
+`KeyPress.rt`. `waitKeys` is not a blocking read of the queue either (none of
+the backends offer one), but it sleeps between looks at it and keeps the
+window's events dispatched, so the OS doesn't mark the window as not
+responding during a long wait.
+"""
+
+
+def waitForKeyPress(kb, keyList=None, maxWait=float('inf')):
+    """
+    Wait for a key press on the keyboard's event queue.
+
+    Reset `kb.clock` and clear the keyboard on the flip that shows the
+    stimulus (e.g. `win.callOnFlip(kb.clock.reset)`), so the returned `rt` is
+    measured from stimulus onset. The queue is not cleared again here, so a
+    key pressed between that flip and this call still counts.
+
+    Parameters
+    ==========
+    kb : psychopy.hardware.keyboard.Keyboard
+        Keyboard to wait on.
+    keyList : list of str or None
+        Keys to wait for, leave as None to accept any key.
+    maxWait : float
+        Give up after this many seconds.
+
+    Returns
+    ==========
+    psychopy.hardware.keyboard.KeyPress or None
+        The first key pressed, or None if `maxWait` ran out.
+    """
+    keys = kb.waitKeys(maxWait=maxWait, keyList=keyList, waitRelease=False, clear=False)
+    if not keys:
+        return None
+    return keys[0]
@@ -0,0 +1,403 @@
+"""
+Table-driven Routines.
+
+A Builder script repeats the same `while continueRoutine:` block for every
+Routine, with the start, stop and "has everything finished?" checks written
+out for every component. Here a Routine is described as data instead (its
+components with their start times and durations, the keyboards that end it,
+its fixed duration) and `RoutineEngine.run` executes any such description
+with one frame loop::
+
+    fixation = Routine('fixation', [
+        StimComponent(init_fix, duration=2),
+        StimComponent(init_fix2, duration=2.0),
+    ], duration=2.0)
+    engine = RoutineEngine(win, thisExp, routineTimer, globalClock, defaultKeyboard, frameRecorder)
+    if not engine.run(fixation):
+        endExperiment(thisExp, win=win)  # escape was pressed
+        return
+
+The engine keeps the Builder's timing, data columns (`<routine>.started`,
+`<component>.started`, `<keyboard>.keys`, ...) and attributes (`tStart`,
+`tStartRefresh`, `status`, `keys`, `rt`, ...), so code components can use
+them as before. Only the bookkeeping is cheaper. Instead of every component
+being tested on every frame, the onsets of a Routine are sorted once, when it
+is described, and the stops of started components are kept in a heap by due
+time, so each frame only looks at the next onset and the earliest stop and
+handles just the transitions that are due. A Routine with dozens of
+components costs about as much per frame as one with a single component.
+The Routine ends when a counter of finished components is full.
+
+The Routine tables of the Builder scripts are written by `exptools.exporter`
+from their `.psyexp` files.
+"""
+import heapq
+
+from psychopy.constants import NOT_STARTED, STARTED, PAUSED, FINISHED
+
+from exptools.calibration import checkFrameRate
+from exptools.frametiming import NullFrameRecorder
+
+
+class StimComponent:
+    """
+    A visual stimulus shown from `start` for `duration` seconds.
+
+    Parameters
+    ==========
+    stim : psychopy.visual.BaseVisualStim
+        The stimulus, its `name` names the data columns.
+    start : float
+        Onset (s) from the start of the Routine.
+    duration : float, callable or None
+        Duration (s) from the actual onset, None to show it until the Routine
+        ends. A callable (e.g. `lambda: t_isi`) is called at the onset, for
+        durations set by code.
+    """
+
+    listens = False
+
+    def __init__(self, stim, start=0.0, duration=None):
+        self.component = stim
+        self.name = stim.name
+        self.start = start
+        self.duration = duration
+
+    def reset(self):
+        comp = self.component
+        comp.tStart = comp.tStop = comp.tStartRefresh = comp.tStopRefresh = None
+        comp.status = NOT_STARTED
+
+    def onStart(self, engine):
+        self.component.setAutoDraw(True)
+
+    def onStop(self, engine):
+        self.component.setAutoDraw(False)
+
+    def onEnd(self, handler):
+        self.component.setAutoDraw(False)
+
+
+class KeyboardComponent:
+    """
+    A keyboard listened to from `start`, keeping the last key pressed.
+
+    Parameters
+    ==========
+    keyboard : psychopy.hardware.keyboard.Keyboard
+        The keyboard.
+    name : str
+        Name of the component, for the data columns.
+    keyList : list of str or None
+        Keys to listen for, None for any key.
+    start : float
+        Onset (s) from the start of the Routine.
+    duration : float, callable or None
+        How long to listen (s), None until the Routine ends.
+    forceEndRoutine : bool
+        Whether a key press ends the Routine.
+    store : str
+        `'last key'` to save the last key pressed and its RT, `'nothing'` to
+        save no keys.
+    """
+
+    listens = True
+
+    def __init__(self, keyboard, name, keyList=None, start=0.0, duration=None, forceEndRoutine=True,
+                 store='last key'):
+        if store not in ('last key', 'nothing'):
+            raise ValueError(f"can't store {store!r} of {name}, only 'last key' or 'nothing'")
+        self.component = keyboard
+        self.name = name
+        self.keyList = keyList
+        self.start = start
+        self.duration = duration
+        self.forceEndRoutine = forceEndRoutine
+        self.store = store
+        self._allKeys = []
+
+    def reset(self):
+        comp = self.component
+        comp.tStart = comp.tStop = comp.tStartRefresh = comp.tStopRefresh = None
+        comp.status = NOT_STARTED
+        comp.keys = []
+        comp.rt = []
+        self._allKeys = []
+
+    def onStart(self, engine):
+        # keyboard checking starts on the next flip
+        engine.win.callOnFlip(self.component.clock.reset)  # t=0 on next screen flip
+        engine.win.callOnFlip(self.component.clearEvents, eventType='keyboard')
+
+    def onStop(self, engine):
+        pass
+
+    def update(self):
+        """
+        Collect the keys pressed since the last frame, returns True if the
+        Routine should end.
+        """
+        comp = self.component
+        theseKeys = comp.getKeys(keyList=self.keyList, ignoreKeys=["escape"], waitRelease=False)
+        if not theseKeys:
+            return False
+        self._allKeys.extend(theseKeys)
+        comp.keys = self._allKeys[-1].name  # just the last key pressed
+        comp.rt = self._allKeys[-1].rt
+        comp.duration = self._allKeys[-1].duration
+        return self.forceEndRoutine
+
+    def onEnd(self, handler):
+        if self.store == 'nothing':
+            return
+        comp = self.component
+        if comp.keys in ['', [], None]:  # No response was made
+            comp.keys = None
+        handler.addData(f'{self.name}.keys', comp.keys)
+        if comp.keys is not None:  # we had a response
+            handler.addData(f'{self.name}.rt', comp.rt)
+            handler.addData(f'{self.name}.duration', comp.duration)
+
+
+class SliderComponent:
+    """
+    A slider shown from `start`, saving its rating and RT.
+
+    Unlike the other components, the slider itself isn't reset here: its
+    `reset()` is called with the other updates for each repeat, before the
+    Routine's "Begin Routine" code, as in the Builder's code.
+
+    Parameters
+    ==========
+    slider : psychopy.visual.Slider
+        The slider, its `name` names the data columns.
+    start : float
+        Onset (s) from the start of the Routine.
+    duration : float, callable or None
+        Duration (s) from the actual onset, None to show it until the Routine
+        ends.
+    forceEndRoutine : bool
+        Whether a rating ends the Routine.
+    storeRating, storeRatingTime : bool
+        Whether to save the rating (`<name>.response`) and its RT
+        (`<name>.rt`).
+    """
+
+    listens = True
+
+    def __init__(self, slider, start=0.0, duration=None, forceEndRoutine=True,
+                 storeRating=True, storeRatingTime=True):
+        self.component = slider
+        self.name = slider.name
+        self.start = start
+        self.duration = duration
+        self.forceEndRoutine = forceEndRoutine
+        self.storeRating = storeRating
+        self.storeRatingTime = storeRatingTime
+
+    def reset(self):
+        comp = self.component
+        comp.tStart = comp.tStop = comp.tStartRefresh = comp.tStopRefresh = None
+        comp.status = NOT_STARTED
+
+    def onStart(self, engine):
+        self.component.setAutoDraw(True)
+
+    def onStop(self, engine):
+        self.component.setAutoDraw(False)
+
+    def update(self):
+        """
+        Returns True if the Routine should end.
+        """
+        return self.forceEndRoutine and self.component.getRating() is not None
+
+    def onEnd(self, handler):
+        self.component.setAutoDraw(False)
+        if self.storeRating:
+            handler.addData(f'{self.name}.response', self.component.getRating())
+        if self.storeRatingTime:
+            handler.addData(f'{self.name}.rt', self.component.getRT())
+
+
+class Routine:
+    """
+    What a Routine shows and listens for, and when.
+
+    Parameters
+    ==========
+    name : str
+        Name of the Routine, for the data columns and the frame recorder.
+    components : list
+        `StimComponent`s, `KeyboardComponent`s and `SliderComponent`s, in
+        drawing order.
+    duration : float or None
+        Fixed duration (s) for non-slip timing, None if the Routine ends
+        when its components have finished (or a key ends it).
+    eachFrame : callable or None
+        The Routine's "Each Frame" code, called on every frame after the
+        keyboards have been read. It returns True to end the Routine (where
+        the code sets `continueRoutine = False`).
+    """
+
+    def __init__(self, name, components, duration=None, eachFrame=None):
+        self.name = name
+        self.components = list(components)
+        self.duration = duration
+        self.eachFrame = eachFrame
+        # the start events, in the order they are due (drawing order for ties)
+        self.onsets = sorted(self.components, key=lambda spec: spec.start)
+
+
+class RoutineEngine:
+    """
+    Runs `Routine`s with one frame loop.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window to flip.
+    thisExp : psychopy.data.ExperimentHandler
+        Handler for the Routine and component timestamps.
+    routineTimer : psychopy.core.Clock
+        The Routine timer, non-slip Routines subtract their duration from it.
+    globalClock : psychopy.core.Clock
+        Clock for the `<routine>.started`/`.stopped` columns.
+    defaultKeyboard : psychopy.hardware.keyboard.Keyboard or None
+        Keyboard checked for escape every frame.
+    frameRecorder : exptools.frametiming.FrameRecorder or None
+        Where to record frame timing.
+    frameTolerance : float
+        How close to an onset (s) counts as the same frame.
+    pauseExperiment : callable or None
+        The script's `pauseExperiment`, called on the frame the experiment is
+        paused on (`thisExp.status == PAUSED`), None to not pause within
+        Routines.
+    """
+
+    def __init__(self, win, thisExp, routineTimer, globalClock, defaultKeyboard=None,
+                 frameRecorder=None, frameTolerance=0.001, pauseExperiment=None):
+        self.win = win
+        self.thisExp = thisExp
+        self.routineTimer = routineTimer
+        self.globalClock = globalClock
+        self.defaultKeyboard = defaultKeyboard
+        self.frameRecorder = frameRecorder if frameRecorder is not None else NullFrameRecorder()
+        self.frameTolerance = frameTolerance
+        self.pauseExperiment = pauseExperiment
+
+    def run(self, routine, handler=None):
+        """
+        Run a Routine until it ends.
+
+        Parameters
+        ==========
+        routine : Routine
+            The Routine to run.
+        handler : psychopy.data.ExperimentHandler or psychopy.data.TrialHandler or None
+            Handler for the keyboard data, None for `thisExp`.
+
+        Returns
+        ==========
+        bool
+            True when the Routine ended, False if the experiment was ended
+            (escape pressed), in which case the caller should end it.
+        """
+        win, thisExp, timer = self.win, self.thisExp, self.routineTimer
+        recorder = self.frameRecorder
+        tolerance = self.frameTolerance
+        handler = handler if handler is not None else thisExp
+        # between Routines is where a changed monitor frame rate can be measured again
+        checkFrameRate(win, recorder)
+        recorder.startRoutine(routine.name)
+        thisExp.addData(f'{routine.name}.started', self.globalClock.getTime(format='float'))
+        for spec in routine.components:
+            spec.reset()
+        onsets = routine.onsets
+        nComponents = len(onsets)
+        nStarted = 0  # the next start event is onsets[nStarted]
+        stops = []  # heap of (due time, order, component) stop events
+        justStarted = []  # started on the last frame, their onset is known after the flip
+        listening = []  # started keyboards
+        nFinished = 0
+        forceEnded = False
+        frameN = -1
+        while routine.duration is None or timer.getTime() < routine.duration:
+            recorder.startFrame()
+            t = timer.getTime()
+            tThisFlip = win.getFutureFlipTime(clock=timer)
+            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
+            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
+            # keyboards start listening on the frame after they start
+            for spec in listening:
+                if spec.update():
+                    forceEnded = True
+            if routine.eachFrame is not None and routine.eachFrame():
+                forceEnded = True
+            # stops are timed on the actual onset, set at the flip
+            for order, spec, duration in justStarted:
+                heapq.heappush(stops, (spec.component.tStartRefresh + duration - tolerance, order, spec))
+            justStarted = []
+            # stop what is due to stop
+            while stops and tThisFlipGlobal > stops[0][0]:
+                spec = heapq.heappop(stops)[2]
+                self._stop(spec, frameN, t, tThisFlipGlobal)
+                if spec.listens:
+                    listening.remove(spec)
+                nFinished += 1
+            # start what is due to start
+            while nStarted < nComponents and tThisFlip >= onsets[nStarted].start - tolerance:
+                spec = onsets[nStarted]
+                nStarted += 1
+                comp = spec.component
+                comp.frameNStart = frameN  # exact frame index
+                comp.tStart = t  # local t and not account for scr refresh
+                comp.tStartRefresh = tThisFlipGlobal  # on global time
+                win.timeOnFlip(comp, 'tStartRefresh')  # time at next scr refresh
+                thisExp.timestampOnFlip(win, f'{spec.name}.started')
+                comp.status = STARTED
+                spec.onStart(self)
+                duration = spec.duration() if callable(spec.duration) else spec.duration
+                if duration is not None and duration < tolerance:
+                    # over as soon as it starts
+                    self._stop(spec, frameN, t, tThisFlipGlobal)
+                    nFinished += 1
+                    continue
+                if duration is not None:
+                    justStarted.append((nStarted, spec, duration))
+                if spec.listens:
+                    listening.append(spec)
+            # check for quit (typically the Esc key)
+            if self.defaultKeyboard is not None and self.defaultKeyboard.getKeys(keyList=["escape"]):
+                thisExp.status = FINISHED
+            if thisExp.status == FINISHED:
+                return False
+            # pause experiment here if requested
+            if thisExp.status == PAUSED and self.pauseExperiment is not None:
+                self.pauseExperiment(thisExp=thisExp, win=win, timers=[timer], playbackComponents=[])
+                continue  # skip the frame it was paused on
+            # a component has requested a forced-end of Routine, or all have finished
+            if forceEnded or nFinished == nComponents:
+                break
+            recorder.endUpdates()
+            win.flip()
+            recorder.flipped()
+        # --- Ending the Routine ---
+        for spec in routine.components:
+            spec.onEnd(handler)
+        thisExp.addData(f'{routine.name}.stopped', self.globalClock.getTime(format='float'))
+        if routine.duration is not None and not forceEnded:
+            # using non-slip timing so subtract the expected duration of this Routine
+            timer.addTime(-routine.duration)
+        else:
+            timer.reset()
+        return True
+
+    def _stop(self, spec, frameN, t, tThisFlipGlobal):
+        comp = spec.component
+        comp.tStop = t  # not accounting for scr refresh
+        comp.tStopRefresh = tThisFlipGlobal  # on global time
+        comp.frameNStop = frameN  # exact frame index
+        self.thisExp.timestampOnFlip(self.win, f'{spec.name}.stopped')
+        comp.status = FINISHED
+        spec.onStop(self)
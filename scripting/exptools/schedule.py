@@ -0,0 +1,176 @@
+"""
+Precompiled, seeded trial schedules.
+
+`compileSchedule` turns a list of conditions (e.g. from a conditions CSV) and
+the timing of the events in each trial into one flat NumPy structured array,
+before the window is opened. The trial loop then only reads from that array,
+with no random draws or pandas calls per trial. Schedules are saved next to the
+data and can be loaded again to replay a session exactly.
+"""
+import json
+
+import numpy as np
+
+# one row per event (e.g. fixation, image, rating) of every trial
+SCHEDULE_DTYPE = np.dtype([
+    ('trial', np.int32),     # trial number, from 0
+    ('event', 'U16'),        # event name
+    ('stim', np.int32),      # index into Schedule.conditions
+    ('onset', np.float64),   # planned onset from the start of the run (s), NaN if not fixed
+    ('duration', np.float64),  # planned duration (s), NaN if it ends on a response
+])
+
+
+def _plain(value):
+    # numpy scalars and arrays (e.g. from importConditions) as Python values json can store
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+class Schedule:
+    """
+    A compiled trial schedule.
+
+    Parameters
+    ==========
+    events : numpy.ndarray
+        Structured array with `SCHEDULE_DTYPE`, one row per event, ordered by
+        trial and then by event.
+    conditions : list of dict
+        The distinct conditions the `stim` column refers to.
+    seed : int
+        Seed the schedule was compiled with.
+    """
+
+    def __init__(self, events, conditions, seed):
+        self.events = events
+        self.conditions = conditions
+        self.seed = seed
+        self.eventNames = list(dict.fromkeys(events['event']))
+        self.nTrials = int(events['trial'].max()) + 1 if len(events) else 0
+
+    def byTrial(self):
+        """
+        Get the events as a 2D array of shape (nTrials, events per trial).
+        """
+        return self.events.reshape(self.nTrials, len(self.eventNames))
+
+    def durations(self, event):
+        """
+        Get the planned duration of `event` for every trial, in trial order.
+        """
+        return self.byTrial()['duration'][:, self.eventNames.index(event)]
+
+    def onsets(self, event):
+        """
+        Get the planned onset of `event` for every trial, in trial order.
+        """
+        return self.byTrial()['onset'][:, self.eventNames.index(event)]
+
+    def trialList(self):
+        """
+        Get the condition of every trial, in trial order.
+
+        Returns
+        ==========
+        list of dict
+            Suitable as the `trialList` of a sequential `data.TrialHandler`.
+        """
+        return [self.conditions[i] for i in self.byTrial()['stim'][:, 0]]
+
+    def save(self, path):
+        """
+        Save the schedule (events, conditions and seed) to an `.npz` file.
+
+        NumPy values in the conditions are saved as the equivalent Python
+        values (tuples and arrays as lists).
+        """
+        np.savez(
+            path, events=self.events,
+            conditions=np.array(json.dumps(_plain(self.conditions))),
+            seed=np.uint64(self.seed),
+        )
+
+
+def loadSchedule(path):
+    """
+    Load a schedule saved with `Schedule.save`, e.g. to replay a session.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        File written by `Schedule.save`.
+
+    Returns
+    ==========
+    Schedule
+        The schedule exactly as it was compiled.
+    """
+    with np.load(path) as saved:
+        return Schedule(
+            events=saved['events'],
+            conditions=json.loads(str(saved['conditions'])),
+            seed=int(saved['seed']),
+        )
+
+
+def compileSchedule(conditions, events, nReps=1, shuffle=True, seed=None):
+    """
+    Compile conditions and event timings into a flat schedule.
+
+    Parameters
+    ==========
+    conditions : list of dict
+        One dict per condition, e.g. from `data.importConditions`.
+    events : list of tuple
+        `(name, duration)` for each event of a trial, in order. A duration is
+        either a number of seconds, a `(low, high)` tuple for a uniformly
+        jittered duration, or None for an event that ends on a response.
+    nReps : int
+        Number of times each condition is repeated.
+    shuffle : bool
+        Shuffle the trial order within each repeat, otherwise keep the order
+        of `conditions`.
+    seed : int or None
+        Seed for the shuffling and jitter, leave as None to draw a new one
+        (it is stored in the schedule either way).
+
+    Returns
+    ==========
+    Schedule
+        The compiled schedule.
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    rng = np.random.default_rng(seed)
+    # trial order
+    order = [
+        rng.permutation(len(conditions)) if shuffle else np.arange(len(conditions))
+        for rep in range(nReps)
+    ]
+    stims = np.concatenate(order) if order else np.array([], dtype=int)
+    nTrials, nEvents = len(stims), len(events)
+    schedule = np.zeros((nTrials, nEvents), dtype=SCHEDULE_DTYPE)
+    schedule['trial'] = np.arange(nTrials)[:, None]
+    schedule['stim'] = stims[:, None]
+    for col, (name, duration) in enumerate(events):
+        schedule['event'][:, col] = name
+        if duration is None:
+            schedule['duration'][:, col] = np.nan
+        elif isinstance(duration, (tuple, list)):
+            low, high = duration
+            schedule['duration'][:, col] = rng.uniform(low, high, nTrials)
+        else:
+            schedule['duration'][:, col] = duration
+    # onsets are known up to the first event that ends on a response
+    flat = schedule.reshape(-1)
+    onsets = np.concatenate([[0.0], np.cumsum(flat['duration'])[:-1]])
+    flat['onset'] = onsets  # NaN from the first open-ended event onwards
+    return Schedule(flat, list(conditions), seed)
@@ -0,0 +1,116 @@
+"""
+Import-time profile of an experiment's startup.
+
+Runs the import block at the top of an experiment script (everything up to
+its last top-level import before the experiment starts) in a fresh Python
+with `-X importtime`, and reports the modules that took longest to import::
+
+    python -m exptools.startup stroop/builder_exp/stroop_lastrun.py
+    python -m exptools.startup stroop/builder_exp/stroop_lastrun.py --eager
+
+`--eager` imports what `lazyImport` would defer, to see what the lazy imports
+save. The experiment itself is not run, so no window or dialog is opened.
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# statements that can't be part of the import block (they start the experiment)
+_BLOCKS = (ast.FunctionDef, ast.ClassDef, ast.If, ast.For, ast.While, ast.With, ast.Try)
+
+
+def importBlock(path):
+    """
+    Get the source of a script's top-level import block.
+
+    The block runs from the start of the script to its last import before the
+    first function, class or compound statement, so the `sys.path` and
+    `prefs` changes between the imports are kept.
+    """
+    source = Path(path).read_text(encoding='utf-8-sig')
+    tree = ast.parse(source)
+    end = 0
+    for node in tree.body:
+        if isinstance(node, _BLOCKS):
+            break
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            end = node.end_lineno
+    return '\n'.join(source.splitlines()[:end])
+
+
+def runImports(path, lazy=True, importTime=False):
+    """
+    Run a script's import block in a new Python process.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Experiment script.
+    lazy : bool
+        Whether `lazyImport` defers its modules (`EXPTOOLS_LAZY_IMPORTS`).
+    importTime : bool
+        Run with `-X importtime` and return its report.
+
+    Returns
+    ==========
+    tuple
+        Wall time (s) of the process and the `-X importtime` output (or '').
+    """
+    path = Path(path).resolve()
+    code = f'__file__ = {str(path)!r}\n' + importBlock(path)
+    env = dict(os.environ, EXPTOOLS_LAZY_IMPORTS='1' if lazy else '0')
+    args = [sys.executable] + (['-X', 'importtime'] if importTime else []) + ['-c', code]
+    t0 = time.perf_counter()
+    result = subprocess.run(args, cwd=str(path.parent), env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if result.returncode != 0:
+        raise RuntimeError(f'importing for {path.name} failed:\n{result.stderr[-2000:]}')
+    return wall, result.stderr if importTime else ''
+
+
+def parseImportTime(report):
+    """
+    Parse `-X importtime` output.
+
+    Returns
+    ==========
+    list of tuple
+        `(module, self seconds, cumulative seconds, depth)` in import order.
+    """
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        selfUs, cumulativeUs, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(selfUs) / 1e6, int(cumulativeUs) / 1e6, depth))
+    return rows
+
+
+def profile(path, lazy=True, top=20):
+    """
+    Print the import-time profile of an experiment script.
+    """
+    wall, report = runImports(path, lazy=lazy, importTime=True)
+    rows = parseImportTime(report)
+    print(f'{Path(path).name}: imports took {wall:.2f} s '
+          f'({"lazy" if lazy else "eager"}, {len(rows)} modules)')
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    # the top-level imports the script asked for, the most expensive first
+    for name, selfTime, cumulative, depth in sorted(
+            (row for row in rows if row[3] == 0), key=lambda row: -row[2])[:top]:
+        print(f'{cumulative * 1000:>14.1f}{selfTime * 1000:>10.1f}  {name}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile the imports of an experiment's startup.")
+    parser.add_argument('scripts', nargs='+')
+    parser.add_argument('--eager', action='store_true', help='import deferred modules up front')
+    parser.add_argument('--top', type=int, default=20, help='number of modules to list')
+    args = parser.parse_args()
+    for script in args.scripts:
+        profile(script, lazy=not args.eager, top=args.top)
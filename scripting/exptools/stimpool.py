@@ -0,0 +1,121 @@
+"""
+Reusing stimulus objects across trials.
+
+Creating a `visual.TextStim` or `visual.ImageStim` inside the trial loop
+allocates new GL resources and rebuilds glyphs or textures while the trial is
+running. A `StimulusPool` builds the stimuli before the loop, one per distinct
+value (e.g. "correct" and "wrong" feedback), and hands the ready objects out
+during the trials. It counts how many stimuli still had to be created in each
+trial, which should be 0.
+"""
+from collections import OrderedDict
+
+
+class StimulusPool:
+    """
+    Build stimuli once and hand them out again by key.
+
+    Parameters
+    ==========
+    factory : callable
+        `factory(value)` creates the stimulus for a value, e.g.
+        `lambda text: visual.TextStim(win, text=text)`.
+    update : callable or None
+        `update(stim, value)` changes an existing stimulus to show a new value,
+        e.g. `lambda stim, image: stim.setImage(image)`. Needed for `capacity`.
+    capacity : int or None
+        Maximum number of stimuli to keep. Once it is reached, the least
+        recently used stimulus is updated to show a new value instead of
+        creating another one. None keeps one stimulus per distinct value.
+    """
+
+    def __init__(self, factory, update=None, capacity=None):
+        if capacity is not None and update is None:
+            raise ValueError('StimulusPool needs an `update` function to have a capacity')
+        self.factory = factory
+        self.update = update
+        self.capacity = capacity
+        self.prebuilt = 0  # stimuli created by prebuild
+        self.allocations = 0  # stimuli created by get
+        self.reuses = 0  # stimuli updated to show a new value
+        self.perTrial = []  # stimuli created by get, per trial
+        self._trialAllocations = 0
+        self._stims = OrderedDict()
+
+    def prebuild(self, keys, values=None):
+        """
+        Create the stimuli for `keys` now, before the trial loop.
+
+        Parameters
+        ==========
+        keys : iterable
+            Keys the stimuli will be asked for by.
+        values : iterable or None
+            Value to build each stimulus from, the keys themselves if None.
+        """
+        keys = list(keys)
+        for key, value in zip(keys, keys if values is None else values):
+            if key not in self._stims:
+                self._stims[key] = self.factory(value)
+                self.prebuilt += 1
+        return self
+
+    def get(self, key, value=None):
+        """
+        Get the stimulus for `key`, ready to draw.
+
+        Parameters
+        ==========
+        key : hashable
+            Which stimulus, e.g. the feedback text or an image path.
+        value : object or None
+            Value to build or update the stimulus from if it is not in the
+            pool yet, `key` itself if None.
+
+        Returns
+        ==========
+        psychopy.visual.BaseVisualStim
+            The stimulus.
+        """
+        if key in self._stims:
+            self._stims.move_to_end(key)
+            return self._stims[key]
+        value = key if value is None else value
+        if self.capacity is not None and len(self._stims) >= self.capacity:
+            # show the new value on the least recently used stimulus
+            oldKey, stim = self._stims.popitem(last=False)
+            self.update(stim, value)
+            self.reuses += 1
+        else:
+            stim = self.factory(value)
+            self.allocations += 1
+            self._trialAllocations += 1
+        self._stims[key] = stim
+        return stim
+
+    def endTrial(self):
+        """
+        Record the number of stimuli created in this trial and start counting
+        for the next one.
+
+        Returns
+        ==========
+        int
+            Stimuli created since the last call.
+        """
+        count, self._trialAllocations = self._trialAllocations, 0
+        self.perTrial.append(count)
+        return count
+
+    def stats(self):
+        """
+        Get the prebuilt, allocation and reuse counts.
+        """
+        return {
+            'stimuli': len(self._stims),
+            'prebuilt': self.prebuilt,
+            'allocations': self.allocations,
+            'reuses': self.reuses,
+            'trials': len(self.perTrial),
+            'maxPerTrial': max(self.perTrial, default=0),
+        }
@@ -0,0 +1,298 @@
+"""
+Append-only, crash-safe streaming of trial data.
+
+`StreamingWriter` hooks into `ExperimentHandler.nextEntry()` and keeps every
+finished row in memory until `flush()` is called during a non-critical period
+(fixation, ISI). A background thread then appends the batch to a JSON-lines
+file and syncs it to disk, so a crash loses at most the rows since the last
+flush. The wide CSV can be rebuilt from the stream at any time with::
+
+    python -m exptools.streaming data/<participant>_experiment_stream.jsonl
+
+The rebuilt CSV is the one `ExperimentHandler.saveAsWideText` would have
+written: the stream also records the handler's column order (loop
+parameters, data, extra info, sorted as `sortColumns` asks) and the text of
+every value that would not print the same after a trip through JSON.
+"""
+import json
+import os
+import queue
+import sys
+import threading
+
+
+def _toJson(value):
+    # numpy scalars/arrays and anything else json can't handle natively
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return repr(value)
+
+
+def _fromJson(value):
+    # the value json.loads gives back for `value`
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_fromJson(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _fromJson(item) for key, item in value.items()}
+    return _fromJson(_toJson(value))
+
+
+def _encodeRow(row):
+    # json line of a row, with the text of the values that json changes
+    # (tuples, arrays, numpy floats, objects) as saveAsWideText writes them
+    texts = {}
+    for name, value in row.items():
+        if str(_fromJson(value)) != str(value):
+            texts[name] = str(value)
+    if texts:
+        row = dict(row, __text__=texts)
+    return json.dumps(row, default=_toJson) + '\n'
+
+
+def wideTextColumns(thisExp, sortColumns=None):
+    """
+    Get the columns `ExperimentHandler.saveAsWideText` writes, in its order.
+
+    Parameters
+    ==========
+    thisExp : psychopy.data.ExperimentHandler
+        The handler.
+    sortColumns : str or bool or None
+        As for `saveAsWideText`, None for the handler's `sortColumns`.
+
+    Returns
+    ==========
+    list of str
+        The column names.
+    """
+    names = thisExp._getAllParamNames()
+    for name in thisExp.dataNames:
+        if name not in names:
+            names.append(name)
+    names.extend(thisExp._getExtraInfo()[0])
+    if sortColumns is None:
+        sortColumns = getattr(thisExp, 'sortColumns', False)
+    if sortColumns in ('alphabetical', 'alpha', 'a', True):
+        names.sort()
+    elif sortColumns in ('priority', 'pr'):
+        priorities = [(thisExp.columnPriority.get(name, thisExp._guessPriority(name)), name) for name in names]
+        names = [name for priority, name in sorted(priorities, reverse=True)]
+    return names
+
+
+class StreamingWriter:
+    """
+    Stream the rows of an ExperimentHandler to an append-only file.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        JSON-lines file to append rows to. If it already exists (e.g. from an
+        earlier session with the same participant ID), `_1`, `_2`, ... is
+        added before the extension instead of mixing the two sessions.
+    maxBuffered : int
+        Number of rows after which a flush is started automatically, even if
+        `flush()` has not been called.
+    """
+
+    def __init__(self, path, maxBuffered=50):
+        self.maxBuffered = maxBuffered
+        self.nRows = 0
+        self._buffer = []
+        self._batches = queue.Queue()
+        self._error = None
+        self._thisExp = None
+        self._columns = None
+        path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        stem, ext = os.path.splitext(path)
+        if stem.endswith('_stream'):
+            stem = stem[:-len('_stream')]
+            ext = '_stream' + ext
+        n = 0
+        while True:
+            self.path = path if n == 0 else f'{stem}_{n}{ext}'
+            try:
+                self._file = open(self.path, 'x', encoding='utf-8')
+                break
+            except FileExistsError:
+                n += 1
+        self._thread = threading.Thread(
+            target=self._work, name='StreamingWriter', daemon=True
+        )
+        self._thread.start()
+
+    def attach(self, thisExp):
+        """
+        Append every row finished by `thisExp.nextEntry()` to the stream,
+        until `close()`.
+
+        Parameters
+        ==========
+        thisExp : psychopy.data.ExperimentHandler
+            Handler whose rows should be streamed.
+        """
+        nextEntry = thisExp.nextEntry
+
+        def streamingNextEntry():
+            nextEntry()
+            self.addRow(thisExp.entries[-1])
+
+        thisExp.nextEntry = streamingNextEntry
+        self._thisExp = thisExp
+        return self
+
+    def addRow(self, row):
+        """
+        Buffer one row (a dict of column name to value).
+        """
+        # copy, so later changes to the handler's dict don't leak into the stream
+        self._buffer.append(dict(row))
+        self.nRows += 1
+        if len(self._buffer) >= self.maxBuffered:
+            self.flush()
+
+    def flush(self):
+        """
+        Hand the buffered rows to the background thread to be written.
+
+        This returns immediately, so it is safe to call at the start of a
+        fixation or ISI period.
+        """
+        if self._error is not None:
+            raise IOError(f'Streaming to {self.path} failed') from self._error
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            if self._thisExp is not None:
+                # the column order as saveAsWideText would write it now
+                columns = wideTextColumns(self._thisExp)
+                if columns != self._columns:
+                    self._columns = columns
+                    batch.append({'__columns__': columns})
+            self._batches.put(batch)
+
+    def close(self):
+        """
+        Write any remaining rows and close the stream file.
+
+        Data added after the last `nextEntry()` is written as a last row, as
+        `saveAsWideText` does. The handler is detached again, so it can be
+        saved with `saveAsPickle` afterwards.
+        """
+        if self._thisExp is not None:
+            if self._thisExp.thisEntry:
+                self.addRow(self._thisExp.thisEntry)
+            # the wrapper is a local function, which can't be pickled
+            self._thisExp.__dict__.pop('nextEntry', None)
+        self.flush()
+        self._batches.put(None)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise IOError(f'Streaming to {self.path} failed') from self._error
+
+    def _work(self):
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                # formatting happens here, off the experiment's thread
+                self._file.write(''.join(_encodeRow(row) for row in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except Exception as err:
+                self._error = err
+
+
+def _readRecords(path):
+    # rows, their saveAsWideText texts, and the last column order recorded
+    rows, texts, columns = [], [], None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line.endswith('\n'):
+                    raise
+                continue  # truncated final line
+            if '__columns__' in record:
+                columns = record['__columns__']
+                continue
+            texts.append(record.pop('__text__', {}))
+            rows.append(record)
+    return rows, texts, columns
+
+
+def readStream(path):
+    """
+    Read the rows back from a stream file.
+
+    A partly written last line (e.g. from a crash during a write) is skipped.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Stream file written by `StreamingWriter`.
+
+    Returns
+    ==========
+    list of dict
+        One dict per row, in the order the rows were finished.
+    """
+    return _readRecords(path)[0]
+
+
+def rebuildWideText(path, csvPath=None, delim=','):
+    """
+    Rebuild the wide CSV file (one row per trial) from a stream file, as
+    `ExperimentHandler.saveAsWideText` would have written it.
+
+    Parameters
+    ==========
+    path : str or pathlib.Path
+        Stream file written by `StreamingWriter`.
+    csvPath : str or None
+        CSV file to write, leave as None to replace the `_stream.jsonl`
+        ending of `path` with `.csv`.
+    delim : str
+        Column delimiter.
+
+    Returns
+    ==========
+    str
+        Path of the CSV file written.
+    """
+    path = str(path)
+    if csvPath is None:
+        stem = path[:-len('_stream.jsonl')] if path.endswith('_stream.jsonl') else os.path.splitext(path)[0]
+        csvPath = stem + '.csv'
+    rows, texts, header = _readRecords(path)
+    # the handler's column order, then any columns added after it was recorded
+    # (or all of them in the order they first appeared, for older streams)
+    header = list(dict.fromkeys((header or []) + [key for row in rows for key in row]))
+    with open(csvPath, 'w', newline='', encoding='utf-8-sig') as f:
+        f.write(''.join(f'{name}{delim}' for name in header) + '\n')
+        for row, rowTexts in zip(rows, texts):
+            cells = []
+            for name in header:
+                if name not in row:
+                    cells.append(delim)
+                    continue
+                text = rowTexts.get(name, str(row[name]))
+                # quoted the way saveAsWideText quotes
+                if ',' in text or '\n' in text:
+                    text = f'"{text}"'
+                cells.append(text + delim)
+            f.write(''.join(cells) + '\n')
+    return csvPath
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit('usage: python -m exptools.streaming STREAM.jsonl [OUT.csv]')
+    print(rebuildWideText(*sys.argv[1:]))
@@ -0,0 +1,7 @@
+"""
+Tests for exptools, run from the `scripting` folder with::
+
+    python -m pytest exptools/tests
+
+Tests of modules that need PsychoPy are skipped when it is not installed.
+"""
@@ -0,0 +1,6 @@
+import os
+import sys
+
+if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+    # the tests never open a window, but pyglet needs a display to import
+    os.environ.setdefault('PYGLET_HEADLESS', 'true')
@@ -0,0 +1,44 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from exptools.assetcache import ScaledImageCache  # noqa: E402
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for n in range(6):
+        path = tmp_path / f'img{n}.png'
+        Image.new('RGB', (64, 48), (40 * n, 0, 255 - 40 * n)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_copies_are_made_once(tmp_path, images):
+    cache = ScaledImageCache((16, 12), cacheDir=tmp_path / 'cache')
+    paths = cache.prepare(images + images, workers=4)
+    assert cache.stats() == {'size': (16, 12), 'created': 6, 'found': 0}
+    with Image.open(paths[0]) as im:
+        assert im.size == (16, 12) and im.mode == 'RGBA'
+    source = hashlib.sha1(Path(images[0]).read_bytes()).hexdigest()
+    assert Path(paths[0]).name == f'{source}_16x12_lanczos.png'
+    again = ScaledImageCache((16, 12), cacheDir=tmp_path / 'cache')
+    assert again.prepare(images) == paths[:6]
+    assert again.stats()['created'] == 0
+
+
+def test_filter_is_part_of_the_key(tmp_path, images):
+    lanczos = ScaledImageCache((16, 12), cacheDir=tmp_path / 'cache')
+    nearest = ScaledImageCache((16, 12), cacheDir=tmp_path / 'cache', resample=Image.NEAREST)
+    assert lanczos.path(images[0]) != nearest.path(images[0])
+    assert nearest.stats()['created'] == 1
+
+
+def test_hash_is_read_in_blocks(tmp_path, images):
+    cache = ScaledImageCache((16, 12), cacheDir=tmp_path / 'cache')
+    data = Path(images[0]).read_bytes()
+    assert cache._sourceHash(images[0], blockSize=7) == hashlib.sha1(data).hexdigest()
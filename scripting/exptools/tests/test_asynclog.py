@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pplogging = pytest.importorskip('psychopy.logging')
+
+from exptools.asynclog import AsyncLogWriter, asyncLogFile, closeLogFile  # noqa: E402
+
+# logs from exit handlers registered before and after the log file, as the
+# ExperimentHandler's (saving the data) and others are
+AT_EXIT = '''
+import atexit, sys
+from psychopy import logging
+atexit.register(lambda: logging.exp('saved before the log file was made'))
+from exptools.asynclog import asyncLogFile
+logFile = asyncLogFile(sys.argv[1], level=logging.EXP, filemode='w')
+atexit.register(lambda: logging.exp('saved after the log file was made'))
+logging.exp('during the experiment')
+'''
+
+
+def test_entries_logged_at_exit_reach_the_file(tmp_path):
+    path = tmp_path / 'exp.log'
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, '-c', AT_EXIT, str(path)], check=True, env=env)
+    text = path.read_text()
+    for message in ('during the experiment', 'saved before the log file was made',
+                    'saved after the log file was made'):
+        assert message in text
+
+
+def test_closed_log_file_gets_no_more_entries(tmp_path):
+    first = asyncLogFile(str(tmp_path / 'first.log'), level=pplogging.EXP, filemode='w')
+    pplogging.exp('first experiment')
+    closeLogFile(first)
+    second = asyncLogFile(str(tmp_path / 'second.log'), level=pplogging.EXP, filemode='w')
+    pplogging.exp('second experiment')
+    closeLogFile(second)
+    assert first not in pplogging.root.targets and second not in pplogging.root.targets
+    assert 'first experiment' in (tmp_path / 'first.log').read_text()
+    assert 'second experiment' not in (tmp_path / 'first.log').read_text()
+    assert 'second experiment' in (tmp_path / 'second.log').read_text()
+
+
+def test_writes_after_close_are_not_lost(tmp_path):
+    with open(tmp_path / 'log.txt', 'w') as stream:
+        writer = AsyncLogWriter(stream, closeAtExit=False)
+        writer.put(str, 'queued\n')
+        writer.close()
+        writer.put(str, 'after closing\n')
+    assert (tmp_path / 'log.txt').read_text() == 'queued\nafter closing\n'
+    assert writer.stats()['written'] == 2
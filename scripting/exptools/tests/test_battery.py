@@ -0,0 +1,128 @@
+import sys
+import threading
+import types
+
+import pytest
+
+pytest.importorskip('psychopy')
+
+from psychopy import logging  # noqa: E402
+
+from exptools.asynclog import closeLogFile  # noqa: E402
+from exptools.battery import runBattery  # noqa: E402
+
+# a Builder script, reduced to what the battery calls, that logs what happens where
+SCRIPT = '''
+import os
+import threading
+import batterylog
+from psychopy import logging
+from exptools.asynclog import asyncLogFile
+
+_thisDir = os.path.dirname(os.path.abspath(__file__))
+
+def _onMainThread():
+    return threading.current_thread() is threading.main_thread()
+
+def loadConditions(fileName, selection='', parse=None):
+    fileName = os.path.relpath(os.path.abspath(fileName), batterylog.root)
+    batterylog.events.append(('load', expName, fileName, _onMainThread()))
+    if expName == 'second':
+        batterylog.secondLoaded.set()
+    return [{{'loadedBy': len(batterylog.events)}}]
+
+expName = {name!r}
+expInfo = {{'participant': '', 'session': '001'}}
+batterylog.events.append(('import', expName, _onMainThread()))
+
+def setupResources():
+    # e.g. opening an image pack
+    batterylog.events.append(('resources', expName, _onMainThread()))
+
+class _Exp:
+    dataFileName = os.path.join(_thisDir, expName)
+    def abort(self):
+        pass
+
+def setupData(expInfo):
+    return _Exp()
+
+def setupLogging(filename):
+    logFile = asyncLogFile(filename + '.log', level=logging.EXP, filemode='w')
+    batterylog.logFiles.append(logFile)
+    return logFile
+
+def setupWindow(expInfo, win=None):
+    return win or object()
+
+deviceManager = object()
+
+def setupDevices(expInfo, thisExp, win):
+    pass
+
+def run(expInfo, thisExp, win, globalClock=None):
+    if expName == 'first':
+        # the second experiment is loaded while this one runs
+        batterylog.secondLoaded.wait(5)
+    trialList = loadConditions('stims.csv')
+    logging.exp('running ' + expName)
+    batterylog.events.append(('run', expName, trialList[0]['loadedBy']))
+
+def saveData(thisExp):
+    batterylog.events.append(('save', expName, os.path.basename(os.getcwd())))
+
+def quit(thisExp, win):
+    batterylog.events.append(('quit', expName))
+'''
+
+
+@pytest.fixture
+def experiments(tmp_path, monkeypatch):
+    log = types.ModuleType('batterylog')
+    log.events, log.logFiles, log.root = [], [], str(tmp_path)
+    log.secondLoaded = threading.Event()
+    monkeypatch.setitem(sys.modules, 'batterylog', log)
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for name in ('first', 'second'):
+        (tmp_path / name).mkdir()
+        path = tmp_path / name / f'{name}.py'
+        path.write_text(SCRIPT.format(name=name))
+        paths.append(path)
+    yield paths, log
+    for logFile in log.logFiles:
+        if logFile in logging.root.targets:
+            closeLogFile(logFile)
+
+
+def test_next_experiment_loaded_during_the_run(experiments, capsys):
+    paths, log = experiments
+    report = runBattery(paths, info={'participant': '001'})
+    assert [row['name'] for row in report] == ['first', 'second']
+    assert report[0]['transition'] is None and report[1]['transition'] >= 0
+    assert log.events == [
+        ('import', 'first', True),
+        ('resources', 'first', True),
+        ('load', 'first', 'first/stims.csv', True),
+        # on a worker thread while the first experiment runs, from its own folder
+        ('import', 'second', False),
+        ('resources', 'second', False),
+        ('load', 'second', 'second/stims.csv', False),
+        ('run', 'first', 3),
+        ('save', 'first', 'first'),
+        # run got the trial list loaded before it started, without loading it again
+        ('run', 'second', 6),
+        ('save', 'second', 'second'),
+        ('quit', 'second'),
+    ]
+
+
+def test_earlier_log_files_are_closed(experiments, tmp_path):
+    paths, log = experiments
+    runBattery(paths, info={'participant': '001'})
+    first, second = log.logFiles
+    assert first not in logging.root.targets and second in logging.root.targets
+    closeLogFile(second)
+    assert 'running first' in (tmp_path / 'first' / 'first.log').read_text()
+    assert 'running second' not in (tmp_path / 'first' / 'first.log').read_text()
+    assert 'running second' in (tmp_path / 'second' / 'second.log').read_text()
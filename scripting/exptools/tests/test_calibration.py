@@ -0,0 +1,87 @@
+import pytest
+
+pytest.importorskip('psychopy')
+
+from exptools import calibration
+from exptools.calibration import CalibrationStore, calibratedFrameRate, checkFrameRate, monitorKey
+from exptools.frametiming import FrameRecorder
+
+
+class _Window:
+    # flips at a monitor rate that can be changed, recording intervals as psychopy does
+    def __init__(self, now, frameRate, screen=1):
+        self.now = now
+        self.frameRate = frameRate
+        self.screen = screen
+        self.size = (800, 600)
+        self.recordFrameIntervals = False
+        self.frameIntervals = []
+        self.monitorFramePeriod = 1 / 60
+        self._monitorFrameRate = None
+
+    def flip(self):
+        self.now[0] += 1 / self.frameRate
+        if self.recordFrameIntervals:
+            self.frameIntervals.append(1 / self.frameRate)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(calibration.core, 'getTime', lambda: now[0])
+    return now
+
+
+def _flip(win, n):
+    for frame in range(n):
+        win.flip()
+
+
+def test_measured_once_then_reused(clock, tmp_path):
+    store = CalibrationStore(tmp_path / 'framerate.json')
+    win = _Window(clock, 75.0)
+    assert calibratedFrameRate(win, store=store) == pytest.approx(75.0)
+    # the window's own screen names the monitor
+    assert store.get(monitorKey(win, screen=1))['frameRate'] == pytest.approx(75.0)
+    flips = clock[0]
+    assert calibratedFrameRate(_Window(clock, 75.0), store=store) == pytest.approx(75.0)
+    assert clock[0] == flips  # nothing measured
+
+
+def test_check_waits_for_enough_frames_and_keeps_the_rate(clock, tmp_path):
+    store = CalibrationStore(tmp_path / 'framerate.json')
+    calibratedFrameRate(_Window(clock, 60.0), store=store)
+    win = _Window(clock, 60.0)
+    calibratedFrameRate(win, store=store, validateFrames=30)
+    _flip(win, 10)
+    assert checkFrameRate(win) is None and win._frameRateCheck is not None
+    _flip(win, 20)
+    assert checkFrameRate(win) is None
+    # done, and recording is put back as it was
+    assert win._frameRateCheck is None and not win.recordFrameIntervals
+
+
+def test_drift_is_measured_again_and_applied(clock, tmp_path):
+    store = CalibrationStore(tmp_path / 'framerate.json')
+    calibratedFrameRate(_Window(clock, 60.0), store=store)
+    win = _Window(clock, 60.0)
+    calibratedFrameRate(win, store=store, validateFrames=30)
+    recorder = FrameRecorder(frameDur=1 / 60)
+    win.frameRate = 120.0  # the monitor was switched to 120 Hz
+    _flip(win, 30)
+    assert checkFrameRate(win, recorder) == pytest.approx(120.0)
+    assert win._monitorFrameRate == pytest.approx(120.0)
+    assert win.monitorFramePeriod == pytest.approx(1 / 120)
+    assert recorder.frameDur == pytest.approx(1 / 120)
+    assert store.get(monitorKey(win, screen=1))['frameRate'] == pytest.approx(120.0)
+
+
+def test_slow_experiment_frames_are_not_drift(clock, tmp_path):
+    store = CalibrationStore(tmp_path / 'framerate.json')
+    calibratedFrameRate(_Window(clock, 60.0), store=store)
+    win = _Window(clock, 60.0)
+    calibratedFrameRate(win, store=store, validateFrames=30)
+    # every frame of the experiment dropped one, but blank frames still run at 60 Hz
+    win.frameIntervals.extend([2 / 60] * 30)
+    assert checkFrameRate(win) is None
+    assert store.get(monitorKey(win, screen=1))['frameRate'] == pytest.approx(60.0)
@@ -0,0 +1,139 @@
+import sys
+import types
+
+from exptools.codegen import compileExperiment, formatReport, optimiseScript
+
+# the parts of a Builder export the pass looks at
+SCRIPT = '''\
+from psychopy import visual
+from psychopy.constants import STARTED
+
+def run(win, trials, routineTimer):
+    cross = visual.ShapeStim(
+        win=win, name='cross',
+        vertices='cross')
+    stim_txt = visual.TextStim(win=win, name='stim_txt', text='')
+
+    # --- Prepare to start Routine "stim" ---
+    for thisTrial in trials:
+        cross.setFillColor('black')
+        stim_txt.setText(word)
+        # keep track of which components have finished
+        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
+
+        # --- Run Routine "stim" ---
+        while continueRoutine:
+            # *cross* updates
+            if cross.status == STARTED:
+                # update params
+                pass
+
+            # *stim_txt* updates
+            if stim_txt.status == NOT_STARTED:
+                stim_txt.setAutoDraw(True)
+                thisExp.timestampOnFlip(win, 'stim_txt.started')
+            if stim_txt.status == STARTED:
+                stim_txt.setOpacity(1.0)
+            win.flip()
+
+        # --- Ending Routine "stim" ---
+        thisExp.nextEntry()
+'''
+
+
+def test_dead_branch_removed_with_its_comments():
+    source, report = optimiseScript(SCRIPT)
+    assert 'if cross.status == STARTED' not in source
+    assert '# update params' not in source
+    assert ('stim', 'deadBranch', 'cross', True) in report
+    # a branch that does something stays, and so do unrelated comments
+    assert 'if stim_txt.status == NOT_STARTED' in source
+    assert '# *stim_txt* updates' in source
+    assert '# --- Run Routine "stim" ---' in source
+    assert '        while continueRoutine:\n            # *stim_txt* updates\n' in source
+
+
+def test_unread_time_to_first_frame_removed():
+    source, report = optimiseScript(SCRIPT)
+    assert '_timeToFirstFrame' not in source
+    assert ('stim', 'deadStore', '_timeToFirstFrame', False) in report
+    # read elsewhere, it is kept
+    source, report = optimiseScript(SCRIPT + '\nprint(_timeToFirstFrame)\n')
+    assert '_timeToFirstFrame = win' in source
+    assert not any(kind == 'deadStore' for routine, kind, component, perFrame in report)
+
+
+def test_constant_setter_hoisted_after_creation():
+    source, report = optimiseScript(SCRIPT)
+    lines = source.splitlines()
+    hoisted = lines.index("    cross.setFillColor('black')")
+    assert lines[hoisted - 1] == "        vertices='cross')"
+    assert source.count('cross.setFillColor') == 1
+    assert ('stim', 'hoist', 'cross', False) in report
+    assert ('stim', 'hoist', 'stim_txt', True) in report
+    # the branch it was set in has nothing left to do
+    assert 'if stim_txt.status == STARTED' not in source
+    assert ('stim', 'deadBranch', 'stim_txt', True) in report
+    # set from a variable, or to two constants, it stays in the loop
+    assert '        stim_txt.setText(word)' in source
+    twice = SCRIPT.replace("stim_txt.setText(word)", "cross.setFillColor('red')")
+    source, report = optimiseScript(twice)
+    assert source.count('cross.setFillColor') == 2
+    assert not any(component == 'cross' and kind == 'hoist' for routine, kind, component, perFrame in report)
+
+
+def test_nothing_hoisted_when_other_code_changes_the_component():
+    # a code component setting the attribute itself, on some trials
+    assigned = SCRIPT.replace("        stim_txt.setText(word)\n",
+                              "        stim_txt.setText(word)\n"
+                              "        if word == 'red':\n"
+                              "            cross.fillColor = 'red'\n")
+    # or the component handed to a function that may change it
+    passed = SCRIPT.replace("        stim_txt.setText(word)\n",
+                            "        stim_txt.setText(word)\n"
+                            "        win.timeOnFlip(stim_txt, 'tStartRefresh')\n")
+    for script, component in ((assigned, 'cross'), (passed, 'stim_txt')):
+        source, report = optimiseScript(script)
+        assert not any(name == component and kind == 'hoist' for routine, kind, name, perFrame in report)
+    source, report = optimiseScript(assigned)
+    assert "        cross.setFillColor('black')" in source.splitlines()
+    assert "    cross.setFillColor('black')" not in source.splitlines()
+    source, report = optimiseScript(passed)
+    assert '                stim_txt.setOpacity(1.0)' in source
+    assert 'if stim_txt.status == STARTED' in source
+
+
+def test_timestamps_dropped_only_when_asked():
+    source, report = optimiseScript(SCRIPT)
+    assert "'stim_txt.started'" in source
+    source, report = optimiseScript(SCRIPT, dropTimestamps={'stim_txt'})
+    assert "'stim_txt.started'" not in source
+    assert ('stim', 'timestamp', 'stim_txt', True) in report
+
+
+def test_report():
+    source, report = optimiseScript(SCRIPT)
+    text = formatReport('stim_lastrun.py', report).splitlines()
+    assert text[0] == 'stim_lastrun.py: removed 5 statements, 3 of them from frame loops'
+    assert text[1].split()[0] == 'routine'
+    assert text[2].split() == ['stim', '2', '2', '0', '1', '3']
+
+
+def test_compile_writes_optimised_script_next_to_lastrun(tmp_path, monkeypatch):
+    psyexp = tmp_path / 'stim.psyexp'
+    psyexp.write_text('<PsychoPy2experiment><Routines/></PsychoPy2experiment>')
+    lastrun = tmp_path / 'stim_lastrun.py'
+    lastrun.write_text('# exported with the hooks\n')
+
+    def compileScript(infile, outfile):
+        with open(outfile, 'w', encoding='utf-8-sig') as file:
+            file.write(SCRIPT)
+    # stands in for PsychoPy's own export
+    scripts = types.ModuleType('psychopy.scripts')
+    scripts.psyexpCompile = types.SimpleNamespace(compileScript=compileScript)
+    monkeypatch.setitem(sys.modules, 'psychopy', types.ModuleType('psychopy'))
+    monkeypatch.setitem(sys.modules, 'psychopy.scripts', scripts)
+    report = compileExperiment(psyexp)
+    assert report
+    assert lastrun.read_text() == '# exported with the hooks\n'
+    assert (tmp_path / 'stim_optimised.py').read_text(encoding='utf-8-sig') == optimiseScript(SCRIPT)[0]
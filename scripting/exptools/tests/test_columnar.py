@@ -0,0 +1,61 @@
+import pytest
+
+from exptools import columnar
+from exptools.columnar import convertToColumnar, readWideText
+
+
+def _writeCsv(path, lines):
+    # as saveAsWideText writes it: BOM, and a delimiter at the end of every line
+    path.write_text(''.join(line + ',\n' for line in lines), encoding='utf-8-sig')
+    return path
+
+
+def test_csv_columns_are_typed_as_a_whole(tmp_path):
+    path = _writeCsv(tmp_path / 'p.csv', [
+        'participant,session,code,rt,n,correct,keys',
+        '007,001,0012,0.5,1,True,left',
+        '007,001,abc,,2,False,None',
+        '007,001,12,1e-05,3,,right',
+    ])
+    rows = readWideText(path)
+    assert rows[0] == {'participant': '007', 'session': '001', 'code': '0012', 'rt': 0.5,
+                       'n': 1, 'correct': True, 'keys': 'left'}
+    # one text value keeps the whole column as text, empty cells and None are missing
+    assert rows[1] == {'participant': '007', 'session': '001', 'code': 'abc', 'n': 2, 'correct': False}
+    assert rows[2]['code'] == '12' and rows[2]['rt'] == 1e-05
+
+
+def test_convert_keeps_identifiers_as_strings(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = _writeCsv(tmp_path / 'p.csv', [
+        'participant,session,date,rt',
+        '7,2,2024,0.5',
+        '7,2,2024,0.75',
+    ])
+    table = pq.read_table(convertToColumnar(path))
+    assert table.column_names == ['participant', 'session', 'date', 'rt']
+    assert str(table.schema.field('participant').type) == 'string'
+    assert str(table.schema.field('date').type) == 'string'
+    assert table.column('participant').to_pylist() == ['7', '7']
+    assert str(table.schema.field('rt').type) == 'double'
+
+
+def test_stream_rows_keep_their_types(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from exptools.streaming import StreamingWriter
+    writer = StreamingWriter(tmp_path / 'p_stream.jsonl')
+    writer.addRow({'participant': '007', 'trial': 0, 'rt': 0.5, 'pos': [0, 1]})
+    writer.addRow({'participant': '007', 'trial': 1, 'rt': None, 'pos': [0, -1]})
+    writer.close()
+    table = pq.read_table(convertToColumnar(writer.path))
+    assert table.to_pydict() == {'participant': ['007', '007'], 'trial': [0, 1],
+                                 'rt': [0.5, None], 'pos': [[0, 1], [0, -1]]}
+
+
+def test_missing_pyarrow_is_logged(tmp_path, monkeypatch):
+    logging = pytest.importorskip('psychopy.logging')
+    messages = []
+    monkeypatch.setattr(columnar, 'pa', None)
+    monkeypatch.setattr(logging, 'warning', messages.append)
+    assert columnar.writeColumnar([{'a': 1}], tmp_path / 'p.parquet') is None
+    assert messages == [f'pyarrow is not installed, not writing {tmp_path / "p.parquet"}']
@@ -0,0 +1,84 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+from exptools import compilecache, exporter
+from exptools.compilecache import cachePaths, cacheKey, compileCached, scriptPath
+
+STROOP = Path(__file__).resolve().parents[2] / 'stroop' / 'builder_exp' / 'stroop.psyexp'
+
+
+@pytest.fixture
+def experiment(tmp_path, monkeypatch):
+    # stroop, with its code importing a local module
+    psyexp = tmp_path / 'stroop.psyexp'
+    psyexp.write_text(STROOP.read_text(encoding='utf-8').replace(
+        'import random&amp;#10;', 'import random&amp;#10;import helpers&amp;#10;'), encoding='utf-8')
+    (tmp_path / 'helpers.py').write_text('LEFT = "left"\n')
+    exports = []
+    export = exporter.exportExperiment
+
+    def counted(*args, **kwargs):
+        exports.append(args[0])
+        return export(*args, **kwargs)
+    monkeypatch.setattr(exporter, 'exportExperiment', counted)
+    return psyexp, exports
+
+
+def _entries(psyexp):
+    return sorted(path.name for path in (psyexp.parent / 'cache').iterdir())
+
+
+def test_cache_hit_skips_the_export(experiment):
+    psyexp, exports = experiment
+    code, hit = compileCached(psyexp, version='2024.2.4')
+    assert not hit and len(exports) == 1
+    assert code.co_filename == str(scriptPath(psyexp))
+    # exported with the hooks, as the script next to the experiment would be
+    source = cachePaths(psyexp, cacheKey(psyexp, version='2024.2.4'))[0].read_text(encoding='utf-8-sig')
+    assert 'routines = RoutineEngine(' in source and 'pauseExperiment=pauseExperiment' in source
+    assert f'originPath={str(scriptPath(psyexp))!r}' in source
+    code, hit = compileCached(psyexp, version='2024.2.4')
+    assert hit and len(exports) == 1
+    assert not scriptPath(psyexp).exists()
+
+
+def test_bytecode_of_another_python_is_rebuilt_without_exporting(experiment):
+    psyexp, exports = experiment
+    compileCached(psyexp, version='2024.2.4')
+    bytecode = cachePaths(psyexp, cacheKey(psyexp, version='2024.2.4'))[1]
+    bytecode.write_bytes(b'\0' * len(importlib.util.MAGIC_NUMBER) + bytecode.read_bytes()[4:])
+    code, hit = compileCached(psyexp, version='2024.2.4')
+    assert not hit and len(exports) == 1
+    assert bytecode.read_bytes().startswith(importlib.util.MAGIC_NUMBER)
+
+
+@pytest.mark.parametrize('change', ['psyexp', 'module', 'version'])
+def test_change_compiles_again_and_replaces_the_entry(experiment, change):
+    psyexp, exports = experiment
+    compileCached(psyexp, version='2024.2.4')
+    before = _entries(psyexp)
+    version = '2024.2.4'
+    if change == 'psyexp':
+        psyexp.write_text(psyexp.read_text(encoding='utf-8').replace('t_isi = random.uniform(0, 1)',
+                                                                      't_isi = random.uniform(0, 2)'),
+                          encoding='utf-8')
+    elif change == 'module':
+        (psyexp.parent / 'helpers.py').write_text('LEFT = "a"\n')
+    else:
+        version = '2025.1.0'
+    code, hit = compileCached(psyexp, version=version)
+    assert not hit and len(exports) == 2
+    after = _entries(psyexp)
+    assert len(after) == 2 and not set(after) & set(before)
+    assert compileCached(psyexp, version=version)[1]
+
+
+def test_exporter_is_part_of_the_key(experiment, monkeypatch, tmp_path):
+    psyexp, exports = experiment
+    key = cacheKey(psyexp, version='2024.2.4')
+    changed = tmp_path / 'exporter.py'
+    changed.write_bytes(Path(exporter.__file__).read_bytes() + b'\n# changed\n')
+    monkeypatch.setattr(compilecache.exporter, '__file__', str(changed))
+    assert cacheKey(psyexp, version='2024.2.4') != key
@@ -0,0 +1,78 @@
+import csv
+import os
+import pickle
+
+import pytest
+
+from exptools.conditions import cachePath, loadConditions
+
+
+class _Parser:
+    # parses a CSV file and counts how often it had to
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, fileName, selection):
+        self.calls += 1
+        with open(fileName, newline='') as f:
+            return list(csv.DictReader(f))
+
+
+def _write(path, rows):
+    path.write_text('word,color\n' + ''.join(f'{word},{color}\n' for word, color in rows))
+
+
+def _touch(path, secs=10):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime + secs, stat.st_mtime + secs))
+
+
+def test_cache_is_used_until_the_file_changes(tmp_path):
+    path = tmp_path / 'stims.csv'
+    _write(path, [('red', 'blue'), ('blue', 'red')])
+    parse = _Parser()
+    first = loadConditions(path, parse=parse)
+    assert first == [{'word': 'red', 'color': 'blue'}, {'word': 'blue', 'color': 'red'}]
+    assert os.path.exists(cachePath(path))
+    assert loadConditions(path, parse=parse) == first and parse.calls == 1
+    # touched, same content: still cached, and the new mtime is stored
+    _touch(path)
+    assert loadConditions(path, parse=parse) == first and parse.calls == 1
+    with open(cachePath(path), 'rb') as f:
+        assert pickle.load(f)['mtime'] == os.stat(path).st_mtime
+    _write(path, [('red', 'red')])
+    _touch(path, 30)
+    assert loadConditions(path, parse=parse) == [{'word': 'red', 'color': 'red'}]
+    assert parse.calls == 2
+
+
+def test_selection_and_parser_are_part_of_the_key(tmp_path):
+    path = tmp_path / 'stims.csv'
+    _write(path, [('red', 'blue')])
+    parse = _Parser()
+    loadConditions(path, parse=parse)
+    loadConditions(path, selection='0', parse=parse)
+    assert parse.calls == 2
+    other = _Parser()
+    other.__qualname__ = 'otherParser'
+    loadConditions(path, selection='0', parse=other)
+    assert other.calls == 1
+
+
+def test_unreadable_cache_is_parsed_again(tmp_path):
+    path = tmp_path / 'stims.csv'
+    _write(path, [('red', 'blue')])
+    parse = _Parser()
+    loadConditions(path, parse=parse)
+    with open(cachePath(path), 'wb') as f:
+        f.write(b'not a pickle')
+    assert loadConditions(path, parse=parse) == [{'word': 'red', 'color': 'blue'}]
+    assert parse.calls == 2
+
+
+def test_same_as_import_conditions(tmp_path):
+    data = pytest.importorskip('psychopy.data')
+    path = tmp_path / 'stims.csv'
+    _write(path, [('red', 'blue'), ('blue', 'red')])
+    assert loadConditions(path) == data.importConditions(str(path))
+    assert loadConditions(path) == data.importConditions(str(path))
@@ -0,0 +1,53 @@
+import ast
+from pathlib import Path
+
+import pytest
+
+from exptools.exporter import readHeader, renderScript
+
+SCRIPTING = Path(__file__).resolve().parents[2]
+
+
+@pytest.mark.parametrize('script', [
+    'stroop/builder_exp/stroop_lastrun.py',
+    'image_stim/builder_exp/image_stim_lastrun.py',
+])
+def test_scripts_are_exported_from_their_psyexp(script):
+    # the checked-in scripts are what the exporter writes, so exporting again keeps every hook
+    path = SCRIPTING / script
+    date, originPath = readHeader(path)
+    psyexp = path.with_name(path.parent.parent.name + '.psyexp')
+    assert renderScript(psyexp, date=date, originPath=originPath) == path.read_text(encoding='utf-8-sig')
+
+
+def test_each_frame_code_shares_the_routine_variables():
+    source = renderScript(SCRIPTING / 'image_stim' / 'builder_exp' / 'image_stim.psyexp')
+    assert '    def ratingEachFrame():\n        nonlocal current_slider_pos\n' in source
+    assert "], eachFrame=ratingEachFrame)" in source
+    # the isi is drawn anew for every trial, so its duration is read at the onset
+    assert 'StimComponent(polygon_2, duration=lambda: t_isi)' in source
+    assert 'image_disp.setImage(imagePack.getImage(image))' in source
+    assert 'print(' not in source.replace('asyncPrint(', '')
+
+
+def test_image_packs_are_opened_in_setup_not_at_import():
+    source = renderScript(SCRIPTING / 'image_stim' / 'builder_exp' / 'image_stim.psyexp')
+    tree = ast.parse(source)
+    # importing the script neither changes the working directory nor builds a pack
+    topLevel = [node for node in tree.body if not isinstance(node, (ast.FunctionDef, ast.If))]
+    calls = {node.func.attr if isinstance(node.func, ast.Attribute) else node.func.id
+             for statement in topLevel for node in ast.walk(statement)
+             if isinstance(node, ast.Call) and isinstance(node.func, (ast.Attribute, ast.Name))}
+    assert not calls & {'chdir', 'packConditions'}
+    setupData = next(node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == 'setupData')
+    assert ast.unparse(setupData.body[1]) == 'setupResources()'
+    assert "imagePack = packConditions(os.path.join(_thisDir, 'images.csv'), column='image', root=_thisDir)" in source
+
+
+def test_unsupported_settings(tmp_path):
+    psyexp = tmp_path / 'stroop.psyexp'
+    source = (SCRIPTING / 'stroop' / 'builder_exp' / 'stroop.psyexp').read_text(encoding='utf-8-sig')
+    psyexp.write_text(source.replace('val="None" valType="str" updates="None" name="eyetracker"',
+                                     'val="MouseGaze" valType="str" updates="None" name="eyetracker"'))
+    with pytest.raises(ValueError, match='eyetracker'):
+        renderScript(psyexp)
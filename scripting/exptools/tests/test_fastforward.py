@@ -0,0 +1,63 @@
+import pytest
+
+from exptools.fastforward import FastForward, fastForwardFromArgs
+
+
+class _Key:
+    def __init__(self, tDown):
+        self.name = 'left'
+        self.tDown = tDown
+        self.rt = None
+
+
+class _Window:
+    monitorFramePeriod = 1 / 60
+
+
+@pytest.fixture
+def psychopy(monkeypatch):
+    clock = pytest.importorskip('psychopy.clock')
+    keyboard = pytest.importorskip('psychopy.hardware.keyboard')
+    from psychopy import core
+    now = [100.0]
+    monkeypatch.setattr(clock, 'getTime', lambda: now[0])
+    monkeypatch.setattr(core, 'getTime', lambda: now[0])
+    pressed = []
+    monkeypatch.setattr(keyboard.Keyboard, 'getKeys', lambda kb, *args, **kwargs: pressed)
+    return clock, core, keyboard, now, pressed
+
+
+def test_clocks_run_fast_and_wait_skips(psychopy):
+    clock, core, keyboard, now, pressed = psychopy
+    win = _Window()
+    fastForward = FastForward(60).install(win)
+    fastForward.install(win)  # already installed, nothing changes
+    assert win.monitorFramePeriod == pytest.approx(1.0)
+    now[0] += 0.5
+    assert core.getTime() == pytest.approx(100 + 30)
+    core.wait(10)
+    assert core.getTime() == pytest.approx(100 + 40)
+    fastForward.uninstall()
+    fastForward.uninstall()
+    assert win.monitorFramePeriod == pytest.approx(1 / 60)
+    assert core.getTime() == now[0]
+
+
+def test_keys_are_converted_as_copies(psychopy):
+    clock, core, keyboard, now, pressed = psychopy
+    fastForward = FastForward(10).install()
+    kb = type('Kb', (), {'clock': clock.Clock()})()
+    now[0] += 1.0
+    pressed.append(_Key(tDown=100.5))
+    keys = keyboard.Keyboard.getKeys(kb)
+    assert keys[0].tDown == pytest.approx(100 + 5)
+    # the keyboard's own KeyPress keeps its real time, so a second call gives the same
+    assert pressed[0].tDown == 100.5
+    assert keyboard.Keyboard.getKeys(kb)[0].tDown == pytest.approx(keys[0].tDown)
+    fastForward.uninstall()
+
+
+def test_factor_from_args():
+    assert fastForwardFromArgs(['--pilot']) is None
+    assert fastForwardFromArgs(['--fast-forward']).factor == 60
+    assert fastForwardFromArgs(['--fast-forward=10']).factor == 10
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from exptools import frametiming
+from exptools.frametiming import FrameRecorder, summarise
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a perf_counter that only moves when told to
+    now = [0.0]
+    monkeypatch.setattr(frametiming, 'perf_counter', lambda: now[0])
+    return now
+
+
+def _flipFrames(recorder, clock, n, frameDur):
+    for _ in range(n):
+        recorder.startFrame()
+        recorder.endUpdates()
+        clock[0] += frameDur
+        recorder.flipped()
+
+
+def test_gap_between_routines_is_not_dropped(clock, tmp_path):
+    recorder = FrameRecorder(frameDur=0.01)
+    recorder.startRoutine('trial')
+    _flipFrames(recorder, clock, 10, 0.01)
+    clock[0] += 0.5  # saving data, nothing flips
+    recorder.startRoutine('isi')
+    _flipFrames(recorder, clock, 10, 0.01)
+    rows = {row['routine']: row for row in summarise(recorder.save(str(tmp_path / 'run')))}
+    assert rows['trial']['dropped'] == 0
+    assert rows['isi']['dropped'] == 0
+    assert rows['isi']['maxIntervalMs'] == pytest.approx(10, abs=0.01)
+    frames = recorder.frames()
+    # the first frame of each routine has no interval
+    assert np.isnan(frames['interval'][[0, 10]]).all()
+
+
+def test_dropped_frames_within_routine(clock):
+    recorder = FrameRecorder(frameDur=0.01)
+    recorder.startRoutine('trial')
+    _flipFrames(recorder, clock, 5, 0.01)
+    _flipFrames(recorder, clock, 1, 0.03)  # two frames missed
+    assert recorder._routineDropped[recorder._routineIds['trial']] == 2
+
+
+def test_ring_buffer_keeps_latest_frames(clock):
+    recorder = FrameRecorder(frameDur=0.01, capacity=4)
+    recorder.startRoutine('trial')
+    _flipFrames(recorder, clock, 6, 0.01)
+    assert recorder.nFrames == 6
+    assert len(recorder.frames()['interval']) == 4
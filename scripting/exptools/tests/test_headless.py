@@ -0,0 +1,123 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from exptools.headless import HeadlessSession, SimulatedParticipant, _importVisual, runScript
+from exptools.stimpool import StimulusPool
+from exptools.streaming import readStream
+
+SCRIPTING = Path(__file__).resolve().parents[2]
+# the Builder experiment's conditions file isn't kept in the repository
+STIMS = 'stim_word,stim_color\nred,red\ngreen,green\nred,green\ngreen,red\n'
+
+
+@pytest.fixture
+def stroop(tmp_path):
+    try:
+        _importVisual()
+    except Exception as err:  # not installed, or pyglet can't start without a display
+        pytest.skip(f'psychopy.visual is not available: {err}')
+    shutil.copytree(SCRIPTING / 'stroop', tmp_path / 'stroop',
+                    ignore=shutil.ignore_patterns('data', 'cache', '__pycache__'))
+    (tmp_path / 'stroop' / 'builder_exp' / 'stims.csv').write_text(STIMS)
+    return tmp_path / 'stroop'
+
+
+@pytest.fixture
+def imageStim(tmp_path):
+    try:
+        _importVisual()
+    except Exception as err:
+        pytest.skip(f'psychopy.visual is not available: {err}')
+    shutil.copytree(SCRIPTING / 'image_stim' / 'builder_exp', tmp_path / 'image_stim' / 'builder_exp',
+                    ignore=shutil.ignore_patterns('data', 'cache', '__pycache__', '*.imgpack'))
+    builder = tmp_path / 'image_stim' / 'builder_exp'
+    (builder / 'images.csv').write_text('image\n' + ''.join(f'imgs/img{i}.png\n' for i in range(3)))
+    return builder
+
+
+def _readCsv(path):
+    lines = path.read_text(encoding='utf-8-sig').splitlines()
+    header = lines[0].split(',')[:-1]
+    return [dict(zip(header, line.split(','))) for line in lines[1:]]
+
+
+def test_responses_arrive_after_the_rt():
+    try:
+        _importVisual()
+    except Exception as err:
+        pytest.skip(f'psychopy.visual is not available: {err}')
+    from psychopy.hardware import keyboard
+    participant = SimulatedParticipant(keys=['left', 'right'], rtMean=0.5, rtSD=0.0)
+    with HeadlessSession(participant) as session:
+        kb = keyboard.Keyboard()
+        t0 = session.clock.now
+        assert kb.getKeys(keyList=['left', 'right']) == []  # not on the first poll
+        while not (keys := kb.getKeys(keyList=['left', 'right'])):
+            pass
+        assert keys[0].name == 'left'
+        assert session.clock.now - t0 == pytest.approx(0.5, abs=session.pollCost)
+        # a wait gives up at maxWait if the press would come later
+        t0 = session.clock.now
+        assert kb.waitKeys(maxWait=0.2, keyList=['left', 'right']) is None
+        assert session.clock.now - t0 == pytest.approx(0.2)
+        keys = kb.waitKeys(keyList=['left', 'right'], clear=False)
+        assert keys[0].name == 'right' and session.clock.now - t0 == pytest.approx(0.5)
+    assert participant.nResponses == 2
+
+
+def test_stroop_script(stroop, monkeypatch):
+    allocations = []
+    endTrial = StimulusPool.endTrial
+    monkeypatch.setattr(StimulusPool, 'endTrial', lambda pool: allocations.append(endTrial(pool)) or allocations[-1])
+    participant = SimulatedParticipant(info={'participant': 'sim01', 'seed': '7'}, seed=1)
+    result = runScript(stroop / 'scripting' / 'stroop.py', participant)
+    # the feedback was always one of the prebuilt stimuli
+    assert allocations == [0] * 10
+    data = stroop / 'scripting' / 'data'
+    rows = readStream(data / 'sim01_stroop_task_stream.jsonl')
+    assert len(rows) == 10
+    for row in rows:
+        assert row['response'] in ('left', 'right')
+        assert participant.rtMin <= row['rt'] < 10.0
+        correct = {'red': 'left', 'blue': 'right'}[row['color']] == row['response']
+        assert row['feedback'] == ('correct' if correct else 'wrong')
+        assert 'stim_allocations' not in row
+    assert [row['response'] for row in _readCsv(data / 'sim01_stroop_task.csv')] == [
+        row['response'] for row in rows]
+    assert (data / 'sim01_stroop_task_schedule.npz').exists()
+    assert (data / 'sim01_stroop_task.psydat').exists()
+    # 10 trials of 2 s fixation, the response and 1 s feedback
+    assert result['virtualTime'] > 30
+    assert result['wallTime'] < result['virtualTime']
+
+
+def test_stroop_builder_script(stroop):
+    participant = SimulatedParticipant(info={'participant': 'sim01'}, seed=1)
+    runScript(stroop / 'builder_exp' / 'stroop_lastrun.py', participant)
+    data = stroop / 'builder_exp' / 'data'
+    csvPaths = list(data.glob('sim01_stroop_*.csv'))
+    assert len(csvPaths) == 1
+    rows = [row for row in _readCsv(csvPaths[0]) if row['key_resp_2.keys']]
+    assert len(rows) == 4
+    assert all(row['key_resp_2.keys'] in ('left', 'right') for row in rows)
+    assert all(float(row['key_resp_2.rt']) >= participant.rtMin for row in rows)
+    stem = str(csvPaths[0])[:-len('.csv')]
+    assert len(readStream(f'{stem}_stream.jsonl')) == len(_readCsv(csvPaths[0]))
+    assert Path(f'{stem}.psydat').exists()
+
+
+def test_image_stim_builder_script(imageStim):
+    participant = SimulatedParticipant(info={'participant': 'sim01'}, seed=1)
+    runScript(imageStim / 'image_stim_lastrun.py', participant)
+    csvPaths = list((imageStim / 'data').glob('sim01_image_stim_*.csv'))
+    assert len(csvPaths) == 1
+    rows = [row for row in _readCsv(csvPaths[0]) if row['image']]
+    assert sorted(row['image'] for row in rows) == [f'imgs/img{i}.png' for i in range(3)]
+    # the slider is rated, and its Each Frame code ends the Routine on return
+    assert all(row['slider.response'] in ('1', '2', '3', '4', '5') for row in rows)
+    assert all(row['final_slider_position'] == row['slider.response'] for row in rows)
+    assert all(float(row['rating.stopped']) > float(row['rating.started']) for row in rows)
+    # the image pack was built by setupData, next to the conditions file
+    assert (imageStim / 'images.imgpack').exists()
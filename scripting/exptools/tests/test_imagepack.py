@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from exptools.assetcache import ScaledImageCache  # noqa: E402
+from exptools.imagepack import ImagePack, buildPack, openPack, packConditions  # noqa: E402
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for n in range(3):
+        path = tmp_path / f'img{n}.png'
+        Image.new('RGB', (32, 24), (80 * n, 10, 20)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_pack_holds_the_decoded_pixels(tmp_path, images):
+    pack = buildPack(images, tmp_path / 'images.imgpack')
+    with Image.open(images[1]) as im:
+        assert np.array_equal(pack.getArray(images[1]), np.asarray(im.convert('RGBA')))
+    assert pack.getImage('missing.png') == 'missing.png'
+    assert pack.params == {'mode': 'RGBA'}
+
+
+def test_decode_parameters_are_checked(tmp_path, images):
+    packPath = tmp_path / 'images.imgpack'
+    small = ScaledImageCache((16, 12), cacheDir=tmp_path / 'cache')
+    pack = openPack(images, packPath, decode=small.loader, params=small.params)
+    assert pack.getArray(images[0]).shape == (12, 16, 4)
+    assert pack.params == {'mode': 'RGBA', 'size': [16, 12], 'resample': 'lanczos'}
+    assert pack.isCurrent(images, small.params)
+    # the same images at another size (e.g. another screen) need a new pack
+    large = ScaledImageCache((24, 18), cacheDir=tmp_path / 'cache')
+    assert not ImagePack(packPath).isCurrent(images, large.params)
+    pack = openPack(images, packPath, decode=large.loader, params=large.params)
+    assert pack.getArray(images[0]).shape == (18, 24, 4)
+    assert not pack.isCurrent(images)  # nor are the full-size images
+
+
+def test_changed_images_are_packed_again(tmp_path, images):
+    packPath = tmp_path / 'images.imgpack'
+    openPack(images, packPath)
+    assert not ImagePack(packPath).isCurrent(images[:2])
+    Image.new('RGB', (8, 8)).save(images[0])
+    assert openPack(images, packPath).getArray(images[0]).shape == (8, 8, 4)
+
+
+def test_relative_images_are_read_from_the_root(tmp_path, images, monkeypatch):
+    (tmp_path / 'images.csv').write_text('image\n' + '\n'.join(f'img{n}.png' for n in range(3)) + '\n')
+    monkeypatch.chdir(tmp_path.parent)  # e.g. another experiment's folder
+    pack = packConditions(tmp_path / 'images.csv', root=tmp_path)
+    # looked up by the names in the conditions file, as the experiment does from its folder
+    assert sorted(pack.images) == ['img0.png', 'img1.png', 'img2.png']
+    assert pack.path == str(tmp_path / 'images.imgpack')
+    assert pack.isCurrent(['img0.png', 'img1.png', 'img2.png'], root=tmp_path)
@@ -0,0 +1,43 @@
+import sys
+
+import pytest
+
+from exptools import lazyimport
+from exptools.lazyimport import lazyImport
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    # a package that imports its heavy submodule in its __init__, as psychopy.hardware does
+    (tmp_path / 'lazypkg').mkdir()
+    (tmp_path / 'lazypkg' / '__init__.py').write_text('from . import heavy\n')
+    (tmp_path / 'lazypkg' / 'heavy.py').write_text(
+        'import builtins\nbuiltins.heavyRuns = getattr(builtins, "heavyRuns", 0) + 1\nvalue = 42\n'
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr('builtins.heavyRuns', 0, raising=False)
+    yield
+    for name in ('lazypkg', 'lazypkg.heavy'):
+        sys.modules.pop(name, None)
+
+
+def test_submodule_deferred_before_its_package(package):
+    import builtins
+    heavy = lazyImport('lazypkg.heavy')
+    assert 'lazypkg' not in sys.modules
+    import lazypkg
+    # the package's own import of it got the deferred module, which hasn't run yet
+    assert lazypkg.heavy is heavy and builtins.heavyRuns == 0
+    assert heavy.value == 42 and builtins.heavyRuns == 1
+
+
+def test_eager_mode_imports_now(package, monkeypatch):
+    import builtins
+    monkeypatch.setattr(lazyimport, 'LAZY_IMPORTS', False)
+    heavy = lazyImport('lazypkg.heavy')
+    assert builtins.heavyRuns == 1 and heavy.value == 42
+
+
+def test_missing_module(package):
+    assert lazyImport('lazypkg.missing') is None
+    assert lazyImport('lazypkg_missing.heavy') is None
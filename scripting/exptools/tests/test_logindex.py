@@ -0,0 +1,52 @@
+import os
+
+from exptools.logindex import indexPath, loadIndex, parseLog
+
+LOG = (
+    '1.0000 \tEXP \tNew trial (rep=0, index=0)\n'
+    '1.5000 \tDATA \tKeypress: left\n'
+    '1.2000 \tEXP \timage: autoDraw = True\n'  # logged out of order
+    '2.0000 \tWARNING \tTraceback (most recent call last):\n'
+    '  File "image_stim.py", line 1\n'
+    'ValueError: bad\n'
+    '3.0000 \tINFO \tCreated image = ImageStim()\n'
+    '4.0000 \tEXP \ttext: text = \'two\n'
+    'lines\''
+)
+
+
+def _writeLog(path, text=LOG, newline='\n'):
+    path.write_bytes(text.replace('\n', newline).encode('utf-8'))
+    return path
+
+
+def test_entries_are_sorted_with_their_types(tmp_path):
+    index = parseLog(_writeLog(tmp_path / 'p.log'))
+    assert list(index.times) == [1.0, 1.2, 1.5, 2.0, 3.0, 4.0]
+    entries = index.between(1.0, 2.0)
+    assert [(t, level, kind) for t, level, kind, message in entries] == [
+        (1.0, 'EXP', 'trial'), (1.2, 'EXP', 'autoDraw'), (1.5, 'DATA', 'keypress')]
+    assert index.between(0, 10, types=['created'])[0][3] == 'Created image = ImageStim()'
+    assert [entry[0] for entry in index.between(0, 10, minLevel='DATA')] == [1.5, 2.0]
+
+
+def test_continuation_lines_belong_to_the_entry_before(tmp_path):
+    for newline in ('\n', '\r\n'):
+        index = parseLog(_writeLog(tmp_path / 'p.log', newline=newline))
+        assert len(index) == 6
+        assert index.between(2.0, 3.0)[0][3] == newline.join([
+            'Traceback (most recent call last):', '  File "image_stim.py", line 1', 'ValueError: bad'])
+        # the last line of the file has no line ending
+        assert index.between(4.0, 5.0)[0][3] == f"text: text = 'two{newline}lines'"
+
+
+def test_saved_index_is_reused_until_the_log_changes(tmp_path):
+    logPath = _writeLog(tmp_path / 'p.log')
+    assert len(loadIndex(logPath)) == 6
+    assert os.path.exists(indexPath(logPath))
+    # a saved index is read as it is, without parsing the log again
+    assert list(loadIndex(logPath).times) == list(parseLog(logPath).times)
+    with open(logPath, 'a', encoding='utf-8') as f:
+        f.write('\n5.0000 \tEXP \tNew trial (rep=0, index=1)\n')
+    index = loadIndex(logPath)
+    assert len(index) == 7 and index.between(5.0, 6.0)[0][2] == 'trial'
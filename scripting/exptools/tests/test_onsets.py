@@ -0,0 +1,86 @@
+import pytest
+
+logging = pytest.importorskip('psychopy.logging')
+
+from exptools.onsets import FrameScheduler  # noqa: E402
+
+FRAME = 1 / 60.0
+
+
+class _Time:
+    def __init__(self):
+        self.now = 0.0
+
+
+class _Clock:
+    # a clock on virtual time, `offset` ahead of it
+    def __init__(self, time, offset=0.0):
+        self.time = time
+        self.offset = offset
+
+    def getTime(self):
+        return self.time.now + self.offset
+
+
+class _Window:
+    # flips on the next frame boundary and returns the flip time on the log
+    # clock, then takes `latency` to return to the caller
+    def __init__(self, time, logClock, latency):
+        self.time = time
+        self.logClock = logClock
+        self.latency = latency
+        self.flips = []
+
+    def flip(self):
+        self.time.now = (round(self.time.now / FRAME) + 1) * FRAME
+        self.flips.append(self.time.now)
+        flipTime = self.logClock.getTime()
+        self.time.now += self.latency
+        return flipTime
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    time = _Time()
+    logClock = _Clock(time, offset=100.0)
+    monkeypatch.setattr(logging, 'defaultClock', logClock)
+    win = _Window(time, logClock, latency=0.004)
+    return time, win
+
+
+def test_flip_time_is_the_flip_not_the_return(setup):
+    time, win = setup
+    clock = _Clock(time, offset=-5.0)
+    scheduler = FrameScheduler(win, clock, FRAME)
+    flipTime = scheduler.flip()
+    assert flipTime == pytest.approx(win.flips[-1] - 5.0)
+
+
+def test_show_on_the_onset_frame(setup):
+    time, win = setup
+    clock = _Clock(time)
+    scheduler = FrameScheduler(win, clock, FRAME)
+    for onset in (1.0, 6.0, 6.5):
+        scheduler.show(onset, lambda: None, 'event')
+    assert [row['frame'] for row in scheduler.log] == [60, 360, 390]
+    assert scheduler.maxDrift() < FRAME / 2
+
+
+def test_drift_is_from_the_nominal_onset(setup):
+    time, win = setup
+    clock = _Clock(time)
+    scheduler = FrameScheduler(win, clock, FRAME, resync=lambda: 0.1)
+    scheduler.show(2.0, lambda: None, 'image')
+    row = scheduler.log[0]
+    assert row['onset'] == 2.0
+    assert row['correction'] == 0.1
+    assert row['targetFrame'] == 126
+    assert row['drift'] == pytest.approx(0.1, abs=FRAME / 2)
+
+
+def test_on_frame_after_every_flip(setup):
+    time, win = setup
+    frames = []
+    scheduler = FrameScheduler(win, _Clock(time), FRAME, onFrame=lambda: frames.append(len(win.flips)))
+    scheduler.show(0.5, lambda: None, 'event')
+    assert frames == list(range(1, len(win.flips) + 1))
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from exptools.schedule import compileSchedule, loadSchedule
+
+CONDITIONS = [
+    {'word': 'RED', 'color': 'blue', 'congruent': np.int64(0), 'size': np.float64(0.1)},
+    {'word': 'BLUE', 'color': 'blue', 'congruent': np.int64(1), 'size': np.float32(0.2)},
+    {'word': 'RED', 'color': 'red', 'congruent': np.bool_(True), 'size': np.array([0.1, 0.2])},
+]
+EVENTS = [('fixation', 2.0), ('word', None), ('feedback', 1.0), ('isi', (0, 1))]
+
+
+def _sameEvents(a, b):
+    return all(np.array_equal(a[name], b[name], equal_nan=a.dtype[name].kind == 'f') for name in a.dtype.names)
+
+
+def test_same_seed_same_schedule():
+    first = compileSchedule(CONDITIONS, EVENTS, nReps=2, seed=7)
+    second = compileSchedule(CONDITIONS, EVENTS, nReps=2, seed=7)
+    assert _sameEvents(first.events, second.events)
+    assert first.trialList() == second.trialList()
+    assert not np.array_equal(first.durations('isi'),
+                              compileSchedule(CONDITIONS, EVENTS, nReps=2, seed=8).durations('isi'))
+
+
+def test_timing():
+    schedule = compileSchedule(CONDITIONS, EVENTS, nReps=2, seed=7)
+    assert schedule.nTrials == 6
+    assert schedule.eventNames == ['fixation', 'word', 'feedback', 'isi']
+    assert (schedule.durations('fixation') == 2.0).all()
+    assert np.isnan(schedule.durations('word')).all()
+    isi = schedule.durations('isi')
+    assert ((isi >= 0) & (isi < 1)).all()
+    # onsets are only known up to the first event that ends on a response
+    assert schedule.onsets('fixation')[0] == 0.0
+    assert schedule.onsets('word')[0] == 2.0
+    assert np.isnan(schedule.onsets('feedback')).all()
+    # every condition once per repeat
+    stims = schedule.byTrial()['stim'][:, 0]
+    assert sorted(stims[:3]) == sorted(stims[3:]) == [0, 1, 2]
+
+
+def test_save_and_replay_with_numpy_conditions(tmp_path):
+    schedule = compileSchedule(CONDITIONS, EVENTS, nReps=2, seed=2 ** 40 + 3)
+    schedule.save(tmp_path / 'p_schedule.npz')
+    replay = loadSchedule(tmp_path / 'p_schedule.npz')
+    assert replay.seed == 2 ** 40 + 3
+    assert _sameEvents(replay.events, schedule.events)
+    assert replay.conditions[0] == {'word': 'RED', 'color': 'blue', 'congruent': 0, 'size': 0.1}
+    assert replay.conditions[1]['size'] == pytest.approx(0.2)
+    assert replay.conditions[2]['congruent'] is True
+    assert replay.conditions[2]['size'] == [0.1, 0.2]
+    assert [trial['word'] for trial in replay.trialList()] == [trial['word'] for trial in schedule.trialList()]
@@ -0,0 +1,91 @@
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+from exptools.streaming import StreamingWriter, readStream, rebuildWideText
+
+
+def _lines(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return f.read().split('\n')
+
+
+def test_rebuild_formats_like_wide_text(tmp_path):
+    writer = StreamingWriter(tmp_path / 'p_stream.jsonl')
+    writer.addRow({'a': None, 'b': (1, 2), 'c': 'x,y', 'd': np.float32(0.1)})
+    writer.addRow({'a': 1.5, 'e': ['left', 'right']})
+    writer.close()
+    csvPath = rebuildWideText(writer.path)
+    assert csvPath == str(tmp_path / 'p.csv')
+    assert _lines(csvPath) == [
+        'a,b,c,d,e,',
+        'None,"(1, 2)","x,y",0.1,,',
+        "1.5,,,,\"['left', 'right']\",",
+        '',
+    ]
+    # the values themselves go through json
+    assert readStream(writer.path)[0] == {'a': None, 'b': [1, 2], 'c': 'x,y', 'd': pytest.approx(0.1)}
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    writer = StreamingWriter(tmp_path / 'p_stream.jsonl')
+    writer.addRow({'a': 1})
+    writer.close()
+    with open(writer.path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'a': 2})[:-3])
+    assert readStream(writer.path) == [{'a': 1}]
+
+
+def test_existing_stream_is_not_appended_to(tmp_path):
+    first = StreamingWriter(tmp_path / 'p_stream.jsonl')
+    first.close()
+    second = StreamingWriter(tmp_path / 'p_stream.jsonl')
+    second.close()
+    assert second.path == str(tmp_path / 'p_1_stream.jsonl')
+
+
+@pytest.mark.parametrize('sortColumns', ['time', 'priority', 'alphabetical'])
+def test_round_trip_against_save_as_wide_text(tmp_path, sortColumns):
+    data = pytest.importorskip('psychopy.data')
+    thisExp = data.ExperimentHandler(
+        name='stroop', extraInfo={'participant': '007', 'session': '001'},
+        savePickle=False, saveWideText=False, sortColumns=sortColumns,
+        dataFileName=str(tmp_path / 'handler'),
+    )
+    writer = StreamingWriter(tmp_path / 'p_stream.jsonl', maxBuffered=2).attach(thisExp)
+    trials = data.TrialHandler(nReps=1, method='sequential', trialList=[
+        {'word': 'red', 'colour': 'blue'}, {'word': 'green', 'colour': 'red'}, {'word': 'blue', 'colour': 'blue'},
+    ], name='trials')
+    thisExp.addLoop(trials)
+    thisExp.addData('welcome.started', 0.25)
+    thisExp.nextEntry()
+    for n, trial in enumerate(trials):
+        thisExp.addData('resp.keys', None if n == 1 else 'left')
+        thisExp.addData('resp.rt', np.float64(0.5 + n))
+        thisExp.addData('pos', (0, n))
+        thisExp.addData('note', 'a, b')
+        thisExp.nextEntry()
+        writer.flush()
+    thisExp.addData('goodbye.started', 9.5)  # left in the unfinished entry
+    writer.close()
+    expected = thisExp.saveAsWideText(str(tmp_path / 'expected.csv'), delim=',')
+    rebuilt = rebuildWideText(writer.path, str(tmp_path / 'rebuilt.csv'))
+    with open(expected, 'rb') as f, open(rebuilt, 'rb') as g:
+        assert g.read() == f.read()
+
+
+def test_close_detaches_handler(tmp_path):
+    data = pytest.importorskip('psychopy.data')
+    thisExp = data.ExperimentHandler(
+        name='stroop', savePickle=False, saveWideText=False, dataFileName=str(tmp_path / 'handler'),
+    )
+    writer = StreamingWriter(tmp_path / 'p_stream.jsonl').attach(thisExp)
+    thisExp.addData('a', 1)
+    thisExp.nextEntry()
+    writer.close()
+    thisExp.addData('a', 2)
+    thisExp.nextEntry()  # no longer streamed
+    assert readStream(writer.path) == [{'a': 1}]
+    pickle.dumps(thisExp)
@@ -0,0 +1,84 @@
+import csv
+import threading
+import time
+
+import pytest
+
+logging = pytest.importorskip('psychopy.logging')
+
+from exptools.triggers import TriggerListener, simulatedPoll  # noqa: E402
+
+TR = 2.0
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def getTime(self):
+        return self.now
+
+
+def _mainThreadPoll(pulses, threads):
+    # hands out the queued pulses, noting the thread that asked
+    def poll():
+        threads.add(threading.current_thread())
+        out = list(pulses)
+        pulses.clear()
+        return out
+    poll.mainThread = True
+    return poll
+
+
+def test_keyboard_is_polled_on_the_calling_thread():
+    pulses, threads = [], set()
+    triggers = TriggerListener(_mainThreadPoll(pulses, threads), TR=TR).start(firstPulse=0.0)
+    assert triggers._thread is None
+    pulses.extend([2.0, 4.01])
+    assert triggers.update() == 2
+    pulses.append(6.0)
+    triggers.stop()  # takes the pulses since the last frame
+    assert list(triggers.pulses()) == [0.0, 2.0, 4.01, 6.0]
+    assert threads == {threading.current_thread()}
+    assert triggers.update() == 0  # stopped
+
+
+def test_simulated_pulses_are_polled_in_the_background():
+    clock = _Clock()
+    triggers = TriggerListener(simulatedPoll(clock, TR), TR=TR, pollInterval=0.0001).start(firstPulse=0.0)
+    assert triggers._thread is not None
+    assert triggers.update() == 0  # the listener thread does the polling
+    clock.now = 6.5
+    deadline = time.monotonic() + 5
+    while triggers.nPulses < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    triggers.stop()
+    assert list(triggers.pulses()) == [0.0, 2.0, 4.0, 6.0]
+
+
+def test_missed_pulses_are_counted_and_warned(tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(logging, 'warning', lambda msg, *args, **kwargs: warnings.append(msg))
+    pulses, threads = [], set()
+    triggers = TriggerListener(_mainThreadPoll(pulses, threads), TR=TR).start(firstPulse=0.0)
+    # the pulses of volumes 2 and 3 never arrived
+    pulses.extend([2.0, 8.02, 10.02])
+    triggers.update()
+    assert triggers.missed == 2 and len(warnings) == 1
+    assert list(triggers.volumes()) == [0, 1, 4, 5]
+    # the offset is from the volumes the pulses belong to, not their count
+    assert triggers.offset(nRecent=2) == pytest.approx(0.02)
+    with open(triggers.savePulseTable(tmp_path / 'pulses.csv')) as f:
+        rows = list(csv.DictReader(f))
+    assert [row['volume'] for row in rows] == ['0', '1', '4', '5']
+    assert float(rows[2]['interval']) == pytest.approx(6.02)
+
+
+def test_late_pulse_within_half_a_tr_is_not_a_gap(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(logging, 'warning', lambda msg, *args, **kwargs: warnings.append(msg))
+    triggers = TriggerListener(lambda: [], TR=TR)
+    for t in (0.0, 2.9, 4.0):
+        triggers.record(t)
+    assert triggers.missed == 0 and not warnings
+    assert list(triggers.volumes()) == [0, 1, 2]
@@ -0,0 +1,59 @@
+import os
+
+from exptools.warehouse import Warehouse
+
+
+def _writeSession(path, rts, participant='007'):
+    lines = ['participant,expName,date,rt,keys,'] + [
+        f'{participant},stroop,2024-01-01_10h00.00,{rt},left,' for rt in rts
+    ]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8-sig')
+
+
+def _touch(path, secs=10):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime + secs, stat.st_mtime + secs))
+
+
+def test_update_is_incremental(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    _writeSession(data / 'a.csv', [0.5, 0.6])
+    _writeSession(data / 'b.csv', [0.7])
+    (data / 'a_pulses.csv').write_text('volume,time\n0,0.0\n')  # a sidecar, not a session
+    warehouse = Warehouse(tmp_path / 'study.sqlite')
+    try:
+        assert warehouse.update([data], workers=1) == {'added': 2, 'updated': 0, 'unchanged': 0, 'removed': 0}
+        # nothing changed
+        assert warehouse.update([data], workers=1) == {'added': 0, 'updated': 0, 'unchanged': 2, 'removed': 0}
+        # touched, same content: parsed again but not stored again
+        _touch(data / 'a.csv')
+        assert warehouse.update([data], workers=1) == {'added': 0, 'updated': 0, 'unchanged': 2, 'removed': 0}
+        _writeSession(data / 'b.csv', [0.7, 0.8, 0.9])
+        _touch(data / 'b.csv')
+        (data / 'a.csv').unlink()
+        assert warehouse.update([data], workers=1) == {'added': 0, 'updated': 1, 'unchanged': 0, 'removed': 1}
+        db = warehouse.db
+        assert db.execute('SELECT participant, expName, nTrials FROM sessions').fetchall() == [('007', 'stroop', 3)]
+        assert db.execute("SELECT num FROM trials WHERE name = 'rt' ORDER BY row").fetchall() == [
+            (0.7,), (0.8,), (0.9,)]
+        assert db.execute("SELECT DISTINCT text FROM trials WHERE name = 'keys'").fetchall() == [('left',)]
+        assert db.execute('SELECT COUNT(*) FROM manifest').fetchone() == (1,)
+    finally:
+        warehouse.close()
+
+
+def test_sessions_outside_the_scanned_folders_are_kept(tmp_path):
+    first, second = tmp_path / 'stroop', tmp_path / 'images'
+    first.mkdir()
+    second.mkdir()
+    _writeSession(first / 'a.csv', [0.5])
+    _writeSession(second / 'b.csv', [0.6], participant='008')
+    warehouse = Warehouse(tmp_path / 'study.sqlite')
+    try:
+        warehouse.update([first, second], workers=1)
+        # only scanning one folder doesn't drop the other folder's sessions
+        assert warehouse.update([first], workers=1)['removed'] == 0
+        assert warehouse.db.execute('SELECT COUNT(*) FROM sessions').fetchone() == (2,)
+    finally:
+        warehouse.close()
@@ -0,0 +1,251 @@
+"""
+Background recording of scanner sync pulses.
+
+`launchScan` only waits for the first trigger; the sync pulses the scanner
+sends at the start of every following volume are never looked at. A
+`TriggerListener` records every pulse into a preallocated ring buffer, writes
+them out as a per-volume pulse table, and tells the trial scheduler how far
+the scanner has drifted from the nominal TR grid so onsets can be corrected.
+Pulses from the keyboard are read on the main thread, once per frame, other
+sources on a background thread.
+"""
+import csv
+import threading
+import time
+
+import numpy as np
+from psychopy import logging
+
+
+def keyboardPoll(clock, syncKey='t'):
+    """
+    Make a poll function reading sync pulses from the keyboard.
+
+    Uses `keyboard.Keyboard`, whose key events are timestamped when they
+    arrive, and converts those timestamps to `clock`. PsychoPy's keyboard
+    backend isn't thread-safe, and the main thread reads it too (the escape
+    key, rating scales), so a `TriggerListener` polls it on the main thread
+    with `update`, e.g. once per frame as `FrameScheduler`'s `onFrame`.
+    Pulses that arrive while nothing is flipped keep their own timestamps.
+
+    Parameters
+    ==========
+    clock : psychopy.core.Clock
+        Clock the pulse times should be on (e.g. `globalClock`).
+    syncKey : str
+        Key the scanner sends at the start of every volume.
+
+    Returns
+    ==========
+    callable
+        Returns the times of all pulses since the last call.
+    """
+    from psychopy import core
+    from psychopy.hardware import keyboard
+    kb = keyboard.Keyboard()
+    kb.clearEvents()
+
+    def poll():
+        keys = kb.getKeys(keyList=[syncKey], waitRelease=False)
+        if not keys:
+            return []
+        # key times are on the same timebase as core.getTime()
+        toClock = clock.getTime() - core.getTime()
+        return [key.tDown + toClock for key in keys]
+    poll.mainThread = True
+    return poll
+
+
+def simulatedPoll(clock, TR):
+    """
+    Make a poll function producing a pulse every `TR` seconds of `clock`.
+
+    For running without a scanner, e.g. in `launchScan`'s Test mode.
+    """
+    state = {'next': 1}  # volume 0 is the trigger launchScan waited for
+
+    def poll():
+        now = clock.getTime()
+        pulses = []
+        while state['next'] * TR <= now:
+            pulses.append(state['next'] * TR)
+            state['next'] += 1
+        return pulses
+    return poll
+
+
+class TriggerListener:
+    """
+    Record every scanner sync pulse.
+
+    Pulses are stored in a preallocated ring buffer, with the volume each
+    belongs to. A gap of more than 1.5 TR between two pulses means pulses
+    were missed: it is logged as a warning, and the volumes are counted on
+    from the gap, so the offset from the TR grid stays right. Only one thread
+    writes to the buffer (the time and volume first, then the count), so
+    readers never need a lock.
+
+    Parameters
+    ==========
+    poll : callable
+        Returns the times (on the experiment clock) of the pulses that arrived
+        since it was last called, e.g. from `keyboardPoll` or `simulatedPoll`.
+        It is polled on a background thread, unless it has a true `mainThread`
+        attribute (as `keyboardPoll` does), in which case the main thread
+        calls `update`.
+    TR : float
+        Nominal duration (s) of one volume.
+    capacity : int
+        Number of pulses kept in the ring buffer.
+    pollInterval : float
+        Seconds to sleep between polls.
+    """
+
+    def __init__(self, poll, TR, capacity=4096, pollInterval=0.0005):
+        self.poll = poll
+        self.TR = TR
+        self.capacity = capacity
+        self.pollInterval = pollInterval
+        self.nPulses = 0
+        self.missed = 0  # pulses missing in the gaps
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._volumes = np.zeros(capacity, dtype=np.int64)
+        self._running = False
+        self._thread = None
+
+    def start(self, firstPulse=None):
+        """
+        Start listening.
+
+        Parameters
+        ==========
+        firstPulse : float or None
+            Time of a pulse that was already consumed (e.g. 0.0 for the
+            trigger `launchScan` waited for), to record as volume 0.
+        """
+        if firstPulse is not None:
+            self.record(firstPulse)
+        self._running = True
+        if not getattr(self.poll, 'mainThread', False):
+            self._thread = threading.Thread(
+                target=self._listen, name='TriggerListener', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop listening (pulses already recorded are kept).
+        """
+        if self._running and self._thread is None:
+            self.update()  # the pulses since the last frame
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def update(self):
+        """
+        Record the pulses that arrived since the last call, on the main
+        thread. Does nothing if the listener polls on its own thread.
+
+        Returns
+        ==========
+        int
+            Number of pulses recorded.
+        """
+        if not self._running or self._thread is not None:
+            return 0
+        return self._update()
+
+    def record(self, t):
+        """
+        Record one pulse at time `t`.
+        """
+        n = self.nPulses
+        volume = 0
+        if n:
+            last = (n - 1) % self.capacity
+            gap = t - self._times[last]
+            volumes = max(1, int(round(gap / self.TR)))
+            volume = int(self._volumes[last]) + volumes
+            if gap > 1.5 * self.TR:
+                self.missed += volumes - 1
+                logging.warning(f'No scanner pulse for {gap:.3f} s (TR {self.TR} s), '
+                                f'{volumes - 1} missed; the pulse at {t:.3f} s is volume {volume}')
+        self._times[n % self.capacity] = t
+        self._volumes[n % self.capacity] = volume
+        self.nPulses = n + 1
+
+    def pulses(self):
+        """
+        Get the times of the recorded pulses still in the ring buffer.
+
+        Returns
+        ==========
+        numpy.ndarray
+            Pulse times, oldest first.
+        """
+        n = self.nPulses
+        kept = min(n, self.capacity)
+        return self._times[np.arange(n - kept, n) % self.capacity]
+
+    def volumes(self):
+        """
+        Get the volume numbers of the pulses returned by `pulses`.
+        """
+        n = self.nPulses
+        kept = min(n, self.capacity)
+        return self._volumes[np.arange(n - kept, n) % self.capacity]
+
+    def offset(self, nRecent=4):
+        """
+        Estimate how far the scanner is from the nominal TR grid.
+
+        Parameters
+        ==========
+        nRecent : int
+            Number of most recent pulses to average over.
+
+        Returns
+        ==========
+        float
+            Mean of (pulse time - volume * TR) over the last `nRecent` pulses,
+            add it to a nominal onset to line it up with the scanner. 0 if no
+            pulse has been recorded yet.
+        """
+        n = self.nPulses
+        if n == 0:
+            return 0.0
+        first = max(0, n - min(nRecent, self.capacity))
+        index = np.arange(first, n) % self.capacity
+        return float(np.mean(self._times[index] - self._volumes[index] * self.TR))
+
+    def savePulseTable(self, path):
+        """
+        Write one row per recorded volume to a CSV file.
+
+        Columns are the volume number, pulse time, interval since the previous
+        pulse and offset from the nominal TR grid. Volumes whose pulse was
+        missed have no row.
+        """
+        times, volumes = self.pulses(), self.volumes()
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['volume', 'time', 'interval', 'offset'])
+            for i, (t, volume) in enumerate(zip(times, volumes)):
+                volume = int(volume)
+                interval = t - times[i - 1] if i else ''
+                writer.writerow([volume, t, interval, t - volume * self.TR])
+        return path
+
+    def _update(self):
+        pulses = self.poll()
+        for t in pulses:
+            self.record(t)
+        return len(pulses)
+
+    def _listen(self):
+        while self._running:
+            self._update()
+            time.sleep(self.pollInterval)
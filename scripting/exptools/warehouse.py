@@ -0,0 +1,230 @@
+"""
+Collecting the sessions in `data/` folders into one SQLite database.
+
+Every session leaves its own CSV file (plus `.psydat`, `.log`, ...) in the
+experiment's `data/` folder, so a study ends up as thousands of files. This
+tool parses the trial CSV files in parallel (one process per core) and loads
+them into a single indexed SQLite database:
+
+- `sessions`: one row per session, keyed by participant, experiment name and
+  date, with the path of its CSV file and the number of trials;
+- `trials`: one row per value, `(session, row, name, num, text)`, so sessions
+  with different columns fit in the same table (`num` holds numbers, `text`
+  everything else);
+- `manifest`: the size, modification time and hash of every file loaded.
+
+Re-running only parses files that are new or whose size or modification time
+changed (and whose content hash then differs), and drops sessions whose file
+was deleted::
+
+    python -m exptools.warehouse stroop/scripting/data stroop/builder_exp/data --db study.sqlite
+
+Query it with any SQLite client, e.g.::
+
+    SELECT s.participant, AVG(t.num) FROM trials t JOIN sessions s ON s.id = t.session
+    WHERE t.name = 'rt' GROUP BY s.participant;
+"""
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# CSV files next to the session data that are not sessions themselves
+SIDECAR_SUFFIXES = ('_pulses.csv', '_drift.csv')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    participant TEXT, expName TEXT, date TEXT,
+    path TEXT UNIQUE, nTrials INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_key ON sessions (participant, expName, date);
+CREATE TABLE IF NOT EXISTS trials (
+    session INTEGER, row INTEGER, name TEXT, num REAL, text TEXT
+);
+CREATE INDEX IF NOT EXISTS trials_session ON trials (session, row);
+CREATE INDEX IF NOT EXISTS trials_name ON trials (name, session);
+CREATE TABLE IF NOT EXISTS manifest (
+    path TEXT PRIMARY KEY, size INTEGER, mtime REAL, hash TEXT
+);
+"""
+
+
+def findSessions(dataDirs):
+    """
+    Find the trial CSV file of every session in the given `data` folders.
+    """
+    paths = []
+    for dataDir in dataDirs:
+        for path in sorted(Path(dataDir).glob('*.csv')):
+            if not path.name.endswith(SIDECAR_SUFFIXES):
+                paths.append(str(path.resolve()))
+    return paths
+
+
+def fileHash(path, blockSize=2 ** 20):
+    """
+    Get the SHA-1 of a file's content.
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parseSession(path):
+    """
+    Parse one session's CSV file (runs in a worker process).
+
+    Parameters
+    ==========
+    path : str
+        Trial CSV file.
+
+    Returns
+    ==========
+    dict
+        The file's hash, the session key (participant, expName, date) and the
+        values as `(row, name, num, text)` tuples.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    first = rows[0] if rows else {}
+    # Builder data has these columns, otherwise they come from the file name
+    stem = Path(path).stem
+    participant = first.get('participant') or stem.split('_')[0]
+    expName = first.get('expName') or stem[len(participant):].strip('_')
+    date = first.get('date') or datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d_%Hh%M.%S')
+    values = []
+    for i, row in enumerate(rows):
+        for name, text in row.items():
+            if name is None or text in (None, ''):
+                continue
+            num = _number(text)
+            values.append((i, name, num, None if num is not None else text))
+    return {
+        'path': path, 'hash': fileHash(path), 'nTrials': len(rows),
+        'participant': participant, 'expName': expName, 'date': date,
+        'values': values,
+    }
+
+
+class Warehouse:
+    """
+    An SQLite database of sessions, updated incrementally.
+
+    Parameters
+    ==========
+    dbPath : str or pathlib.Path
+        Database file, created if it doesn't exist.
+    """
+
+    def __init__(self, dbPath):
+        self.db = sqlite3.connect(str(dbPath))
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, dataDirs, workers=None):
+        """
+        Load new and changed sessions from `dataDirs` and drop deleted ones.
+
+        Parameters
+        ==========
+        dataDirs : list of str
+            `data` folders to scan.
+        workers : int or None
+            Number of worker processes, leave as None for one per core.
+
+        Returns
+        ==========
+        dict
+            Number of sessions added, updated, unchanged and removed.
+        """
+        manifest = {
+            path: (size, mtime, sha)
+            for path, size, mtime, sha in self.db.execute('SELECT path, size, mtime, hash FROM manifest')
+        }
+        paths = findSessions(dataDirs)
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+        # only files whose size or mtime changed need to be looked at
+        toParse = []
+        for path in paths:
+            stat = os.stat(path)
+            if manifest.get(path, (None, None))[:2] == (stat.st_size, stat.st_mtime):
+                counts['unchanged'] += 1
+            else:
+                toParse.append(path)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for session in pool.map(parseSession, toParse, chunksize=8):
+                stat = os.stat(session['path'])
+                old = manifest.get(session['path'])
+                if old is not None and old[2] == session['hash']:
+                    # touched but not changed
+                    counts['unchanged'] += 1
+                else:
+                    counts['updated' if old is not None else 'added'] += 1
+                    self._store(session)
+                self.db.execute(
+                    'INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?)',
+                    (session['path'], stat.st_size, stat.st_mtime, session['hash']),
+                )
+        # sessions whose file has gone, under the folders scanned
+        scanned = [str(Path(d).resolve()) + os.sep for d in dataDirs]
+        for path in set(manifest) - set(paths):
+            if path.startswith(tuple(scanned)):
+                self._remove(path)
+                counts['removed'] += 1
+        self.db.commit()
+        return counts
+
+    def _remove(self, path):
+        for (sessionId,) in self.db.execute('SELECT id FROM sessions WHERE path = ?', (path,)).fetchall():
+            self.db.execute('DELETE FROM trials WHERE session = ?', (sessionId,))
+        self.db.execute('DELETE FROM sessions WHERE path = ?', (path,))
+        self.db.execute('DELETE FROM manifest WHERE path = ?', (path,))
+
+    def _store(self, session):
+        self._remove(session['path'])
+        cursor = self.db.execute(
+            'INSERT INTO sessions (participant, expName, date, path, nTrials) VALUES (?, ?, ?, ?, ?)',
+            (session['participant'], session['expName'], session['date'], session['path'], session['nTrials']),
+        )
+        sessionId = cursor.lastrowid
+        self.db.executemany(
+            'INSERT INTO trials VALUES (?, ?, ?, ?, ?)',
+            [(sessionId,) + value for value in session['values']],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load session CSV files from data folders into an SQLite database.')
+    parser.add_argument('dataDirs', nargs='+', help='data folders to scan')
+    parser.add_argument('--db', default='warehouse.sqlite', help='database file')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    warehouse = Warehouse(args.db)
+    counts = warehouse.update(args.dataDirs, workers=args.workers)
+    warehouse.close()
+    print(', '.join(f'{n} {what}' for what, n in counts.items()) +
+          f' in {time.perf_counter() - t0:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,21 @@
 ### Import packages ###
 from psychopy import visual, core, data, event, logging, gui, monitors
-import os, locale, platform
+import os, sys, locale, platform
 from pathlib import Path
-import pandas as pd
 from psychopy.hardware.emulator import launchScan
 from screeninfo import get_monitors
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from exptools.preload import ImagePreloader
+from exptools.assetcache import ScaledImageCache, pixelSize
+from exptools.imagepack import openPack
+from exptools.streaming import StreamingWriter, rebuildWideText
+from exptools.columnar import convertToColumnar
+from exptools.schedule import compileSchedule
+from exptools.conditions import loadConditions
+from exptools.onsets import FrameScheduler
+from exptools.triggers import TriggerListener, keyboardPoll, simulatedPoll
+from exptools.calibration import calibratedFrameRate, checkFrameRate
 
 # MR_Settings initialization
 MR_settings = {
@@ -41,6 +52,27 @@ logging.info(f'Participant ID: {exp_info["participant"]}')
 thisExp = data.ExperimentHandler(name='image_fmri', version='v01', extraInfo=None, runtimeInfo=None,
                                  originPath=None, savePickle=True, saveWideText=True, dataFileName=filename)
 
+# stream every finished trial to disk, so a crash doesn't lose the session
+stream = StreamingWriter(filename + '_stream.jsonl').attach(thisExp)
+
+# Load the image paths from the CSV file (parsed once, then from the cache while it is unchanged)
+try:
+    image_data = loadConditions('images.csv')
+    logging.info('Loaded images.csv successfully')
+except Exception as e:
+    logging.error(f'Error loading images.csv: {e}')
+    core.quit()
+
+# compile the order and timing of every event before the window opens
+# (the rating ends on the response, so every trial starts when the previous rating ends)
+schedule = compileSchedule(image_data, shuffle=False,
+                           events=[('fixation', 1), ('image', 5), ('rating', None)])
+schedule.save(filename + '_schedule.npz')
+image_paths = [condition['image'] for condition in schedule.trialList()]
+# within a trial the image and the rating follow the fixation at fixed times
+fixation_durations = schedule.durations('fixation')
+image_durations = schedule.durations('image')
+
 # now generate the screen
 monitors_list = get_monitors()
 monitor_names = [f"{monitor.name} ({monitor.x},{monitor.y}) - {monitor.width}x{monitor.height}" for monitor in monitors_list]
@@ -72,14 +104,9 @@ xScr = float(win_res[0])/win_res[1]
 fontH = yScr/25
 wrapW = xScr/1.5
 textCol = 'black'
-
-# Load the image paths from the CSV file
-try:
-    image_data = pd.read_csv('images.csv')
-    logging.info('Loaded images.csv successfully')
-except Exception as e:
-    logging.error(f'Error loading images.csv: {e}')
-    core.quit()
+# get the frame rate (measured once per monitor, then reused), every onset is presented on a whole frame
+frameRate = calibratedFrameRate(win, infoMsg='Measuring the frame rate of the screen...')
+frameDur = 1.0 / round(frameRate) if frameRate else 1.0 / 60.0
 
 # Create some handy timers
 globalClock = core.Clock()  # to track the time since experiment started
@@ -87,7 +114,7 @@ globalClock = core.Clock()  # to track the time since experiment started
 logging.setDefaultClock(globalClock) # set a default clock for logging, so combined task will run smoothly
 
 # Create TrialHandlers to save data
-trials = data.TrialHandler([], nReps=len(image_data))
+trials = data.TrialHandler([], nReps=schedule.nTrials)
 
 # Initialize components for wanting scales # left='g'reen, right='b'lue, confirm='r'ed
 questionScale = visual.RatingScale(win=win, name='questionScale', scale='How realistic do you think this image is?\n\n\n',
@@ -99,6 +126,14 @@ fix = visual.TextStim(win, text='+', height=fontH*2, color=textCol)
 
 # Create an image stimulus
 image = visual.ImageStim(win, size=(.5625, .5625)) # size is relative
+# scale every image once to the pixels it covers on this screen (cached on disk for the next session)
+asset_cache = ScaledImageCache(pixelSize(win, (.5625, .5625)), cacheDir='cache')
+asset_cache.prepare(image_paths)
+# pack the scaled images, decoded, into one memory-mapped file (built on the first run)
+image_pack = openPack(image_paths, 'cache/images_%dx%d.imgpack' % asset_cache.size, decode=asset_cache.loader,
+                      params=asset_cache.params)
+# take the upcoming images from the pack in the background, keeping only a few of them in memory
+preloader = ImagePreloader(capacity=4, loader=image_pack.loader)
 
 # clear all the keyboard presses and hide the mouse cursor
 event.clearEvents(eventType='keyboard')
@@ -121,35 +156,45 @@ thisExp.addLoop(trials)
 launchScan(win=win, settings=MR_settings, 
            globalClock=globalClock, mode='Scan' if fmri else 'Test', 
            wait_msg='Waiting for the trigger')
-
-# Loop through each image in the CSV file
-for idx, row in image_data.iterrows():
-    image_path = row['image']
+# record every following sync pulse (simulated ones in Test mode, in the background)
+pulsePoll = keyboardPoll(globalClock, MR_settings['sync']) if fmri else simulatedPoll(globalClock, MR_settings['TR'])
+triggers = TriggerListener(pulsePoll, TR=MR_settings['TR']).start(firstPulse=0.0)
+# globalClock is now 0 at the first trigger, every screen is flipped on the frame of its onset
+# (and the keyboard is read for pulses after every flip, on this thread)
+scheduler = FrameScheduler(win, globalClock, frameDur, onFrame=triggers.update)
+# the first trial starts at the first trigger
+trial_onset = 0.0
+
+# Loop through the trials of the schedule
+for idx, image_path in enumerate(image_paths):
     logging.info(f'Displaying image: {image_path}')
+    # decode this and the next image while the fixation cross is on the screen
+    preloader.prefetch(image_paths[idx:idx + 2])
 
-    # Display the fixation cross for 1 second
-    fix.draw()
-    win.flip()
-    core.wait(1)
+    # Display the fixation cross at its onset (1 second)
+    scheduler.show(trial_onset, fix.draw, 'fixation')
+    stream.flush()  # write the previous trial in the background during the fixation
 
-    # set the image on the screen
-    image.setImage(image_path)
+    # set the image on the screen (already decoded, so no disk access here)
+    image.setImage(preloader.getImage(image_path))
     trials.addData('imgName', image_path) # get image name and add to table
 
-    # Display the image for 5 seconds
-    image.draw()
-    trials.addData('imgBeginTime', globalClock.getTime()) # get image drawing begin time and add to table
-    win.flip()
-    core.wait(5)
-    trials.addData('imgEndTime', globalClock.getTime()) # get image drawing end time and add to table
+    # Display the image at its onset (5 seconds)
+    image_onset = trial_onset + fixation_durations[idx]
+    imgBeginTime = scheduler.show(image_onset, image.draw, 'image')
+    trials.addData('imgBeginTime', imgBeginTime) # get image flip time and add to table
 
-    # Display the rating scale prompt
+    # Display the rating scale prompt at its onset, this flip also ends the image
     questionScale.reset()
-    trials.addData('scaleBeginTime', globalClock.getTime()) # get scale drawing begin time and add to table
+    scaleBeginTime = scheduler.show(image_onset + image_durations[idx], questionScale.draw, 'rating')
+    trials.addData('imgEndTime', scaleBeginTime) # get image end time and add to table
+    trials.addData('scaleBeginTime', scaleBeginTime) # get scale drawing begin time and add to table
+    last_flip = scaleBeginTime
     while questionScale.noResponse:
-        questionScale.draw()
-        win.flip()
+        last_flip = scheduler.flip()
     trials.addData('scaleEndTime', globalClock.getTime()) # get scale drawing begin time and add to table
+    # the next trial starts on the next frame, as soon as the rating is over
+    trial_onset = last_flip + frameDur
 
     # Save the rating and RT
     ratingTime = questionScale.getRT()
@@ -159,6 +204,23 @@ for idx, row in image_data.iterrows():
     # 
     thisExp.nextEntry()
 
+# save the time of every volume's sync pulse
+triggers.stop()
+triggers.savePulseTable(filename + '_pulses.csv')
+if triggers.missed:
+    logging.warning(f'{triggers.missed} scanner pulses were missed, see the pulse table')
+
+# save how far each event was from its scheduled onset
+scheduler.saveLog(filename + '_drift.csv')
+logging.info(f'Largest onset drift: {scheduler.maxDrift() * 1000:.2f} ms')
+
+# report how many images were ready in time and free the cache
+logging.info(f'Image preloader: {preloader.stats()}, scaled image cache: {asset_cache.stats()}')
+preloader.close()
+# check the stored frame rate against the scan's frames (not during it, every onset is timed on it),
+# measured again and stored for the next session if the monitor has changed
+checkFrameRate(win)
+
 # Create an end screen
 end_text = visual.TextStim(win, text="Thank you for participating!\n\nPress any key to exit.", color='black', height=fontH)
 end_text.draw()
@@ -168,8 +230,10 @@ win.flip()
 event.waitKeys()
 logging.info('End of experiment screen completed')
 
-# save log files as csv and pickle as backup
-thisExp.saveAsWideText(filename+'.csv',fileCollisionMethod = 'rename')
+# finish the stream and rebuild the csv (and a typed parquet file) from it, keep the pickle as backup
+stream.close()
+rebuildWideText(stream.path)
+convertToColumnar(stream.path)
 thisExp.saveAsPickle(filename, fileCollisionMethod = 'rename')
 logging.flush()
 
@@ -18,7 +18,19 @@ from psychopy import plugins
 plugins.activatePlugins()
 prefs.hardware['audioLib'] = 'ptb'
 prefs.hardware['audioLatencyMode'] = '3'
-from psychopy import sound, gui, visual, core, data, event, logging, clock, colors, layout, hardware
+import os  # handy system and path functions
+import sys  # to get file system encoding
+
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from exptools.lazyimport import lazyImport
+# sound, ioHub and the eyetracker controls are only imported when first used
+# (EXPTOOLS_LAZY_IMPORTS=0 imports them here); psychopy.hardware imports the eyetracker
+# controls, and with them the alerts system, so they are deferred before it is imported
+sound = lazyImport('psychopy.sound')
+io = lazyImport('psychopy.iohub')
+lazyImport('psychopy.hardware.eyetracker')
+from psychopy import gui, visual, core, data, event, logging, clock, colors, layout, hardware
 from psychopy.tools import environmenttools
 from psychopy.constants import (NOT_STARTED, STARTED, PLAYING, PAUSED,
                                 STOPPED, FINISHED, PRESSED, RELEASED, FOREVER, priority)
@@ -27,15 +39,28 @@ import numpy as np  # whole numpy lib is available, prepend 'np.'
 from numpy import (sin, cos, tan, log, log10, pi, average,
                    sqrt, std, deg2rad, rad2deg, linspace, asarray)
 from numpy.random import random, randint, normal, shuffle, choice as randchoice
-import os  # handy system and path functions
-import sys  # to get file system encoding
 
-import psychopy.iohub as io
 from psychopy.hardware import keyboard
 
+from exptools.frametiming import FrameRecorder, NullFrameRecorder
+from exptools.streaming import StreamingWriter, rebuildWideText
+from exptools.fastforward import fastForwardFromArgs
+from exptools.columnar import convertToColumnar, saveAsColumnar
+from exptools.asynclog import asyncLogFile, asyncPrint
+from exptools.imagepack import packConditions
+from exptools.conditions import loadConditions
+from exptools.calibration import calibratedFrameRate, checkFrameRate
+from exptools.hubpool import hubPool
+
 # --- Setup global variables (available in all functions) ---
 # create a device manager to handle hardware (keyboards, mice, mirophones, speakers, etc.)
 deviceManager = hardware.DeviceManager()
+# per-frame timing recorder, replaced by a real one in run() when recording frames
+frameRecorder = NullFrameRecorder()
+# crash-safe stream of the data rows, created in setupData()
+streamWriter = None
+# memory-mapped pack of everything in images.csv, opened in setupResources()
+imagePack = None
 # ensure that relative paths start from the same directory as this script
 _thisDir = os.path.dirname(os.path.abspath(__file__))
 # store info about the experiment session
@@ -58,6 +83,12 @@ or run the experiment with `--pilot` as an argument. To change what pilot
 '''
 # work out from system args whether we are running in pilot mode
 PILOTING = core.setPilotModeFromArgs()
+# record per-frame timing to a `_frames.npz` sidecar if run with `--record-frames`
+_recordFrames = '--record-frames' in sys.argv
+# in pilot mode, run the clocks faster than real time if run with `--fast-forward[=factor]`
+_fastForward = fastForwardFromArgs() if PILOTING else None
+if _fastForward is not None:
+    expInfo['fastForward|hid'] = _fastForward.factor
 # start off with values from experiment settings
 _fullScr = True
 _winSize = (1024, 768)
@@ -97,6 +128,19 @@ def showExpInfoDlg(expInfo):
     return expInfo
 
 
+def setupResources():
+    """
+    Open the memory-mapped pack of everything in images.csv, building it on the
+    first run (or when an image changed), before the window opens. Called by
+    `setupData`, or beforehand from any folder or thread (e.g. by a battery
+    while the previous experiment runs).
+    """
+    global imagePack
+    if imagePack is None:
+        # the image paths start from the experiment's folder
+        imagePack = packConditions(os.path.join(_thisDir, 'images.csv'), column='image', root=_thisDir)
+
+
 def setupData(expInfo, dataDir=None):
     """
     Make an ExperimentHandler to handle trials and saving.
@@ -113,6 +157,8 @@ def setupData(expInfo, dataDir=None):
         Handler object for this experiment, contains the data to save and information about 
         where to save it to.
     """
+    # open the image pack (unless already open) before the window opens
+    setupResources()
     # remove dialog-specific syntax from expInfo
     for key, val in expInfo.copy().items():
         newKey, _ = data.utils.parsePipeSyntax(key)
@@ -137,6 +183,9 @@ def setupData(expInfo, dataDir=None):
     )
     thisExp.setPriority('thisRow.t', priority.CRITICAL)
     thisExp.setPriority('expName', priority.LOW)
+    # stream every finished row to disk, so a crash doesn't lose the session
+    global streamWriter
+    streamWriter = StreamingWriter(thisExp.dataFileName + '_stream.jsonl').attach(thisExp)
     # return experiment handler
     return thisExp
 
@@ -157,8 +206,8 @@ def setupLogging(filename):
     """
     # this outputs to the screen, not a file
     logging.console.setLevel(_loggingLevel)
-    # save a log file for detail verbose info
-    logFile = logging.LogFile(filename+'.log', level=_loggingLevel)
+    # save a log file for detail verbose info, written to disk on a background thread
+    logFile = asyncLogFile(filename+'.log', level=_loggingLevel)
     
     return logFile
 
@@ -202,8 +251,9 @@ def setupWindow(expInfo=None, win=None):
         win.units = 'height'
     if expInfo is not None:
         # get/measure frame rate if not already in expInfo
+        # (measured once per monitor, then reused and checked between Routines)
         if win._monitorFrameRate is None:
-            win.getActualFrameRate(infoMsg='Attempting to measure frame rate of screen, please wait...')
+            calibratedFrameRate(win, infoMsg='Attempting to measure frame rate of screen, please wait...')
         expInfo['frameRate'] = win._monitorFrameRate
     win.mouseVisible = False
     win.hideMessage()
@@ -242,7 +292,8 @@ def setupDevices(expInfo, thisExp, win):
     ioSession = '1'
     if 'session' in expInfo:
         ioSession = str(expInfo['session'])
-    ioServer = io.launchHubServer(window=win, **ioConfig)
+    # reuse the ioHub server of an earlier experiment in this Session, if it is still running
+    ioServer = hubPool.launch(io, window=win, **ioConfig)
     # store ioServer object in the device manager
     deviceManager.ioServer = ioServer
     
@@ -361,6 +412,13 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         frameDur = 1.0 / round(expInfo['frameRate'])
     else:
         frameDur = 1.0 / 60.0  # could not measure, so guess
+    # start recording frame timing if requested
+    global frameRecorder
+    if _recordFrames:
+        frameRecorder = FrameRecorder(frameDur=frameDur)
+    # from here on the clocks run fast, if piloting with `--fast-forward`
+    if _fastForward is not None:
+        _fastForward.install(win)
     
     # Start Code - component code to be run after the window creation
     
@@ -445,8 +503,11 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         format='%Y-%m-%d %Hh%M.%S.%f %z', fractionalSecondDigits=6
     )
     
+    # check the stored frame rate against the frames so far (measured again if it changed)
+    checkFrameRate(win, frameRecorder)
     # --- Prepare to start Routine "welcome" ---
     continueRoutine = True
+    frameRecorder.startRoutine('welcome')
     # update component parameters for each repeat
     thisExp.addData('welcome.started', globalClock.getTime(format='float'))
     key_resp.keys = []
@@ -469,6 +530,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     # --- Run Routine "welcome" ---
     routineForceEnded = not continueRoutine
     while continueRoutine:
+        frameRecorder.startFrame()
         # get current time
         t = routineTimer.getTime()
         tThisFlip = win.getFutureFlipTime(clock=routineTimer)
@@ -543,7 +605,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         
         # refresh the screen
         if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
+            frameRecorder.endUpdates()
             win.flip()
+            frameRecorder.flipped()
     
     # --- Ending Routine "welcome" ---
     for thisComponent in welcomeComponents:
@@ -561,8 +625,14 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     # the Routine "welcome" was not non-slip safe, so reset the non-slip timer
     routineTimer.reset()
     
+    # check the stored frame rate against the frames so far (measured again if it changed)
+    checkFrameRate(win, frameRecorder)
     # --- Prepare to start Routine "fixation" ---
     continueRoutine = True
+    frameRecorder.startRoutine('fixation')
+    # write finished rows in the background while nothing is changing on screen
+    if streamWriter is not None:
+        streamWriter.flush()
     # update component parameters for each repeat
     thisExp.addData('fixation.started', globalClock.getTime(format='float'))
     # keep track of which components have finished
@@ -582,6 +652,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     # --- Run Routine "fixation" ---
     routineForceEnded = not continueRoutine
     while continueRoutine and routineTimer.getTime() < 1.0:
+        frameRecorder.startFrame()
         # get current time
         t = routineTimer.getTime()
         tThisFlip = win.getFutureFlipTime(clock=routineTimer)
@@ -642,7 +713,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         
         # refresh the screen
         if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
+            frameRecorder.endUpdates()
             win.flip()
+            frameRecorder.flipped()
     
     # --- Ending Routine "fixation" ---
     for thisComponent in fixationComponents:
@@ -659,7 +732,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     # set up handler to look after randomisation of conditions etc
     trials = data.TrialHandler(nReps=1.0, method='random', 
         extraInfo=expInfo, originPath=-1,
-        trialList=data.importConditions('images.csv'),
+        trialList=loadConditions('images.csv'),
         seed=None, name='trials')
     thisExp.addLoop(trials)  # add the loop to the experiment
     thisTrial = trials.trialList[0]  # so we can initialise stimuli with some values
@@ -684,11 +757,14 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             for paramName in thisTrial:
                 globals()[paramName] = thisTrial[paramName]
         
+        # check the stored frame rate against the frames so far (measured again if it changed)
+        checkFrameRate(win, frameRecorder)
         # --- Prepare to start Routine "image_stim" ---
         continueRoutine = True
+        frameRecorder.startRoutine('image_stim')
         # update component parameters for each repeat
         thisExp.addData('image_stim.started', globalClock.getTime(format='float'))
-        image_disp.setImage(image)
+        image_disp.setImage(imagePack.getImage(image))
         # keep track of which components have finished
         image_stimComponents = [image_disp]
         for thisComponent in image_stimComponents:
@@ -706,6 +782,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         # --- Run Routine "image_stim" ---
         routineForceEnded = not continueRoutine
         while continueRoutine and routineTimer.getTime() < 5.0:
+            frameRecorder.startFrame()
             # get current time
             t = routineTimer.getTime()
             tThisFlip = win.getFutureFlipTime(clock=routineTimer)
@@ -766,7 +843,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             
             # refresh the screen
             if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
+                frameRecorder.endUpdates()
                 win.flip()
+                frameRecorder.flipped()
         
         # --- Ending Routine "image_stim" ---
         for thisComponent in image_stimComponents:
@@ -779,8 +858,11 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         else:
             routineTimer.addTime(-5.000000)
         
+        # check the stored frame rate against the frames so far (measured again if it changed)
+        checkFrameRate(win, frameRecorder)
         # --- Prepare to start Routine "rating" ---
         continueRoutine = True
+        frameRecorder.startRoutine('rating')
         # update component parameters for each repeat
         thisExp.addData('rating.started', globalClock.getTime(format='float'))
         slider.reset()
@@ -816,6 +898,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         # --- Run Routine "rating" ---
         routineForceEnded = not continueRoutine
         while continueRoutine:
+            frameRecorder.startFrame()
             # get current time
             t = routineTimer.getTime()
             tThisFlip = win.getFutureFlipTime(clock=routineTimer)
@@ -869,7 +952,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             
             # Adjust the slider position based on key presses
             for key in keys:
-                print(key.name)
+                asyncPrint(key.name)
                 if key.name == 'left':
                     current_slider_pos -= 1  # Move left
                 elif key.name == 'right':
@@ -931,7 +1014,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             
             # refresh the screen
             if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
+                frameRecorder.endUpdates()
                 win.flip()
+                frameRecorder.flipped()
         
         # --- Ending Routine "rating" ---
         for thisComponent in ratingComponents:
@@ -954,8 +1039,14 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         # the Routine "rating" was not non-slip safe, so reset the non-slip timer
         routineTimer.reset()
         
+        # check the stored frame rate against the frames so far (measured again if it changed)
+        checkFrameRate(win, frameRecorder)
         # --- Prepare to start Routine "isi" ---
         continueRoutine = True
+        frameRecorder.startRoutine('isi')
+        # write finished rows in the background while nothing is changing on screen
+        if streamWriter is not None:
+            streamWriter.flush()
         # update component parameters for each repeat
         thisExp.addData('isi.started', globalClock.getTime(format='float'))
         # Run 'Begin Routine' code from code_2
@@ -978,6 +1069,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         # --- Run Routine "isi" ---
         routineForceEnded = not continueRoutine
         while continueRoutine:
+            frameRecorder.startFrame()
             # get current time
             t = routineTimer.getTime()
             tThisFlip = win.getFutureFlipTime(clock=routineTimer)
@@ -1038,7 +1130,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             
             # refresh the screen
             if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
+                frameRecorder.endUpdates()
                 win.flip()
+                frameRecorder.flipped()
         
         # --- Ending Routine "isi" ---
         for thisComponent in isiComponents:
@@ -1070,8 +1164,15 @@ def saveData(thisExp):
         where to save it to.
     """
     filename = thisExp.dataFileName
+    # finish the crash-safe stream and rebuild the csv (and a typed parquet file) from it
+    if streamWriter is not None:
+        streamWriter.close()
+        rebuildWideText(streamWriter.path, delim=',')
+        convertToColumnar(streamWriter.path)
+    else:
+        thisExp.saveAsWideText(filename + '.csv', delim='auto')
+        saveAsColumnar(thisExp)
     # these shouldn't be strictly necessary (should auto-save)
-    thisExp.saveAsWideText(filename + '.csv', delim='auto')
     thisExp.saveAsPickle(filename)
 
 
@@ -1097,6 +1198,11 @@ def endExperiment(thisExp, win=None):
         win.flip()
     # mark experiment handler as finished
     thisExp.status = FINISHED
+    # write the frame timing sidecar (does nothing unless recording frames)
+    frameRecorder.save(thisExp.dataFileName)
+    # put the real clocks back (does nothing unless fast-forwarding)
+    if _fastForward is not None:
+        _fastForward.uninstall()
     # shut down eyetracker, if there is one
     if deviceManager.getDevice('eyetracker') is not None:
         deviceManager.removeDevice('eyetracker')
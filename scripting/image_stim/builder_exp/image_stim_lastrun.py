@@ -3,10 +3,11 @@
 """
 This experiment was created using PsychoPy3 Experiment Builder (v2024.1.4),
     on May 26, 2024, at 17:20
+and exported with the exptools hooks by `python -m exptools.exporter`.
 If you publish work using this script the most relevant publication is:
 
-    Peirce J, Gray JR, Simpson S, MacAskill M, Höchenberger R, Sogo H, Kastman E, Lindeløv JK. (2019) 
-        PsychoPy2: Experiments in behavior made easy Behav Res 51: 195. 
+    Peirce J, Gray JR, Simpson S, MacAskill M, Höchenberger R, Sogo H, Kastman E, Lindeløv JK. (2019)
+        PsychoPy2: Experiments in behavior made easy Behav Res 51: 195.
         https://doi.org/10.3758/s13428-018-01193-y
 
 """
@@ -18,7 +19,19 @@ from psychopy import plugins
 plugins.activatePlugins()
 prefs.hardware['audioLib'] = 'ptb'
 prefs.hardware['audioLatencyMode'] = '3'
-from psychopy import sound, gui, visual, core, data, event, logging, clock, colors, layout, hardware
+import os  # handy system and path functions
+import sys  # to get file system encoding
+
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from exptools.lazyimport import lazyImport
+# sound, ioHub and the eyetracker controls are only imported when first used
+# (EXPTOOLS_LAZY_IMPORTS=0 imports them here); psychopy.hardware imports the eyetracker
+# controls, and with them the alerts system, so they are deferred before it is imported
+sound = lazyImport('psychopy.sound')
+io = lazyImport('psychopy.iohub')
+lazyImport('psychopy.hardware.eyetracker')
+from psychopy import gui, visual, core, data, event, logging, clock, colors, layout, hardware
 from psychopy.tools import environmenttools
 from psychopy.constants import (NOT_STARTED, STARTED, PLAYING, PAUSED,
                                 STOPPED, FINISHED, PRESSED, RELEASED, FOREVER, priority)
@@ -27,15 +40,30 @@ import numpy as np  # whole numpy lib is available, prepend 'np.'
 from numpy import (sin, cos, tan, log, log10, pi, average,
                    sqrt, std, deg2rad, rad2deg, linspace, asarray)
 from numpy.random import random, randint, normal, shuffle, choice as randchoice
-import os  # handy system and path functions
-import sys  # to get file system encoding
 
-import psychopy.iohub as io
 from psychopy.hardware import keyboard
 
+from exptools.frametiming import FrameRecorder, NullFrameRecorder
+from exptools.streaming import StreamingWriter, rebuildWideText
+from exptools.fastforward import fastForwardFromArgs
+from exptools.columnar import convertToColumnar, saveAsColumnar
+from exptools.asynclog import asyncLogFile, asyncPrint
+from exptools.imagepack import packConditions
+from exptools.conditions import loadConditions
+from exptools.calibration import calibratedFrameRate
+from exptools.hubpool import hubPool
+from exptools.routine import Routine, RoutineEngine, StimComponent, KeyboardComponent, SliderComponent
+
 # --- Setup global variables (available in all functions) ---
 # create a device manager to handle hardware (keyboards, mice, mirophones, speakers, etc.)
 deviceManager = hardware.DeviceManager()
+# per-frame timing recorder, replaced by a real one in run() when recording frames
+frameRecorder = NullFrameRecorder()
+# crash-safe stream of the data rows, created in setupData()
+streamWriter = None
+# memory-mapped packs of the images of image_disp in the conditions files,
+# opened in setupResources()
+imagePack = None
 # ensure that relative paths start from the same directory as this script
 _thisDir = os.path.dirname(os.path.abspath(__file__))
 # store info about the experiment session
@@ -52,12 +80,18 @@ expInfo = {
 
 # --- Define some variables which will change depending on pilot mode ---
 '''
-To run in pilot mode, either use the run/pilot toggle in Builder, Coder and Runner, 
-or run the experiment with `--pilot` as an argument. To change what pilot 
+To run in pilot mode, either use the run/pilot toggle in Builder, Coder and Runner,
+or run the experiment with `--pilot` as an argument. To change what pilot
 #mode does, check out the 'Pilot mode' tab in preferences.
 '''
 # work out from system args whether we are running in pilot mode
 PILOTING = core.setPilotModeFromArgs()
+# record per-frame timing to a `_frames.npz` sidecar if run with `--record-frames`
+_recordFrames = '--record-frames' in sys.argv
+# in pilot mode, run the clocks faster than real time if run with `--fast-forward[=factor]`
+_fastForward = fastForwardFromArgs() if PILOTING else None
+if _fastForward is not None:
+    expInfo['fastForward|hid'] = _fastForward.factor
 # start off with values from experiment settings
 _fullScr = True
 _winSize = [1920, 1080]
@@ -81,7 +115,7 @@ def showExpInfoDlg(expInfo):
     ==========
     expInfo : dict
         Information about this experiment.
-    
+
     Returns
     ==========
     dict
@@ -97,27 +131,42 @@ def showExpInfoDlg(expInfo):
     return expInfo
 
 
+def setupResources():
+    """
+    Open the memory-mapped packs of the images in the conditions files, building
+    them on the first run (or when an image changed), before the window opens.
+    Called by `setupData`, or beforehand from any folder or thread (e.g. by a
+    battery while the previous experiment runs).
+    """
+    global imagePack
+    if imagePack is None:
+        # the image paths start from the experiment's folder
+        imagePack = packConditions(os.path.join(_thisDir, 'images.csv'), column='image', root=_thisDir)
+
+
 def setupData(expInfo, dataDir=None):
     """
     Make an ExperimentHandler to handle trials and saving.
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     dataDir : Path, str or None
-        Folder to save the data to, leave as None to create a folder in the current directory.    
+        Folder to save the data to, leave as None to create a folder in the current directory.
     Returns
     ==========
     psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     """
+    # open the image packs (unless already open) before the window opens
+    setupResources()
     # remove dialog-specific syntax from expInfo
     for key, val in expInfo.copy().items():
         newKey, _ = data.utils.parsePipeSyntax(key)
         expInfo[newKey] = expInfo.pop(key)
-    
+
     # data file name stem = absolute path + name; later add .psyexp, .csv, .log, etc
     if dataDir is None:
         dataDir = _thisDir
@@ -126,7 +175,7 @@ def setupData(expInfo, dataDir=None):
     if os.path.isabs(filename):
         dataDir = os.path.commonprefix([dataDir, filename])
         filename = os.path.relpath(filename, dataDir)
-    
+
     # an ExperimentHandler isn't essential but helps with data saving
     thisExp = data.ExperimentHandler(
         name=expName, version='',
@@ -137,6 +186,9 @@ def setupData(expInfo, dataDir=None):
     )
     thisExp.setPriority('thisRow.t', priority.CRITICAL)
     thisExp.setPriority('expName', priority.LOW)
+    # stream every finished row to disk, so a crash doesn't lose the session
+    global streamWriter
+    streamWriter = StreamingWriter(thisExp.dataFileName + '_stream.jsonl').attach(thisExp)
     # return experiment handler
     return thisExp
 
@@ -144,12 +196,12 @@ def setupData(expInfo, dataDir=None):
 def setupLogging(filename):
     """
     Setup a log file and tell it what level to log at.
-    
+
     Parameters
     ==========
     filename : str or pathlib.Path
         Filename to save log file and data files as, doesn't need an extension.
-    
+
     Returns
     ==========
     psychopy.logging.LogFile
@@ -157,23 +209,23 @@ def setupLogging(filename):
     """
     # this outputs to the screen, not a file
     logging.console.setLevel(_loggingLevel)
-    # save a log file for detail verbose info
-    logFile = logging.LogFile(filename+'.log', level=_loggingLevel)
-    
+    # save a log file for detail verbose info, written to disk on a background thread
+    logFile = asyncLogFile(filename+'.log', level=_loggingLevel)
+
     return logFile
 
 
 def setupWindow(expInfo=None, win=None):
     """
     Setup the Window
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     win : psychopy.visual.Window
         Window to setup - leave as None to create a new window.
-    
+
     Returns
     ==========
     psychopy.visual.Window
@@ -181,7 +233,7 @@ def setupWindow(expInfo=None, win=None):
     """
     if PILOTING:
         logging.debug('Fullscreen settings ignored as running in pilot mode.')
-    
+
     if win is None:
         # if not given a window to setup, make one
         win = visual.Window(
@@ -190,7 +242,7 @@ def setupWindow(expInfo=None, win=None):
             monitor='testMonitor', color=[0,0,0], colorSpace='rgb',
             backgroundImage='', backgroundFit='none',
             blendMode='avg', useFBO=True,
-            units='height', 
+            units='height',
             checkTiming=False  # we're going to do this ourselves in a moment
         )
     else:
@@ -202,29 +254,30 @@ def setupWindow(expInfo=None, win=None):
         win.units = 'height'
     if expInfo is not None:
         # get/measure frame rate if not already in expInfo
+        # (measured once per monitor, then reused and checked between Routines)
         if win._monitorFrameRate is None:
-            win.getActualFrameRate(infoMsg='Attempting to measure frame rate of screen, please wait...')
+            calibratedFrameRate(win, infoMsg='Attempting to measure frame rate of screen, please wait...')
         expInfo['frameRate'] = win._monitorFrameRate
     win.mouseVisible = False
     win.hideMessage()
     # show a visual indicator if we're in piloting mode
     if PILOTING and prefs.piloting['showPilotingIndicator']:
         win.showPilotingIndicator()
-    
+
     return win
 
 
 def setupDevices(expInfo, thisExp, win):
     """
-    Setup whatever devices are available (mouse, keyboard, speaker, eyetracker, etc.) and add them to 
+    Setup whatever devices are available (mouse, keyboard, speaker, eyetracker, etc.) and add them to
     the device manager (deviceManager)
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     win : psychopy.visual.Window
         Window in which to run this experiment.
@@ -235,17 +288,18 @@ def setupDevices(expInfo, thisExp, win):
     """
     # --- Setup input devices ---
     ioConfig = {}
-    
+
     # Setup iohub keyboard
     ioConfig['Keyboard'] = dict(use_keymap='psychopy')
-    
+
     ioSession = '1'
     if 'session' in expInfo:
         ioSession = str(expInfo['session'])
-    ioServer = io.launchHubServer(window=win, **ioConfig)
+    # reuse the ioHub server of an earlier experiment in this Session, if it is still running
+    ioServer = hubPool.launch(io, window=win, **ioConfig)
     # store ioServer object in the device manager
     deviceManager.ioServer = ioServer
-    
+
     # create a default keyboard (e.g. to check for escape)
     if deviceManager.getDevice('defaultKeyboard') is None:
         deviceManager.addDevice(
@@ -269,11 +323,11 @@ def setupDevices(expInfo, thisExp, win):
 def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
     """
     Pause this experiment, preventing the flow from advancing to the next routine until resumed.
-    
+
     Parameters
     ==========
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     win : psychopy.visual.Window
         Window for this experiment.
@@ -285,7 +339,7 @@ def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
     # if we are not paused, do nothing
     if thisExp.status != PAUSED:
         return
-    
+
     # pause any playback components
     for comp in playbackComponents:
         comp.pause()
@@ -322,13 +376,13 @@ def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
 def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     """
     Run the experiment flow.
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     psychopy.visual.Window
         Window in which to run this experiment.
@@ -361,37 +415,44 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         frameDur = 1.0 / round(expInfo['frameRate'])
     else:
         frameDur = 1.0 / 60.0  # could not measure, so guess
-    
+    # start recording frame timing if requested
+    global frameRecorder
+    if _recordFrames:
+        frameRecorder = FrameRecorder(frameDur=frameDur)
+    # from here on the clocks run fast, if piloting with `--fast-forward`
+    if _fastForward is not None:
+        _fastForward.install(win)
+
     # Start Code - component code to be run after the window creation
-    
+
     # --- Initialize components for Routine "welcome" ---
     text = visual.TextStim(win=win, name='text',
         text='Welcome to the experiment!\n\nYou will see a series of images.\nPlease rate each image after it is displayed.\nPress any key to start.',
         font='Arial',
-        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0, 
-        color='white', colorSpace='rgb', opacity=None, 
+        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0,
+        color='white', colorSpace='rgb', opacity=None,
         languageStyle='LTR',
         depth=0.0);
     key_resp = keyboard.Keyboard(deviceName='key_resp')
-    
+
     # --- Initialize components for Routine "fixation" ---
     polygon = visual.ShapeStim(
-        win=win, name='polygon', vertices='cross',
-        size=(0.1, 0.1),
+        win=win, name='polygon',
+        size=(0.1, 0.1), vertices='cross',
         ori=0.0, pos=(0, 0), anchor='center',
         lineWidth=1.0,     colorSpace='rgb',  lineColor='white', fillColor='white',
         opacity=None, depth=0.0, interpolate=True)
-    
+
     # --- Initialize components for Routine "image_stim" ---
     image_disp = visual.ImageStim(
         win=win,
-        name='image_disp', 
+        name='image_disp',
         image='default.png', mask=None, anchor='center',
         ori=0.0, pos=(0, 0), size=(0.5, 0.5),
         color=[1,1,1], colorSpace='rgb', opacity=None,
         flipHoriz=False, flipVert=False,
         texRes=128.0, interpolate=True, depth=0.0)
-    
+
     # --- Initialize components for Routine "rating" ---
     slider = visual.Slider(win=win, name='slider',
         startValue=3, size=None, pos=(0, -150), units='pix',
@@ -403,22 +464,22 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     text_2 = visual.TextStim(win=win, name='text_2',
         text='How realistic do you think this image is?',
         font='Arial',
-        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0, 
-        color='white', colorSpace='rgb', opacity=None, 
+        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0,
+        color='white', colorSpace='rgb', opacity=None,
         languageStyle='LTR',
         depth=-1.0);
     key_resp_2 = keyboard.Keyboard(deviceName='key_resp_2')
-    
+
     # --- Initialize components for Routine "isi" ---
     polygon_2 = visual.ShapeStim(
-        win=win, name='polygon_2', vertices='cross',
-        size=(0.1, 0.1),
+        win=win, name='polygon_2',
+        size=(0.1, 0.1), vertices='cross',
         ori=0.0, pos=(0, 0), anchor='center',
         lineWidth=1.0,     colorSpace='rgb',  lineColor='white', fillColor=[-0.0039, 1.0000, 0.6627],
         opacity=None, depth=-1.0, interpolate=True)
-    
+
     # create some handy timers
-    
+
     # global clock to track the time since experiment started
     if globalClock is None:
         # create a clock if not given one
@@ -444,215 +505,77 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     expInfo['expStart'] = data.getDateStr(
         format='%Y-%m-%d %Hh%M.%S.%f %z', fractionalSecondDigits=6
     )
-    
-    # --- Prepare to start Routine "welcome" ---
-    continueRoutine = True
-    # update component parameters for each repeat
-    thisExp.addData('welcome.started', globalClock.getTime(format='float'))
-    key_resp.keys = []
-    key_resp.rt = []
-    _key_resp_allKeys = []
-    # keep track of which components have finished
-    welcomeComponents = [text, key_resp]
-    for thisComponent in welcomeComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    frameN = -1
-    
-    # --- Run Routine "welcome" ---
-    routineForceEnded = not continueRoutine
-    while continueRoutine:
-        # get current time
-        t = routineTimer.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *text* updates
-        
-        # if text is starting this frame...
-        if text.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            text.frameNStart = frameN  # exact frame index
-            text.tStart = t  # local t and not account for scr refresh
-            text.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(text, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'text.started')
-            # update status
-            text.status = STARTED
-            text.setAutoDraw(True)
-        
-        # if text is active this frame...
-        if text.status == STARTED:
-            # update params
-            pass
-        
-        # *key_resp* updates
-        waitOnFlip = False
-        
-        # if key_resp is starting this frame...
-        if key_resp.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            key_resp.frameNStart = frameN  # exact frame index
-            key_resp.tStart = t  # local t and not account for scr refresh
-            key_resp.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(key_resp, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'key_resp.started')
-            # update status
-            key_resp.status = STARTED
-            # keyboard checking is just starting
-            waitOnFlip = True
-            win.callOnFlip(key_resp.clock.reset)  # t=0 on next screen flip
-            win.callOnFlip(key_resp.clearEvents, eventType='keyboard')  # clear events on next screen flip
-        if key_resp.status == STARTED and not waitOnFlip:
-            theseKeys = key_resp.getKeys(keyList=['space', 'left', 'right', 'return'], ignoreKeys=["escape"], waitRelease=False)
-            _key_resp_allKeys.extend(theseKeys)
-            if len(_key_resp_allKeys):
-                key_resp.keys = _key_resp_allKeys[-1].name  # just the last key pressed
-                key_resp.rt = _key_resp_allKeys[-1].rt
-                key_resp.duration = _key_resp_allKeys[-1].duration
-                # a response ends the routine
+
+    # --- Routines: what each one shows and listens for, and when ---
+    welcome = Routine('welcome', [
+        StimComponent(text),
+        KeyboardComponent(key_resp, 'key_resp', keyList=['space', 'left', 'right', 'return'], store='nothing'),
+    ])
+    fixation = Routine('fixation', [
+        StimComponent(polygon, duration=1.0),
+    ], duration=1.0)
+    image_stim = Routine('image_stim', [
+        StimComponent(image_disp, duration=5),
+    ], duration=5.0)
+    # Run 'Each Frame' code from code
+    def ratingEachFrame():
+        nonlocal current_slider_pos
+        continueRoutine = True
+        # Get the keys pressed
+        keys = key_resp_2.getKeys()
+
+        # Adjust the slider position based on key presses
+        for key in keys:
+            asyncPrint(key.name)
+            if key.name == 'left':
+                current_slider_pos -= 1  # Move left
+            elif key.name == 'right':
+                current_slider_pos += 1  # Move right
+            elif key.name == 'return':
+                # Confirm selection and end routine
+                thisExp.addData('final_slider_position', slider.markerPos)
                 continueRoutine = False
-        
-        # check for quit (typically the Esc key)
-        if defaultKeyboard.getKeys(keyList=["escape"]):
-            thisExp.status = FINISHED
-        if thisExp.status == FINISHED or endExpNow:
-            endExperiment(thisExp, win=win)
-            return
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            routineForceEnded = True
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in welcomeComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-    
-    # --- Ending Routine "welcome" ---
-    for thisComponent in welcomeComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    thisExp.addData('welcome.stopped', globalClock.getTime(format='float'))
+
+            # Ensure the position stays within the slider's range
+            current_slider_pos = max(slider_min, min(slider_max, current_slider_pos))
+
+            # Update the slider position
+            slider.markerPos = current_slider_pos
+        return not continueRoutine
+    rating = Routine('rating', [
+        SliderComponent(slider, forceEndRoutine=False),
+        StimComponent(text_2),
+        KeyboardComponent(key_resp_2, 'key_resp_2', keyList=['return','left','right'], forceEndRoutine=False),
+    ], eachFrame=ratingEachFrame)
+    isi = Routine('isi', [
+        StimComponent(polygon_2, duration=lambda: t_isi),
+    ])
+    # one frame loop runs them all
+    routines = RoutineEngine(
+        win, thisExp, routineTimer, globalClock, defaultKeyboard,
+        frameRecorder=frameRecorder, frameTolerance=frameTolerance,
+        pauseExperiment=pauseExperiment
+    )
+
+    # --- Run Routine "welcome" ---
+    if not routines.run(welcome):
+        endExperiment(thisExp, win=win)
+        return
     thisExp.nextEntry()
-    # the Routine "welcome" was not non-slip safe, so reset the non-slip timer
-    routineTimer.reset()
-    
-    # --- Prepare to start Routine "fixation" ---
-    continueRoutine = True
-    # update component parameters for each repeat
-    thisExp.addData('fixation.started', globalClock.getTime(format='float'))
-    # keep track of which components have finished
-    fixationComponents = [polygon]
-    for thisComponent in fixationComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    frameN = -1
-    
+
     # --- Run Routine "fixation" ---
-    routineForceEnded = not continueRoutine
-    while continueRoutine and routineTimer.getTime() < 1.0:
-        # get current time
-        t = routineTimer.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *polygon* updates
-        
-        # if polygon is starting this frame...
-        if polygon.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            polygon.frameNStart = frameN  # exact frame index
-            polygon.tStart = t  # local t and not account for scr refresh
-            polygon.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(polygon, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'polygon.started')
-            # update status
-            polygon.status = STARTED
-            polygon.setAutoDraw(True)
-        
-        # if polygon is active this frame...
-        if polygon.status == STARTED:
-            # update params
-            pass
-        
-        # if polygon is stopping this frame...
-        if polygon.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > polygon.tStartRefresh + 1.0-frameTolerance:
-                # keep track of stop time/frame for later
-                polygon.tStop = t  # not accounting for scr refresh
-                polygon.tStopRefresh = tThisFlipGlobal  # on global time
-                polygon.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'polygon.stopped')
-                # update status
-                polygon.status = FINISHED
-                polygon.setAutoDraw(False)
-        
-        # check for quit (typically the Esc key)
-        if defaultKeyboard.getKeys(keyList=["escape"]):
-            thisExp.status = FINISHED
-        if thisExp.status == FINISHED or endExpNow:
-            endExperiment(thisExp, win=win)
-            return
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            routineForceEnded = True
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in fixationComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-    
-    # --- Ending Routine "fixation" ---
-    for thisComponent in fixationComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    thisExp.addData('fixation.stopped', globalClock.getTime(format='float'))
-    # using non-slip timing so subtract the expected duration of this Routine (unless ended on request)
-    if routineForceEnded:
-        routineTimer.reset()
-    else:
-        routineTimer.addTime(-1.000000)
+    # write finished rows in the background while nothing is changing on screen
+    if streamWriter is not None:
+        streamWriter.flush()
+    if not routines.run(fixation):
+        endExperiment(thisExp, win=win)
+        return
     thisExp.nextEntry()
-    
+
     # set up handler to look after randomisation of conditions etc
-    trials = data.TrialHandler(nReps=1.0, method='random', 
+    trials = data.TrialHandler(nReps=1.0, method='random',
         extraInfo=expInfo, originPath=-1,
-        trialList=data.importConditions('images.csv'),
+        trialList=loadConditions('images.csv'),
         seed=None, name='trials')
     thisExp.addLoop(trials)  # add the loop to the experiment
     thisTrial = trials.trialList[0]  # so we can initialise stimuli with some values
@@ -660,399 +583,74 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     if thisTrial != None:
         for paramName in thisTrial:
             globals()[paramName] = thisTrial[paramName]
-    
+
     for thisTrial in trials:
         currentLoop = trials
         thisExp.timestampOnFlip(win, 'thisRow.t', format=globalClock.format)
         # pause experiment here if requested
         if thisExp.status == PAUSED:
             pauseExperiment(
-                thisExp=thisExp, 
-                win=win, 
-                timers=[routineTimer], 
+                thisExp=thisExp,
+                win=win,
+                timers=[routineTimer],
                 playbackComponents=[]
         )
         # abbreviate parameter names if possible (e.g. rgb = thisTrial.rgb)
         if thisTrial != None:
             for paramName in thisTrial:
                 globals()[paramName] = thisTrial[paramName]
-        
-        # --- Prepare to start Routine "image_stim" ---
-        continueRoutine = True
-        # update component parameters for each repeat
-        thisExp.addData('image_stim.started', globalClock.getTime(format='float'))
-        image_disp.setImage(image)
-        # keep track of which components have finished
-        image_stimComponents = [image_disp]
-        for thisComponent in image_stimComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
-        # reset timers
-        t = 0
-        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-        frameN = -1
-        
+
         # --- Run Routine "image_stim" ---
-        routineForceEnded = not continueRoutine
-        while continueRoutine and routineTimer.getTime() < 5.0:
-            # get current time
-            t = routineTimer.getTime()
-            tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-            # update/draw components on each frame
-            
-            # *image_disp* updates
-            
-            # if image_disp is starting this frame...
-            if image_disp.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                image_disp.frameNStart = frameN  # exact frame index
-                image_disp.tStart = t  # local t and not account for scr refresh
-                image_disp.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(image_disp, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'image_disp.started')
-                # update status
-                image_disp.status = STARTED
-                image_disp.setAutoDraw(True)
-            
-            # if image_disp is active this frame...
-            if image_disp.status == STARTED:
-                # update params
-                pass
-            
-            # if image_disp is stopping this frame...
-            if image_disp.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > image_disp.tStartRefresh + 5-frameTolerance:
-                    # keep track of stop time/frame for later
-                    image_disp.tStop = t  # not accounting for scr refresh
-                    image_disp.tStopRefresh = tThisFlipGlobal  # on global time
-                    image_disp.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'image_disp.stopped')
-                    # update status
-                    image_disp.status = FINISHED
-                    image_disp.setAutoDraw(False)
-            
-            # check for quit (typically the Esc key)
-            if defaultKeyboard.getKeys(keyList=["escape"]):
-                thisExp.status = FINISHED
-            if thisExp.status == FINISHED or endExpNow:
-                endExperiment(thisExp, win=win)
-                return
-            
-            # check if all components have finished
-            if not continueRoutine:  # a component has requested a forced-end of Routine
-                routineForceEnded = True
-                break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in image_stimComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
-            
-            # refresh the screen
-            if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
-        
-        # --- Ending Routine "image_stim" ---
-        for thisComponent in image_stimComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
-        thisExp.addData('image_stim.stopped', globalClock.getTime(format='float'))
-        # using non-slip timing so subtract the expected duration of this Routine (unless ended on request)
-        if routineForceEnded:
-            routineTimer.reset()
-        else:
-            routineTimer.addTime(-5.000000)
-        
-        # --- Prepare to start Routine "rating" ---
-        continueRoutine = True
-        # update component parameters for each repeat
-        thisExp.addData('rating.started', globalClock.getTime(format='float'))
+        image_disp.setImage(imagePack.getImage(image))
+        if not routines.run(image_stim, handler=trials):
+            endExperiment(thisExp, win=win)
+            return
+
+        # --- Run Routine "rating" ---
         slider.reset()
-        key_resp_2.keys = []
-        key_resp_2.rt = []
-        _key_resp_2_allKeys = []
         # Run 'Begin Routine' code from code
         # Initial position of the slider
         current_slider_pos = slider.markerPos
-        
+
         # Ensure markerPos is initialized to avoid NoneType issues
         if current_slider_pos is None:
             current_slider_pos = slider.ticks[0]
-        
+
         # Define the slider's range based on its ticks
         slider_min = min(slider.ticks)
         slider_max = max(slider.ticks)
-        
+
         # Clear the keyboard events
         key_resp.clearEvents()
         key_resp_2.clearEvents()
-        
+
         dummy = key_resp_2.getKeys()
-        print(dummy)
-        # keep track of which components have finished
-        ratingComponents = [slider, text_2, key_resp_2]
-        for thisComponent in ratingComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
-        # reset timers
-        t = 0
-        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-        frameN = -1
-        
-        # --- Run Routine "rating" ---
-        routineForceEnded = not continueRoutine
-        while continueRoutine:
-            # get current time
-            t = routineTimer.getTime()
-            tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-            # update/draw components on each frame
-            
-            # *slider* updates
-            
-            # if slider is starting this frame...
-            if slider.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                slider.frameNStart = frameN  # exact frame index
-                slider.tStart = t  # local t and not account for scr refresh
-                slider.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(slider, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'slider.started')
-                # update status
-                slider.status = STARTED
-                slider.setAutoDraw(True)
-            
-            # if slider is active this frame...
-            if slider.status == STARTED:
-                # update params
-                pass
-            
-            # *text_2* updates
-            
-            # if text_2 is starting this frame...
-            if text_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                text_2.frameNStart = frameN  # exact frame index
-                text_2.tStart = t  # local t and not account for scr refresh
-                text_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(text_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'text_2.started')
-                # update status
-                text_2.status = STARTED
-                text_2.setAutoDraw(True)
-            
-            # if text_2 is active this frame...
-            if text_2.status == STARTED:
-                # update params
-                pass
-            
-            # *key_resp_2* updates
-            waitOnFlip = False
-            
-            # if key_resp_2 is starting this frame...
-            if key_resp_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                key_resp_2.frameNStart = frameN  # exact frame index
-                key_resp_2.tStart = t  # local t and not account for scr refresh
-                key_resp_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(key_resp_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'key_resp_2.started')
-                # update status
-                key_resp_2.status = STARTED
-                # keyboard checking is just starting
-                waitOnFlip = True
-                win.callOnFlip(key_resp_2.clock.reset)  # t=0 on next screen flip
-                win.callOnFlip(key_resp_2.clearEvents, eventType='keyboard')  # clear events on next screen flip
-            if key_resp_2.status == STARTED and not waitOnFlip:
-                theseKeys = key_resp_2.getKeys(keyList=['return','left','right'], ignoreKeys=["escape"], waitRelease=False)
-                _key_resp_2_allKeys.extend(theseKeys)
-                if len(_key_resp_2_allKeys):
-                    key_resp_2.keys = _key_resp_2_allKeys[-1].name  # just the last key pressed
-                    key_resp_2.rt = _key_resp_2_allKeys[-1].rt
-                    key_resp_2.duration = _key_resp_2_allKeys[-1].duration
-            # Run 'Each Frame' code from code
-            # Get the keys pressed
-            keys = key_resp_2.getKeys()
-            
-            # Adjust the slider position based on key presses
-            for key in keys:
-                print(key.name)
-                if key.name == 'left':
-                    current_slider_pos -= 1  # Move left
-                elif key.name == 'right':
-                    current_slider_pos += 1  # Move right
-                elif key.name == 'return':
-                    # Confirm selection and end routine
-                    thisExp.addData('final_slider_position', slider.markerPos)
-                    continueRoutine = False
-            
-                # Ensure the position stays within the slider's range
-                current_slider_pos = max(slider_min, min(slider_max, current_slider_pos))
-            
-                # Update the slider position
-                slider.markerPos = current_slider_pos
-            
-            
-            # check for quit (typically the Esc key)
-            if defaultKeyboard.getKeys(keyList=["escape"]):
-                thisExp.status = FINISHED
-            if thisExp.status == FINISHED or endExpNow:
-                endExperiment(thisExp, win=win)
-                return
-            
-            # check if all components have finished
-            if not continueRoutine:  # a component has requested a forced-end of Routine
-                routineForceEnded = True
-                break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in ratingComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
-            
-            # refresh the screen
-            if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
-        
-        # --- Ending Routine "rating" ---
-        for thisComponent in ratingComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
-        thisExp.addData('rating.stopped', globalClock.getTime(format='float'))
-        trials.addData('slider.response', slider.getRating())
-        trials.addData('slider.rt', slider.getRT())
-        # check responses
-        if key_resp_2.keys in ['', [], None]:  # No response was made
-            key_resp_2.keys = None
-        trials.addData('key_resp_2.keys',key_resp_2.keys)
-        if key_resp_2.keys != None:  # we had a response
-            trials.addData('key_resp_2.rt', key_resp_2.rt)
-            trials.addData('key_resp_2.duration', key_resp_2.duration)
+        asyncPrint(dummy)
+        if not routines.run(rating, handler=trials):
+            endExperiment(thisExp, win=win)
+            return
         # Run 'End Routine' code from code
         # Save the final slider position if needed
         thisExp.addData('final_slider_position', slider.markerPos)
-        
-        # the Routine "rating" was not non-slip safe, so reset the non-slip timer
-        routineTimer.reset()
-        
-        # --- Prepare to start Routine "isi" ---
-        continueRoutine = True
-        # update component parameters for each repeat
-        thisExp.addData('isi.started', globalClock.getTime(format='float'))
+
+        # --- Run Routine "isi" ---
+        # write finished rows in the background while nothing is changing on screen
+        if streamWriter is not None:
+            streamWriter.flush()
         # Run 'Begin Routine' code from code_2
         import random
         t_isi = random.uniform(0, 1)
-        # keep track of which components have finished
-        isiComponents = [polygon_2]
-        for thisComponent in isiComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
-        # reset timers
-        t = 0
-        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-        frameN = -1
-        
-        # --- Run Routine "isi" ---
-        routineForceEnded = not continueRoutine
-        while continueRoutine:
-            # get current time
-            t = routineTimer.getTime()
-            tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-            # update/draw components on each frame
-            
-            # *polygon_2* updates
-            
-            # if polygon_2 is starting this frame...
-            if polygon_2.status == NOT_STARTED and tThisFlip >= 0-frameTolerance:
-                # keep track of start time/frame for later
-                polygon_2.frameNStart = frameN  # exact frame index
-                polygon_2.tStart = t  # local t and not account for scr refresh
-                polygon_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(polygon_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'polygon_2.started')
-                # update status
-                polygon_2.status = STARTED
-                polygon_2.setAutoDraw(True)
-            
-            # if polygon_2 is active this frame...
-            if polygon_2.status == STARTED:
-                # update params
-                pass
-            
-            # if polygon_2 is stopping this frame...
-            if polygon_2.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > polygon_2.tStartRefresh + t_isi-frameTolerance:
-                    # keep track of stop time/frame for later
-                    polygon_2.tStop = t  # not accounting for scr refresh
-                    polygon_2.tStopRefresh = tThisFlipGlobal  # on global time
-                    polygon_2.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'polygon_2.stopped')
-                    # update status
-                    polygon_2.status = FINISHED
-                    polygon_2.setAutoDraw(False)
-            
-            # check for quit (typically the Esc key)
-            if defaultKeyboard.getKeys(keyList=["escape"]):
-                thisExp.status = FINISHED
-            if thisExp.status == FINISHED or endExpNow:
-                endExperiment(thisExp, win=win)
-                return
-            
-            # check if all components have finished
-            if not continueRoutine:  # a component has requested a forced-end of Routine
-                routineForceEnded = True
-                break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in isiComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
-            
-            # refresh the screen
-            if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
-        
-        # --- Ending Routine "isi" ---
-        for thisComponent in isiComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
-        thisExp.addData('isi.stopped', globalClock.getTime(format='float'))
-        # the Routine "isi" was not non-slip safe, so reset the non-slip timer
-        routineTimer.reset()
+        if not routines.run(isi, handler=trials):
+            endExperiment(thisExp, win=win)
+            return
         thisExp.nextEntry()
-        
+
         if thisSession is not None:
             # if running in a Session with a Liaison client, send data up to now
             thisSession.sendExperimentData()
     # completed 1.0 repeats of 'trials'
-    
-    
+
+
     # mark experiment as finished
     endExperiment(thisExp, win=win)
 
@@ -1060,29 +658,36 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
 def saveData(thisExp):
     """
     Save data from this experiment
-    
+
     Parameters
     ==========
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     """
     filename = thisExp.dataFileName
+    # finish the crash-safe stream and rebuild the csv (and a typed parquet file) from it
+    if streamWriter is not None:
+        streamWriter.close()
+        rebuildWideText(streamWriter.path, delim=',')
+        convertToColumnar(streamWriter.path)
+    else:
+        thisExp.saveAsWideText(filename + '.csv', delim='auto')
+        saveAsColumnar(thisExp)
     # these shouldn't be strictly necessary (should auto-save)
-    thisExp.saveAsWideText(filename + '.csv', delim='auto')
     thisExp.saveAsPickle(filename)
 
 
 def endExperiment(thisExp, win=None):
     """
     End this experiment, performing final shut down operations.
-    
+
     This function does NOT close the window or end the Python process - use `quit` for this.
-    
+
     Parameters
     ==========
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     win : psychopy.visual.Window
         Window for this experiment.
@@ -1090,11 +695,16 @@ def endExperiment(thisExp, win=None):
     if win is not None:
         # remove autodraw from all current components
         win.clearAutoDraw()
-        # Flip one final time so any remaining win.callOnFlip() 
+        # Flip one final time so any remaining win.callOnFlip()
         # and win.timeOnFlip() tasks get executed
         win.flip()
     # mark experiment handler as finished
     thisExp.status = FINISHED
+    # write the frame timing sidecar (does nothing unless recording frames)
+    frameRecorder.save(thisExp.dataFileName)
+    # put the real clocks back (does nothing unless fast-forwarding)
+    if _fastForward is not None:
+        _fastForward.uninstall()
     # shut down eyetracker, if there is one
     if deviceManager.getDevice('eyetracker') is not None:
         deviceManager.removeDevice('eyetracker')
@@ -1104,7 +714,7 @@ def endExperiment(thisExp, win=None):
 def quit(thisExp, win=None, thisSession=None):
     """
     Fully quit, closing the window and ending the Python process.
-    
+
     Parameters
     ==========
     win : psychopy.visual.Window
@@ -1115,7 +725,7 @@ def quit(thisExp, win=None, thisSession=None):
     thisExp.abort()  # or data files will save again on exit
     # make sure everything is closed down
     if win is not None:
-        # Flip one final time so any remaining win.callOnFlip() 
+        # Flip one final time so any remaining win.callOnFlip()
         # and win.timeOnFlip() tasks get executed before quitting
         win.flip()
         win.close()
@@ -1138,8 +748,8 @@ if __name__ == '__main__':
     win = setupWindow(expInfo=expInfo)
     setupDevices(expInfo=expInfo, thisExp=thisExp, win=win)
     run(
-        expInfo=expInfo, 
-        thisExp=thisExp, 
+        expInfo=expInfo,
+        thisExp=thisExp,
         win=win,
         globalClock='float'
     )
@@ -1,7 +1,17 @@
 import logging
 from psychopy import visual, event, core, data, gui
-import pandas as pd
 import os  # Import os to create directories
+import sys
+from pathlib import Path
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from exptools.preload import ImagePreloader
+from exptools.assetcache import ScaledImageCache, pixelSize
+from exptools.imagepack import openPack
+from exptools.stimpool import StimulusPool
+from exptools.columnar import convertToColumnar
+from exptools.asynclog import AsyncFileHandler
+from exptools.conditions import loadConditions
 
 # Collect participant info
 exp_info = {'participant': ''}
@@ -14,23 +24,24 @@ data_dir = 'data'
 if not os.path.exists(data_dir):
     os.makedirs(data_dir)
 
-# Set up logging
-logging.basicConfig(filename='data/' + exp_info["participant"] + '_experiment.log', level=logging.INFO, 
+# Set up logging (records are queued and written to the file on a background thread)
+log_handler = AsyncFileHandler('data/' + exp_info["participant"] + '_experiment.log')
+logging.basicConfig(handlers=[log_handler], level=logging.INFO,
                     format='%(asctime)s %(message)s')
 
 # Log the start of the experiment
 logging.info('Experiment started')
 
-# Load the image paths from the CSV file
+# Load the image paths from the CSV file (parsed once, then from the cache while it is unchanged)
 try:
-    image_data = pd.read_csv('images.csv')
+    image_data = loadConditions('images.csv')
     logging.info('Loaded images.csv successfully')
 except Exception as e:
-    logging.error(f'Error loading images.csv: {e}')
+    logging.error('Error loading images.csv: %s', e)
     core.quit()
 
 
-logging.info(f'Participant ID: {exp_info["participant"]}')
+logging.info('Participant ID: %s', exp_info['participant'])
 
 # Create a window
 win = visual.Window(size=[800, 600], color='gray', units='pix')
@@ -57,23 +68,40 @@ data_filename = os.path.join(data_dir, '%s_ratings.csv' % exp_info['participant'
 try:
     data_file = open(data_filename, 'w')
     data_file.write('participant,image,rating,response_time\n')
-    logging.info(f'Data file created: {data_filename}')
+    logging.info('Data file created: %s', data_filename)
 except Exception as e:
-    logging.error(f'Error creating data file: {e}')
+    logging.error('Error creating data file: %s', e)
     core.quit()
 
+image_paths = [row['image'] for row in image_data]
+# Scale every image once to the 400x400 pixels it is shown at (cached on disk for the next session)
+asset_cache = ScaledImageCache(pixelSize(win, (400, 400)), cacheDir='cache')
+asset_cache.prepare(image_paths)
+logging.info('Scaled image cache: %s', asset_cache.stats())
+# Pack the scaled images, decoded, into one memory-mapped file (built on the first run)
+image_pack = openPack(image_paths, 'cache/images_%dx%d.imgpack' % asset_cache.size, decode=asset_cache.loader,
+                      params=asset_cache.params)
+# Take the upcoming images from the pack in the background, keeping only a few of them in memory
+preloader = ImagePreloader(capacity=4, loader=image_pack.loader)
+# Build one image stimulus up front and show each new image on it
+image_pool = StimulusPool(lambda image: visual.ImageStim(win, image=image, size=(400, 400)),
+                          update=lambda stim, image: stim.setImage(image), capacity=1)
+image_pool.prebuild([None])
+
 # Loop through each image in the CSV file
-for idx, row in image_data.iterrows():
+for idx, row in enumerate(image_data):
     image_path = row['image']
-    logging.info(f'Displaying image: {image_path}')
+    logging.info('Displaying image: %s', image_path)
+    # Decode this and the next image while the fixation cross is on the screen
+    preloader.prefetch(image_paths[idx:idx + 2])
 
     # Display the fixation cross for 1 second
     fixation.draw()
     win.flip()
     core.wait(1)
 
-    # Create an image stimulus
-    image = visual.ImageStim(win, image=image_path, size=(400, 400))
+    # Put the decoded image on the pooled image stimulus
+    image = image_pool.get(image_path, preloader.getImage(image_path))
 
     # Display the image for 5 seconds
     image.draw()
@@ -91,11 +119,19 @@ for idx, row in image_data.iterrows():
     rating = ratingScale.getRating()
     ratingTime = ratingScale.getRT()
     data_file.write(f'{exp_info["participant"]},{image_path},{rating},{ratingTime}\n')
-    logging.info(f'Rating recorded: image={image_path}, rating={rating}, response_time={ratingTime}')
+    logging.info('Rating recorded: image=%s, rating=%s, response_time=%s', image_path, rating, ratingTime)
+    logging.info('Stimuli created in this trial: %s', image_pool.endTrial())
 
 # Close the data file
 data_file.close()
 logging.info('Data file closed')
+# Also save the ratings as a typed Parquet file, for fast column-wise reading
+convertToColumnar(data_filename)
+
+# Report how many images were ready in time and free the cache
+logging.info('Image preloader: %s', preloader.stats())
+preloader.close()
+logging.info('Image stimulus pool: %s', image_pool.stats())
 
 # Create an end screen
 end_text = visual.TextStim(win, text="Thank you for participating!\n\nPress any key to exit.", color='black', height=30)
@@ -105,6 +141,7 @@ win.flip()
 # Wait for a key press to exit
 event.waitKeys()
 logging.info('End of experiment screen completed')
+logging.info('Log queue: %s', log_handler.writer.stats())  # depth, maxDepth, written, dropped
 
 # Close the window
 win.close()
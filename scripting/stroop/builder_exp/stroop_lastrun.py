@@ -3,10 +3,11 @@
 """
 This experiment was created using PsychoPy3 Experiment Builder (v2024.1.4),
     on May 24, 2024, at 14:37
+and exported with the exptools hooks by `python -m exptools.exporter`.
 If you publish work using this script the most relevant publication is:
 
-    Peirce J, Gray JR, Simpson S, MacAskill M, Höchenberger R, Sogo H, Kastman E, Lindeløv JK. (2019) 
-        PsychoPy2: Experiments in behavior made easy Behav Res 51: 195. 
+    Peirce J, Gray JR, Simpson S, MacAskill M, Höchenberger R, Sogo H, Kastman E, Lindeløv JK. (2019)
+        PsychoPy2: Experiments in behavior made easy Behav Res 51: 195.
         https://doi.org/10.3758/s13428-018-01193-y
 
 """
@@ -18,7 +19,19 @@ from psychopy import plugins
 plugins.activatePlugins()
 prefs.hardware['audioLib'] = 'ptb'
 prefs.hardware['audioLatencyMode'] = '3'
-from psychopy import sound, gui, visual, core, data, event, logging, clock, colors, layout, hardware
+import os  # handy system and path functions
+import sys  # to get file system encoding
+
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from exptools.lazyimport import lazyImport
+# sound, ioHub and the eyetracker controls are only imported when first used
+# (EXPTOOLS_LAZY_IMPORTS=0 imports them here); psychopy.hardware imports the eyetracker
+# controls, and with them the alerts system, so they are deferred before it is imported
+sound = lazyImport('psychopy.sound')
+io = lazyImport('psychopy.iohub')
+lazyImport('psychopy.hardware.eyetracker')
+from psychopy import gui, visual, core, data, event, logging, clock, colors, layout, hardware
 from psychopy.tools import environmenttools
 from psychopy.constants import (NOT_STARTED, STARTED, PLAYING, PAUSED,
                                 STOPPED, FINISHED, PRESSED, RELEASED, FOREVER, priority)
@@ -27,18 +40,30 @@ import numpy as np  # whole numpy lib is available, prepend 'np.'
 from numpy import (sin, cos, tan, log, log10, pi, average,
                    sqrt, std, deg2rad, rad2deg, linspace, asarray)
 from numpy.random import random, randint, normal, shuffle, choice as randchoice
-import os  # handy system and path functions
-import sys  # to get file system encoding
 
-import psychopy.iohub as io
 from psychopy.hardware import keyboard
 
+from exptools.frametiming import FrameRecorder, NullFrameRecorder
+from exptools.streaming import StreamingWriter, rebuildWideText
+from exptools.fastforward import fastForwardFromArgs
+from exptools.columnar import convertToColumnar, saveAsColumnar
+from exptools.asynclog import asyncLogFile, asyncPrint
+from exptools.conditions import loadConditions
+from exptools.calibration import calibratedFrameRate
+from exptools.hubpool import hubPool
+from exptools.routine import Routine, RoutineEngine, StimComponent, KeyboardComponent
+
 # Run 'Before Experiment' code from t_isi
 import random
 t_isi = random.uniform(0, 1)
+
 # --- Setup global variables (available in all functions) ---
 # create a device manager to handle hardware (keyboards, mice, mirophones, speakers, etc.)
 deviceManager = hardware.DeviceManager()
+# per-frame timing recorder, replaced by a real one in run() when recording frames
+frameRecorder = NullFrameRecorder()
+# crash-safe stream of the data rows, created in setupData()
+streamWriter = None
 # ensure that relative paths start from the same directory as this script
 _thisDir = os.path.dirname(os.path.abspath(__file__))
 # store info about the experiment session
@@ -54,12 +79,18 @@ expInfo = {
 
 # --- Define some variables which will change depending on pilot mode ---
 '''
-To run in pilot mode, either use the run/pilot toggle in Builder, Coder and Runner, 
-or run the experiment with `--pilot` as an argument. To change what pilot 
+To run in pilot mode, either use the run/pilot toggle in Builder, Coder and Runner,
+or run the experiment with `--pilot` as an argument. To change what pilot
 #mode does, check out the 'Pilot mode' tab in preferences.
 '''
 # work out from system args whether we are running in pilot mode
 PILOTING = core.setPilotModeFromArgs()
+# record per-frame timing to a `_frames.npz` sidecar if run with `--record-frames`
+_recordFrames = '--record-frames' in sys.argv
+# in pilot mode, run the clocks faster than real time if run with `--fast-forward[=factor]`
+_fastForward = fastForwardFromArgs() if PILOTING else None
+if _fastForward is not None:
+    expInfo['fastForward|hid'] = _fastForward.factor
 # start off with values from experiment settings
 _fullScr = True
 _winSize = [2560, 1440]
@@ -83,7 +114,7 @@ def showExpInfoDlg(expInfo):
     ==========
     expInfo : dict
         Information about this experiment.
-    
+
     Returns
     ==========
     dict
@@ -102,24 +133,24 @@ def showExpInfoDlg(expInfo):
 def setupData(expInfo, dataDir=None):
     """
     Make an ExperimentHandler to handle trials and saving.
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     dataDir : Path, str or None
-        Folder to save the data to, leave as None to create a folder in the current directory.    
+        Folder to save the data to, leave as None to create a folder in the current directory.
     Returns
     ==========
     psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     """
     # remove dialog-specific syntax from expInfo
     for key, val in expInfo.copy().items():
         newKey, _ = data.utils.parsePipeSyntax(key)
         expInfo[newKey] = expInfo.pop(key)
-    
+
     # data file name stem = absolute path + name; later add .psyexp, .csv, .log, etc
     if dataDir is None:
         dataDir = _thisDir
@@ -128,7 +159,7 @@ def setupData(expInfo, dataDir=None):
     if os.path.isabs(filename):
         dataDir = os.path.commonprefix([dataDir, filename])
         filename = os.path.relpath(filename, dataDir)
-    
+
     # an ExperimentHandler isn't essential but helps with data saving
     thisExp = data.ExperimentHandler(
         name=expName, version='',
@@ -139,6 +170,9 @@ def setupData(expInfo, dataDir=None):
     )
     thisExp.setPriority('thisRow.t', priority.CRITICAL)
     thisExp.setPriority('expName', priority.LOW)
+    # stream every finished row to disk, so a crash doesn't lose the session
+    global streamWriter
+    streamWriter = StreamingWriter(thisExp.dataFileName + '_stream.jsonl').attach(thisExp)
     # return experiment handler
     return thisExp
 
@@ -146,12 +180,12 @@ def setupData(expInfo, dataDir=None):
 def setupLogging(filename):
     """
     Setup a log file and tell it what level to log at.
-    
+
     Parameters
     ==========
     filename : str or pathlib.Path
         Filename to save log file and data files as, doesn't need an extension.
-    
+
     Returns
     ==========
     psychopy.logging.LogFile
@@ -159,23 +193,23 @@ def setupLogging(filename):
     """
     # this outputs to the screen, not a file
     logging.console.setLevel(_loggingLevel)
-    # save a log file for detail verbose info
-    logFile = logging.LogFile(filename+'.log', level=_loggingLevel)
-    
+    # save a log file for detail verbose info, written to disk on a background thread
+    logFile = asyncLogFile(filename+'.log', level=_loggingLevel)
+
     return logFile
 
 
 def setupWindow(expInfo=None, win=None):
     """
     Setup the Window
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     win : psychopy.visual.Window
         Window to setup - leave as None to create a new window.
-    
+
     Returns
     ==========
     psychopy.visual.Window
@@ -183,7 +217,7 @@ def setupWindow(expInfo=None, win=None):
     """
     if PILOTING:
         logging.debug('Fullscreen settings ignored as running in pilot mode.')
-    
+
     if win is None:
         # if not given a window to setup, make one
         win = visual.Window(
@@ -192,7 +226,7 @@ def setupWindow(expInfo=None, win=None):
             monitor='testMonitor', color=[0,0,0], colorSpace='rgb',
             backgroundImage='', backgroundFit='none',
             blendMode='avg', useFBO=True,
-            units='height', 
+            units='height',
             checkTiming=False  # we're going to do this ourselves in a moment
         )
     else:
@@ -204,29 +238,30 @@ def setupWindow(expInfo=None, win=None):
         win.units = 'height'
     if expInfo is not None:
         # get/measure frame rate if not already in expInfo
+        # (measured once per monitor, then reused and checked between Routines)
         if win._monitorFrameRate is None:
-            win.getActualFrameRate(infoMsg='Attempting to measure frame rate of screen, please wait...')
+            calibratedFrameRate(win, infoMsg='Attempting to measure frame rate of screen, please wait...')
         expInfo['frameRate'] = win._monitorFrameRate
     win.mouseVisible = False
     win.hideMessage()
     # show a visual indicator if we're in piloting mode
     if PILOTING and prefs.piloting['showPilotingIndicator']:
         win.showPilotingIndicator()
-    
+
     return win
 
 
 def setupDevices(expInfo, thisExp, win):
     """
-    Setup whatever devices are available (mouse, keyboard, speaker, eyetracker, etc.) and add them to 
+    Setup whatever devices are available (mouse, keyboard, speaker, eyetracker, etc.) and add them to
     the device manager (deviceManager)
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     win : psychopy.visual.Window
         Window in which to run this experiment.
@@ -237,17 +272,18 @@ def setupDevices(expInfo, thisExp, win):
     """
     # --- Setup input devices ---
     ioConfig = {}
-    
+
     # Setup iohub keyboard
     ioConfig['Keyboard'] = dict(use_keymap='psychopy')
-    
+
     ioSession = '1'
     if 'session' in expInfo:
         ioSession = str(expInfo['session'])
-    ioServer = io.launchHubServer(window=win, **ioConfig)
+    # reuse the ioHub server of an earlier experiment in this Session, if it is still running
+    ioServer = hubPool.launch(io, window=win, **ioConfig)
     # store ioServer object in the device manager
     deviceManager.ioServer = ioServer
-    
+
     # create a default keyboard (e.g. to check for escape)
     if deviceManager.getDevice('defaultKeyboard') is None:
         deviceManager.addDevice(
@@ -271,11 +307,11 @@ def setupDevices(expInfo, thisExp, win):
 def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
     """
     Pause this experiment, preventing the flow from advancing to the next routine until resumed.
-    
+
     Parameters
     ==========
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     win : psychopy.visual.Window
         Window for this experiment.
@@ -287,7 +323,7 @@ def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
     # if we are not paused, do nothing
     if thisExp.status != PAUSED:
         return
-    
+
     # pause any playback components
     for comp in playbackComponents:
         comp.pause()
@@ -324,13 +360,13 @@ def pauseExperiment(thisExp, win=None, timers=[], playbackComponents=[]):
 def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     """
     Run the experiment flow.
-    
+
     Parameters
     ==========
     expInfo : dict
         Information about this experiment, created by the `setupExpInfo` function.
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     psychopy.visual.Window
         Window in which to run this experiment.
@@ -363,28 +399,35 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         frameDur = 1.0 / round(expInfo['frameRate'])
     else:
         frameDur = 1.0 / 60.0  # could not measure, so guess
-    
+    # start recording frame timing if requested
+    global frameRecorder
+    if _recordFrames:
+        frameRecorder = FrameRecorder(frameDur=frameDur)
+    # from here on the clocks run fast, if piloting with `--fast-forward`
+    if _fastForward is not None:
+        _fastForward.install(win)
+
     # Start Code - component code to be run after the window creation
-    
+
     # --- Initialize components for Routine "welcome" ---
     welcome_txt = visual.TextStim(win=win, name='welcome_txt',
         text='Welcome to the Stroop task',
         font='Arial',
-        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0, 
-        color='white', colorSpace='rgb', opacity=None, 
+        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0,
+        color='white', colorSpace='rgb', opacity=None,
         languageStyle='LTR',
         depth=0.0);
-    
+
     # --- Initialize components for Routine "instructions" ---
     text = visual.TextStim(win=win, name='text',
         text='In this experiment, you will see words (either “green” or “red”) in different colors (also either “green” or “red”). Importantly, you need to respond to the COLOR of the word and you need to ignore the actual word. You respond with the arrow keys:\n\nGREEN color = left RED color = right\n\n(Press ‘enter’ to start the experiment!)',
         font='Arial',
-        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0, 
-        color='white', colorSpace='rgb', opacity=None, 
+        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0,
+        color='white', colorSpace='rgb', opacity=None,
         languageStyle='LTR',
         depth=0.0);
     key_resp = keyboard.Keyboard(deviceName='key_resp')
-    
+
     # --- Initialize components for Routine "fixation" ---
     init_fix = visual.ShapeStim(
         win=win, name='init_fix',
@@ -393,8 +436,8 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         lineWidth=1.0,     colorSpace='rgb',  lineColor=[-1.0000, -1.0000, -1.0000], fillColor=[-1.0000, -1.0000, -1.0000],
         opacity=None, depth=0.0, interpolate=True)
     init_fix2 = visual.ShapeStim(
-        win=win, name='init_fix2', vertices='cross',
-        size=(0.1, 0.1),
+        win=win, name='init_fix2',
+        size=(0.1, 0.1), vertices='cross',
         ori=0.0, pos=(0, 0), anchor='center',
         lineWidth=1.0,     colorSpace='rgb',  lineColor=[0.0039, 0.0039, 0.0039], fillColor=[0.0039, 0.0039, 0.0039],
         opacity=None, depth=-1.0, interpolate=True)
@@ -404,26 +447,26 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         ori=0.0, pos=(0, 0), anchor='center',
         lineWidth=1.0,     colorSpace='rgb',  lineColor=[-1.0000, -1.0000, -1.0000], fillColor=[-1.0000, -1.0000, -1.0000],
         opacity=None, depth=-2.0, interpolate=True)
-    
+
     # --- Initialize components for Routine "stim" ---
     stim_txt = visual.TextStim(win=win, name='stim_txt',
         text='',
         font='Arial',
-        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0, 
-        color='white', colorSpace='rgb', opacity=None, 
+        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0,
+        color='white', colorSpace='rgb', opacity=None,
         languageStyle='LTR',
         depth=0.0);
     key_resp_2 = keyboard.Keyboard(deviceName='key_resp_2')
-    
+
     # --- Initialize components for Routine "checker" ---
     text_2 = visual.TextStim(win=win, name='text_2',
         text='',
         font='Arial',
-        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0, 
-        color='white', colorSpace='rgb', opacity=None, 
+        pos=(0, 0), height=0.05, wrapWidth=None, ori=0.0,
+        color='white', colorSpace='rgb', opacity=None,
         languageStyle='LTR',
         depth=-1.0);
-    
+
     # --- Initialize components for Routine "isi" ---
     init_fix_2 = visual.ShapeStim(
         win=win, name='init_fix_2',
@@ -432,8 +475,8 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         lineWidth=1.0,     colorSpace='rgb',  lineColor=[-1.0000, -1.0000, -1.0000], fillColor=[-1.0000, -1.0000, -1.0000],
         opacity=None, depth=0.0, interpolate=True)
     init_fix2_2 = visual.ShapeStim(
-        win=win, name='init_fix2_2', vertices='cross',
-        size=(0.1, 0.1),
+        win=win, name='init_fix2_2',
+        size=(0.1, 0.1), vertices='cross',
         ori=0.0, pos=(0, 0), anchor='center',
         lineWidth=1.0,     colorSpace='rgb',  lineColor=[0.0039, 0.0039, 0.0039], fillColor=[0.0039, 0.0039, 0.0039],
         opacity=None, depth=-1.0, interpolate=True)
@@ -443,9 +486,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         ori=0.0, pos=(0, 0), anchor='center',
         lineWidth=1.0,     colorSpace='rgb',  lineColor=[-1.0000, -1.0000, -1.0000], fillColor=[-1.0000, -1.0000, -1.0000],
         opacity=None, depth=-2.0, interpolate=True)
-    
+
     # create some handy timers
-    
+
     # global clock to track the time since experiment started
     if globalClock is None:
         # create a clock if not given one
@@ -471,385 +514,64 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     expInfo['expStart'] = data.getDateStr(
         format='%Y-%m-%d %Hh%M.%S.%f %z', fractionalSecondDigits=6
     )
-    
-    # --- Prepare to start Routine "welcome" ---
-    continueRoutine = True
-    # update component parameters for each repeat
-    thisExp.addData('welcome.started', globalClock.getTime(format='float'))
-    # keep track of which components have finished
-    welcomeComponents = [welcome_txt]
-    for thisComponent in welcomeComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    frameN = -1
-    
+
+    # --- Routines: what each one shows and listens for, and when ---
+    welcome = Routine('welcome', [
+        StimComponent(welcome_txt, duration=3.0),
+    ], duration=3.0)
+    instructions = Routine('instructions', [
+        StimComponent(text),
+        KeyboardComponent(key_resp, 'key_resp', keyList=['return']),
+    ])
+    fixation = Routine('fixation', [
+        StimComponent(init_fix, duration=2),
+        StimComponent(init_fix2, duration=2.0),
+        StimComponent(init_fix3, duration=2),
+    ], duration=2.0)
+    stim = Routine('stim', [
+        StimComponent(stim_txt),
+        KeyboardComponent(key_resp_2, 'key_resp_2', keyList=['left','right']),
+    ])
+    checker = Routine('checker', [
+        StimComponent(text_2, duration=2),
+    ], duration=2.0)
+    isi = Routine('isi', [
+        StimComponent(init_fix_2, duration=lambda: t_isi),
+        StimComponent(init_fix2_2, duration=lambda: t_isi),
+        StimComponent(init_fix3_2, duration=lambda: t_isi),
+    ])
+    # one frame loop runs them all
+    routines = RoutineEngine(
+        win, thisExp, routineTimer, globalClock, defaultKeyboard,
+        frameRecorder=frameRecorder, frameTolerance=frameTolerance,
+        pauseExperiment=pauseExperiment
+    )
+
     # --- Run Routine "welcome" ---
-    routineForceEnded = not continueRoutine
-    while continueRoutine and routineTimer.getTime() < 3.0:
-        # get current time
-        t = routineTimer.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *welcome_txt* updates
-        
-        # if welcome_txt is starting this frame...
-        if welcome_txt.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            welcome_txt.frameNStart = frameN  # exact frame index
-            welcome_txt.tStart = t  # local t and not account for scr refresh
-            welcome_txt.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(welcome_txt, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'welcome_txt.started')
-            # update status
-            welcome_txt.status = STARTED
-            welcome_txt.setAutoDraw(True)
-        
-        # if welcome_txt is active this frame...
-        if welcome_txt.status == STARTED:
-            # update params
-            pass
-        
-        # if welcome_txt is stopping this frame...
-        if welcome_txt.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > welcome_txt.tStartRefresh + 3.0-frameTolerance:
-                # keep track of stop time/frame for later
-                welcome_txt.tStop = t  # not accounting for scr refresh
-                welcome_txt.tStopRefresh = tThisFlipGlobal  # on global time
-                welcome_txt.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'welcome_txt.stopped')
-                # update status
-                welcome_txt.status = FINISHED
-                welcome_txt.setAutoDraw(False)
-        
-        # check for quit (typically the Esc key)
-        if defaultKeyboard.getKeys(keyList=["escape"]):
-            thisExp.status = FINISHED
-        if thisExp.status == FINISHED or endExpNow:
-            endExperiment(thisExp, win=win)
-            return
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            routineForceEnded = True
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in welcomeComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-    
-    # --- Ending Routine "welcome" ---
-    for thisComponent in welcomeComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    thisExp.addData('welcome.stopped', globalClock.getTime(format='float'))
-    # using non-slip timing so subtract the expected duration of this Routine (unless ended on request)
-    if routineForceEnded:
-        routineTimer.reset()
-    else:
-        routineTimer.addTime(-3.000000)
+    if not routines.run(welcome):
+        endExperiment(thisExp, win=win)
+        return
     thisExp.nextEntry()
-    
-    # --- Prepare to start Routine "instructions" ---
-    continueRoutine = True
-    # update component parameters for each repeat
-    thisExp.addData('instructions.started', globalClock.getTime(format='float'))
-    key_resp.keys = []
-    key_resp.rt = []
-    _key_resp_allKeys = []
-    # keep track of which components have finished
-    instructionsComponents = [text, key_resp]
-    for thisComponent in instructionsComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    frameN = -1
-    
+
     # --- Run Routine "instructions" ---
-    routineForceEnded = not continueRoutine
-    while continueRoutine:
-        # get current time
-        t = routineTimer.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *text* updates
-        
-        # if text is starting this frame...
-        if text.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            text.frameNStart = frameN  # exact frame index
-            text.tStart = t  # local t and not account for scr refresh
-            text.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(text, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'text.started')
-            # update status
-            text.status = STARTED
-            text.setAutoDraw(True)
-        
-        # if text is active this frame...
-        if text.status == STARTED:
-            # update params
-            pass
-        
-        # *key_resp* updates
-        waitOnFlip = False
-        
-        # if key_resp is starting this frame...
-        if key_resp.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            key_resp.frameNStart = frameN  # exact frame index
-            key_resp.tStart = t  # local t and not account for scr refresh
-            key_resp.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(key_resp, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'key_resp.started')
-            # update status
-            key_resp.status = STARTED
-            # keyboard checking is just starting
-            waitOnFlip = True
-            win.callOnFlip(key_resp.clock.reset)  # t=0 on next screen flip
-            win.callOnFlip(key_resp.clearEvents, eventType='keyboard')  # clear events on next screen flip
-        if key_resp.status == STARTED and not waitOnFlip:
-            theseKeys = key_resp.getKeys(keyList=['return'], ignoreKeys=["escape"], waitRelease=False)
-            _key_resp_allKeys.extend(theseKeys)
-            if len(_key_resp_allKeys):
-                key_resp.keys = _key_resp_allKeys[-1].name  # just the last key pressed
-                key_resp.rt = _key_resp_allKeys[-1].rt
-                key_resp.duration = _key_resp_allKeys[-1].duration
-                # a response ends the routine
-                continueRoutine = False
-        
-        # check for quit (typically the Esc key)
-        if defaultKeyboard.getKeys(keyList=["escape"]):
-            thisExp.status = FINISHED
-        if thisExp.status == FINISHED or endExpNow:
-            endExperiment(thisExp, win=win)
-            return
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            routineForceEnded = True
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in instructionsComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-    
-    # --- Ending Routine "instructions" ---
-    for thisComponent in instructionsComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    thisExp.addData('instructions.stopped', globalClock.getTime(format='float'))
-    # check responses
-    if key_resp.keys in ['', [], None]:  # No response was made
-        key_resp.keys = None
-    thisExp.addData('key_resp.keys',key_resp.keys)
-    if key_resp.keys != None:  # we had a response
-        thisExp.addData('key_resp.rt', key_resp.rt)
-        thisExp.addData('key_resp.duration', key_resp.duration)
+    if not routines.run(instructions):
+        endExperiment(thisExp, win=win)
+        return
     thisExp.nextEntry()
-    # the Routine "instructions" was not non-slip safe, so reset the non-slip timer
-    routineTimer.reset()
-    
-    # --- Prepare to start Routine "fixation" ---
-    continueRoutine = True
-    # update component parameters for each repeat
-    thisExp.addData('fixation.started', globalClock.getTime(format='float'))
-    # keep track of which components have finished
-    fixationComponents = [init_fix, init_fix2, init_fix3]
-    for thisComponent in fixationComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
-    # reset timers
-    t = 0
-    _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-    frameN = -1
-    
+
     # --- Run Routine "fixation" ---
-    routineForceEnded = not continueRoutine
-    while continueRoutine and routineTimer.getTime() < 2.0:
-        # get current time
-        t = routineTimer.getTime()
-        tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-        tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-        frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-        # update/draw components on each frame
-        
-        # *init_fix* updates
-        
-        # if init_fix is starting this frame...
-        if init_fix.status == NOT_STARTED and tThisFlip >= 0-frameTolerance:
-            # keep track of start time/frame for later
-            init_fix.frameNStart = frameN  # exact frame index
-            init_fix.tStart = t  # local t and not account for scr refresh
-            init_fix.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(init_fix, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'init_fix.started')
-            # update status
-            init_fix.status = STARTED
-            init_fix.setAutoDraw(True)
-        
-        # if init_fix is active this frame...
-        if init_fix.status == STARTED:
-            # update params
-            pass
-        
-        # if init_fix is stopping this frame...
-        if init_fix.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > init_fix.tStartRefresh + 2-frameTolerance:
-                # keep track of stop time/frame for later
-                init_fix.tStop = t  # not accounting for scr refresh
-                init_fix.tStopRefresh = tThisFlipGlobal  # on global time
-                init_fix.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'init_fix.stopped')
-                # update status
-                init_fix.status = FINISHED
-                init_fix.setAutoDraw(False)
-        
-        # *init_fix2* updates
-        
-        # if init_fix2 is starting this frame...
-        if init_fix2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            init_fix2.frameNStart = frameN  # exact frame index
-            init_fix2.tStart = t  # local t and not account for scr refresh
-            init_fix2.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(init_fix2, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'init_fix2.started')
-            # update status
-            init_fix2.status = STARTED
-            init_fix2.setAutoDraw(True)
-        
-        # if init_fix2 is active this frame...
-        if init_fix2.status == STARTED:
-            # update params
-            pass
-        
-        # if init_fix2 is stopping this frame...
-        if init_fix2.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > init_fix2.tStartRefresh + 2.0-frameTolerance:
-                # keep track of stop time/frame for later
-                init_fix2.tStop = t  # not accounting for scr refresh
-                init_fix2.tStopRefresh = tThisFlipGlobal  # on global time
-                init_fix2.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'init_fix2.stopped')
-                # update status
-                init_fix2.status = FINISHED
-                init_fix2.setAutoDraw(False)
-        
-        # *init_fix3* updates
-        
-        # if init_fix3 is starting this frame...
-        if init_fix3.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            init_fix3.frameNStart = frameN  # exact frame index
-            init_fix3.tStart = t  # local t and not account for scr refresh
-            init_fix3.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(init_fix3, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'init_fix3.started')
-            # update status
-            init_fix3.status = STARTED
-            init_fix3.setAutoDraw(True)
-        
-        # if init_fix3 is active this frame...
-        if init_fix3.status == STARTED:
-            # update params
-            pass
-        
-        # if init_fix3 is stopping this frame...
-        if init_fix3.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > init_fix3.tStartRefresh + 2-frameTolerance:
-                # keep track of stop time/frame for later
-                init_fix3.tStop = t  # not accounting for scr refresh
-                init_fix3.tStopRefresh = tThisFlipGlobal  # on global time
-                init_fix3.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'init_fix3.stopped')
-                # update status
-                init_fix3.status = FINISHED
-                init_fix3.setAutoDraw(False)
-        
-        # check for quit (typically the Esc key)
-        if defaultKeyboard.getKeys(keyList=["escape"]):
-            thisExp.status = FINISHED
-        if thisExp.status == FINISHED or endExpNow:
-            endExperiment(thisExp, win=win)
-            return
-        
-        # check if all components have finished
-        if not continueRoutine:  # a component has requested a forced-end of Routine
-            routineForceEnded = True
-            break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in fixationComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
-        
-        # refresh the screen
-        if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
-    
-    # --- Ending Routine "fixation" ---
-    for thisComponent in fixationComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
-    thisExp.addData('fixation.stopped', globalClock.getTime(format='float'))
-    # using non-slip timing so subtract the expected duration of this Routine (unless ended on request)
-    if routineForceEnded:
-        routineTimer.reset()
-    else:
-        routineTimer.addTime(-2.000000)
+    # write finished rows in the background while nothing is changing on screen
+    if streamWriter is not None:
+        streamWriter.flush()
+    if not routines.run(fixation):
+        endExperiment(thisExp, win=win)
+        return
     thisExp.nextEntry()
-    
+
     # set up handler to look after randomisation of conditions etc
-    trials = data.TrialHandler(nReps=1.0, method='random', 
+    trials = data.TrialHandler(nReps=1.0, method='random',
         extraInfo=expInfo, originPath=-1,
-        trialList=data.importConditions('stims.csv'),
+        trialList=loadConditions('stims.csv'),
         seed=None, name='trials')
     thisExp.addLoop(trials)  # add the loop to the experiment
     thisTrial = trials.trialList[0]  # so we can initialise stimuli with some values
@@ -857,149 +579,36 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     if thisTrial != None:
         for paramName in thisTrial:
             globals()[paramName] = thisTrial[paramName]
-    
+
     for thisTrial in trials:
         currentLoop = trials
         thisExp.timestampOnFlip(win, 'thisRow.t', format=globalClock.format)
         # pause experiment here if requested
         if thisExp.status == PAUSED:
             pauseExperiment(
-                thisExp=thisExp, 
-                win=win, 
-                timers=[routineTimer], 
+                thisExp=thisExp,
+                win=win,
+                timers=[routineTimer],
                 playbackComponents=[]
         )
         # abbreviate parameter names if possible (e.g. rgb = thisTrial.rgb)
         if thisTrial != None:
             for paramName in thisTrial:
                 globals()[paramName] = thisTrial[paramName]
-        
-        # --- Prepare to start Routine "stim" ---
-        continueRoutine = True
-        # update component parameters for each repeat
-        thisExp.addData('stim.started', globalClock.getTime(format='float'))
+
+        # --- Run Routine "stim" ---
         stim_txt.setColor(stim_color, colorSpace='rgb')
         stim_txt.setText(stim_word)
-        key_resp_2.keys = []
-        key_resp_2.rt = []
-        _key_resp_2_allKeys = []
-        # keep track of which components have finished
-        stimComponents = [stim_txt, key_resp_2]
-        for thisComponent in stimComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
-        # reset timers
-        t = 0
-        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-        frameN = -1
-        
-        # --- Run Routine "stim" ---
-        routineForceEnded = not continueRoutine
-        while continueRoutine:
-            # get current time
-            t = routineTimer.getTime()
-            tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-            # update/draw components on each frame
-            
-            # *stim_txt* updates
-            
-            # if stim_txt is starting this frame...
-            if stim_txt.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                stim_txt.frameNStart = frameN  # exact frame index
-                stim_txt.tStart = t  # local t and not account for scr refresh
-                stim_txt.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(stim_txt, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'stim_txt.started')
-                # update status
-                stim_txt.status = STARTED
-                stim_txt.setAutoDraw(True)
-            
-            # if stim_txt is active this frame...
-            if stim_txt.status == STARTED:
-                # update params
-                pass
-            
-            # *key_resp_2* updates
-            waitOnFlip = False
-            
-            # if key_resp_2 is starting this frame...
-            if key_resp_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                key_resp_2.frameNStart = frameN  # exact frame index
-                key_resp_2.tStart = t  # local t and not account for scr refresh
-                key_resp_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(key_resp_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'key_resp_2.started')
-                # update status
-                key_resp_2.status = STARTED
-                # keyboard checking is just starting
-                waitOnFlip = True
-                win.callOnFlip(key_resp_2.clock.reset)  # t=0 on next screen flip
-                win.callOnFlip(key_resp_2.clearEvents, eventType='keyboard')  # clear events on next screen flip
-            if key_resp_2.status == STARTED and not waitOnFlip:
-                theseKeys = key_resp_2.getKeys(keyList=['left','right'], ignoreKeys=["escape"], waitRelease=False)
-                _key_resp_2_allKeys.extend(theseKeys)
-                if len(_key_resp_2_allKeys):
-                    key_resp_2.keys = _key_resp_2_allKeys[-1].name  # just the last key pressed
-                    key_resp_2.rt = _key_resp_2_allKeys[-1].rt
-                    key_resp_2.duration = _key_resp_2_allKeys[-1].duration
-                    # a response ends the routine
-                    continueRoutine = False
-            
-            # check for quit (typically the Esc key)
-            if defaultKeyboard.getKeys(keyList=["escape"]):
-                thisExp.status = FINISHED
-            if thisExp.status == FINISHED or endExpNow:
-                endExperiment(thisExp, win=win)
-                return
-            
-            # check if all components have finished
-            if not continueRoutine:  # a component has requested a forced-end of Routine
-                routineForceEnded = True
-                break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in stimComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
-            
-            # refresh the screen
-            if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
-        
-        # --- Ending Routine "stim" ---
-        for thisComponent in stimComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
-        thisExp.addData('stim.stopped', globalClock.getTime(format='float'))
-        # check responses
-        if key_resp_2.keys in ['', [], None]:  # No response was made
-            key_resp_2.keys = None
-        trials.addData('key_resp_2.keys',key_resp_2.keys)
-        if key_resp_2.keys != None:  # we had a response
-            trials.addData('key_resp_2.rt', key_resp_2.rt)
-            trials.addData('key_resp_2.duration', key_resp_2.duration)
-        # the Routine "stim" was not non-slip safe, so reset the non-slip timer
-        routineTimer.reset()
-        
-        # --- Prepare to start Routine "checker" ---
-        continueRoutine = True
-        # update component parameters for each repeat
-        thisExp.addData('checker.started', globalClock.getTime(format='float'))
+        if not routines.run(stim, handler=trials):
+            endExperiment(thisExp, win=win)
+            return
+
+        # --- Run Routine "checker" ---
         # Run 'Begin Routine' code from code
         #stimColor = stim_txt._foreColor.rgb
         stimColor = stim_color
-        print(stimColor, key_resp_2.keys)
-        
+        asyncPrint(stimColor, key_resp_2.keys)
+
         if stimColor == 'red' and key_resp_2.keys == 'left':
             text = 'correct'
         elif stimColor == 'red' and key_resp_2.keys == 'right':
@@ -1009,262 +618,25 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         elif stimColor == 'green' and key_resp_2.keys == 'left':
             text = 'wrong'
         text_2.setText(text)
-        # keep track of which components have finished
-        checkerComponents = [text_2]
-        for thisComponent in checkerComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
-        # reset timers
-        t = 0
-        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-        frameN = -1
-        
-        # --- Run Routine "checker" ---
-        routineForceEnded = not continueRoutine
-        while continueRoutine and routineTimer.getTime() < 2.0:
-            # get current time
-            t = routineTimer.getTime()
-            tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-            # update/draw components on each frame
-            
-            # *text_2* updates
-            
-            # if text_2 is starting this frame...
-            if text_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                text_2.frameNStart = frameN  # exact frame index
-                text_2.tStart = t  # local t and not account for scr refresh
-                text_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(text_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'text_2.started')
-                # update status
-                text_2.status = STARTED
-                text_2.setAutoDraw(True)
-            
-            # if text_2 is active this frame...
-            if text_2.status == STARTED:
-                # update params
-                pass
-            
-            # if text_2 is stopping this frame...
-            if text_2.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > text_2.tStartRefresh + 2-frameTolerance:
-                    # keep track of stop time/frame for later
-                    text_2.tStop = t  # not accounting for scr refresh
-                    text_2.tStopRefresh = tThisFlipGlobal  # on global time
-                    text_2.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'text_2.stopped')
-                    # update status
-                    text_2.status = FINISHED
-                    text_2.setAutoDraw(False)
-            
-            # check for quit (typically the Esc key)
-            if defaultKeyboard.getKeys(keyList=["escape"]):
-                thisExp.status = FINISHED
-            if thisExp.status == FINISHED or endExpNow:
-                endExperiment(thisExp, win=win)
-                return
-            
-            # check if all components have finished
-            if not continueRoutine:  # a component has requested a forced-end of Routine
-                routineForceEnded = True
-                break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in checkerComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
-            
-            # refresh the screen
-            if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
-        
-        # --- Ending Routine "checker" ---
-        for thisComponent in checkerComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
-        thisExp.addData('checker.stopped', globalClock.getTime(format='float'))
-        # using non-slip timing so subtract the expected duration of this Routine (unless ended on request)
-        if routineForceEnded:
-            routineTimer.reset()
-        else:
-            routineTimer.addTime(-2.000000)
-        
-        # --- Prepare to start Routine "isi" ---
-        continueRoutine = True
-        # update component parameters for each repeat
-        thisExp.addData('isi.started', globalClock.getTime(format='float'))
-        # keep track of which components have finished
-        isiComponents = [init_fix_2, init_fix2_2, init_fix3_2]
-        for thisComponent in isiComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
-        # reset timers
-        t = 0
-        _timeToFirstFrame = win.getFutureFlipTime(clock="now")
-        frameN = -1
-        
+        if not routines.run(checker, handler=trials):
+            endExperiment(thisExp, win=win)
+            return
+
         # --- Run Routine "isi" ---
-        routineForceEnded = not continueRoutine
-        while continueRoutine:
-            # get current time
-            t = routineTimer.getTime()
-            tThisFlip = win.getFutureFlipTime(clock=routineTimer)
-            tThisFlipGlobal = win.getFutureFlipTime(clock=None)
-            frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
-            # update/draw components on each frame
-            
-            # *init_fix_2* updates
-            
-            # if init_fix_2 is starting this frame...
-            if init_fix_2.status == NOT_STARTED and tThisFlip >= 0-frameTolerance:
-                # keep track of start time/frame for later
-                init_fix_2.frameNStart = frameN  # exact frame index
-                init_fix_2.tStart = t  # local t and not account for scr refresh
-                init_fix_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(init_fix_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'init_fix_2.started')
-                # update status
-                init_fix_2.status = STARTED
-                init_fix_2.setAutoDraw(True)
-            
-            # if init_fix_2 is active this frame...
-            if init_fix_2.status == STARTED:
-                # update params
-                pass
-            
-            # if init_fix_2 is stopping this frame...
-            if init_fix_2.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > init_fix_2.tStartRefresh + t_isi-frameTolerance:
-                    # keep track of stop time/frame for later
-                    init_fix_2.tStop = t  # not accounting for scr refresh
-                    init_fix_2.tStopRefresh = tThisFlipGlobal  # on global time
-                    init_fix_2.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'init_fix_2.stopped')
-                    # update status
-                    init_fix_2.status = FINISHED
-                    init_fix_2.setAutoDraw(False)
-            
-            # *init_fix2_2* updates
-            
-            # if init_fix2_2 is starting this frame...
-            if init_fix2_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                init_fix2_2.frameNStart = frameN  # exact frame index
-                init_fix2_2.tStart = t  # local t and not account for scr refresh
-                init_fix2_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(init_fix2_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'init_fix2_2.started')
-                # update status
-                init_fix2_2.status = STARTED
-                init_fix2_2.setAutoDraw(True)
-            
-            # if init_fix2_2 is active this frame...
-            if init_fix2_2.status == STARTED:
-                # update params
-                pass
-            
-            # if init_fix2_2 is stopping this frame...
-            if init_fix2_2.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > init_fix2_2.tStartRefresh + t_isi-frameTolerance:
-                    # keep track of stop time/frame for later
-                    init_fix2_2.tStop = t  # not accounting for scr refresh
-                    init_fix2_2.tStopRefresh = tThisFlipGlobal  # on global time
-                    init_fix2_2.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'init_fix2_2.stopped')
-                    # update status
-                    init_fix2_2.status = FINISHED
-                    init_fix2_2.setAutoDraw(False)
-            
-            # *init_fix3_2* updates
-            
-            # if init_fix3_2 is starting this frame...
-            if init_fix3_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                init_fix3_2.frameNStart = frameN  # exact frame index
-                init_fix3_2.tStart = t  # local t and not account for scr refresh
-                init_fix3_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(init_fix3_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'init_fix3_2.started')
-                # update status
-                init_fix3_2.status = STARTED
-                init_fix3_2.setAutoDraw(True)
-            
-            # if init_fix3_2 is active this frame...
-            if init_fix3_2.status == STARTED:
-                # update params
-                pass
-            
-            # if init_fix3_2 is stopping this frame...
-            if init_fix3_2.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > init_fix3_2.tStartRefresh + t_isi-frameTolerance:
-                    # keep track of stop time/frame for later
-                    init_fix3_2.tStop = t  # not accounting for scr refresh
-                    init_fix3_2.tStopRefresh = tThisFlipGlobal  # on global time
-                    init_fix3_2.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'init_fix3_2.stopped')
-                    # update status
-                    init_fix3_2.status = FINISHED
-                    init_fix3_2.setAutoDraw(False)
-            
-            # check for quit (typically the Esc key)
-            if defaultKeyboard.getKeys(keyList=["escape"]):
-                thisExp.status = FINISHED
-            if thisExp.status == FINISHED or endExpNow:
-                endExperiment(thisExp, win=win)
-                return
-            
-            # check if all components have finished
-            if not continueRoutine:  # a component has requested a forced-end of Routine
-                routineForceEnded = True
-                break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in isiComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
-            
-            # refresh the screen
-            if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
-        
-        # --- Ending Routine "isi" ---
-        for thisComponent in isiComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
-        thisExp.addData('isi.stopped', globalClock.getTime(format='float'))
-        # the Routine "isi" was not non-slip safe, so reset the non-slip timer
-        routineTimer.reset()
+        # write finished rows in the background while nothing is changing on screen
+        if streamWriter is not None:
+            streamWriter.flush()
+        if not routines.run(isi, handler=trials):
+            endExperiment(thisExp, win=win)
+            return
         thisExp.nextEntry()
-        
+
         if thisSession is not None:
             # if running in a Session with a Liaison client, send data up to now
             thisSession.sendExperimentData()
     # completed 1.0 repeats of 'trials'
-    
-    
+
+
     # mark experiment as finished
     endExperiment(thisExp, win=win)
 
@@ -1272,29 +644,36 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
 def saveData(thisExp):
     """
     Save data from this experiment
-    
+
     Parameters
     ==========
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     """
     filename = thisExp.dataFileName
+    # finish the crash-safe stream and rebuild the csv (and a typed parquet file) from it
+    if streamWriter is not None:
+        streamWriter.close()
+        rebuildWideText(streamWriter.path, delim=',')
+        convertToColumnar(streamWriter.path)
+    else:
+        thisExp.saveAsWideText(filename + '.csv', delim='auto')
+        saveAsColumnar(thisExp)
     # these shouldn't be strictly necessary (should auto-save)
-    thisExp.saveAsWideText(filename + '.csv', delim='auto')
     thisExp.saveAsPickle(filename)
 
 
 def endExperiment(thisExp, win=None):
     """
     End this experiment, performing final shut down operations.
-    
+
     This function does NOT close the window or end the Python process - use `quit` for this.
-    
+
     Parameters
     ==========
     thisExp : psychopy.data.ExperimentHandler
-        Handler object for this experiment, contains the data to save and information about 
+        Handler object for this experiment, contains the data to save and information about
         where to save it to.
     win : psychopy.visual.Window
         Window for this experiment.
@@ -1302,11 +681,16 @@ def endExperiment(thisExp, win=None):
     if win is not None:
         # remove autodraw from all current components
         win.clearAutoDraw()
-        # Flip one final time so any remaining win.callOnFlip() 
+        # Flip one final time so any remaining win.callOnFlip()
         # and win.timeOnFlip() tasks get executed
         win.flip()
     # mark experiment handler as finished
     thisExp.status = FINISHED
+    # write the frame timing sidecar (does nothing unless recording frames)
+    frameRecorder.save(thisExp.dataFileName)
+    # put the real clocks back (does nothing unless fast-forwarding)
+    if _fastForward is not None:
+        _fastForward.uninstall()
     # shut down eyetracker, if there is one
     if deviceManager.getDevice('eyetracker') is not None:
         deviceManager.removeDevice('eyetracker')
@@ -1316,7 +700,7 @@ def endExperiment(thisExp, win=None):
 def quit(thisExp, win=None, thisSession=None):
     """
     Fully quit, closing the window and ending the Python process.
-    
+
     Parameters
     ==========
     win : psychopy.visual.Window
@@ -1327,7 +711,7 @@ def quit(thisExp, win=None, thisSession=None):
     thisExp.abort()  # or data files will save again on exit
     # make sure everything is closed down
     if win is not None:
-        # Flip one final time so any remaining win.callOnFlip() 
+        # Flip one final time so any remaining win.callOnFlip()
         # and win.timeOnFlip() tasks get executed before quitting
         win.flip()
         win.close()
@@ -1350,8 +734,8 @@ if __name__ == '__main__':
     win = setupWindow(expInfo=expInfo)
     setupDevices(expInfo=expInfo, thisExp=thisExp, win=win)
     run(
-        expInfo=expInfo, 
-        thisExp=thisExp, 
+        expInfo=expInfo,
+        thisExp=thisExp,
         win=win,
         globalClock='float'
     )
@@ -1,34 +1,65 @@
 # Import necessary libraries
-from psychopy import visual, core, data, event, gui
-import random  # Import random for generating random ISI
+from psychopy import visual, core, data, event, gui, logging
+from psychopy.hardware import keyboard
+import random  # Import random for shuffling the conditions and drawing a seed
+import csv
+import sys
+from pathlib import Path
+# make the shared helpers in scripting/exptools importable
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from exptools.streaming import StreamingWriter, rebuildWideText
+from exptools.columnar import convertToColumnar
+from exptools.responses import waitForKeyPress
+from exptools.schedule import compileSchedule, loadSchedule
+from exptools.stimpool import StimulusPool
+from exptools.conditions import loadConditions
+
+# Wait on the keyboard's event queue for responses (timestamped when the key is pressed).
+# Set to False to poll event.getKeys() in a loop instead (timestamped when the loop sees the key).
+WAIT_FOR_KEYS = True
+# Seconds to wait for a response to the word, a trial without one counts as wrong
+RESPONSE_TIMEOUT = 10.0
 
 # Define a function to create the conditions CSV file
-def create_conditions_file():
-    import pandas as pd
+def create_conditions_file(seed=None):
+    rng = random.Random(seed)  # seeded, so the same seed gives the same conditions
 
     # create the lists
     words = ['BLUE']*5 + ['RED']*5
     colors = ['blue']*5 + ['red']*5
 
-    # shuffle them and create the dataframe using them
-    random.shuffle(words)
-    random.shuffle(colors)
+    # shuffle them
+    rng.shuffle(words)
+    rng.shuffle(colors)
 
-    # create the dataframe with using dictionary declaration
-    df_conditions = pd.DataFrame({'word': words, 'color': colors})
-
-    # save the dataframe
-    df_conditions.to_csv('conditions.csv', index=False)
-
-# Create the conditions file
-create_conditions_file()
+    # save them as the conditions file (no need for pandas to write 10 rows)
+    with open('conditions.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['word', 'color'])
+        writer.writerows(zip(words, colors))
 
 # Create a dictionary for storing the experiment info
-exp_info = {'participant': ''}
+# (leave seed empty for a new random order, or give a saved _schedule.npz file to replay it)
+exp_info = {'participant': '', 'seed': '', 'schedule': ''}
 dlg = gui.DlgFromDict(dictionary=exp_info, title='Stroop Task')
 if not dlg.OK:
     core.quit()
 
+# Work out the whole trial order and timing before the window opens
+if exp_info['schedule']:
+    schedule = loadSchedule(exp_info['schedule'])
+else:
+    seed = int(exp_info['seed']) if exp_info['seed'] else random.randrange(2**32)
+    # Create the conditions file
+    create_conditions_file(seed)
+    schedule = compileSchedule(loadConditions('conditions.csv'),
+                               events=[('fixation', 2.0), ('word', None), ('feedback', 1.0), ('isi', (0, 1))],
+                               seed=seed)
+exp_info['seed'] = schedule.seed  # keep the seed with the data
+fixation_durations = schedule.durations('fixation')
+feedback_durations = schedule.durations('feedback')
+isi_durations = schedule.durations('isi')
+
 # Create a window with gray background
 win = visual.Window([800, 600], color='gray', units='height')
 
@@ -52,64 +83,98 @@ fixation = visual.ShapeStim(win=win, vertices='cross', size=(0.05, 0.05), fillCo
 # Define the trial routine
 trial_text = visual.TextStim(win=win, text='', color='', height=0.1)
 key_resp = event.BuilderKeyResponse()
+# Build the feedback texts once, instead of a new TextStim in every trial
+feedback_pool = StimulusPool(lambda text: visual.TextStim(win=win, text=text, color='black', height=0.05))
+feedback_pool.prebuild(['correct', 'wrong'])
+kb = keyboard.Keyboard()
 
 # Create a data handler for the trials
-trials = data.TrialHandler(nReps=1, method='random', trialList=data.importConditions('conditions.csv'))
+# (the order is already shuffled in the schedule, so present it sequentially)
+trials = data.TrialHandler(nReps=1, method='sequential', trialList=schedule.trialList())
 this_exp = data.ExperimentHandler(dataFileName='data/%s_%s' % (exp_info['participant'], 'stroop'), extraInfo=exp_info)
 
 # Add the data handler to the experiment
 this_exp.addLoop(trials)
 
+# Stream every finished trial to disk, so a crash doesn't lose the session
+data_stem = 'data/%s_stroop_task' % exp_info['participant']
+stream = StreamingWriter(data_stem + '_stream.jsonl').attach(this_exp)
+# Save the schedule, so this session can be replayed exactly
+schedule.save(data_stem + '_schedule.npz')
+
 # Run the trial loop
 for trial in trials:
+    n = trials.thisN  # row of this trial in the schedule
+
     # Fixation cross
     fixation.draw()
     win.flip()
-    core.wait(2.0)
+    core.wait(fixation_durations[n])
 
     # Display the word with the color
     trial_text.setText(trial['word'])
     trial_text.setColor(trial['color'])
     trial_text.draw()
+    if WAIT_FOR_KEYS:
+        # start the response clock and empty the queue exactly when the word appears
+        win.callOnFlip(kb.clock.reset)
+        win.callOnFlip(kb.clearEvents, eventType='keyboard')
     win.flip()
 
     # Collect response
     key_resp.keys = []
     key_resp.rt = []
-    event.clearEvents(eventType='keyboard')
-    resp_clock = core.Clock()
-    while len(key_resp.keys) == 0:
-        theseKeys = event.getKeys(keyList=['left', 'right'])
-        if len(theseKeys) > 0:
-            key_resp.keys = theseKeys[0]
-            key_resp.rt = resp_clock.getTime()
-            if key_resp.keys == 'left' and trial['color'] == 'red':
-                feedback = 'correct'
-            elif key_resp.keys == 'right' and trial['color'] == 'blue':
-                feedback = 'correct'
-            else:
-                feedback = 'wrong'
-            trials.addData('response', key_resp.keys)
-            trials.addData('feedback', feedback)
-            trials.addData('rt', key_resp.rt)
-            this_exp.nextEntry()
-            break
+    if WAIT_FOR_KEYS:
+        # sleep until a key is in the queue, the rt comes from the key event itself
+        key = waitForKeyPress(kb, keyList=['left', 'right'], maxWait=RESPONSE_TIMEOUT)
+        if key is not None:
+            key_resp.keys = key.name
+            key_resp.rt = key.rt
+        else:
+            key_resp.keys = None
+            key_resp.rt = None
+    else:
+        event.clearEvents(eventType='keyboard')
+        resp_clock = core.Clock()
+        while len(key_resp.keys) == 0:
+            theseKeys = event.getKeys(keyList=['left', 'right'])
+            if len(theseKeys) > 0:
+                key_resp.keys = theseKeys[0]
+                key_resp.rt = resp_clock.getTime()
+            elif resp_clock.getTime() > RESPONSE_TIMEOUT:
+                key_resp.keys = None
+                key_resp.rt = None
+                break
+    if key_resp.keys == 'left' and trial['color'] == 'red':
+        feedback = 'correct'
+    elif key_resp.keys == 'right' and trial['color'] == 'blue':
+        feedback = 'correct'
+    else:
+        feedback = 'wrong'
+    feedback_text = feedback_pool.get(feedback)
+    trials.addData('response', key_resp.keys)
+    trials.addData('feedback', feedback)
+    trials.addData('rt', key_resp.rt)
+    logging.debug(f'Stimuli created in this trial: {feedback_pool.endTrial()}')  # should be 0
+    this_exp.nextEntry()
 
     # Display feedback
-    feedback_text = visual.TextStim(win=win, text=feedback, color='black', height=0.05)
     feedback_text.draw()
     win.flip()
-    core.wait(1.0)
+    core.wait(feedback_durations[n])
 
     # Inter-stimulus interval (ISI)
-    t_isi = random.uniform(0, 1)
+    t_isi = isi_durations[n]
     fixation.draw()
     win.flip()
+    stream.flush()  # write the finished trial in the background during the ISI
     core.wait(t_isi)
 
-# Save the data to a CSV file
-this_exp.saveAsWideText('data/%s_stroop_task.csv' % exp_info['participant'], delim=',')
-this_exp.saveAsPickle('data/%s_stroop_task' % exp_info['participant'])
+# Finish the stream and rebuild the CSV file (and a typed Parquet file) from it, keep the pickle as a backup
+stream.close()
+rebuildWideText(stream.path, delim=',')
+convertToColumnar(stream.path)
+this_exp.saveAsPickle(data_stem)
 
 # End of experiment
 end_text = visual.TextStim(win=win, text='Thank you for participating!\n\nPress any key to exit.', color='black', height=0.05)